@@ -0,0 +1,125 @@
+#
+# Measure the throughput of the insertion of ProcessedMutation-like rows in a SQLite database
+# through the ORM session (objects added to the session and flushed at commit) and through
+# the bulk insert API of the SqlManager (Core INSERT statements by batches of BULK_SIZE rows)
+#
+
+import os
+import time
+import shutil
+import tempfile
+from optparse import OptionParser
+
+from sqlalchemy import Column, String, Integer, Float, create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.sql.schema import PrimaryKeyConstraint
+
+from util import Constants
+from util.sql.SqlManager import SqlManager
+from util.log.Logger import Logger
+
+OPTIONS = [
+       ["-n", "--rows", "store", "int", "rows", 200000, "The number of rows to insert.", None],
+       ["-b", "--bulk_size", "store", "int", "bulk_size", Constants.BULK_SIZE, "The number of rows per INSERT statement of the bulk insert.", None],
+       ["-l", "--log", "store", "string", "log", None, "The path to the log folder.", None],
+    ]
+
+# Parse the options provided in command line
+parser = OptionParser()
+for element in OPTIONS:
+    parser.add_option(element[0], element[1], action=element[2], type=element[3],
+                      dest=element[4], default=element[5],
+                      help=element[6], metavar=element[7])
+
+# Retrieve options and argument
+(options, args) = parser.parse_args()
+
+# Get the value of the options
+ROW_COUNT = options.rows
+BULK_SIZE = options.bulk_size
+LOG = options.log
+
+# Initialize the Logger
+Logger.get_instance( os.path.join( LOG, "bulk_insert_benchmark.log"))
+
+# Table with the columns of the processed_mutation table (declared apart from the model so that the benchmark
+# database only contains this table)
+BenchmarkBase = declarative_base()
+
+class BenchmarkMutation( BenchmarkBase):
+    __tablename__ = 'processed_mutation'
+
+    phenotype_name = Column(String)
+    method = Column(String)
+    age = Column(Integer)
+    name = Column(String)
+    number_line = Column(Integer)
+    rank = Column(Integer)
+    weight = Column(Float)
+    ratio = Column(Float)
+    fdr = Column( Float)
+
+    __table_args__ = ( PrimaryKeyConstraint( 'phenotype_name', 'method', 'age', 'name'), {})
+
+#
+# Build the rows to insert
+#
+# @param row_count : int - the number of rows
+#
+# @return list - the row dictionaries
+def build_rows( row_count):
+
+    return [ { "phenotype_name": "Heartperiod_Mean", "method": Constants.MEAN_KEYWORD, "age": 1, "name": "2L_" + str( row_index) + "_SNP",
+               "number_line": row_index % 200, "rank": row_index + 1, "weight": 1.0 / ( row_index + 1), "ratio": float( row_index) / row_count, "fdr": None}
+             for row_index in range( row_count)]
+
+#
+# Create an empty benchmark database
+#
+# @param db_path : string - the path to the database file
+#
+def create_database( db_path):
+
+    if os.path.exists( db_path):
+        os.remove( db_path)
+    BenchmarkBase.metadata.create_all( create_engine( Constants.PATH_SQL_BASE + db_path))
+
+#
+# Insert the rows through the ORM session
+#
+# @param db_path : string - the path to the database file
+# @param rows : list - the row dictionaries
+#
+def insert_with_session( db_path, rows):
+
+    session = sessionmaker( bind = create_engine( Constants.PATH_SQL_BASE + db_path))()
+    for row in rows:
+        session.add( BenchmarkMutation( **row))
+    session.commit()
+    session.close()
+
+#
+# Insert the rows through the bulk insert API of the SqlManager
+#
+# @param db_path : string - the path to the database file
+# @param rows : list - the row dictionaries
+#
+def insert_with_bulk( db_path, rows):
+
+    SqlManager.get_instance().set_DBpath( db_path)
+    SqlManager.get_instance().bulk_insert( BenchmarkMutation, rows, BULK_SIZE)
+
+
+rows = build_rows( ROW_COUNT)
+benchmark_folder = tempfile.mkdtemp()
+try:
+    for method_name, insert_method in [ ( "ORM session", insert_with_session), ( "SqlManager.bulk_insert", insert_with_bulk)]:
+        db_path = os.path.join( benchmark_folder, "benchmark.sqlite")
+        create_database( db_path)
+        start_time = time.time()
+        insert_method( db_path, rows)
+        elapsed_time = time.time() - start_time
+        Logger.get_instance().info( method_name + " : " + str( ROW_COUNT) + " rows in " + "%.2f" % elapsed_time + "s (" + str( int( ROW_COUNT / max( elapsed_time, 1e-6))) + " rows/s)")
+finally:
+    shutil.rmtree( benchmark_folder, ignore_errors = True)
@@ -1,6 +1,7 @@
 import os
 from optparse import OptionParser
 
+from util import Constants
 from util.epistasis.FastEpistasisWrapper import FastEpistasisWrapper
 
 OPTIONS = [
@@ -11,6 +12,13 @@ OPTIONS = [
        ["-g", "--genotype", "store", "string", "genotype", None, "The path to the genotype file.", None],
        ["-f", "--families", "store", "string", "families", None, "The path to the families (lines) file.", None],
        ["-l", "--log", "store", "string", "log", None, "The path to the log folder.", None],
+       ["-e", "--engine", "store", "string", "engine", FastEpistasisWrapper.FASTEPISTASIS_ENGINE, "The epistasis engine to use: " + " or ".join( FastEpistasisWrapper.ENGINE_LIST) + " (optional, default is " + FastEpistasisWrapper.FASTEPISTASIS_ENGINE + ").", None],
+       ["-m", "--memory", "store", "int", "memory", None, "The memory in MB targeted by the blocks of pairs tested at once by the native engine (optional).", None],
+       ["-b", "--block_size", "store", "int", "block_size", None, "The number of SET_B SNPs tested at once by the native engine (optional, computed from the memory by default).", None],
+       ["-n", "--shards", "store", "int", "shards", 1, "The number of shards SET_B is split in, executed concurrently and merged (optional, default is 1).", None],
+       ["-i", "--shard_index", "store", "int", "shard_index", None, "The index of the only shard to execute, from 0 to the number of shards - 1 (optional, the shard summaries are then merged with merge_epistasis_shards.py).", None],
+       ["-q", "--log_queue", "store_true", None, "log_queue", False, "Write the log records on a background thread, through buffers of log_buffer_size records (optional, the records are written synchronously by default).", None],
+       ["-z", "--log_buffer_size", "store", "int", "log_buffer_size", Constants.LOG_BUFFER_SIZE, "The number of log records buffered with --log_queue (optional, default is " + str( Constants.LOG_BUFFER_SIZE) + ").", None],
     ]
 
     
@@ -32,10 +40,20 @@ ALPHA = float( options.alpha)
 GENOTYPE_FILE = options.genotype
 FAMILIES_FILE = options.families
 LOG = options.log
+ENGINE = options.engine
+MEMORY_GOAL = options.memory * 1024 * 1024 if options.memory != None else None
+BLOCK_SIZE = options.block_size
+SHARDS = options.shards
+SHARD_INDEX = options.shard_index
+LOG_QUEUE = options.log_queue
+LOG_BUFFER_SIZE = options.log_buffer_size
 
 # Define the output folder
 OUTPUT_FOLDER = "output/9_epistasis_execution"
+# (the summaries of the shards executed as separate jobs are written to a sub-folder, before their merge)
+if SHARD_INDEX != None:
+    OUTPUT_FOLDER = os.path.join( OUTPUT_FOLDER, "shards")
 
 # Build the FastLMM Wrapper and launch the GWAS analysis
-fastlmm_gwas = FastEpistasisWrapper( PHENOTYPE_FILE, SNPSET_FILE, SNPKEPT_FILE, ALPHA, GENOTYPE_FILE, FAMILIES_FILE, OUTPUT_FOLDER, LOG)
+fastlmm_gwas = FastEpistasisWrapper( PHENOTYPE_FILE, SNPSET_FILE, SNPKEPT_FILE, ALPHA, GENOTYPE_FILE, FAMILIES_FILE, OUTPUT_FOLDER, LOG, ENGINE, MEMORY_GOAL, BLOCK_SIZE, SHARDS, SHARD_INDEX, LOG_QUEUE, LOG_BUFFER_SIZE)
 fastlmm_gwas.execute()
\ No newline at end of file
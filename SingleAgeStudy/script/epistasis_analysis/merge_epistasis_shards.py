@@ -0,0 +1,39 @@
+#
+# Merge the summaries of the shards of an epistasis analysis executed as separate jobs
+# (see FastEpistasisWrapper and EpistasisShards)
+#
+
+import os
+from optparse import OptionParser
+
+from util.log.Logger import Logger
+from util.epistasis.EpistasisShards import EpistasisShards
+
+OPTIONS = [
+       ["-s", "--snpsetfile", "store", "string", "snpsetfile", None, "The path to the file describing the SNP sets of the whole analysis.", None],
+       ["-i", "--input", "store", "string", "input", None, "The comma-separated paths to the summary files of the shards, in shard order.", None],
+       ["-o", "--output", "store", "string", "output", None, "The path to the merged summary file.", None],
+       ["-l", "--log", "store", "string", "log", None, "The path to the log folder.", None],
+    ]
+
+# Parse the options provided in command line
+parser = OptionParser()
+for element in OPTIONS:
+    parser.add_option(element[0], element[1], action=element[2], type=element[3],
+                      dest=element[4], default=element[5],
+                      help=element[6], metavar=element[7])
+
+# Retrieve options and argument
+(options, args) = parser.parse_args()
+
+# Get the value of the options
+SNPSET_FILE = options.snpsetfile
+SHARD_SUMMARY_FILES = options.input.split( ",")
+OUTPUT_FILE = options.output
+LOG = options.log
+
+# Initialize the Logger
+Logger.get_instance( os.path.join( LOG, "merge_epistasis_shards_" + os.path.basename( OUTPUT_FILE) + ".log"))
+
+# Merge the summaries of the shards
+EpistasisShards.merge_summaries( SNPSET_FILE, SHARD_SUMMARY_FILES, OUTPUT_FILE)
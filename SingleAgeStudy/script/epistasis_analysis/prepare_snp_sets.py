@@ -4,7 +4,7 @@ import ast
 
 from optparse import OptionParser
 
-from sqlalchemy import and_
+from sqlalchemy import and_, select
 
 from model.Mutation import Mutation
 
@@ -47,8 +47,8 @@ PHENOTYPE_SNP_FILE_LIST = [r.strip() for r in PHENOTYPE_SNP_FILE_LIST]
 # Initialize the Logger
 Logger.get_instance( os.path.join( LOG, "prepare_snp_sets.log"))
 
-# Initialize the SqlManager
-SqlManager.get_instance().set_DBpath( os.path.join( INPUT, DB_NAME))
+# Initialize the SqlManager (the DB is only read)
+SqlManager.get_instance().set_DBpath( os.path.join( INPUT, DB_NAME), read_only = True)
 
 # Set the output folder
 output_folder = os.path.join( OUTPUT, "8_epistasis_snp_sets")
@@ -78,6 +78,11 @@ for current_snp_file in PHENOTYPE_SNP_FILE_LIST:
             if "SNP" in snp_id:
                 snp_set_A.add( snp_id)
 
+# Check that the SNPs of the setA are in the database (the IN-query is executed by chunks of SNPs)
+db_snp_set_A = set( [ r[0].encode("utf-8") for r in SqlManager.get_instance().iterate_in_query( select( [ Mutation.mutation_id]), Mutation.mutation_id, snp_set_A)])
+if len( db_snp_set_A) < len( snp_set_A):
+    Logger.get_instance().warning( "prepare_snp_sets : " + str( len( snp_set_A) - len( db_snp_set_A)) + " SNPs of the setA are not in the database: " + ", ".join( sorted( snp_set_A - db_snp_set_A)[ :10]))
+
 # Add the setA to the complete list
 all_snp_set = all_snp_set.union( snp_set_A)
             
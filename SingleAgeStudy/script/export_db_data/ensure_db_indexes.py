@@ -0,0 +1,55 @@
+#
+# Create the indexes declared by the models that are missing from a SQLite database and check with
+# EXPLAIN QUERY PLAN that the hot queries of the project use an index (exit status 1 if a query scans a table)
+#
+
+import os
+import sys
+
+from util import Constants
+from util.sql.SqlManager import SqlManager
+from util.log.Logger import Logger
+from optparse import OptionParser
+
+OPTIONS = [
+       ["-i", "--input", "store", "string", "input", None, "The path to the input data folder.", None],
+       ["-l", "--log", "store", "string", "log", None, "The path to the log folder.", None],
+       ["-d", "--database", "store", "string", "database", None, "The name of the SQlite database to index.", None],
+       ["-c", "--check_only", "store_true", None, "check_only", False, "Only check the query plans, without creating the missing indexes.", None],
+       ["-w", "--wal_journal", "store_true", None, "wal_journal", False, "Switch the database to the WAL journal mode (not readable by RSQLite nor from NFS).", None],
+    ]
+
+# Parse the options provided in command line
+parser = OptionParser()
+for element in OPTIONS:
+    parser.add_option(element[0], element[1], action=element[2], type=element[3],
+                      dest=element[4], default=element[5],
+                      help=element[6], metavar=element[7])
+
+# Retrieve options and argument
+(options, args) = parser.parse_args()
+
+# Get the value of the options
+INPUT = options.input
+LOG = options.log
+DB_NAME = options.database
+CHECK_ONLY = options.check_only
+WAL_JOURNAL = options.wal_journal or Constants.SQLITE_WAL_JOURNAL
+
+# Initialize the Logger
+Logger.get_instance( os.path.join( LOG, "ensure_db_indexes.log"))
+
+# Initialize the SqlManager
+SqlManager.get_instance().set_DBpath( os.path.join( INPUT, DB_NAME), read_only = CHECK_ONLY)
+SqlManager.get_instance().set_wal_journal( WAL_JOURNAL)
+
+# Create the missing indexes
+if not CHECK_ONLY:
+    created_indexes = SqlManager.get_instance().ensure_indexes()
+    Logger.get_instance().info( "ensure_db_indexes : " + str( len( created_indexes)) + " indexes created")
+
+# Check the query plans of the hot queries
+unindexed_queries = [ query_name for query_name, uses_index, plan_details in SqlManager.get_instance().check_query_plans() if not uses_index]
+if len( unindexed_queries) > 0:
+    Logger.get_instance().error( "ensure_db_indexes : The following queries do not use an index: " + ", ".join( unindexed_queries), ex = False)
+    sys.exit( 1)
@@ -1,7 +1,10 @@
 import os
 
 from util.sql.SqlManager import SqlManager
+from util.sql.ColumnarTableExporter import ColumnarTableExporter
+from util.sql.ExportManifest import ExportManifest
 from util.log.Logger import Logger
+from util import Constants
 from optparse import OptionParser
 
 OPTIONS = [
@@ -9,41 +12,86 @@ OPTIONS = [
        ["-o", "--output", "store", "string", "output", None, "The path to the output folder.", None],
        ["-l", "--log", "store", "string", "log", None, "The path to the log folder.", None],
        ["-d", "--database", "store", "string", "database", None, "The name of the SQlite database to read.", None],
+       ["-b", "--batch_size", "store", "int", "batch_size", Constants.FETCH_SIZE, "The number of rows fetched at once from the database.", None],
+       ["-z", "--compression", "store", "string", "compression", None, "The compression of the exported files (gzip or zstd, none by default).", None],
+       ["-t", "--threads", "store", "int", "threads", 3, "The number of tables exported in parallel.", None],
+       ["-f", "--format", "store", "string", "format", "csv", "The format of the exported files: csv (tab separated), feather (Arrow IPC) or parquet.", None],
+       ["-r", "--force", "store_true", None, "force", False, "Export all the tables, even the ones unchanged since the previous export.", None],
     ]
-    
+
 # Parse the options provided in command line
 parser = OptionParser()
 for element in OPTIONS:
     parser.add_option(element[0], element[1], action=element[2], type=element[3],
                       dest=element[4], default=element[5],
                       help=element[6], metavar=element[7])
-    
+
 # Retrieve options and argument
 (options, args) = parser.parse_args()
-    
-# Get the value of the options 
+
+# Get the value of the options
 INPUT = options.input
 OUTPUT = options.output
 LOG = options.log
 DB_NAME = options.database
-    
+BATCH_SIZE = options.batch_size
+COMPRESSION = options.compression
+THREADS = options.threads
+FORMAT = options.format
+FORCE = options.force
+
+# The phenotype data joined to the individuals and their strains (the data frame built by the R scripts)
+PHENOTYPE_DATA_JOINED_NAME = "phenotype_data_joined"
+PHENOTYPE_DATA_JOIN = "phenotype_data join individual on phenotype_data.individual_name = individual.name left join strain on individual.strain_number = strain.number"
+PHENOTYPE_DATA_JOINED_COLUMNS = [ "phenotype_data.phenotype_name", "phenotype_data.value", "phenotype_data.individual_name", "phenotype_data.age",
+                                  "individual.date", "individual.sex", "individual.strain_number", "strain.control"]
+
 # Initialize the Logger
 Logger.get_instance( os.path.join( LOG, "export_sql_table.log"))
 
-# Initialize the SqlManager
-SqlManager.get_instance().set_DBpath( os.path.join( INPUT, DB_NAME))
+# Initialize the SqlManager (the DB is only read)
+SqlManager.get_instance().set_DBpath( os.path.join( INPUT, DB_NAME), read_only = True)
 
 # Set the output folder
 output_folder = os.path.join( OUTPUT, "1_export_sql_tables")
 if not os.path.exists( output_folder):
    os.makedirs( output_folder)
 
-# Export the SQL tables
-for table_name in [ "strain", "individual", "phenotype_data"]:
+# Set the export of the tables to CSV or columnar files
+if FORMAT == "csv":
+   file_extension = ".csv" + SqlManager.EXPORT_EXTENSIONS.get( COMPRESSION, "")
+   export_arguments = { "batch_size": BATCH_SIZE, "compression": COMPRESSION}
+   export_function = SqlManager.get_instance().export_table
+else:
+   file_extension = ColumnarTableExporter.EXTENSIONS[ FORMAT]
+   export_arguments = { "file_format": FORMAT}
+   export_function = ColumnarTableExporter( SqlManager.get_instance(), BATCH_SIZE).export_table
+
+# Load the manifest of the previous export (the files whose tables did not change are not exported again)
+manifest = ExportManifest( os.path.join( output_folder, ExportManifest.MANIFEST_FILE_NAME), SqlManager.get_instance())
+
+# Export the SQL tables and the joined phenotype data (in parallel, each table on its own read connection)
+table_exports = []
+exported_files = []
+for table_name, file_name, columns, source_tables in [ ( "strain", "strain", None, [ "strain"]), ( "individual", "individual", None, [ "individual"]),
+                                                      ( "phenotype_data", "phenotype_data", None, [ "phenotype_data"]),
+                                                      ( PHENOTYPE_DATA_JOIN, PHENOTYPE_DATA_JOINED_NAME, PHENOTYPE_DATA_JOINED_COLUMNS, [ "phenotype_data", "individual", "strain"])]:
    # build the path to the output file
-   out_file_path = os.path.join( output_folder, table_name + ".csv")
+   out_file_path = os.path.join( output_folder, file_name + file_extension)
+   export_settings = { "table": table_name, "columns": columns, "format": FORMAT, "compression": COMPRESSION}
+   if not FORCE and manifest.is_up_to_date( out_file_path, source_tables, export_settings):
+      print( "TABLE=" + file_name + " unchanged, " + out_file_path + " is kept")
+      continue
    print( "DB=" + SqlManager.get_instance().get_DBpath())
-   print( "TABLE=" + table_name + "->" + out_file_path) 
-   # export the table to file
-   SqlManager.get_instance().export_table( table_name, out_file_path)
+   print( "TABLE=" + file_name + "->" + out_file_path)
+   table_exports.append( ( table_name, out_file_path, dict( export_arguments, columns = columns)))
+   exported_files.append( ( out_file_path, source_tables, export_settings))
+
+# export the tables to files
+if len( table_exports) > 0:
+   SqlManager.get_instance().export_tables( table_exports, THREADS, export_function)
 
+# Record the exported files in the manifest
+for out_file_path, source_tables, export_settings in exported_files:
+   manifest.record( out_file_path, source_tables, export_settings)
+manifest.save()
@@ -1,6 +1,10 @@
 import os
 from optparse import OptionParser
 
+from util import Constants
+from util.log.Logger import Logger
+from util.gwas.GwasUtil import GwasUtil
+from util.gwas.GwasBackend import GwasBackend
 from util.gwas.FastLMMWrapper import FastLMMWrapper
 
 OPTIONS = [
@@ -10,6 +14,16 @@ OPTIONS = [
        ["-g", "--genotype", "store", "string", "genotype", None, "The path to the genotype file.", None],
        ["-f", "--families", "store", "string", "families", None, "The path to the families (lines) file.", None],
        ["-l", "--log", "store", "string", "log", None, "The path to the log folder.", None],
+       ["-k", "--genotype_cache", "store", "string", "genotype_cache", None, "The path to the folder of genotype subsets shared between GWAS (optional).", None],
+       ["-m", "--genotype_cache_max_size", "store", "string", "genotype_cache_max_size", None, "The maximal size of the genotype cache in GB (optional).", None],
+       ["-j", "--kinship_cache", "store", "string", "kinship_cache", None, "The path to the folder of kinship decompositions shared between GWAS (optional).", None],
+       ["-e", "--engine", "store", "string", "engine", GwasBackend.FASTLMM_BACKEND, "The GWAS engine to use: " + " or ".join( GwasBackend.BACKEND_LIST) + " (optional, default is " + GwasBackend.FASTLMM_BACKEND + ").", None],
+       ["-s", "--significance", "store", "string", "significance", None, "The comma-separated suffixes of the significance filters written in addition to alpha: a p-value (e.g. 1e-5) or a rank (e.g. 100th) (optional).", None],
+       ["-y", "--memory", "store", "int", "memory", None, "The memory in MB targeted by the blocks of SNPs tested at once by the GWAS engine (optional, default of the engine if not provided).", None],
+       ["-r", "--columnar", "store_true", None, "columnar", False, "Also write the complete GWAS results as columnar Parquet files (optional, requires pyarrow).", None],
+       ["-b", "--batch", "store", "string", "batch", None, "The path to a Fast-LMM analysis definition file (execute_fastlmm_*.txt). If provided, all the analysis of the file are executed, grouped by families set (optional).", None],
+       ["-q", "--log_queue", "store_true", None, "log_queue", False, "Write the log records on a background thread, through buffers of log_buffer_size records (optional, the records are written synchronously by default).", None],
+       ["-z", "--log_buffer_size", "store", "int", "log_buffer_size", Constants.LOG_BUFFER_SIZE, "The number of log records buffered with --log_queue (optional, default is " + str( Constants.LOG_BUFFER_SIZE) + ").", None],
     ]
     
 # Parse the options provided in command line
@@ -29,10 +43,30 @@ ALPHA = float( options.alpha)
 GENOTYPE_FILE = options.genotype
 FAMILIES_FILE = options.families
 LOG = options.log
+GENOTYPE_CACHE = options.genotype_cache
+GENOTYPE_CACHE_MAX_SIZE = None
+if options.genotype_cache_max_size != None:
+    GENOTYPE_CACHE_MAX_SIZE = int( float( options.genotype_cache_max_size) * 1024 * 1024 * 1024)
+KINSHIP_CACHE = options.kinship_cache
+BATCH_FILE = options.batch
+COLUMNAR_RESULT = options.columnar
+LOG_QUEUE = options.log_queue
+LOG_BUFFER_SIZE = options.log_buffer_size
+GWAS_BACKEND = options.engine
+MEMORY_GOAL = options.memory * 1024 * 1024 if options.memory != None else None
+SIGNIFICANCE_SUFFIX_LIST = []
+if options.significance != None:
+    SIGNIFICANCE_SUFFIX_LIST = [ suffix.strip() for suffix in options.significance.split( ",") if len( suffix.strip()) > 0]
 
 # Define the output folder
 OUTPUT_FOLDER = "output/4_gwas_execution"
 
-# Build the FastLMM Wrapper and launch the GWAS analysis
-fastlmm_gwas = FastLMMWrapper( PHENOTYPE_FILE, COVARIABLES_FILE, ALPHA, GENOTYPE_FILE, FAMILIES_FILE, OUTPUT_FOLDER, LOG)
-fastlmm_gwas.execute()
\ No newline at end of file
+if BATCH_FILE != None:
+    # Launch all the GWAS analysis of the definition file, sharing the genotype and kinship between the phenotypes of the same families
+    Logger.get_instance( os.path.join( LOG, "FastLMMWrapper_" + os.path.splitext( os.path.basename( BATCH_FILE))[0] + ".log"), queue_mode = LOG_QUEUE, buffer_size = LOG_BUFFER_SIZE)
+    analysis_command_list = GwasUtil.read_fastlmm_gwas_analysis_definition( BATCH_FILE)
+    GwasUtil.execute_fastlmm_analysis( analysis_command_list, COVARIABLES_FILE, GENOTYPE_FILE, ALPHA, OUTPUT_FOLDER, LOG, GENOTYPE_CACHE, GENOTYPE_CACHE_MAX_SIZE, KINSHIP_CACHE, GWAS_BACKEND, SIGNIFICANCE_SUFFIX_LIST, COLUMNAR_RESULT, MEMORY_GOAL)
+else:
+    # Build the FastLMM Wrapper and launch the GWAS analysis
+    fastlmm_gwas = FastLMMWrapper( PHENOTYPE_FILE, COVARIABLES_FILE, ALPHA, GENOTYPE_FILE, FAMILIES_FILE, OUTPUT_FOLDER, LOG, GENOTYPE_CACHE, GENOTYPE_CACHE_MAX_SIZE, KINSHIP_CACHE, GWAS_BACKEND, SIGNIFICANCE_SUFFIX_LIST, COLUMNAR_RESULT, MEMORY_GOAL, LOG_QUEUE, LOG_BUFFER_SIZE)
+    fastlmm_gwas.execute()
\ No newline at end of file
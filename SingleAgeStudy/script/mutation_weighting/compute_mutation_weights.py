@@ -0,0 +1,62 @@
+#
+# Compute the weights, ranks and ratios of the mutations of the processed phenotypes of a SQLite database
+# and write them to the processed_mutation table (see MutationWeighting)
+#
+
+import os
+
+from util.log.Logger import Logger
+from util.sql.SqlManager import SqlManager
+from util.annotation.LineMembershipIndex import LineMembershipIndex
+from util.weighting.MutationWeighting import MutationWeighting
+from model.ProcessedPhenotype import ProcessedPhenotype
+from optparse import OptionParser
+
+OPTIONS = [
+       ["-i", "--input", "store", "string", "input", None, "The path to the input data folder.", None],
+       ["-l", "--log", "store", "string", "log", None, "The path to the log folder.", None],
+       ["-d", "--database", "store", "string", "database", None, "The name of the SQlite database.", None],
+       ["-p", "--phenotypes", "store", "string", "phenotypes", None, "The comma-separated names of the phenotypes to weight (default: all the processed phenotypes).", None],
+       ["-x", "--annotation_index", "store", "string", "annotation_index", None, "The path to the folder of the annotation indexes of the database (default: the input folder).", None],
+    ]
+
+# Parse the options provided in command line
+parser = OptionParser()
+for element in OPTIONS:
+    parser.add_option(element[0], element[1], action=element[2], type=element[3],
+                      dest=element[4], default=element[5],
+                      help=element[6], metavar=element[7])
+
+# Retrieve options and argument
+(options, args) = parser.parse_args()
+
+# Get the value of the options
+INPUT = options.input
+LOG = options.log
+DB_PATH = os.path.join( INPUT, options.database)
+PHENOTYPES = options.phenotypes.split( ",") if options.phenotypes != None else None
+ANNOTATION_INDEX_FOLDER = options.annotation_index
+if ANNOTATION_INDEX_FOLDER == None:
+    ANNOTATION_INDEX_FOLDER = INPUT
+
+# Initialize the Logger
+Logger.get_instance( os.path.join( LOG, "compute_mutation_weights.log"))
+
+# Initialize the SqlManager
+SqlManager.get_instance().set_DBpath( DB_PATH)
+sql_session = SqlManager.get_instance().get_session()
+
+# Get the processed phenotypes to weight
+query = sql_session.query( ProcessedPhenotype)
+if PHENOTYPES != None:
+    query = query.filter( ProcessedPhenotype.name.in_( PHENOTYPES))
+processed_phenotype_list = query.order_by( ProcessedPhenotype.name, ProcessedPhenotype.method, ProcessedPhenotype.age).all()
+print( "Number of processed phenotypes: " + str( len( processed_phenotype_list)))
+
+# Compute the weights of the mutations of the phenotypes from the lines carrying them and replace
+# the previous processed mutations of the phenotypes
+line_membership_index = LineMembershipIndex.get_index( ANNOTATION_INDEX_FOLDER, DB_PATH)
+MutationWeighting( sql_session, line_membership_index).process( processed_phenotype_list)
+SqlManager.get_instance().commit()
+
+print( "Mutation weights written for " + str( len( processed_phenotype_list)) + " phenotypes")
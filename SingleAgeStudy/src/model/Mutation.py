@@ -6,6 +6,7 @@ import abc
 
 from sqlalchemy import Column, String, Integer
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql.schema import Index
 
 from util.sql.Base import Base
 from model.AssociationMutationLine import AssociationMutationLine
@@ -56,6 +57,11 @@ class Mutation(Base):
     __mapper_args__ = {'polymorphic_identity': 'mutation',
                        'polymorphic_on': type_mutation}
 
+    # Covering index of the selection of the mutations by type and allele
+    # counts (e.g. the SNPs of the epistasis sets)
+    __table_args__ = (Index('ix_mutation_type_counts', 'type_mutation', 'refCount', 'altCount', 'mutation_id'),
+                      {})
+
     ## get_mutation_id
     #  ---------------
     #
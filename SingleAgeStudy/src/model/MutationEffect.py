@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from sqlalchemy import Column, String, Integer, ForeignKey
+from sqlalchemy.sql.schema import Index
 from util.sql.Base import Base
 from util import Constants
 from util.log.Logger import Logger
@@ -28,6 +29,11 @@ class MutationEffect(Base):
     mutation_id = Column(String, ForeignKey('mutation.mutation_id'), primary_key=True)
     position = Column(String)
     type = Column(String)
+
+    # The primary key starts with flybase_id: the effects of a mutation are
+    # retrieved through a covering index starting with mutation_id
+    __table_args__ = (Index('ix_mutation_effect_mutation_id', 'mutation_id', 'flybase_id', 'symbol', 'position', 'type'),
+                      {})
     
     # mutation = created by the many-to-one relationship in between Mutation
     #            and MutationEffect.
@@ -52,10 +52,11 @@ class ProcessedMutation(Base):
     fdr = Column( Float)
     # phenotype = created by backref in ProcessedPhenotype.py
 
-#     index_processed_mutation = Index(name, phenotype_name, weight, rank)
+    # Index of the mutations of a phenotype ordered by weight
     __table_args__ = (ForeignKeyConstraint([phenotype_name, method, age],
                                            ['processed_phenotype.name', 'processed_phenotype.method', 'processed_phenotype.age']),
                       PrimaryKeyConstraint( 'phenotype_name', 'method', 'age', 'name'),
+                      Index('ix_processed_mutation_phenotype_weight', 'phenotype_name', 'weight'),
                       {})
 
     ## set_number_line
@@ -173,6 +174,8 @@ class ProcessedMutation(Base):
     #  --------------
     #
     # Compute weight for the current ProcessedMutation.
+    # (see util.weighting.MutationWeighting to compute the weights of all
+    # the mutations of whole phenotypes at once)
     #
     #    @param processed_strain_list : list<ProcessedStrain>
     #    where the mutation is present.
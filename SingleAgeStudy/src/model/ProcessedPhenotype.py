@@ -187,6 +187,25 @@ class ProcessedPhenotype( Base ):
         if analyzed_phenotype != None:
             self.analyzed_phenotype_list.append( analyzed_phenotype )
 
+    # # get_bulk_objects
+    #  ----------------
+    #
+    # Return the ProcessedPhenotype followed by its ProcessedPhenotypeData,
+    # ProcessedStrain and ProcessedMutation objects, in the order they can be
+    # inserted with SqlManager.bulk_insert_objects instead of the session
+    # (millions of ProcessedMutation rows are not flushed one by one).
+    # The keys of the phenotype are set to the children that were not flushed.
+    #
+    # @return List
+    def get_bulk_objects( self ):
+        children = list( self.processed_data_list ) + list( self.processed_strain_list ) + list( self.processed_mutation_list )
+        for child in children:
+            for key_column, key_value in [ ( 'phenotype_name', self.name ), ( 'method', self.method ), ( 'age', self.age ) ]:
+                if hasattr( child.__class__, key_column ) and getattr( child, key_column ) == None:
+                    setattr( child, key_column, key_value )
+
+        return [ self ] + children
+
     # # get_name
     #  --------
     #
@@ -160,6 +160,10 @@ LOG_MODE_CRITICAL = ['c', 'critical']
 
 LOG_APPEND = 'a'
 LOG_NO_APPEND = 'w'
+# Number of log records buffered before being written in the queue mode of the Logger
+# (the queue mode is opt-in: the records are written up to LOG_BUFFER_SIZE records late and the records buffered
+# are lost if the process is killed)
+LOG_BUFFER_SIZE = 100
 
 # ########################################
 # Constants used to associate reference/alternate genotype
@@ -210,6 +214,18 @@ PATH_DGRP_TEST_FILE = os.path.expanduser('~') + '/workspace/tagc-snpnet2/phase6/
 
 BULK_SIZE = 10000
 
+# Use the WAL journal on the DB files opened for writing (see SqlManager.WAL_PRAGMAS). The WAL mode persists in the
+# DB file, which can then no longer be read by the R scripts (RSQLite) nor from a NFS folder
+SQLITE_WAL_JOURNAL = False
+
+# Number of values bound per statement by the IN-queries executed by chunks (below the
+# SQLite limit of 999 host parameters of the versions prior to 3.32)
+IN_QUERY_CHUNK_SIZE = 500
+# Number of values from which an IN-query is executed through a join with a temporary table
+IN_QUERY_TEMPORARY_TABLE_SIZE = 50000
+# Number of rows fetched at once from the cursors of the streamed queries
+FETCH_SIZE = 10000
+
 # ##############################################
 # Constants for analyzes result
 # ##############################################
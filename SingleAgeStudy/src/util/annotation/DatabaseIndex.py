@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+
+from util.log.Logger import Logger
+
+# Interface of the on-disk indexes built from a table of the database
+#
+# The annotation tables are static for a given database, so an index is built once per database fingerprint
+# (path, size and modification time of the database file) in an index folder shared by all the jobs.
+# Each index is a folder named by the index type (INDEX_FOLDER_PREFIX) and the fingerprint, containing NumPy arrays
+# that are memory-mapped when the index is opened.
+#
+# An index is built in a temporary folder and published with an atomic rename (as done by GenotypeCache), so that
+# concurrent jobs never see a partial index.
+#
+# The available indexes are:
+#   - GeneAnnotationIndex : the effects of the mutations (mutation_effect table)
+#   - LineMembershipIndex : the lines carrying the mutations (mutation_in_line table)
+
+class DatabaseIndex(object):
+
+    INDEX_FOLDER_PREFIX = None
+    TEMPORARY_INDEX_PREFIX = ".tmp_"
+    NPY_EXTENSION = ".npy"
+
+    #
+    # Open an index
+    #
+    # @param index_path : string - the path to the index folder
+    #
+    def __init__(self, index_path):
+
+        self.indexPath = index_path
+
+    #
+    # Load an array of the index as a memory-mapped array
+    #
+    # @param name : string - the name of the array
+    #
+    # @return numpy.ndarray
+    def load_array(self, name):
+
+        return np.load( os.path.join( self.indexPath, name + DatabaseIndex.NPY_EXTENSION), mmap_mode = "r")
+
+    #
+    # Return the index of a database, building it if no job built it before
+    #
+    # @param index_folder : string - the path to the folder of the indexes (created if required)
+    # @param db_path : string - the path to the SQLite database file
+    #
+    # @return DatabaseIndex - the index, of the class on which the method is called
+    @classmethod
+    def get_index( cls, index_folder, db_path):
+
+        if not os.path.isdir( index_folder):
+            try:
+                os.makedirs( index_folder)
+            except OSError:
+                # The folder may have been created by a concurrent job
+                if not os.path.isdir( index_folder):
+                    raise
+
+        fingerprint = DatabaseIndex.compute_fingerprint( db_path)
+        index_path = os.path.join( index_folder, cls.INDEX_FOLDER_PREFIX + fingerprint)
+        if os.path.isdir( index_path):
+            Logger.get_instance().info( cls.__name__ + " : Using index " + fingerprint)
+        else:
+            Logger.get_instance().info( cls.__name__ + " : Building index " + fingerprint + " from " + db_path)
+            cls.build( db_path, index_folder, index_path)
+
+        return cls( index_path)
+
+    #
+    # Compute the fingerprint of a database file
+    #
+    # @param db_path : string - the path to the SQLite database file
+    #
+    # @return string - the hexadecimal fingerprint
+    @staticmethod
+    def compute_fingerprint( db_path):
+
+        db_path = os.path.realpath( db_path)
+        db_stat = os.stat( db_path)
+
+        return hashlib.sha1( db_path + "\t" + str( db_stat.st_size) + "\t" + str( int( db_stat.st_mtime)) + "\n").hexdigest()
+
+    #
+    # Build the index of a database in a temporary folder and publish it with an atomic rename
+    #
+    # @param db_path : string - the path to the SQLite database file
+    # @param index_folder : string - the path to the folder of the indexes
+    # @param index_path : string - the path of the index folder to publish
+    #
+    @classmethod
+    def build( cls, db_path, index_folder, index_path):
+
+        temporary_path = tempfile.mkdtemp( prefix = DatabaseIndex.TEMPORARY_INDEX_PREFIX, dir = index_folder)
+        try:
+            cls.write_arrays( db_path, temporary_path)
+            os.chmod( temporary_path, 0755)
+            os.rename( temporary_path, index_path)
+        except OSError:
+            # A concurrent job published the same index first: its index is used
+            shutil.rmtree( temporary_path, ignore_errors = True)
+            if not os.path.isdir( index_path):
+                raise
+        except:
+            shutil.rmtree( temporary_path, ignore_errors = True)
+            raise
+
+    #
+    # Read the table of the database and write the arrays of the index
+    #
+    # @param db_path : string - the path to the SQLite database file
+    # @param index_path : string - the path to the folder where the arrays are written
+    #
+    @classmethod
+    def write_arrays( cls, db_path, index_path):
+
+        raise NotImplementedError( "DatabaseIndex.write_arrays : Not implemented in " + cls.__name__)
+
+    #
+    # Save an array of the index
+    #
+    # @param index_path : string - the path to the index folder
+    # @param name : string - the name of the array
+    # @param array : numpy.ndarray - the array
+    #
+    @staticmethod
+    def save_array( index_path, name, array):
+
+        np.save( os.path.join( index_path, name + DatabaseIndex.NPY_EXTENSION), array)
+
+    #
+    # Convert a list of strings to a fixed-width byte string array (None values are stored as empty strings)
+    #
+    # @param values : list - the strings
+    #
+    # @return numpy.ndarray
+    @staticmethod
+    def to_string_array( values):
+
+        return np.array( [ value if value != None else "" for value in values], dtype = np.string_)
+
+    #
+    # Locate a list of strings in a sorted string array of the index
+    #
+    # @param sorted_values : numpy.ndarray - the sorted string array
+    # @param values : list - the strings to locate
+    #
+    # @return tuple - the positions of the strings in the array and a boolean array indicating the strings found
+    @staticmethod
+    def locate( sorted_values, values):
+
+        values = np.array( [ str( value) for value in values])
+        if len( sorted_values) == 0 or len( values) == 0:
+            return ( np.zeros( len( values), dtype = np.intp), np.zeros( len( values), dtype = bool))
+
+        positions = np.searchsorted( sorted_values, values)
+        positions[ positions >= len( sorted_values)] = 0
+        found = sorted_values[ positions] == values
+
+        return ( positions, found)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+
+import numpy as np
+
+from util.log.Logger import Logger
+from util.annotation.DatabaseIndex import DatabaseIndex
+
+# On-disk index of the gene annotation (MutationEffect table) of the mutations of a database
+#
+# The index is built once per database and shared by all the gene mapping jobs (see DatabaseIndex).
+# It contains the NumPy arrays:
+#   - mutation_ids : the sorted IDs of the mutations having effects
+#   - effect_offsets : the position of the first effect of each mutation in the effect arrays (plus the total count)
+#   - flybase_ids, symbols, positions, types : the fields of the effects, sorted by mutation ID
+# The arrays are memory-mapped when the index is opened and a batch of mutation IDs is located with a binary search,
+# so that a lookup does not read the database nor the whole index.
+
+class GeneAnnotationIndex( DatabaseIndex):
+
+    INDEX_FOLDER_PREFIX = "gene_annotation_"
+
+    MUTATION_IDS = "mutation_ids"
+    EFFECT_OFFSETS = "effect_offsets"
+    EFFECT_FIELDS = [ "flybase_ids", "symbols", "positions", "types"]
+
+    EFFECT_QUERY = "SELECT mutation_id, flybase_id, symbol, position, type FROM mutation_effect ORDER BY mutation_id, flybase_id"
+
+    #
+    # Open an index
+    #
+    # @param index_path : string - the path to the index folder
+    #
+    def __init__(self, index_path):
+
+        DatabaseIndex.__init__( self, index_path)
+        self.mutationIds = self.load_array( GeneAnnotationIndex.MUTATION_IDS)
+        self.effectOffsets = self.load_array( GeneAnnotationIndex.EFFECT_OFFSETS)
+        self.effectFields = [ self.load_array( field) for field in GeneAnnotationIndex.EFFECT_FIELDS]
+
+    #
+    # Return the number of mutations having effects
+    #
+    # @return int
+    def get_mutation_count(self):
+
+        return len( self.mutationIds)
+
+    #
+    # Return the effects of a list of mutations
+    #
+    # @param mutation_ids : list - the mutation IDs
+    #
+    # @return dict - the list of ( flybase_id, symbol, position, type) tuples of each mutation having effects
+    def get_effects(self, mutation_ids):
+
+        # Locate all the mutations at once in the sorted mutation IDs
+        effects = {}
+        positions, found = DatabaseIndex.locate( self.mutationIds, mutation_ids)
+        for mutation_id, position in zip( self.mutationIds[ positions[ found]], positions[ found]):
+            effect_start = self.effectOffsets[ position]
+            effect_end = self.effectOffsets[ position + 1]
+            effects[ str( mutation_id)] = zip( *[ field[ effect_start:effect_end].tolist() for field in self.effectFields])
+
+        return effects
+
+    #
+    # Read the effects of the database sorted by mutation and write the arrays of the index
+    #
+    # @param db_path : string - the path to the SQLite database file
+    # @param index_path : string - the path to the folder where the arrays are written
+    #
+    @classmethod
+    def write_arrays( cls, db_path, index_path):
+
+        mutation_ids = []
+        effect_offsets = []
+        effect_fields = [ [] for field in GeneAnnotationIndex.EFFECT_FIELDS]
+        connection = sqlite3.connect( db_path)
+        try:
+            connection.text_factory = str
+            effect_count = 0
+            for row in connection.execute( GeneAnnotationIndex.EFFECT_QUERY):
+                if len( mutation_ids) == 0 or mutation_ids[ -1] != row[ 0]:
+                    mutation_ids.append( row[ 0])
+                    effect_offsets.append( effect_count)
+                for field_index in range( len( effect_fields)):
+                    effect_fields[ field_index].append( row[ field_index + 1])
+                effect_count += 1
+            effect_offsets.append( effect_count)
+        finally:
+            connection.close()
+
+        DatabaseIndex.save_array( index_path, GeneAnnotationIndex.MUTATION_IDS, DatabaseIndex.to_string_array( mutation_ids))
+        DatabaseIndex.save_array( index_path, GeneAnnotationIndex.EFFECT_OFFSETS, np.array( effect_offsets, dtype = np.int64))
+        for field, values in zip( GeneAnnotationIndex.EFFECT_FIELDS, effect_fields):
+            DatabaseIndex.save_array( index_path, field, DatabaseIndex.to_string_array( values))
+
+        Logger.get_instance().info( "GeneAnnotationIndex : Index built with " + str( len( mutation_ids)) + " mutations and " + str( effect_count) + " effects")
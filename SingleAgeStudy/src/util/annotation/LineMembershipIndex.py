@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+
+import numpy as np
+
+from util.log.Logger import Logger
+from util.annotation.DatabaseIndex import DatabaseIndex
+
+# On-disk bitset index of the DGRP lines carrying the mutations of a database (AssociationMutationLine table)
+#
+# The index is built once per database and shared by all the jobs (see DatabaseIndex). It contains the NumPy arrays:
+#   - mutation_ids : the sorted IDs of the mutations carried by at least one line
+#   - line_ids : the sorted IDs of the lines of the table
+#   - line_bits : one row of packed bits per mutation (bit j set if the line j carries the mutation),
+#                 the bits being packed by numpy.packbits (the first line is the highest bit of the first byte)
+# The arrays are memory-mapped when the index is opened. A batch of mutation IDs is located with a binary search
+# and the lines of a subset carrying each mutation are counted with a bitwise AND with the packed mask of the subset
+# and a byte popcount table, for all the mutations at once.
+
+class LineMembershipIndex( DatabaseIndex):
+
+    INDEX_FOLDER_PREFIX = "line_membership_"
+
+    MUTATION_IDS = "mutation_ids"
+    LINE_IDS = "line_ids"
+    LINE_BITS = "line_bits"
+
+    MUTATION_QUERY = "SELECT DISTINCT mutation_id FROM mutation_in_line ORDER BY mutation_id"
+    LINE_QUERY = "SELECT DISTINCT line_id FROM mutation_in_line ORDER BY line_id"
+    ASSOCIATION_QUERY = "SELECT mutation_id, line_id FROM mutation_in_line"
+
+    # Number of rows of the association table read at once while building the index
+    FETCH_SIZE = 100000
+
+    # Number of bits set in each byte value
+    BYTE_POPCOUNT = np.array( [ bin( byte_value).count( "1") for byte_value in range( 256)], dtype = np.uint8)
+
+    #
+    # Open an index
+    #
+    # @param index_path : string - the path to the index folder
+    #
+    def __init__(self, index_path):
+
+        DatabaseIndex.__init__( self, index_path)
+        self.mutationIds = self.load_array( LineMembershipIndex.MUTATION_IDS)
+        self.lineIds = self.load_array( LineMembershipIndex.LINE_IDS)
+        self.lineBits = self.load_array( LineMembershipIndex.LINE_BITS)
+
+    #
+    # Return the number of mutations carried by at least one line
+    #
+    # @return int
+    def get_mutation_count(self):
+
+        return len( self.mutationIds)
+
+    #
+    # Return the IDs of all the lines of the index
+    #
+    # @return list
+    def get_line_ids(self):
+
+        return self.lineIds.tolist()
+
+    #
+    # Return the lines carrying a mutation
+    #
+    # @param mutation_id : string - the mutation ID
+    #
+    # @return list - the IDs of the lines carrying the mutation (empty if the mutation is not in the index)
+    def get_lines(self, mutation_id):
+
+        positions, found = DatabaseIndex.locate( self.mutationIds, [ mutation_id])
+        if not found[ 0]:
+            return []
+
+        line_flags = np.unpackbits( self.lineBits[ positions[ 0]])[ :len( self.lineIds)].astype( bool)
+
+        return self.lineIds[ line_flags].tolist()
+
+    #
+    # Return the packed bit mask of a subset of lines
+    #
+    # @param line_ids : list - the IDs of the lines of the subset (the lines absent from the index are ignored)
+    #
+    # @return numpy.ndarray - the packed mask, with the width of the rows of the index
+    def get_line_mask(self, line_ids):
+
+        positions, found = DatabaseIndex.locate( self.lineIds, line_ids)
+        line_flags = np.zeros( self.lineBits.shape[ 1] * 8, dtype = np.uint8)
+        line_flags[ positions[ found]] = 1
+
+        return np.packbits( line_flags)
+
+    #
+    # Count the lines carrying each mutation of a list, among all the lines and among the lines of subsets
+    #
+    # @param mutation_ids : list - the mutation IDs
+    # @param line_masks : list - the packed masks of the line subsets (see get_line_mask)
+    #
+    # @return tuple - the boolean array indicating the mutations found in the index, the array of the number of lines
+    #                 carrying each mutation and the list of the arrays of the number of lines of each subset carrying it
+    #                 (the counts of the mutations not found are 0)
+    def count_lines(self, mutation_ids, line_masks = []):
+
+        positions, found = DatabaseIndex.locate( self.mutationIds, mutation_ids)
+        mutation_bits = self.lineBits[ positions[ found]]
+
+        line_counts = np.zeros( len( found), dtype = np.int64)
+        line_counts[ found] = LineMembershipIndex.popcount( mutation_bits)
+        subset_counts = []
+        for line_mask in line_masks:
+            counts = np.zeros( len( found), dtype = np.int64)
+            counts[ found] = LineMembershipIndex.popcount( mutation_bits & line_mask)
+            subset_counts.append( counts)
+
+        return ( found, line_counts, subset_counts)
+
+    #
+    # Count the bits set in each row of a packed bit array
+    #
+    # @param bits : numpy.ndarray - the 2D array of packed bits
+    #
+    # @return numpy.ndarray - the number of bits set in each row
+    @staticmethod
+    def popcount( bits):
+
+        return LineMembershipIndex.BYTE_POPCOUNT[ bits].sum( axis = 1, dtype = np.int64)
+
+    #
+    # Read the associations of the database and write the arrays of the index
+    #
+    # @param db_path : string - the path to the SQLite database file
+    # @param index_path : string - the path to the folder where the arrays are written
+    #
+    @classmethod
+    def write_arrays( cls, db_path, index_path):
+
+        connection = sqlite3.connect( db_path)
+        try:
+            connection.text_factory = str
+            LineMembershipIndex.write_connection_arrays( connection, index_path)
+        finally:
+            connection.close()
+
+    #
+    # Read the associations of a database connection and write the arrays of the index
+    # The packed bits are written in a memory-mapped array, so that the complete table is never held in memory
+    #
+    # @param connection : sqlite3.Connection - the connection to the database (with str as text factory)
+    # @param index_path : string - the path to the folder where the arrays are written
+    #
+    @staticmethod
+    def write_connection_arrays( connection, index_path):
+
+        mutation_ids = DatabaseIndex.to_string_array( [ row[ 0] for row in connection.execute( LineMembershipIndex.MUTATION_QUERY)])
+        line_ids = DatabaseIndex.to_string_array( [ row[ 0] for row in connection.execute( LineMembershipIndex.LINE_QUERY)])
+        DatabaseIndex.save_array( index_path, LineMembershipIndex.MUTATION_IDS, mutation_ids)
+        DatabaseIndex.save_array( index_path, LineMembershipIndex.LINE_IDS, line_ids)
+
+        line_bits = np.lib.format.open_memmap( os.path.join( index_path, LineMembershipIndex.LINE_BITS + DatabaseIndex.NPY_EXTENSION), mode = "w+",
+                                               dtype = np.uint8, shape = ( len( mutation_ids), ( len( line_ids) + 7) // 8))
+        line_bits[:] = 0
+        association_count = 0
+        cursor = connection.execute( LineMembershipIndex.ASSOCIATION_QUERY)
+        while True:
+            rows = cursor.fetchmany( LineMembershipIndex.FETCH_SIZE)
+            if len( rows) == 0:
+                break
+            row_mutation_ids, row_line_ids = zip( *rows)
+            mutation_positions = np.searchsorted( mutation_ids, np.array( row_mutation_ids))
+            line_positions = np.searchsorted( line_ids, np.array( row_line_ids))
+            np.bitwise_or.at( line_bits, ( mutation_positions, line_positions // 8), ( 128 >> ( line_positions % 8)).astype( np.uint8))
+            association_count += len( rows)
+        line_bits.flush()
+        del line_bits
+
+        Logger.get_instance().info( "LineMembershipIndex : Index built with " + str( len( mutation_ids)) + " mutations, " + str( len( line_ids)) + " lines and "
+                                    + str( association_count) + " associations")
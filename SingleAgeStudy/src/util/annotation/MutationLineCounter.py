@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+from util.log.Logger import Logger
+
+# Count the DGRP lines having mutations, in the whole database and among the lines used by an analysis (GWAS or epistasis)
+#
+# The lines of the database are named "dgrp<number>" whereas the lines of the analysis are named "line_<number>".
+# The counts are computed from the line membership bitset index of the database (see LineMembershipIndex):
+# the lines used by the analysis are converted once to a packed mask and the counts of a batch of mutations
+# are computed at once, with no query to the database.
+
+class MutationLineCounter(object):
+
+    DB_LINE_PREFIX = "dgrp"
+    ANALYSIS_LINE_PREFIX = "line_"
+
+    #
+    # Instantiate the counter
+    #
+    # @param line_membership_index : LineMembershipIndex - the line membership index of the database
+    # @param used_lines : list - the names of the DGRP lines used by the analysis (e.g. "line_21")
+    #
+    def __init__(self, line_membership_index, used_lines):
+
+        self.lineMembershipIndex = line_membership_index
+
+        # Get the lines of the database and the ones used by the analysis, with the names of the database
+        used_lines = set( used_lines)
+        self.dbLines = line_membership_index.get_line_ids()
+        self.usedDBLines = [ line_id for line_id in self.dbLines if line_id.replace( MutationLineCounter.DB_LINE_PREFIX, MutationLineCounter.ANALYSIS_LINE_PREFIX) in used_lines]
+        self.usedLineMask = line_membership_index.get_line_mask( self.usedDBLines)
+        Logger.get_instance().info( "Total number of lines=" + str( len( self.dbLines)) + " (" + str( len( self.usedDBLines)) + " used by the analysis)")
+
+    #
+    # Return the total number of lines in the database
+    #
+    # @return int
+    def get_total_line_count(self):
+
+        return len( self.dbLines)
+
+    #
+    # Return the number of lines having each mutation of a list, in the database and among the lines used by the analysis
+    #
+    # @param mutation_ids : list - the mutation IDs
+    #
+    # @return dict - the ( number of lines in database, number of used lines) tuple of each mutation found in lines
+    def get_line_counts(self, mutation_ids):
+
+        mutation_ids = list( mutation_ids)
+        found, line_counts, subset_counts = self.lineMembershipIndex.count_lines( mutation_ids, [ self.usedLineMask])
+
+        return dict( [ ( mutation_ids[ mutation_index], ( int( line_counts[ mutation_index]), int( subset_counts[ 0][ mutation_index])))
+                       for mutation_index in found.nonzero()[ 0]])
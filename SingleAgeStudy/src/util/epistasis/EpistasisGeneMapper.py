@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+from util.log.Logger import Logger
+from util.epistasis.EpistasisSummaryReader import EpistasisSummaryReader
+
+# Map the pairs of SNPs of an epistasis summary to the genes they affect
+#
+# The first effect of each SNP of the summary is read from the gene annotation index of the database (see
+# GeneAnnotationIndex) and the numbers of DGRP lines having the SNP are provided by a MutationLineCounter. They form an
+# effect table with one row per SNP having an effect, keyed by the code of the SNP in the summary index (see
+# EpistasisSummaryIndex). The mapped pairs are obtained by two keyed joins of the pairs with the effect table, on the
+# 1_SNP column then on the 2_SNP column. Each mapped pair is written with the gene information of its two SNPs around
+# the columns of the summary, the other pairs (at least one SNP with no effect) are written to a separate "missing" file.
+#
+# Both files are written by the same bulk writer: the tables are written by chunks of CHUNK_SIZE rows through a
+# buffered file, with a progress message after each chunk. The rows are written in the order of the summary.
+# The float columns of the summary are read as text (TEXT_COLUMNS), so that their tokens are written unchanged, and the
+# chromosome and SNP of a missing best partner are written as MISSING_VALUE, as in the summary.
+
+class EpistasisGeneMapper(object):
+
+    CHUNK_SIZE = 100000
+
+    # Size of the buffer of the output files (in bytes)
+    BUFFER_SIZE = 4 * 1024 * 1024
+
+    EFFECT_HEADERS = [ "ID", "FlybaseID", "GeneSymbol", "Position", "Type", "NbOfLinesForMutationInEpistasis", "NbOfLinesForMutationInDB", "TotalNbOfLinesinDB"]
+    SNP_PREFIXES = [ "1_", "2_"]
+
+    # Columns of the summary read as text (see EpistasisSummaryReader), written as their tokens in the summary
+    TEXT_COLUMNS = [ "PROP", "CHISQ"]
+
+    # Value written for the missing values of the summary (no best partner)
+    MISSING_VALUE = "NA"
+
+    #
+    # Instantiate the mapper
+    #
+    # @param gene_annotation_index : GeneAnnotationIndex - the gene annotation index of the database
+    # @param line_counter : MutationLineCounter - the counter of the lines having the mutations
+    #
+    def __init__(self, gene_annotation_index, line_counter):
+
+        self.geneAnnotationIndex = gene_annotation_index
+        self.lineCounter = line_counter
+        self.chunkSize = EpistasisGeneMapper.CHUNK_SIZE
+
+    #
+    # Return the headers of the mapped pairs
+    #
+    # @return list
+    @staticmethod
+    def get_output_headers():
+
+        return ( [ EpistasisGeneMapper.SNP_PREFIXES[ 0] + header for header in EpistasisGeneMapper.EFFECT_HEADERS]
+                 + EpistasisSummaryReader.COLUMNS
+                 + [ EpistasisGeneMapper.SNP_PREFIXES[ 1] + header for header in EpistasisGeneMapper.EFFECT_HEADERS])
+
+    #
+    # Build the table of the first effect of the SNPs of a summary
+    #
+    # @param summary_index : EpistasisSummaryIndex - the index of the SNPs of the summary
+    #
+    # @return pandas.DataFrame - the effect table (columns of EFFECT_HEADERS), indexed by the code of the SNPs having an effect
+    def get_effect_table(self, summary_index):
+
+        snp_ids = summary_index.get_snp_ids()
+        effects = self.geneAnnotationIndex.get_effects( snp_ids)
+        line_counts = self.lineCounter.get_line_counts( list( effects.keys()))
+        Logger.get_instance().info( "EpistasisGeneMapper.get_effect_table : " + str( sum( [ len( snp_effects) for snp_effects in effects.values()])) + " effects found for " + str( len( effects)) + " of the " + str( len( snp_ids)) + " SNPs")
+
+        codes = [ code for code, snp_id in enumerate( snp_ids) if snp_id in effects]
+        effect_rows = []
+        for code in codes:
+            snp_id = snp_ids[ code]
+            line_count, used_line_count = line_counts.get( snp_id, ( 0, 0))
+            effect_rows.append( ( snp_id,) + tuple( effects[ snp_id][ 0]) + ( used_line_count, line_count))
+        effect_df = pd.DataFrame.from_records( effect_rows, index = pd.Index( codes, dtype = np.int64), columns = EpistasisGeneMapper.EFFECT_HEADERS[ :-1])
+        for header in EpistasisGeneMapper.EFFECT_HEADERS[ -3:-1]:
+            effect_df[ header] = effect_df[ header].astype( np.int64)
+        effect_df[ EpistasisGeneMapper.EFFECT_HEADERS[ -1]] = self.lineCounter.get_total_line_count()
+
+        return effect_df
+
+    #
+    # Map the pairs of a summary to genes and write the mapped and missing pairs to files
+    #
+    # @param summary_df : pandas.DataFrame - the summary, as read by EpistasisSummaryReader.read with the TEXT_COLUMNS as text
+    # @param summary_index : EpistasisSummaryIndex - the index of the SNPs of the summary
+    # @param output_file_path : string - the path to the file where the mapped pairs are written
+    # @param missing_file_path : string - the path to the file where the pairs with a SNP with no effect are written
+    #
+    # @return tuple - the number of pairs mapped and the number of pairs with a SNP with no effect
+    def map_summary(self, summary_df, summary_index, output_file_path, missing_file_path):
+
+        effect_df = self.get_effect_table( summary_index)
+
+        # Join the pairs with the effects of their first SNP, then with the effects of their second SNP
+        # (the SNP columns share the categories of the summary index, so their codes are the keys of the effect table)
+        mapped_df = summary_df
+        for prefix, snp_column in zip( EpistasisGeneMapper.SNP_PREFIXES, EpistasisSummaryReader.SNP_COLUMNS):
+            code_column = prefix + "CODE"
+            mapped_df = mapped_df.assign( **{ code_column: summary_df[ snp_column].cat.codes.astype( np.int64)})
+            mapped_df = mapped_df.join( effect_df.add_prefix( prefix), on = code_column, how = "inner")
+        # The inner joins group the rows by key: restore the order of the summary
+        mapped_df = mapped_df[ EpistasisGeneMapper.get_output_headers()].sort_index( kind = "mergesort")
+
+        # The missing pairs are the pairs not kept by the joins
+        missing_df = summary_df[ ~summary_df.index.isin( mapped_df.index)]
+
+        self.write_table( mapped_df, output_file_path, "mapped pairs")
+        self.write_table( missing_df, missing_file_path, "missing pairs")
+
+        Logger.get_instance().info( "EpistasisGeneMapper.map_summary : " + str( len( mapped_df)) + " pairs mapped to genes, " + str( len( missing_df)) + " pairs with a SNP with no gene")
+
+        return ( len( mapped_df), len( missing_df))
+
+    #
+    # Write a table to a tab-separated file with its headers, by chunks through a buffered file
+    #
+    # @param table_df : pandas.DataFrame - the table to write
+    # @param file_path : string - the path to the file
+    # @param label : string - the description of the rows in the progress messages
+    #
+    def write_table(self, table_df, file_path, label):
+
+        row_count = len( table_df)
+        with open( file_path, "w", EpistasisGeneMapper.BUFFER_SIZE) as table_file:
+            table_file.write( "\t".join( table_df.columns) + "\n")
+            for start in range( 0, row_count, self.chunkSize):
+                end = min( start + self.chunkSize, row_count)
+                table_df.iloc[ start:end].to_csv( table_file, sep = "\t", header = False, index = False, na_rep = EpistasisGeneMapper.MISSING_VALUE)
+                Logger.get_instance().info( "EpistasisGeneMapper.write_table : " + str( end) + "/" + str( row_count) + " " + label + " written to " + file_path)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+from util.log.Logger import Logger
+from util.epistasis.NativeEpistasisEngine import NativeEpistasisEngine
+
+# Split of an epistasis analysis in shards and merge of the summaries of the shards
+#
+# SET_B is partitioned in shard_count contiguous chunks of balanced sizes (the sizes differ by 1 at most). Each shard
+# tests all the SNPs of SET_A against its chunk of SET_B, so the shards can be executed concurrently, on the same node
+# or as separate jobs.
+#
+# The summaries of the shards are merged in a single .epi.qt.lm.summary file: for each SNP of SET_A the numbers of
+# significant tests and of tests are summed, their proportion is recomputed, and the best chi-square of the shards is
+# kept with its SET_B SNP (on ties, the SNP of the first shard, i.e. the first SNP in SET_B order, as in a single
+# execution). The rows are written in the order of SET_A, so the merged file does not depend on the order in which the
+# shards completed.
+
+class EpistasisShards(object):
+
+    SHARD_SUFFIX = "_shard"
+
+    # Number of lines preceding the rows of a summary file (title, headers and blank line)
+    SUMMARY_HEADER_LINE_COUNT = 3
+    SUMMARY_COLUMN_COUNT = 8
+
+    # The best chi-square is written as read from the shard summary
+    MERGED_ROW_FORMAT = "%4s %12s %8d %8d %8.4g %12s %4s %12s\n"
+
+    #
+    # Return the chunk of SET_B tested by a shard
+    #
+    # @param set_b : list - the SNP IDs of SET_B
+    # @param shard_count : int - the number of shards
+    # @param shard_index : int - the index of the shard (from 0 to shard_count - 1)
+    #
+    # @return list - the SNP IDs of the chunk, in SET_B order
+    @staticmethod
+    def get_shard_snps( set_b, shard_count, shard_index):
+
+        return set_b[ shard_index * len( set_b) // shard_count:( shard_index + 1) * len( set_b) // shard_count]
+
+    #
+    # Write a set file (SET_A and SET_B lists of SNP IDs, see FastEpistasisWrapper.concat_set_of_snp)
+    #
+    # @param set_file_path : string - the path to the set file
+    # @param set_a : list - the SNP IDs of SET_A
+    # @param set_b : list - the SNP IDs of SET_B
+    #
+    @staticmethod
+    def write_set_file( set_file_path, set_a, set_b):
+
+        with open( set_file_path, "w") as set_file:
+            set_file.write( NativeEpistasisEngine.SET_A_START + "\n")
+            for snp_id in set_a:
+                set_file.write( snp_id + "\n")
+            set_file.write( NativeEpistasisEngine.SET_END + "\n")
+            set_file.write( "\n")
+            set_file.write( NativeEpistasisEngine.SET_B_START + "\n")
+            for snp_id in set_b:
+                set_file.write( snp_id + "\n")
+            set_file.write( NativeEpistasisEngine.SET_END + "\n")
+
+    #
+    # Write the set file of a shard
+    #
+    # @param set_file_name : string - the path to the set file of the whole analysis
+    # @param shard_set_file_path : string - the path to the set file of the shard
+    # @param shard_count : int - the number of shards
+    # @param shard_index : int - the index of the shard
+    #
+    # @return tuple - the SNP IDs of SET_A and of the chunk of SET_B of the shard
+    @staticmethod
+    def write_shard_set_file( set_file_name, shard_set_file_path, shard_count, shard_index):
+
+        set_a, set_b = NativeEpistasisEngine.read_snp_sets( set_file_name)
+        shard_snps = EpistasisShards.get_shard_snps( set_b, shard_count, shard_index)
+        EpistasisShards.write_set_file( shard_set_file_path, set_a, shard_snps)
+
+        return ( set_a, shard_snps)
+
+    #
+    # Read the rows of a summary file
+    #
+    # @param summary_file_path : string - the path to the summary file
+    #
+    # @return list - the tokens of each row (CHR SNP N_SIG N_TOT PROP CHISQ CHR SNP)
+    @staticmethod
+    def read_summary_rows( summary_file_path):
+
+        rows = []
+        with open( summary_file_path) as summary_file:
+            for line_index, line in enumerate( summary_file):
+                tokens = line.split()
+                if line_index < EpistasisShards.SUMMARY_HEADER_LINE_COUNT or len( tokens) < EpistasisShards.SUMMARY_COLUMN_COUNT:
+                    continue
+                rows.append( tokens)
+
+        return rows
+
+    #
+    # Merge the summaries of the shards of an analysis
+    #
+    # @param set_file_name : string - the path to the set file of the whole analysis
+    # @param summary_file_paths : list - the paths to the summary files of the shards, in shard order
+    # @param output_path : string - the path to the merged summary file
+    #
+    # @return int - the number of SET_A SNPs in the merged summary
+    @staticmethod
+    def merge_summaries( set_file_name, summary_file_paths, output_path):
+
+        set_a, set_b = NativeEpistasisEngine.read_snp_sets( set_file_name)
+
+        # Combine the rows of each SNP of SET_A, reading the shards in order
+        merged_rows = {}
+        for summary_file_path in summary_file_paths:
+            for tokens in EpistasisShards.read_summary_rows( summary_file_path):
+                chromosome, snp_id, significant_count, test_count, proportion, chisq, best_chromosome, best_snp_id = tokens[ 0:EpistasisShards.SUMMARY_COLUMN_COUNT]
+                if snp_id not in merged_rows:
+                    merged_rows[ snp_id] = [ chromosome, snp_id, int( significant_count), int( test_count), chisq, best_chromosome, best_snp_id]
+                    continue
+                merged_row = merged_rows[ snp_id]
+                merged_row[ 2] += int( significant_count)
+                merged_row[ 3] += int( test_count)
+                if float( chisq) > float( merged_row[ 4]):
+                    merged_row[ 4:7] = [ chisq, best_chromosome, best_snp_id]
+
+        # Write the merged rows in SET_A order
+        row_count = 0
+        with open( output_path, "w") as output_file:
+            output_file.write( "Epistasis summary of " + str( len( set_a)) + " SET_A SNPs against " + str( len( set_b)) + " SET_B SNPs (merged from " + str( len( summary_file_paths)) + " shards)\n")
+            output_file.write( NativeEpistasisEngine.SUMMARY_HEADER_FORMAT % tuple( NativeEpistasisEngine.SUMMARY_HEADERS))
+            output_file.write( "\n")
+            for snp_id in set_a:
+                merged_row = merged_rows.pop( snp_id, None)
+                if merged_row == None:
+                    continue
+                chromosome, snp_id, significant_count, test_count, chisq, best_chromosome, best_snp_id = merged_row
+                proportion = float( significant_count) / test_count if test_count > 0 else 0.0
+                output_file.write( EpistasisShards.MERGED_ROW_FORMAT % ( chromosome, snp_id, significant_count, test_count, proportion, chisq, best_chromosome, best_snp_id))
+                row_count += 1
+
+        Logger.get_instance().info( "EpistasisShards.merge_summaries : " + str( len( summary_file_paths)) + " shard summaries merged to " + output_path + " (" + str( row_count) + " SNPs)")
+
+        return row_count
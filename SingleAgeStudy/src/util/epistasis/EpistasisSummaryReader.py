@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from util.log.Logger import Logger
+from util.epistasis.EpistasisShards import EpistasisShards
+
+# Typed reader of the epistasis summary files (.epi.qt.lm.summary, see NativeEpistasisEngine and FastEpistasisWrapper)
+#
+# The summary starts with 3 lines (title, headers with repeated CHR and SNP names, and a blank or comment line)
+# followed by one whitespace-aligned row per pair of SNPs. The rows are parsed by pandas in chunks of chunk_size rows
+# into typed columns:
+#   - 1_CHR, 1_SNP, 2_CHR, 2_SNP : categorical (2_CHR and 2_SNP are missing for a SNP with no best partner)
+#   - N_SIG, N_TOT : integer
+#   - PROP, CHISQ : float
+# Columns can also be kept as the text of their tokens (text_columns), e.g. to write them back unchanged.
+#
+# While the chunks are read, the SNP IDs of both SNP columns are recorded in a hash index (see EpistasisSummaryIndex),
+# so that the SNPs of the summary and the rows of a SNP are found in constant time, and the complete table is built
+# with both SNP columns sharing the categories of the index.
+
+class EpistasisSummaryReader(object):
+
+    HEADER_LINE_COUNT = EpistasisShards.SUMMARY_HEADER_LINE_COUNT
+
+    SNP_1_COLUMN = "1_SNP"
+    SNP_2_COLUMN = "2_SNP"
+    SNP_COLUMNS = [ SNP_1_COLUMN, SNP_2_COLUMN]
+    CHROMOSOME_COLUMNS = [ "1_CHR", "2_CHR"]
+    COLUMNS = [ "1_CHR", "1_SNP", "N_SIG", "N_TOT", "PROP", "CHISQ", "2_CHR", "2_SNP"]
+    COLUMN_TYPES = { "1_CHR": "category", "1_SNP": "category", "N_SIG": np.int64, "N_TOT": np.int64,
+                     "PROP": np.float64, "CHISQ": np.float64, "2_CHR": "category", "2_SNP": "category"}
+
+    # Number of rows parsed at once
+    CHUNK_SIZE = 500000
+
+    #
+    # Instantiate the reader of a summary file
+    #
+    # @param summary_file_path : string - the path to the summary file (compressed files are read according to their extension)
+    # @param chunk_size : int - the number of rows parsed at once (None for CHUNK_SIZE)
+    # @param text_columns : list - the columns kept as the text of their tokens instead of their type (None for no column)
+    #
+    def __init__(self, summary_file_path, chunk_size = None, text_columns = None):
+
+        self.summaryFilePath = summary_file_path
+        self.chunkSize = chunk_size if chunk_size != None else EpistasisSummaryReader.CHUNK_SIZE
+        self.columnTypes = dict( EpistasisSummaryReader.COLUMN_TYPES)
+        if text_columns != None:
+            self.columnTypes.update( [ ( column, str) for column in text_columns])
+
+    #
+    # Read the rows of the summary by chunks
+    #
+    # @param index : EpistasisSummaryIndex - the index the SNPs of the chunks are added to (None for no index)
+    #
+    # @return generator - the pandas.DataFrame chunks, with the typed (or text) columns of COLUMNS
+    def iterate_chunks(self, index = None):
+
+        chunks = pd.read_csv( self.summaryFilePath, delim_whitespace = True, header = None, skiprows = EpistasisSummaryReader.HEADER_LINE_COUNT,
+                              names = EpistasisSummaryReader.COLUMNS, usecols = range( len( EpistasisSummaryReader.COLUMNS)),
+                              dtype = self.columnTypes, chunksize = self.chunkSize, compression = "infer")
+        for chunk in chunks:
+            if index != None:
+                index.add_chunk( chunk)
+            yield chunk
+
+    #
+    # Read the complete summary
+    # Both SNP columns share the categories of the index (the SNP IDs in order of first appearance).
+    #
+    # @return tuple - the pandas.DataFrame of the summary and its EpistasisSummaryIndex
+    def read(self):
+
+        index = EpistasisSummaryIndex()
+        chunks = list( self.iterate_chunks( index))
+        if len( chunks) == 0:
+            summary_df = pd.DataFrame( dict( [ ( column, pd.Series( [], dtype = self.columnTypes[ column])) for column in EpistasisSummaryReader.COLUMNS]),
+                                       columns = EpistasisSummaryReader.COLUMNS)
+        else:
+            summary_df = pd.concat( chunks, ignore_index = True)
+            for column in EpistasisSummaryReader.CHROMOSOME_COLUMNS:
+                summary_df[ column] = union_categoricals( [ chunk[ column] for chunk in chunks])
+        pair_codes = index.get_pair_codes()
+        snp_categories = index.get_snp_ids()
+        for column_index, column in enumerate( EpistasisSummaryReader.SNP_COLUMNS):
+            summary_df[ column] = pd.Categorical.from_codes( pair_codes[ :, column_index], snp_categories)
+
+        Logger.get_instance().info( "EpistasisSummaryReader.read : " + str( len( summary_df)) + " pairs of " + str( len( snp_categories)) + " SNPs read from " + self.summaryFilePath)
+
+        return ( summary_df, index)
+
+
+# Hash index of the SNP IDs of an epistasis summary
+#
+# Each SNP ID gets an integer code (in order of first appearance in the summary) and each pair is stored as the codes
+# of its two SNPs, so that the rows of a SNP are found from a sorted copy of the codes.
+
+class EpistasisSummaryIndex(object):
+
+    #
+    # Instantiate an empty index
+    #
+    def __init__(self):
+
+        self.snpCodes = {}
+        self.snpIds = []
+        self.pairCodeChunks = []
+        self.rowOrder = None
+        self.sortedCodes = None
+
+    #
+    # Add the pairs of a chunk of the summary (rows following the previous chunks)
+    #
+    # @param chunk : pandas.DataFrame - the chunk, with categorical SNP columns
+    #
+    def add_chunk(self, chunk):
+
+        pair_codes = np.empty( ( len( chunk), len( EpistasisSummaryReader.SNP_COLUMNS)), dtype = np.int64)
+        for column_index, column in enumerate( EpistasisSummaryReader.SNP_COLUMNS):
+            values = chunk[ column].astype( "category")
+            # The missing SNPs (no best partner) keep the code -1
+            category_codes = np.array( [ self.add_snp( snp_id) for snp_id in values.cat.categories] + [ -1], dtype = np.int64)
+            pair_codes[ :, column_index] = category_codes[ values.cat.codes.values]
+        self.pairCodeChunks.append( pair_codes)
+        self.rowOrder = None
+
+    #
+    # Return the code of a SNP ID, adding it to the index if required
+    #
+    # @param snp_id : string - the SNP ID
+    #
+    # @return int
+    def add_snp(self, snp_id):
+
+        code = self.snpCodes.get( snp_id)
+        if code == None:
+            code = len( self.snpIds)
+            self.snpCodes[ snp_id] = code
+            self.snpIds.append( snp_id)
+
+        return code
+
+    #
+    # Indicate if a SNP is in the summary
+    #
+    # @param snp_id : string - the SNP ID
+    #
+    # @return boolean
+    def contains(self, snp_id):
+
+        return snp_id in self.snpCodes
+
+    #
+    # Return the SNP IDs of the summary
+    #
+    # @return list - the SNP IDs, in order of first appearance
+    def get_snp_ids(self):
+
+        return self.snpIds
+
+    #
+    # Return the codes of the SNPs of each pair
+    #
+    # @return numpy.ndarray - the codes (one row per pair, one column per SNP column, -1 for a missing SNP)
+    def get_pair_codes(self):
+
+        if len( self.pairCodeChunks) > 1:
+            self.pairCodeChunks = [ np.concatenate( self.pairCodeChunks)]
+        if len( self.pairCodeChunks) == 0:
+            return np.empty( ( 0, len( EpistasisSummaryReader.SNP_COLUMNS)), dtype = np.int64)
+
+        return self.pairCodeChunks[ 0]
+
+    #
+    # Return the rows of the pairs containing a SNP
+    #
+    # @param snp_id : string - the SNP ID
+    #
+    # @return numpy.ndarray - the sorted row indexes (empty if the SNP is not in the summary)
+    def get_rows(self, snp_id):
+
+        code = self.snpCodes.get( snp_id)
+        if code == None:
+            return np.empty( 0, dtype = np.int64)
+
+        # Sort the codes once, so that the rows of each SNP are a contiguous range of the sorted codes
+        if self.rowOrder is None:
+            flat_codes = self.get_pair_codes().ravel()
+            flat_order = np.argsort( flat_codes, kind = "mergesort")
+            self.sortedCodes = flat_codes[ flat_order]
+            self.rowOrder = flat_order // len( EpistasisSummaryReader.SNP_COLUMNS)
+        start, end = np.searchsorted( self.sortedCodes, [ code, code + 1])
+
+        return np.unique( self.rowOrder[ start:end])
@@ -1,39 +1,57 @@
 import os
-import gc
 import csv
 import sys
-import subprocess
 import shutil
-import glob
+import multiprocessing
 
 #import pylab
 #import pandas as pd
 
 import logging
 
+from util import Constants
 from util.log.Logger import Logger
+from util.log.QueueLogging import QueueListener
+from util.process.ProcessRunner import ProcessRunner
+from util.plink.PlinkBedFile import PlinkBedFile
+from util.file.FileStaging import FileStaging
+from util.epistasis.NativeEpistasisEngine import NativeEpistasisEngine
+from util.epistasis.EpistasisShards import EpistasisShards
 
 # Execute FastEpistasis Analysis
 #
-# - Requires for the genotype a ped and a map files (plink will be used to generated required bed, bim and fam files) 
+# - Requires for the genotype a bed, a bim and a fam files (the DGRP global genotype). The genotype of the selected families
+#   and SNPs is extracted from it in-process (see PlinkBedFile), without plink nor intermediate .ped file
 # - Requires a space separated file for the phenotype with three column and headers "fid iid <pheno_name>" : 
 #     column 1: family ID, column 2: Individual ID, column 3 phenotype value
 # - Requires a file describing the two sets of SNP to be tested. The file contains two list of SNP (one SNP per line). The first set
 # start by a line with "SET_A" and end with a line with "END". The second set start with a line with "SET_B" and end with a line with "END.
 # 
 # Note: A validation of the order of the family/individuals in the genotype file is done.
-# If the order differ from the one in the ped file, a new ordered file will be produced for the genotype
+# If the order differ from the one in the fam file, a new ordered file will be produced for the phenotype
+#
+# The pairs of SNPs are tested by an engine:
+#   - fastepistasis : the preFastEpistasis and smpFastEpistasis tools (the genotype is converted to a .bin file)
+#   - native : the NumPy implementation testing the pairs by blocks in-process (see NativeEpistasisEngine)
+#
+# The analysis can be split in shards, each shard testing SET_A against a chunk of SET_B (see EpistasisShards):
+#   - with a shard count and no shard index, the shards are executed concurrently (one process per shard, each running
+#     the engine on its own folder, the native engine with an equal part of the memory goal) and their summaries are
+#     merged in the summary of the analysis (the log records of the shard processes are written by the Logger of the
+#     main process)
+#   - with a shard index, only this shard is executed and its summary is the result (<phenotype>_shard<index>.epi.qt.lm.summary),
+#     so that the shards can be executed as separate jobs and merged afterwards (see script/epistasis_analysis/merge_epistasis_shards.py)
 #
 # Outputs:
 # - a summary of the best pairs
 #
-# To produce the genotype files in plink format (ped and map) from the DGRP complete file, use the following commands
-# plink --noweb --bfile dgrp2 --recode --out dgrp2
-# To produce the genotype files in plink format (ped and map) from the DGRP complete file with limitation on strains and SNPs, use the following commands
+# The genotype subset produced is equivalent to the one produced by the following command
 # (selection_files.txt contains the list of SNP ids to keep, and selection_strains.txt contains the list of strains to keep (two columns file))
-# plink --noweb --bfile dgrp2 --recode --extract selection_file.txt --keep selected_strains.txt --out dgrp2_selected
+# plink --noweb --bfile dgrp2 --extract selection_file.txt --keep selected_strains.txt --make-bed --out dgrp2_selected
 #
-# IMPORTANT NOTE: since long path are not accepted by plink, we copy the required files to a single folder (self.outputPlinkPath)
+# IMPORTANT NOTE: since long path are not accepted by plink, the required files are staged under short names in a single
+# folder (self.outputPlinkPath) through hard links, reflinks or symbolic links, copies being the last resort (see FileStaging).
+# The DGRP genotype is not staged: it is only read in-process to build the genotype subset.
 
 class FastEpistasisWrapper:
     
@@ -44,28 +62,60 @@ class FastEpistasisWrapper:
     PHENOTYPE_FILE_ORDERED_EXTENSION = "_or.txt"
     
     RESULT_FILE_SIGNIFICANT_EXTENSION = "_signif.txt"
+    RESULT_FILE_SUMMARY_EXTENSION = ".epi.qt.lm.summary"
+
+    SHARD_FOLDER_PREFIX = "shard_"
+
+    FASTEPISTASIS_ENGINE = "fastepistasis"
+    NATIVE_ENGINE = "native"
+    ENGINE_LIST = [ FASTEPISTASIS_ENGINE, NATIVE_ENGINE]
     
     
     #
     # Instantiate the FastEpistasisWrapper object
-    # IMPORTANT NOTE: since long path are not accepted by plink, we copy the required files to a single folder (self.outputPlinkPath)
+    # IMPORTANT NOTE: since long path are not accepted by plink, the required files are staged to a single folder (self.outputPlinkPath)
     #
     # @param phenotype_file_name : string - The name of the file containing the phenotype data
     # @param set_file_name : string - The path to the file containing the set (SETA and SETB) of SNP to compare
     # @param snp_kept_file_name : string - The path to the file containing the list of SNP to keep (should be the union of SETA and SETB)
     # @param alpha : float - The significant level used to filter out the results.
-    # @param dgrp_file : string - the path to the genotype .ped and .map files (name with no extension)
+    # @param dgrp_file : string - the path to the genotype .bed, .bim and .fam files (name with no extension)
     # @param families : string - the path to the file containing th list of strain to use
     # @param output_path : string - the path to the output folder
     # @param log_path : string - the path to the log folder
+    # @param engine : string - the name of the engine testing the pairs of SNPs (see ENGINE_LIST)
+    # @param memory_goal : int - the memory (in bytes) targeted by the blocks of pairs of the native engine, shared by the shards executed concurrently (None for the default)
+    # @param set_b_block_size : int - the number of SET_B SNPs tested at once by the native engine (None to compute it from the memory goal)
+    # @param shard_count : int - the number of shards SET_B is split in
+    # @param shard_index : int - the index of the only shard to execute (None to execute all the shards and merge them)
+    # @param log_queue_mode : boolean - True to write the log records on a background thread (see Logger), False to write them synchronously
+    # @param log_buffer_size : int - the number of log records buffered in queue mode (None for Constants.LOG_BUFFER_SIZE)
     #
-    def __init__(self, phenotype_file_name, set_file_name, snp_kept_file_name, alpha, dgrp_file, families, output_path, log_path):
+    # @raise ValueError : if the engine name is unknown or the shard index is not lower than the shard count
+    def __init__(self, phenotype_file_name, set_file_name, snp_kept_file_name, alpha, dgrp_file, families, output_path, log_path, engine = FASTEPISTASIS_ENGINE, memory_goal = None, set_b_block_size = None, shard_count = 1, shard_index = None, log_queue_mode = False, log_buffer_size = None):
         
+        if engine not in FastEpistasisWrapper.ENGINE_LIST:
+            raise ValueError( "FastEpistasisWrapper : Unknown epistasis engine '" + str( engine) + "'. Available engines are: " + ", ".join( FastEpistasisWrapper.ENGINE_LIST))
+        if shard_index != None and not 0 <= shard_index < shard_count:
+            raise ValueError( "FastEpistasisWrapper : Shard index " + str( shard_index) + " is not in the " + str( shard_count) + " shards")
+        self.engine = engine
+        self.memoryGoal = memory_goal
+        self.setBBlockSize = set_b_block_size
+        self.shardCount = max( 1, shard_count)
+        self.shardIndex = shard_index
+
         self.alpha = alpha
         self.originalPhenotypeFileName = os.path.splitext( os.path.basename( phenotype_file_name))[0]
         
         # Define the log file name
         self.logFileName = "FastEpistasisWrapper_" + os.path.splitext( os.path.basename( phenotype_file_name))[0] +".log"
+        if shard_index != None:
+            self.originalPhenotypeFileName += EpistasisShards.SHARD_SUFFIX + str( shard_index)
+            self.logFileName = "FastEpistasisWrapper_" + self.originalPhenotypeFileName + ".log"
+        
+        # Initialize the Logger
+        Logger.get_instance( os.path.join( log_path, self.logFileName), queue_mode = log_queue_mode,
+                             buffer_size = log_buffer_size if log_buffer_size != None else Constants.LOG_BUFFER_SIZE)
         
         # Check and create the output folders
         self.outputPath = output_path
@@ -73,44 +123,41 @@ class FastEpistasisWrapper:
             os.mkdir(self.outputPath, 0777)
             
         self.outputPlinkPath = os.path.join( self.outputPath, "plink_" + str( hash( os.path.splitext( os.path.basename( phenotype_file_name))[0])))
+        if shard_index != None:
+            self.outputPlinkPath += EpistasisShards.SHARD_SUFFIX + str( shard_index)
         if not os.path.isdir( self.outputPlinkPath):
             os.mkdir(self.outputPlinkPath, 0777)
         
-        # Copy the phenotype file to plink folder
+        # Stage the phenotype file to plink folder
 #         self.phenotypeFileName = os.path.join( self.outputPlinkPath, os.path.basename( phenotype_file_name))
         self.phenotypeFileName = os.path.join( self.outputPlinkPath, "Pheno.txt")
-        shutil.copyfile( phenotype_file_name, self.phenotypeFileName)
+        FileStaging.stage_file( phenotype_file_name, self.phenotypeFileName)
         
-        # Copy the sets of SNP to plink folder
+        # Stage the sets of SNP to plink folder
 #         self.setFileName = os.path.join( self.outputPlinkPath, os.path.basename( set_file_name))
         self.setFileName = os.path.join( self.outputPlinkPath, "Sets.txt")
-        shutil.copyfile( set_file_name, self.setFileName)
+        FileStaging.stage_file( set_file_name, self.setFileName)
         
 #         self.snpKeptFileName = os.path.join( self.outputPlinkPath, os.path.basename( snp_kept_file_name))
         self.snpKeptFileName = os.path.join( self.outputPlinkPath, "Kept.txt")
-        shutil.copyfile( snp_kept_file_name, self.snpKeptFileName)
+        FileStaging.stage_file( snp_kept_file_name, self.snpKeptFileName)
         
-        # Copy the dgrp file to plink folder
-        self.dgrpFile = os.path.join( self.outputPlinkPath, os.path.basename( dgrp_file))
-        for file in glob.glob( dgrp_file + ".*"):
-            shutil.copyfile( file, os.path.join( self.outputPlinkPath, os.path.basename( file)))
+        # The dgrp file is read in place (see build_family_genotype)
+        self.dgrpFile = dgrp_file
         
-        # Copy the families file  to plink folder
+        # Stage the families file  to plink folder
 #         self.families = os.path.join( self.outputPlinkPath, os.path.basename( families))
         self.families = os.path.join( self.outputPlinkPath, "Fami.txt")
-        shutil.copyfile( families, self.families)
+        FileStaging.stage_file( families, self.families)
         
         # Initialize the name of the computed genotype file
 #         self.genotypeFileName = "genotype_" + os.path.splitext( os.path.basename( self.phenotypeFileName))[0]
         self.genotypeFileName = "geno"
-            
-        # Initialize the Logger
-        Logger.get_instance( os.path.join( log_path, self.logFileName))
     
     #
     # Execute the FastEpistasisWrapper
     #
-    # @param no_plink : boolean - True if the plink utility must not be run before execute Fast-LMM
+    # @param no_plink : boolean - True if the order of the phenotype file must not be checked against the genotype
     def execute(self, no_plink = False):
         
         # Open the output file of execution log
@@ -119,11 +166,14 @@ class FastEpistasisWrapper:
         # If required build the suitable genotype file from global DGRP file
         if( self.dgrpFile != None and self.families != None):
             Logger.get_instance().info("\nBuilding the genotype file from DGRP global data...\n-----------------------------------------------------------")
-            self.build_family_genotype( outfile)
+            self.build_family_genotype()
         
         
-        # Check the phenotype file (if plink required because it means .ped file is present)
-        if no_plink == False:
+        # Check the phenotype file
+        # (the native engine reads the phenotype of each individual of the genotype by its IDs)
+        if self.engine == FastEpistasisWrapper.NATIVE_ENGINE:
+            Logger.get_instance().info( "\nPhenotype file read by individual IDs\n--------------------------------------------")
+        elif no_plink == False:
             try:
                 Logger.get_instance().info("\nChecking the phenotype file...\n------------------------------")
                 self.check_phenotype_file()
@@ -131,30 +181,8 @@ class FastEpistasisWrapper:
                 Logger.get_instance().error( "An exception occurred while checking the phenotype data file:")
                 Logger.get_instance().error( str(e))
                 return
-
-            
-        # Launch the plink utility to build the binary version of ped and map files if it does not exists
-        if no_plink == False:
-            Logger.get_instance().info( "\nGenerating Bed file of DGRP SNP information...\n------------------------------")
-            plink_out_file = "bed." + self.genotypeFileName
-            # -- Check if a previous Bed file exists in order to remove it before creating the new one
-            if os.path.isfile( plink_out_file + ".bed"):
-                try:
-                    os.remove( plink_out_file)
-                except:
-                    Logger.get_instance().error( "ERROR: Unable to remove DGRP Bed file : " + plink_out_file + ".bed")
-                    Logger.get_instance().error( "       check if Bed file was updated.")
-            else:
-                Logger.get_instance().info("No previous bed file found")
-            # -- build the plink command to generate the bed/map files and execute it
-            Logger.get_instance().info( "Generating bed file") 
-            plink_command = "cd " + self.outputPlinkPath + ";plink --noweb --file " + self.genotypeFileName + " --make-bed --out " + plink_out_file
-            self.launch_command( plink_command, outfile)
-            # -- the files produced by plink are the files to use 
-            self.genotypeFileName = plink_out_file
-            Logger.get_instance().info( "  Bed file generated")
         else:
-            Logger.get_instance().info( "\nBypassing plink execution on genotype data\n--------------------------------------------")
+            Logger.get_instance().info( "\nBypassing check of phenotype file\n--------------------------------------------")
         
         
         # Run Espistasis analysis
@@ -165,20 +193,18 @@ class FastEpistasisWrapper:
         Logger.get_instance().info(" Genotype = " + geno_epistasis)
         Logger.get_instance().info(" Phenotype = " + pheno_epistasis)
         Logger.get_instance().info(" SNP set = " + snp_set_epistasis)
+        Logger.get_instance().info(" Engine = " + self.engine)
+        Logger.get_instance().info(" Shards = " + str( self.shardCount) + ( " (shard " + str( self.shardIndex) + ")" if self.shardIndex != None else ""))
+        result_file_path = os.path.join( self.outputPlinkPath, geno_epistasis + FastEpistasisWrapper.RESULT_FILE_SUMMARY_EXTENSION)
         try:
-            # Launch the PreFastEpistasis utility that manage the data from plink into data for FastEpistasis
-            print( "|--Executing PreFastEpistasis...")
-
-            previous_working_dir = os.getcwd()
-            pre_fast_command = "cd " + self.outputPlinkPath + ";preFastEpistasis --bfile " + os.path.basename( geno_epistasis) + " --pheno " + os.path.basename( pheno_epistasis) + " --set " + os.path.basename( snp_set_epistasis) + ";cd " + previous_working_dir
-            self.launch_command( pre_fast_command, outfile)
-            
-            # Launch the FastEspistatis analysis
-            print( "|--Executing FastEpistasis...")
-
-            previous_working_dir = os.getcwd()
-            fast_epistasis_command = "cd " + self.outputPlinkPath + ";smpFastEpistasis " + os.path.basename(geno_epistasis) +".bin --method 4 --epi1 0.0" + ";cd " + previous_working_dir
-            self.launch_command( fast_epistasis_command, outfile)
+            if self.shardIndex != None:
+                result_file_path = self.execute_shard( self.shardIndex, geno_epistasis, pheno_epistasis)
+            elif self.shardCount > 1:
+                self.execute_shards( geno_epistasis, pheno_epistasis, result_file_path)
+            elif self.engine == FastEpistasisWrapper.NATIVE_ENGINE:
+                self.execute_native_engine( geno_epistasis, pheno_epistasis, snp_set_epistasis)
+            else:
+                self.execute_fastepistasis( geno_epistasis, pheno_epistasis, snp_set_epistasis, outfile)
 
         except Exception as e:
             print( "ERROR: an exception occurred during FastEpistasis of '" + pheno_epistasis + "' on genotype '" + geno_epistasis + "' with SNP sets '" + snp_set_epistasis + "'")
@@ -193,8 +219,8 @@ class FastEpistasisWrapper:
         # and remove the plink result folder
         try:
             print( "|--Renaming and moving results...")
-            print( "|--|-- Trying to move " + os.path.join( self.outputPlinkPath, geno_epistasis + ".epi.qt.lm.summary") + " to " + os.path.join( self.outputPath, self.originalPhenotypeFileName + ".epi.qt.lm.summary"))
-            shutil.move( os.path.join( self.outputPlinkPath, geno_epistasis + ".epi.qt.lm.summary"), os.path.join( self.outputPath, self.originalPhenotypeFileName + ".epi.qt.lm.summary"))
+            print( "|--|-- Trying to move " + result_file_path + " to " + os.path.join( self.outputPath, self.originalPhenotypeFileName + FastEpistasisWrapper.RESULT_FILE_SUMMARY_EXTENSION))
+            shutil.move( result_file_path, os.path.join( self.outputPath, self.originalPhenotypeFileName + FastEpistasisWrapper.RESULT_FILE_SUMMARY_EXTENSION))
             print( "|--Deleting plink folder...")
             shutil.rmtree( self.outputPlinkPath)
             
@@ -212,23 +238,146 @@ class FastEpistasisWrapper:
     
     
     #
-    # Build the plink files required by the fast-LMM starting from the global GDRP file and
-    # keeping only the desired families
+    # Test the pairs of SNPs with the preFastEpistasis and smpFastEpistasis tools
+    #
+    # @param geno_epistasis : string - the name of the genotype files in the plink folder (with no extension)
+    # @param pheno_epistasis : string - the path to the phenotype file
+    # @param snp_set_epistasis : string - the path to the file describing SET_A and SET_B
+    # @param outfile : file - the output file of the execution log
+    # @param working_path : string - the folder containing the genotype and phenotype files, where the tools are executed (None for the plink folder)
+    #
+    # @raise ProcessException : if a command fails
+    def execute_fastepistasis(self, geno_epistasis, pheno_epistasis, snp_set_epistasis, outfile, working_path = None):
+
+        if working_path == None:
+            working_path = self.outputPlinkPath
+
+        # Launch the PreFastEpistasis utility that manage the data from plink into data for FastEpistasis
+        print( "|--Executing PreFastEpistasis...")
+
+        pre_fast_command = "preFastEpistasis --bfile " + os.path.basename( geno_epistasis) + " --pheno " + os.path.basename( pheno_epistasis) + " --set " + os.path.basename( snp_set_epistasis)
+        self.launch_command( pre_fast_command, outfile, cwd = working_path)
+        
+        # Launch the FastEspistatis analysis
+        print( "|--Executing FastEpistasis...")
+
+        fast_epistasis_command = "smpFastEpistasis " + os.path.basename(geno_epistasis) +".bin --method 4 --epi1 0.0"
+        self.launch_command( fast_epistasis_command, outfile, cwd = working_path)
+
+    #
+    # Test the pairs of SNPs in-process with the native engine, writing the summary file where smpFastEpistasis writes it
+    #
+    # @param geno_epistasis : string - the name of the genotype files in the plink folder (with no extension)
+    # @param pheno_epistasis : string - the path to the phenotype file
+    # @param snp_set_epistasis : string - the path to the file describing SET_A and SET_B
+    # @param working_path : string - the folder where the summary file is written (None for the plink folder)
+    #
+    def execute_native_engine(self, geno_epistasis, pheno_epistasis, snp_set_epistasis, working_path = None):
+
+        if working_path == None:
+            working_path = self.outputPlinkPath
+
+        print( "|--Executing native epistasis engine...")
+
+        engine = NativeEpistasisEngine( memory_goal = self.get_engine_memory_goal(), set_b_block_size = self.setBBlockSize)
+        pair_count = engine.run( os.path.join( self.outputPlinkPath, geno_epistasis), pheno_epistasis, snp_set_epistasis,
+                                 os.path.join( working_path, geno_epistasis + FastEpistasisWrapper.RESULT_FILE_SUMMARY_EXTENSION))
+        Logger.get_instance().info( "  " + str( pair_count) + " pairs of SNPs tested")
+
+    #
+    # Return the memory goal of each execution of the native engine: the shards executed concurrently share the memory goal
+    #
+    # @return int - the memory goal (in bytes) of an execution of the native engine
+    def get_engine_memory_goal(self):
+
+        memory_goal = self.memoryGoal if self.memoryGoal != None else NativeEpistasisEngine.MEMORY_GOAL
+        if self.shardIndex == None:
+            memory_goal //= self.shardCount
+
+        return memory_goal
+
+    #
+    # Execute all the shards concurrently in a pool of processes and merge their summaries
+    # The log records of the shard processes are sent to the main process through a queue and written directly by the
+    # handlers of its Logger (the buffered handlers in queue mode). The background thread of the Logger is paused while
+    # the processes are forked, and the thread reading the records of the shards is started once they are forked, so that
+    # no process inherits a lock held by a thread of the main process.
+    #
+    # @param geno_epistasis : string - the name of the genotype files in the plink folder (with no extension)
+    # @param pheno_epistasis : string - the path to the phenotype file
+    # @param result_file_path : string - the path to the merged summary file
+    #
+    def execute_shards(self, geno_epistasis, pheno_epistasis, result_file_path):
+
+        print( "|--Executing " + str( self.shardCount) + " shards...")
+
+        logger = Logger.get_instance()
+        record_queue = multiprocessing.Queue()
+        record_listener = QueueListener( record_queue, *logger.get_record_handlers())
+        logger.pause_listener()
+        try:
+            pool = multiprocessing.Pool( self.shardCount, initializer = initialize_shard_process, initargs = ( record_queue,))
+            record_listener.start()
+            try:
+                summary_file_paths = pool.map( execute_shard_process, [ ( self, shard_index, geno_epistasis, pheno_epistasis) for shard_index in range( self.shardCount)])
+            finally:
+                pool.close()
+                pool.join()
+                record_listener.stop()
+        finally:
+            logger.resume_listener()
+
+        print( "|--Merging shard summaries...")
+        EpistasisShards.merge_summaries( self.setFileName, summary_file_paths, result_file_path)
+
+    #
+    # Execute a shard: test SET_A against the chunk of SET_B of the shard, in a folder of the shard
+    # For the FastEpistasis tools, the genotype of the shard is reduced to the SNPs of SET_A and of the chunk.
+    #
+    # @param shard_index : int - the index of the shard
+    # @param geno_epistasis : string - the name of the genotype files in the plink folder (with no extension)
+    # @param pheno_epistasis : string - the path to the phenotype file
     #
-    # @param outfile : File - the file where the output of the used shell command will be written
+    # @return string - the path to the summary file of the shard
+    # @raise ProcessException : if a command fails
+    def execute_shard(self, shard_index, geno_epistasis, pheno_epistasis):
+
+        shard_path = os.path.join( self.outputPlinkPath, FastEpistasisWrapper.SHARD_FOLDER_PREFIX + str( shard_index))
+        if not os.path.isdir( shard_path):
+            os.mkdir( shard_path, 0777)
+
+        shard_set_file = os.path.join( shard_path, os.path.basename( self.setFileName))
+        set_a, shard_snps = EpistasisShards.write_shard_set_file( self.setFileName, shard_set_file, self.shardCount, shard_index)
+        Logger.get_instance().info( "  Shard " + str( shard_index) + " : " + str( len( set_a)) + " SET_A SNPs against " + str( len( shard_snps)) + " SET_B SNPs")
+
+        if self.engine == FastEpistasisWrapper.NATIVE_ENGINE:
+            self.execute_native_engine( geno_epistasis, pheno_epistasis, shard_set_file, shard_path)
+        else:
+            PlinkBedFile( os.path.join( self.outputPlinkPath, geno_epistasis)).subset( os.path.join( shard_path, geno_epistasis), extract_snps = set( set_a) | set( shard_snps))
+            shard_pheno_epistasis = os.path.join( shard_path, os.path.basename( pheno_epistasis))
+            FileStaging.stage_file( pheno_epistasis, shard_pheno_epistasis)
+            with open( os.path.join( shard_path, self.logFileName), "wb") as shard_outfile:
+                self.execute_fastepistasis( geno_epistasis, shard_pheno_epistasis, shard_set_file, shard_outfile, shard_path)
+
+        return os.path.join( shard_path, geno_epistasis + FastEpistasisWrapper.RESULT_FILE_SUMMARY_EXTENSION)
+
     #
-    def build_family_genotype(self, outfile):
-
-        # Create the ped file from the DGRP and families file
-        command = "cd " + self.outputPlinkPath + \
-                    ";plink --noweb --recode" + \
-                    " --bfile "+ os.path.basename( self.dgrpFile) +\
-                    " --keep " + os.path.basename( self.families) + \
-                    " --extract " + os.path.basename( self.snpKeptFileName) + \
-                    " --out " + self.genotypeFileName + \
-                    " > my_plink.out"
-                    
-        self.launch_command( command, outfile)
+    # Build the bed, bim and fam files required by FastEpistasis starting from the global GDRP file and
+    # keeping only the desired families and SNPs
+    #
+    def build_family_genotype(self):
+
+        plink_out_file = "bed." + self.genotypeFileName
+
+        # Extract the genotype of the families and SNPs from the DGRP binary genotype
+        keep_individuals = set( PlinkBedFile.read_individuals( self.families))
+        extract_snps = PlinkBedFile.read_snp_ids( self.snpKeptFileName)
+        PlinkBedFile( self.dgrpFile).subset( os.path.join( self.outputPlinkPath, plink_out_file),
+                                             keep_individuals = keep_individuals, extract_snps = extract_snps)
+        
+        # -- the files produced are the files to use
+        self.genotypeFileName = plink_out_file
+        Logger.get_instance().info( "  Bed file generated")
     
     #
     # Check if the phenotype file has the family and individuals classified in the same order
@@ -236,16 +385,12 @@ class FastEpistasisWrapper:
     # 
     def check_phenotype_file(self):
         
-        # Read the genotype data file
-        geno_csv_path = os.path.join( self.outputPlinkPath, self.genotypeFileName + ".ped")
-        Logger.get_instance().info( "Reading filtered genotype file : " + geno_csv_path)
-        geno_csv_file = open( geno_csv_path)
-        geno_reader = csv.reader( geno_csv_file, delimiter=' ', quoting=csv.QUOTE_NONE)
+        # Read the genotype fam file
+        geno_fam_path = os.path.join( self.outputPlinkPath, self.genotypeFileName + PlinkBedFile.FAM_EXTENSION)
+        Logger.get_instance().info( "Reading filtered genotype file : " + geno_fam_path)
         
-        # Get the list of family names with the order in the .ped file
-        family_names = []
-        for row in geno_reader:
-            family_names.append( self.getKey( row[0], row[1]))
+        # Get the list of family names with the order in the .fam file
+        family_names = [ self.getKey( fid, iid) for fid, iid in PlinkBedFile.read_individuals( geno_fam_path)]
         
         # Read the phenotype data file
         Logger.get_instance().info( "Reading phenotype file : " + self.phenotypeFileName)
@@ -295,6 +440,8 @@ class FastEpistasisWrapper:
             Logger.get_instance().info( "Writing ordered phenotype file...")
             try:
                 # Produce the name of the ordered file and open it
+                # (the file staged at this path by a previous execution is removed, so that its source is not overwritten)
+                FileStaging.remove_staged_file( ordered_filepath)
                 ordered_file = open( ordered_filepath, "w")
                 # Write the headers
                 if missing_headers:
@@ -309,7 +456,7 @@ class FastEpistasisWrapper:
             except KeyError:
                 raise Exception( "ERROR : A family name does not exist in phenotype data but is present in genotype data:" + family_name)
         else:
-            copyfile( self.phenotypeFileName, ordered_filepath)
+            FileStaging.stage_file( self.phenotypeFileName, ordered_filepath)
     
         # Replace the original phenotype file by the ordered one
         self.phenotypeFileName = ordered_filepath
@@ -328,17 +475,13 @@ class FastEpistasisWrapper:
     #
     # @param command : string - the command line to execute
     # @param outfile : file - the output file object
+    # @param cwd : string - the working directory of the command (None to keep the current one)
     #
-    def launch_command(self, command, outfile):
-        
-        Logger.get_instance().info( "  command = " + command)
+    # @return ProcessResult - the description of the command execution
+    # @raise ProcessException : if the command fails
+    def launch_command(self, command, outfile, cwd = None):
         
-        # -- run the command in a subprocess
-        gc.collect()
-        p = subprocess.Popen( command, shell=True, stdout=outfile, stderr=outfile)
-        while True:
-            if p.poll() != None:
-                break
+        return ProcessRunner.run( command, outfile, cwd = cwd)
     
 
     #
@@ -370,6 +513,27 @@ class FastEpistasisWrapper:
             return outfile_path
     	return None
             
+#
+# Initialize a process of the pool executing the shards: its log records are put in the queue read by the main process
+#
+# @param record_queue : multiprocessing.Queue - the queue of the log records
+#
+def initialize_shard_process( record_queue):
+
+    Logger.get_instance().forward_to_queue( record_queue)
+
+#
+# Execute a shard in a process of the pool (see FastEpistasisWrapper.execute_shard)
+#
+# @param arguments : tuple - the FastEpistasisWrapper, the index of the shard, the name of the genotype files and the path to the phenotype file
+#
+# @return string - the path to the summary file of the shard
+def execute_shard_process( arguments):
+
+    wrapper, shard_index, geno_epistasis, pheno_epistasis = arguments
+
+    return wrapper.execute_shard( shard_index, geno_epistasis, pheno_epistasis)
+
 # #######################
 # The main script
 # #######################
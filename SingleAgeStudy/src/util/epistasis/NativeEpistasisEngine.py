@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from scipy import stats
+
+from util.log.Logger import Logger
+from util.plink.PlinkBedFile import PlinkBedFile
+from util.gwas.GwasBackend import GwasBackend
+
+# In-process alternative to preFastEpistasis/smpFastEpistasis: NumPy implementation of the pairwise epistasis
+# test of a quantitative phenotype between the SNPs of SET_A and the SNPs of SET_B
+#
+# Each pair of SNPs (a, b) is tested with the linear model y = b0 + b1.a + b2.b + b3.a.b + e fitted on the
+# individuals having a phenotype value and both genotypes, the statistic being the Wald chi-square
+# (b3 / se(b3))^2 of the interaction term with 1 degree of freedom.
+#
+# - The genotypes of the SNPs of both sets are read once from the .bed file as an int8 matrix of allele counts
+#   (see PlinkBedFile.read_genotype_counts)
+# - The SNPs are centered (missing genotypes set to 0) and the phenotype is centered, then, for a block of SET_A SNPs
+#   and a block of SET_B SNPs, all the sums required by the model of all the pairs of the blocks are obtained with a
+#   single matrix product:
+#       [ Ma, A, A^2, A.y, Ma.y, Ma.y^2]^T . [ Mb, B, B^2]
+#   where M are the indicators of the non-missing genotypes. The interaction term is then tested for all the pairs
+#   of the blocks at once by projecting a.b, y and their cross-products out of (1, a, b) (Frisch-Waugh).
+#   The pairs whose interaction term is collinear to the main effects (e.g. a SNP tested with itself or with a SNP
+#   in complete linkage on the tested lines) are not counted.
+# - The block of SET_B SNPs is sized from a memory goal, so that the matrix products are large and executed by BLAS
+#   (the number of BLAS threads is controlled by the OMP_NUM_THREADS / OPENBLAS_NUM_THREADS / MKL_NUM_THREADS
+#   environment variables).
+#
+# As with "smpFastEpistasis --epi1 0.0", only the summary of the tests is written (.epi.qt.lm.summary): for each SNP
+# of SET_A, the number of significant tests (p-value < summary_threshold), the number of tests, their proportion, and
+# the best chi-square with the SET_B SNP giving it (NO_PARTNER as chromosome and SNP if no test has a positive chi-square).
+
+class NativeEpistasisEngine(object):
+
+    SET_A_START = "SET_A"
+    SET_B_START = "SET_B"
+    SET_END = "END"
+
+    # Phenotype value of the individuals with no measure (as in plink)
+    MISSING_PHENOTYPE = -9.0
+
+    # p-value under which a test is counted as significant in the summary (as the default --epi2 of plink)
+    SUMMARY_THRESHOLD = 0.01
+
+    # Memory (in bytes) targeted by the arrays of a pair of blocks
+    MEMORY_GOAL = 512 * 1024 * 1024
+    SET_A_BLOCK_SIZE = 1024
+    MIN_BLOCK_SIZE = 16
+
+    # Number of float arrays of the size of the SNP block allocated for each SNP of SET_A and SET_B,
+    # and number of float arrays of the size of the pair block allocated at the same time while testing it
+    SET_A_ARRAY_COUNT = 6
+    SET_B_ARRAY_COUNT = 3
+    PAIR_ARRAY_COUNT = 36
+
+    # Relative tolerance under which a variable is considered as collinear to the other variables of the model
+    COLLINEARITY_TOLERANCE = 1e-8
+
+    # Number of parameters of the model of a pair
+    MODEL_PARAMETER_COUNT = 4
+
+    SUMMARY_HEADERS = [ "CHR", "SNP", "N_SIG", "N_TOT", "PROP", "CHISQ", "CHR", "SNP"]
+    SUMMARY_HEADER_FORMAT = "%4s %12s %8s %8s %8s %12s %4s %12s\n"
+    SUMMARY_ROW_FORMAT = "%4s %12s %8d %8d %8.4g %12.4g %4s %12s\n"
+
+    # Chromosome and SNP written as best partner of the SNPs with no positive chi-square (read as missing values by pandas)
+    NO_PARTNER = "NA"
+
+    #
+    # Instantiate the engine
+    #
+    # @param memory_goal : int - the memory (in bytes) targeted by the arrays of a pair of blocks (None for the default)
+    # @param set_a_block_size : int - the number of SET_A SNPs tested at once (None for the default)
+    # @param set_b_block_size : int - the number of SET_B SNPs tested at once (None to compute it from the memory goal)
+    # @param summary_threshold : float - the p-value under which a test is counted as significant (None for the default)
+    #
+    def __init__(self, memory_goal = None, set_a_block_size = None, set_b_block_size = None, summary_threshold = None):
+
+        self.memoryGoal = memory_goal if memory_goal != None else NativeEpistasisEngine.MEMORY_GOAL
+        self.setABlockSize = set_a_block_size if set_a_block_size != None else NativeEpistasisEngine.SET_A_BLOCK_SIZE
+        self.setBBlockSize = set_b_block_size
+        self.summaryThreshold = summary_threshold if summary_threshold != None else NativeEpistasisEngine.SUMMARY_THRESHOLD
+
+    #
+    # Test all the pairs of SNPs of SET_A and SET_B and write the summary of the tests
+    #
+    # @param genotype_prefix : string - the path to the .bed, .bim and .fam files (name with no extension)
+    # @param phenotype_file_name : string - the path to the phenotype file (family ID, individual ID and value, optional header)
+    # @param set_file_name : string - the path to the file describing SET_A and SET_B
+    # @param summary_file_path : string - the path to the .epi.qt.lm.summary file to write
+    #
+    # @return int - the number of pairs tested
+    def run(self, genotype_prefix, phenotype_file_name, set_file_name, summary_file_path):
+
+        genotype = PlinkBedFile( genotype_prefix)
+
+        # Get the individuals having a phenotype value and the centered phenotype
+        sample_index, phenotype = self.read_phenotype( genotype.get_individuals(), phenotype_file_name)
+
+        # Get the genotypes of the SNPs of the sets
+        snp_table = genotype.get_snp_table()
+        set_a, set_b = NativeEpistasisEngine.read_snp_sets( set_file_name)
+        set_a_index = self.get_snp_indexes( snp_table, set_a, NativeEpistasisEngine.SET_A_START)
+        set_b_index = self.get_snp_indexes( snp_table, set_b, NativeEpistasisEngine.SET_B_START)
+        set_a_counts = genotype.read_genotype_counts( set_a_index, sample_index)
+        set_b_counts = genotype.read_genotype_counts( set_b_index, sample_index)
+
+        set_a_block_size, set_b_block_size = self.get_block_sizes( len( sample_index), len( set_a_index))
+        Logger.get_instance().info( "NativeEpistasisEngine : Testing " + str( len( set_a_index)) + " x " + str( len( set_b_index)) + " pairs of SNPs on " + str( len( sample_index)) +
+                                    " individuals by blocks of " + str( set_a_block_size) + " x " + str( set_b_block_size) + " pairs")
+
+        # Test the pairs by blocks, keeping for each SNP of SET_A the summary of its tests
+        significant_chisq = stats.chi2.isf( self.summaryThreshold, 1)
+        significant_counts = np.zeros( len( set_a_index), dtype = np.int64)
+        test_counts = np.zeros( len( set_a_index), dtype = np.int64)
+        best_chisq = np.zeros( len( set_a_index))
+        best_partners = np.full( len( set_a_index), -1, dtype = np.intp)
+        for a_start in range( 0, len( set_a_index), set_a_block_size):
+            a_end = min( a_start + set_a_block_size, len( set_a_index))
+            a_block = SnpBlock( set_a_counts[ :, a_start:a_end], phenotype)
+            a_matrix = a_block.get_left_matrix()
+            for b_start in range( 0, len( set_b_index), set_b_block_size):
+                b_end = min( b_start + set_b_block_size, len( set_b_index))
+                b_block = SnpBlock( set_b_counts[ :, b_start:b_end], phenotype)
+                chisq, tested = self.test_block( a_matrix, b_block.get_right_matrix(), a_end - a_start, b_end - b_start)
+                tested &= ( set_a_index[ a_start:a_end, np.newaxis] != set_b_index[ np.newaxis, b_start:b_end])
+                chisq[ ~tested] = 0.0
+
+                significant_counts[ a_start:a_end] += ( chisq > significant_chisq).sum( axis = 1)
+                test_counts[ a_start:a_end] += tested.sum( axis = 1)
+                block_best = chisq.argmax( axis = 1)
+                block_best_chisq = chisq[ np.arange( a_end - a_start), block_best]
+                improved = block_best_chisq > best_chisq[ a_start:a_end]
+                best_chisq[ a_start:a_end][ improved] = block_best_chisq[ improved]
+                best_partners[ a_start:a_end][ improved] = b_start + block_best[ improved]
+            Logger.get_instance().debug( "NativeEpistasisEngine : %d SNPs of SET_A tested", a_end)
+
+        self.write_summary( summary_file_path, snp_table, set_a_index, set_b_index, significant_counts, test_counts, best_chisq, best_partners)
+
+        return int( test_counts.sum())
+
+    #
+    # Return the sizes of the blocks of SET_A and SET_B SNPs tested at once
+    #
+    # @param sample_count : int - the number of individuals
+    # @param set_a_count : int - the number of SNPs of SET_A
+    #
+    # @return tuple - the number of SET_A SNPs and the number of SET_B SNPs of a block
+    def get_block_sizes(self, sample_count, set_a_count):
+
+        set_a_block_size = max( 1, min( set_a_count, self.setABlockSize))
+        if self.setBBlockSize != None:
+            return ( set_a_block_size, max( 1, self.setBBlockSize))
+
+        available_memory = self.memoryGoal - 8 * NativeEpistasisEngine.SET_A_ARRAY_COUNT * sample_count * set_a_block_size
+        set_b_block_size = available_memory // ( 8 * ( NativeEpistasisEngine.SET_B_ARRAY_COUNT * sample_count + NativeEpistasisEngine.PAIR_ARRAY_COUNT * set_a_block_size))
+
+        return ( set_a_block_size, max( NativeEpistasisEngine.MIN_BLOCK_SIZE, int( set_b_block_size)))
+
+    #
+    # Read the phenotype of the individuals of the genotype
+    #
+    # @param individuals : list - the (family ID, individual ID) tuples of the genotype, in genotype order
+    # @param phenotype_file_name : string - the path to the phenotype file
+    #
+    # @return tuple - the indexes of the individuals having a phenotype value and their centered phenotype values
+    def read_phenotype(self, individuals, phenotype_file_name):
+
+        # The header line, if any, is read as an individual with no value
+        phenotype_values = GwasBackend.read_individual_values( phenotype_file_name)
+
+        sample_index = []
+        phenotype = []
+        for index, individual in enumerate( individuals):
+            value = phenotype_values.get( individual, [ np.nan])[ 0]
+            if np.isfinite( value) and value != NativeEpistasisEngine.MISSING_PHENOTYPE:
+                sample_index.append( index)
+                phenotype.append( value)
+        if len( sample_index) < len( individuals):
+            Logger.get_instance().info( "  " + str( len( individuals) - len( sample_index)) + " individuals of the genotype have no phenotype value")
+
+        phenotype = np.array( phenotype)
+
+        return ( np.array( sample_index, dtype = np.intp), phenotype - phenotype.mean())
+
+    #
+    # Return the indexes in the genotype of the SNPs of a set (the SNPs absent from the genotype are ignored)
+    #
+    # @param snp_table : pandas.DataFrame - the description of the SNPs of the genotype (see PlinkBedFile.get_snp_table)
+    # @param snp_ids : list - the IDs of the SNPs of the set
+    # @param set_name : string - the name of the set
+    #
+    # @return numpy.ndarray - the indexes of the SNPs, in set order
+    def get_snp_indexes(self, snp_table, snp_ids, set_name):
+
+        snp_positions = dict( ( snp_id, index) for index, snp_id in enumerate( snp_table[ "snp"].values))
+        snp_indexes = [ snp_positions[ snp_id] for snp_id in snp_ids if snp_id in snp_positions]
+        if len( snp_indexes) < len( snp_ids):
+            Logger.get_instance().warning( "NativeEpistasisEngine : " + str( len( snp_ids) - len( snp_indexes)) + " SNPs of " + set_name + " are not in the genotype")
+
+        return np.array( snp_indexes, dtype = np.intp)
+
+    #
+    # Test the interaction term of all the pairs of a block of SET_A SNPs and a block of SET_B SNPs
+    #
+    # @param a_matrix : numpy.ndarray - the left matrix of the SET_A block (see SnpBlock.get_left_matrix)
+    # @param b_matrix : numpy.ndarray - the right matrix of the SET_B block (see SnpBlock.get_right_matrix)
+    # @param a_count : int - the number of SNPs of the SET_A block
+    # @param b_count : int - the number of SNPs of the SET_B block
+    #
+    # @return tuple - the chi-square of each pair (a_count x b_count) and the indicators of the pairs actually tested
+    def test_block(self, a_matrix, b_matrix, a_count, b_count):
+
+        # Get the sums over the individuals having both genotypes
+        sums = a_matrix.T.dot( b_matrix)
+        def get_sum( left, right):
+            return sums[ left * a_count:( left + 1) * a_count, right * b_count:( right + 1) * b_count]
+        n = get_sum( 0, 0)
+        s_a, s_aa, s_ay, s_y, s_yy = get_sum( 1, 0), get_sum( 2, 0), get_sum( 3, 0), get_sum( 4, 0), get_sum( 5, 0)
+        s_b, s_bb, s_by = get_sum( 0, 1), get_sum( 0, 2), get_sum( 4, 1)
+        s_w, s_aw, s_bw, s_ww, s_wy = get_sum( 1, 1), get_sum( 2, 1), get_sum( 1, 2), get_sum( 2, 2), get_sum( 3, 1)
+
+        with np.errstate( divide = "ignore", invalid = "ignore"):
+            # Center the cross-products of the variables a, b, w = a.b and y on these individuals
+            c_aa = s_aa - s_a * s_a / n
+            c_bb = s_bb - s_b * s_b / n
+            c_ab = s_w - s_a * s_b / n
+            c_aw = s_aw - s_a * s_w / n
+            c_bw = s_bw - s_b * s_w / n
+            c_ww = s_ww - s_w * s_w / n
+            c_ay = s_ay - s_a * s_y / n
+            c_by = s_by - s_b * s_y / n
+            c_wy = s_wy - s_w * s_y / n
+            c_yy = s_yy - s_y * s_y / n
+
+            # Project w and y out of the main effects
+            determinant = c_aa * c_bb - c_ab * c_ab
+            residual_ww = c_ww - ( c_bb * c_aw * c_aw - 2.0 * c_ab * c_aw * c_bw + c_aa * c_bw * c_bw) / determinant
+            residual_wy = c_wy - ( c_bb * c_aw * c_ay - c_ab * ( c_aw * c_by + c_bw * c_ay) + c_aa * c_bw * c_by) / determinant
+            residual_yy = c_yy - ( c_bb * c_ay * c_ay - 2.0 * c_ab * c_ay * c_by + c_aa * c_by * c_by) / determinant
+
+            # Test the interaction term
+            dof = n - NativeEpistasisEngine.MODEL_PARAMETER_COUNT
+            residual_sum_squares = residual_yy - residual_wy * residual_wy / residual_ww
+            chisq = residual_wy * residual_wy / residual_ww / ( residual_sum_squares / dof)
+
+            tested = ( dof > 0) & ( determinant > NativeEpistasisEngine.COLLINEARITY_TOLERANCE * c_aa * c_bb) \
+                     & ( residual_ww > NativeEpistasisEngine.COLLINEARITY_TOLERANCE * c_ww) & ( residual_sum_squares > 0) & np.isfinite( chisq)
+
+        return ( chisq, tested)
+
+    #
+    # Write the summary of the tests (one line per SNP of SET_A having at least one test)
+    #
+    # @param summary_file_path : string - the path to the summary file
+    # @param snp_table : pandas.DataFrame - the description of the SNPs of the genotype
+    # @param set_a_index : numpy.ndarray - the indexes of the SET_A SNPs
+    # @param set_b_index : numpy.ndarray - the indexes of the SET_B SNPs
+    # @param significant_counts : numpy.ndarray - the number of significant tests of each SET_A SNP
+    # @param test_counts : numpy.ndarray - the number of tests of each SET_A SNP
+    # @param best_chisq : numpy.ndarray - the best chi-square of each SET_A SNP
+    # @param best_partners : numpy.ndarray - the position in SET_B of the SNP giving the best chi-square of each SET_A SNP (-1 for no partner)
+    #
+    def write_summary(self, summary_file_path, snp_table, set_a_index, set_b_index, significant_counts, test_counts, best_chisq, best_partners):
+
+        chromosomes = snp_table[ "chromosome"].values
+        snp_ids = snp_table[ "snp"].values
+
+        with open( summary_file_path, "w") as summary_file:
+            summary_file.write( "Epistasis summary of " + str( len( set_a_index)) + " SET_A SNPs against " + str( len( set_b_index)) + " SET_B SNPs (p-value threshold " + str( self.summaryThreshold) + ")\n")
+            summary_file.write( NativeEpistasisEngine.SUMMARY_HEADER_FORMAT % tuple( NativeEpistasisEngine.SUMMARY_HEADERS))
+            summary_file.write( "\n")
+            for position, snp_index in enumerate( set_a_index):
+                if test_counts[ position] == 0:
+                    continue
+                if best_partners[ position] >= 0:
+                    partner_index = set_b_index[ best_partners[ position]]
+                    partner_chromosome, partner_id = chromosomes[ partner_index], snp_ids[ partner_index]
+                else:
+                    partner_chromosome, partner_id = NativeEpistasisEngine.NO_PARTNER, NativeEpistasisEngine.NO_PARTNER
+                summary_file.write( NativeEpistasisEngine.SUMMARY_ROW_FORMAT % ( chromosomes[ snp_index], snp_ids[ snp_index], significant_counts[ position], test_counts[ position],
+                                                                                 float( significant_counts[ position]) / test_counts[ position], best_chisq[ position],
+                                                                                 partner_chromosome, partner_id))
+
+        untested_count = ( test_counts == 0).sum()
+        if untested_count > 0:
+            Logger.get_instance().info( "  " + str( untested_count) + " SNPs of SET_A have no testable pair and are not in the summary")
+
+    #
+    # Read the SNP IDs of SET_A and SET_B from a set file (each set starts with a line "SET_A" or "SET_B",
+    # followed by one SNP ID per line, and ends with a line "END")
+    #
+    # @param set_file_name : string - the path to the set file
+    #
+    # @return tuple - the list of SNP IDs of SET_A and the list of SNP IDs of SET_B, in file order
+    @staticmethod
+    def read_snp_sets( set_file_name):
+
+        snp_sets = { NativeEpistasisEngine.SET_A_START: [], NativeEpistasisEngine.SET_B_START: []}
+        current_set = None
+        with open( set_file_name) as set_file:
+            for line in set_file:
+                token = line.strip()
+                if token in snp_sets:
+                    current_set = snp_sets[ token]
+                elif token == NativeEpistasisEngine.SET_END:
+                    current_set = None
+                elif token != "" and current_set is not None:
+                    current_set.append( token)
+
+        return ( snp_sets[ NativeEpistasisEngine.SET_A_START], snp_sets[ NativeEpistasisEngine.SET_B_START])
+
+
+# Centered genotypes of a block of SNPs, with the matrices giving the sums of the pairwise model by matrix product
+
+class SnpBlock(object):
+
+    #
+    # Center the genotypes of a block of SNPs
+    #
+    # @param counts : numpy.ndarray - the int8 allele counts (one row per individual, one column per SNP, negative for missing genotypes)
+    # @param phenotype : numpy.ndarray - the centered phenotype values of the individuals
+    #
+    def __init__(self, counts, phenotype):
+
+        self.mask = ( counts >= 0).astype( np.float64)
+        values = counts.astype( np.float64) * self.mask
+        means = values.sum( axis = 0) / np.maximum( self.mask.sum( axis = 0), 1.0)
+        self.values = ( values - means) * self.mask
+        self.phenotype = phenotype[ :, np.newaxis]
+
+    #
+    # Return the matrix of the block used as left operand: [ M, X, X^2, X.y, M.y, M.y^2]
+    #
+    # @return numpy.ndarray - the N x 6B matrix
+    def get_left_matrix(self):
+
+        return np.hstack( [ self.mask, self.values, self.values * self.values, self.values * self.phenotype,
+                            self.mask * self.phenotype, self.mask * ( self.phenotype * self.phenotype)])
+
+    #
+    # Return the matrix of the block used as right operand: [ M, X, X^2]
+    #
+    # @return numpy.ndarray - the N x 3B matrix
+    def get_right_matrix(self):
+
+        return np.hstack( [ self.mask, self.values, self.values * self.values])
@@ -13,5 +13,5 @@ class FileFormatException(SNPnetException):
     #
     #    @param message : a message describing in which context the exception happened.
     def __init__ (self, message):
-        super( MeanException, self).__init__( message, "")
+        super( FileFormatException, self).__init__( message, "")
 
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+from util.exception.SNPnetException import SNPnetException
+
+## Class ProcessException
+#  ======================
+#
+# Exception raised when an external command (plink, preFastEpistasis,
+# smpFastEpistasis...) fails, either because it returned a non-zero
+# exit code or because it exceeded its allowed execution time.
+class ProcessException(SNPnetException):
+    ##  Constructor of ProcessException
+    #  -------------------------------
+    #
+    #    @param message : a message describing in which context the exception happened.
+    #    @param info : additional info (typically the tail of the command standard error).
+    def __init__ (self, message, info=''):
+        super( ProcessException, self).__init__( message, info)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+import os
+import errno
+import shutil
+
+from util.log.Logger import Logger
+from util.exception.SNPnetException import SNPnetException
+from util.plink.PlinkBedFile import PlinkBedFile
+
+# Staging of input files in a working folder without copying their content
+#
+# The tools requiring short paths (plink, FastEpistasis...) are executed in a working folder containing their input
+# files under short names. A file is staged by the first of these methods that succeeds:
+#   - hardlink : a new name of the same file (same file system only)
+#   - reflink : a copy-on-write clone of the file (file systems supporting the FICLONE ioctl, e.g. btrfs or xfs)
+#   - symlink : a symbolic link to the absolute path of the file
+#   - copy : a copy of the file content (with its modification time)
+# The target is always replaced (removed, then created), never written through, so that staging can not modify the
+# source file.
+#
+# A target already staged from the same source (same file, or same size and modification time) is kept, and each
+# staged target is verified to have the size of its source.
+
+class FileStaging(object):
+
+    HARDLINK = "hardlink"
+    REFLINK = "reflink"
+    SYMLINK = "symlink"
+    COPY = "copy"
+
+    # The default order of the staging methods
+    METHODS = [ HARDLINK, REFLINK, SYMLINK, COPY]
+
+    # The methods giving a target independent of the source path (the target stays valid if the source is removed)
+    INDEPENDENT_METHODS = [ HARDLINK, REFLINK, COPY]
+
+    # ioctl request cloning a file on Linux (FICLONE)
+    FICLONE_REQUEST = 0x40049409
+
+    #
+    # Stage a file at a target path
+    #
+    # @param source_path : string - the path to the file to stage
+    # @param target_path : string - the path where the file must be provided
+    # @param methods : list - the staging methods to try, in order (None for METHODS)
+    #
+    # @return string - the method used (None if the target was already staged)
+    # @raise SNPnetException : if no method can stage the file or the staged file does not match its source
+    @staticmethod
+    def stage_file( source_path, target_path, methods = None):
+
+        if methods == None:
+            methods = FileStaging.METHODS
+
+        if not os.path.isfile( source_path):
+            raise SNPnetException( "FileStaging.stage_file : The file to stage does not exist : " + source_path)
+        if FileStaging.is_staged( source_path, target_path):
+            return None
+
+        errors = []
+        for method in methods:
+            if os.path.lexists( target_path):
+                os.remove( target_path)
+            try:
+                FileStaging.stage_with_method( method, source_path, target_path)
+            except ( OSError, IOError) as staging_error:
+                errors.append( method + ": " + str( staging_error))
+                continue
+
+            if os.path.getsize( target_path) != os.path.getsize( source_path):
+                raise SNPnetException( "FileStaging.stage_file : The staged file " + target_path + " has not the size of " + source_path)
+            Logger.get_instance().debug( "FileStaging.stage_file : %s staged to %s (%s)", source_path, target_path, method)
+            return method
+
+        if os.path.lexists( target_path):
+            os.remove( target_path)
+        raise SNPnetException( "FileStaging.stage_file : Unable to stage " + source_path + " to " + target_path + " (" + "; ".join( errors) + ")")
+
+    #
+    # Stage the .bed, .bim and .fam files of a PLINK genotype
+    #
+    # @param source_prefix : string - the path to the genotype files (name with no extension)
+    # @param target_prefix : string - the path to the staged genotype files (name with no extension)
+    # @param methods : list - the staging methods to try, in order (None for METHODS)
+    #
+    @staticmethod
+    def stage_genotype( source_prefix, target_prefix, methods = None):
+
+        for extension in [ PlinkBedFile.BED_EXTENSION, PlinkBedFile.BIM_EXTENSION, PlinkBedFile.FAM_EXTENSION]:
+            FileStaging.stage_file( source_prefix + extension, target_prefix + extension, methods)
+
+    #
+    # Remove the file staged at a path (if any) before a new file is written at this path,
+    # so that the source of a hard link is not written through
+    #
+    # @param target_path : string - the path to the target
+    #
+    @staticmethod
+    def remove_staged_file( target_path):
+
+        if os.path.lexists( target_path):
+            os.remove( target_path)
+
+    #
+    # Indicate if a target is already staged from a source: the target is the source file (hard link or
+    # symbolic link) or has its size and modification time (copy)
+    #
+    # @param source_path : string - the path to the source file
+    # @param target_path : string - the path to the target
+    #
+    # @return boolean
+    @staticmethod
+    def is_staged( source_path, target_path):
+
+        if not os.path.exists( target_path):
+            return False
+        if os.path.samefile( source_path, target_path):
+            return True
+
+        source_stat = os.stat( source_path)
+        target_stat = os.stat( target_path)
+
+        return target_stat.st_size == source_stat.st_size and int( target_stat.st_mtime) == int( source_stat.st_mtime)
+
+    #
+    # Stage a file with the given method (the target must not exist)
+    #
+    # @param method : string - the staging method (one of METHODS)
+    # @param source_path : string - the path to the source file
+    # @param target_path : string - the path to the target
+    #
+    # @raise OSError, IOError : if the method is not possible
+    @staticmethod
+    def stage_with_method( method, source_path, target_path):
+
+        if method == FileStaging.HARDLINK:
+            os.link( source_path, target_path)
+        elif method == FileStaging.REFLINK:
+            FileStaging.reflink( source_path, target_path)
+        elif method == FileStaging.SYMLINK:
+            os.symlink( os.path.abspath( source_path), target_path)
+        elif method == FileStaging.COPY:
+            shutil.copy2( source_path, target_path)
+        else:
+            raise ValueError( "FileStaging.stage_with_method : Unknown staging method '" + str( method) + "'")
+
+    #
+    # Clone a file with the FICLONE ioctl, keeping its modification time
+    #
+    # @param source_path : string - the path to the source file
+    # @param target_path : string - the path to the clone
+    #
+    # @raise IOError : if the file system does not support cloning
+    @staticmethod
+    def reflink( source_path, target_path):
+
+        try:
+            import fcntl
+        except ImportError:
+            raise IOError( errno.EOPNOTSUPP, "Reflink is not supported on this platform")
+
+        try:
+            with open( source_path, "rb") as source_file, open( target_path, "wb") as target_file:
+                fcntl.ioctl( target_file.fileno(), FileStaging.FICLONE_REQUEST, source_file.fileno())
+        except:
+            if os.path.lexists( target_path):
+                os.remove( target_path)
+            raise
+        shutil.copystat( source_path, target_path)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+from fastlmm.association import single_snp
+from pysnptools.snpreader import Bed
+from pysnptools.kernelreader import KernelData
+
+from util.log.Logger import Logger
+from util.plink.PlinkBedFile import PlinkBedFile
+from util.gwas.GwasBackend import GwasBackend
+from util.gwas.KinshipDecomposition import KinshipDecomposition
+
+# GWAS backend delegating the test to the Fast-LMM single_snp function (mode LMM(all), leave-out-one-chromosome)
+# https://github.com/MicrosoftGenomics/FaST-LMM/blob/master/doc/ipynb/FaST-LMM.ipynb
+#
+# If a shared kinship decomposition is provided, the leave-out-one-chromosome loop of single_snp is done here: the SNPs
+# of each chromosome are tested by single_snp with the similarity matrix of the other chromosomes given through its
+# public K0 argument (leave_out_one_chrom = False), so that Fast-LMM still computes the null model (kernel scaling,
+# mixing and heritability) itself. The results of the chromosomes are then combined as single_snp does (sorted by p-value).
+#
+# This backend does not stream: single_snp returns the complete result sorted by p-value, and it reads the phenotype,
+# the covariables and the genotype blocks of its GB_goal in memory. run_chunks (see GwasBackend) only slices this
+# complete result, so the peak memory of a GWAS is the one of single_snp plus the complete result, whatever the chunk
+# size. Use the native backend to bound the memory of the result.
+
+class FastLMMBackend(GwasBackend):
+
+    BYTES_PER_GB = 1024.0 * 1024 * 1024
+
+    #
+    # Return the name of the backend
+    #
+    def get_name(self):
+
+        return GwasBackend.FASTLMM_BACKEND
+
+    #
+    # Execute the GWAS with Fast-LMM
+    #
+    # @param genotype_prefix : string - the path to the .bed, .bim and .fam files (name with no extension)
+    # @param phenotype_file_name : string - the path to the phenotype file
+    # @param covariable_file_name : string - the path to the covariable file
+    # @param kinship_file_path : string - the path to the .npz file of the shared kinship decomposition (None to let Fast-LMM compute it)
+    #
+    # @return pandas.DataFrame - the result of the test of each SNP, sorted by p-value
+    def run(self, genotype_prefix, phenotype_file_name, covariable_file_name, kinship_file_path = None):
+
+        #-- Provide the shared kinship decomposition to Fast-LMM if possible
+        if kinship_file_path != None:
+            results_df = self.run_with_kinship( genotype_prefix, phenotype_file_name, covariable_file_name, kinship_file_path)
+            if results_df is not None:
+                return results_df
+
+        #-- execute the GWAS in mode LMM(all)
+        return single_snp( genotype_prefix, phenotype_file_name, covar = covariable_file_name, **self.get_memory_options())
+
+    #
+    # Return the memory goal of the backend as the GB_goal of single_snp, which sets the number of SNPs tested at once
+    #
+    # @return float - the memory goal in GB (None to let Fast-LMM test the SNPs by blocks of its default size)
+    def get_gb_goal(self):
+
+        if self.memoryGoal == None:
+            return None
+
+        return self.memoryGoal / FastLMMBackend.BYTES_PER_GB
+
+    #
+    # Return the memory options of single_snp: GB_goal is only given if a memory goal is set, so that Fast-LMM
+    # keeps its own default otherwise
+    #
+    # @return dict - the keyword arguments of single_snp
+    def get_memory_options(self):
+
+        if self.memoryGoal == None:
+            return {}
+
+        return { "GB_goal" : self.get_gb_goal()}
+
+    #
+    # Execute the GWAS with Fast-LMM, chromosome by chromosome, using the similarity matrices of the kinship decomposition
+    # shared by the phenotypes measured on the same families (computed and saved if it does not exist yet)
+    #
+    # @param genotype_prefix : string - the path to the .bed, .bim and .fam files (name with no extension)
+    # @param phenotype_file_name : string - the path to the phenotype file
+    # @param covariable_file_name : string - the path to the covariable file
+    # @param kinship_file_path : string - the path to the .npz file of the shared kinship decomposition
+    #
+    # @return pandas.DataFrame - the result of the test of each SNP, sorted by p-value, or None if the phenotype or covariable data do not allow to use the decomposition
+    def run_with_kinship(self, genotype_prefix, phenotype_file_name, covariable_file_name, kinship_file_path):
+
+        Logger.get_instance().info("\nPreparing the kinship decomposition...\n------------------------------")
+
+        decomposition = KinshipDecomposition.load_or_compute( kinship_file_path, genotype_prefix)
+
+        # Fast-LMM removes the individuals with missing values and computes the similarity matrix on the remaining ones,
+        # so the shared decomposition can only be used when all the individuals of the genotype have values
+        individuals = GwasBackend.get_complete_individuals( decomposition.get_individuals(), phenotype_file_name, covariable_file_name)[ 0]
+        if len( individuals) < len( decomposition.get_individuals()):
+            Logger.get_instance().warning( "FastLMMBackend.run_with_kinship : Missing phenotype or covariable values. The kinship decomposition is not used.")
+            return None
+
+        genotype = Bed( genotype_prefix)
+        snp_chromosomes = np.array( PlinkBedFile( genotype_prefix).get_snp_chromosomes())
+        kernel_iid = np.array( [ [ fid, iid] for fid, iid in decomposition.get_individuals()])
+
+        # Test the SNPs of each chromosome against the similarity matrix of the other chromosomes
+        chromosome_results = []
+        for chromosome in decomposition.get_chromosomes():
+            kernel = KernelData( iid = kernel_iid, val = decomposition.get_kernel( chromosome))
+            chromosome_results.append( single_snp( genotype[ :, snp_chromosomes == chromosome], phenotype_file_name, K0 = kernel,
+                                                   covar = covariable_file_name, leave_out_one_chrom = False, **self.get_memory_options()))
+            Logger.get_instance().info( "  Chromosome " + chromosome + " tested : h2 = " + str( chromosome_results[ -1][ "Nullh2"].iloc[ 0]))
+
+        results_df = pd.concat( chromosome_results)
+        results_df.sort_values( by = "PValue", inplace = True)
+        results_df.index = np.arange( len( results_df))
+
+        return results_df
@@ -1,41 +1,47 @@
 
 import os
-import gc
 import csv
-import subprocess
-from shutil import copyfile
-
-import pylab
-import pandas as pd
 
 # from util.cluster.ClusterData import ClusterData
 
-from fastlmm.association import single_snp
-import fastlmm.util.util as flutil
-from fastlmm.util.stats import plotp
-import logging
-
+from util import Constants
 from util.log.Logger import Logger
+from util.plink.PlinkBedFile import PlinkBedFile
+from util.plink.GenotypeCache import GenotypeCache
+from util.file.FileStaging import FileStaging
+from util.gwas.GwasBackend import GwasBackend
+from util.gwas.KinshipDecomposition import KinshipDecomposition
+from util.gwas.GwasResultWriter import GwasResultWriter
+from util.gwas.GwasPlot import GwasPlot, GwasPlotPoints
 
 # Execute Fast-LMM GWAS
 # https://github.com/MicrosoftGenomics/FaST-LMM/blob/master/doc/ipynb/FaST-LMM.ipynb
 #
-# - Requires for the genotype:
-#     - or a ped and a map files (default usage as plink will be used to generated required bed, bim and fam files) 
-#     - or a bed, a bim and a fam files (use the -x option to disable plink usage)
+# - Requires for the genotype a bed, a bim and a fam files (the DGRP global genotype). The genotype of the
+#   selected families is extracted from it in-process (see PlinkBedFile), without plink nor intermediate .ped file.
+#   If a genotype cache folder is provided, the genotype subsets are shared between the GWAS using the same families
+#   (see GenotypeCache)
+# - The GWAS itself is executed by a backend (see GwasBackend): the single_snp function of Fast-LMM (FastLMMBackend)
+#   or its NumPy implementation (NativeLMMBackend)
+# - If a kinship cache folder is provided, the eigendecomposition of the genetic similarity matrices is computed once
+#   per genotype subset and shared by all the phenotypes measured on the same families (see KinshipDecomposition).
 # - Requires a space separated file for the phenotype with three columns and no header : 
 #     column 1: family ID, column 2: Individual ID, column 3 phenotype value
 # - Requires a tab separated file for the covariate with at least three columns and no header :
 #     column 1: family ID, column 2: Individual ID, column 3 and next covariable values
 # 
-# Note: if plink is used (ped and map files provided), a validation of the order of the family/individuals in the genotype and
-# covariate files will also be done. If the order differ from the one in the ped file, new ordered files willbe produced for the genotype
+# Note: a validation of the order of the family/individuals in the phenotype and covariate files is done.
+# If the order differ from the one in the fam file, new ordered files will be produced for the phenotype
 # and covariates
 #
 # Outputs:
-# - A Manhattan plot
-# - A QQ-plot
-# - The complete result dataframe as csv file
+# - A Manhattan plot (see GwasPlot)
+# - A QQ-plot (see GwasPlot)
+# - The complete result dataframe as csv file, written by chunks of rows sorted by p-value (the native backend builds
+#   each chunk when it is written; the fastlmm backend keeps its complete result in memory, see FastLMMBackend)
+# - The significant SNPs (p-value < alpha) and the SNPs passing the additional significance filters
+#   (e.g. "1e-5" or "100th", see GwasResultWriter) as csv files, written in the same pass
+# - Optionally, the complete result as a columnar Parquet file sorted by p-value (see GwasResultTable)
 # Columns in the output are as follows:
 #  * SNP or Set The SNP or set identifier tested.
 #  * PValue The P value computed for the SNP tested.
@@ -55,11 +61,9 @@ from util.log.Logger import Logger
 #  * Alt_a2 See Alt_h2.
 #  * Null_h2 The value found in the null model, given by sigma3(h2*KC+1-h2)*I), where KC is the NxN matric to correct for confounding.
 #
-# To produce the genotype files in plink format (ped and map) from the DGRP complete file, use the following commands
-# plink --noweb --bfile dgrp2 --recode --out dgrp2
-# To produce the genotype files in plink format (ped and map) from the DGRP complete file with limitation on strains and SNPs, use the following commands
-# (selection_files.txt contains the list of SNP ids to keep, and selection_strains.txt contains the list of strains to keep (two columns file))
-# plink --noweb --bfile dgrp2 --recode --extract selection_file.txt --keep selected_strains.txt --out dgrp2_selected
+# The genotype subset produced is equivalent to the one produced by the following command
+# (selected_strains.txt contains the list of strains to keep (two columns file))
+# plink --noweb --bfile dgrp2 --keep selected_strains.txt --make-bed --out dgrp2_selected
 #
 
 class FastLMMWrapper:
@@ -68,7 +72,7 @@ class FastLMMWrapper:
     PHENOTYPE_FILE_INDIVIDUAL_HEADER = "iid"
     PHENOTYPE_FILE_ORDERED_EXTENSION = "_ordered"
     
-    RESULT_FILE_SIGNIFICANT_EXTENSION = "_signif"
+    KINSHIP_FILE_PREFIX = "kinship_"
     
     #
     # Instantiate the fastLMM object
@@ -76,20 +80,34 @@ class FastLMMWrapper:
     # @param phenotype_file_name : string - The name of the file containing the phenotype data
     # @param covariable_file_name : string - The name of the file containing the covariable definition
     # @param alpha : float - The significant level used to filter out the results.
-    # @param dgrp_file : string - the path to the genotype .ped and .map files (name with no extension)
+    # @param dgrp_file : string - the path to the genotype .bed, .bim and .fam files (name with no extension)
     # @param families : string - the path to the file containing th list of strain to use
     # @param output_path : string - the path to the output folder
     # @param log_path : string - the path to the log folder
+    # @param genotype_cache_path : string - the path to the folder of genotype subsets shared between GWAS (None to disable the cache)
+    # @param genotype_cache_max_size : int - the maximal size of the genotype cache in bytes (None for no limit)
+    # @param kinship_cache_path : string - the path to the folder of kinship decompositions shared between GWAS (None to compute them for each GWAS)
+    # @param gwas_backend : string - the name of the backend executing the GWAS (see GwasBackend.BACKEND_LIST)
+    # @param significance_suffix_list : list - the suffixes of the significance filters applied in addition to alpha (see GwasResultWriter, None for no other filter)
+    # @param columnar_result : boolean - True to also write the complete result in a columnar file (see GwasResultTable)
+    # @param memory_goal : int - the memory (in bytes) targeted by the blocks of SNPs tested at once by the backend (None for the default of the backend)
+    # @param log_queue_mode : boolean - True to write the log records on a background thread (see Logger), False to write them synchronously
+    # @param log_buffer_size : int - the number of log records buffered in queue mode (None for Constants.LOG_BUFFER_SIZE)
     #
-    def __init__(self, phenotype_file_name, covariable_file_name, alpha, dgrp_file, families, output_path, log_path):
+    def __init__(self, phenotype_file_name, covariable_file_name, alpha, dgrp_file, families, output_path, log_path, genotype_cache_path = None, genotype_cache_max_size = None, kinship_cache_path = None, gwas_backend = GwasBackend.FASTLMM_BACKEND, significance_suffix_list = None, columnar_result = False, memory_goal = None, log_queue_mode = False, log_buffer_size = None):
         
         self.phenotypeFileName = phenotype_file_name
         self.covariableFileName = covariable_file_name
         
         self.dgrpFile = dgrp_file
         self.families = families
+        self.genotypeCachePath = genotype_cache_path
+        self.genotypeCacheMaxSize = genotype_cache_max_size
+        self.kinshipCachePath = kinship_cache_path
         
         self.alpha = alpha
+        self.significanceSuffixList = significance_suffix_list
+        self.columnarResult = columnar_result
         self.outputPath = output_path
         self.outputPlinkPath = os.path.join( self.outputPath, "plink")
         self.genotypeFileName = "filtered_dgrp_" + os.path.splitext( os.path.basename( self.phenotypeFileName))[0]
@@ -98,26 +116,27 @@ class FastLMMWrapper:
             os.mkdir(self.outputPath, 0777)
         if not os.path.isdir( self.outputPlinkPath):
             os.mkdir(self.outputPlinkPath, 0777)
+        
+        self.gwasBackend = GwasBackend.get_backend( gwas_backend, self.outputPlinkPath, memory_goal)
             
         # Initialize the Logger
-        Logger.get_instance( os.path.join( log_path, "FastLMMWrapper_" + os.path.splitext( os.path.basename( self.phenotypeFileName))[0] +".log"))
+        Logger.get_instance( os.path.join( log_path, "FastLMMWrapper_" + os.path.splitext( os.path.basename( self.phenotypeFileName))[0] +".log"),
+                             queue_mode = log_queue_mode, buffer_size = log_buffer_size if log_buffer_size != None else Constants.LOG_BUFFER_SIZE)
     
     #
     # Execute the Fast-LMM GWAS
     #
-    # @param no_plink : boolean - True if the plink utility must not be run before execute Fast-LMM
-    def execute(self, no_plink = False):
-        
-        # Open the output file of execution log
-        outfile = open( os.path.join( self.outputPath, "FastLMM_analysis.log"), "wb")
+    # @param no_plink : boolean - True if the order of the phenotype and covariable files must not be checked against the genotype
+    # @param close_log : boolean - True if the log file must be closed at the end of the GWAS
+    def execute(self, no_plink = False, close_log = True):
         
         # If required build the suitable genotype file from global DGRP file
         if( self.dgrpFile != None and self.families != None):
             Logger.get_instance().info("\nBuilding the genotype file from DGRP global data...\n-----------------------------------------------------------")
-            self.build_family_genotype( outfile)
+            self.build_family_genotype()
         
         
-        # Check the phenotype file (if plink required because it means .ped file is present)
+        # Check the phenotype file
         if no_plink == False:
             try:
                 Logger.get_instance().info("\nChecking the phenotype file...\n------------------------------")
@@ -127,7 +146,7 @@ class FastLMMWrapper:
                 Logger.get_instance().error( str(e))
                 return
             
-        # Check the covariable file (if plink required because it means .ped file is present)
+        # Check the covariable file
         if no_plink == False:   
             try:
                 Logger.get_instance().info("\nChecking the covariable file...\n------------------------------")
@@ -136,29 +155,8 @@ class FastLMMWrapper:
                 Logger.get_instance().error( "An exception occurred while checking the covariable data file:")
                 Logger.get_instance().error( str(e))
                 return
-            
-        # Launch the plink utility to build the binary version of ped and map files if it does not exists
-        if no_plink == False:
-            Logger.get_instance().info( "\nGenerating Bed file of DGRP SNP information...\n------------------------------")
-            plink_out_file = os.path.join( self.outputPlinkPath, "FastLMM.data." + self.genotypeFileName)
-            # -- Check if a previous Bed file exists in order to remove it before creating the new one
-            if os.path.isfile( plink_out_file + ".bed"):
-                try:
-                    os.remove( plink_out_file)
-                except:
-                    Logger.get_instance().error( "ERROR: Unable to remove DGRP Bed file : " + plink_out_file + ".bed")
-                    Logger.get_instance().error( "       check if Bed file was updated.")
-            else:
-                Logger.get_instance().info("No previous bed file found")
-            # -- build the plink command to generate the bed/map files and execute it
-            Logger.get_instance().info( "Generating bed file") 
-            plink_command = "plink --noweb --file " + os.path.join( self.outputPlinkPath, self.genotypeFileName) + " --make-bed --out " + plink_out_file
-            self.launch_command( plink_command, outfile)
-            # -- the files produced by plink are the files to use 
-            self.genotypeFileName = plink_out_file
-            Logger.get_instance().info( "  Bed file generated")
         else:
-            Logger.get_instance().info( "\nBypassing plink execution on genotype data\n--------------------------------------------")
+            Logger.get_instance().info( "\nBypassing checks of phenotype and covariable files\n--------------------------------------------")
         
         # Show the cluster of genotypes using the bed file
 #         gsm_fig_path = self.genotypeFileName + "_gsm.png"
@@ -175,9 +173,20 @@ class FastLMMWrapper:
         Logger.get_instance().info(" Genotype = " + geno_gwas)
         Logger.get_instance().info(" Phenotype = " + pheno_gwas)
         Logger.get_instance().info(" covariable = " + cov_gwas)
+        Logger.get_instance().info(" backend = " + self.gwasBackend.get_name())
+        # -- Write the result by chunks to the complete result file and to the significant result files,
+        #    keeping only the points required by the plots (see GwasPlotPoints)
+        result_file_path = os.path.join(  self.outputPath, os.path.splitext( os.path.basename( self.phenotypeFileName))[0] + "_GWASresults.txt")
+        plot_points = GwasPlotPoints()
         try:
             #-- execute the GWAS in mode LMM(all)
-            results_df = single_snp( geno_gwas, pheno_gwas, covar = cov_gwas)
+            result_writer = GwasResultWriter( result_file_path, self.alpha, self.significanceSuffixList, self.columnarResult)
+            try:
+                for chunk in self.gwasBackend.run_chunks( geno_gwas, pheno_gwas, cov_gwas, self.get_kinship_file_path()):
+                    result_writer.write_chunk( chunk)
+                    plot_points.add_chunk( chunk[ "Chr"].values, chunk[ "ChrPos"].values, chunk[ "PValue"].values)
+            finally:
+                result_writer.close()
         except Exception as e:
             Logger.get_instance().error( "ERROR: an exception occurred during Fast-LMM GWAS of '" + pheno_gwas, "' on genotype '" + geno_gwas + "' with covariable '" + cov_gwas + "'")
             Logger.get_instance().error( "  error is : " + str( e))
@@ -186,54 +195,74 @@ class FastLMMWrapper:
             Logger.get_instance().error( "ERROR: an error occurred during Fast-LMM GWAS of '" + pheno_gwas, "' on genotype '" + geno_gwas + "' with covariable '" + cov_gwas + "'")
             Logger.get_instance().error( "  error is : " + str( e))
             return
+        Logger.get_instance().info( "|--Result file created : " + result_file_path)
         
         # Generating the analysis results
-        
         # -- Plot the Manhattan plot of the result
-        chromosome_starts = flutil.manhattan_plot(results_df.as_matrix(["Chr", "ChrPos", "PValue"]),pvalue_line=1e-5,xaxis_unit_bp=False)
         manathan_plot_filename = os.path.join( self.outputPath, os.path.splitext( os.path.basename( self.phenotypeFileName))[0] + "_manathanPlot.png")
         Logger.get_instance().info( "|--Saving Manhattan plot in" + manathan_plot_filename) 
-        pylab.savefig( fname = manathan_plot_filename, format = "png")
+        GwasPlot.manhattan_plot( plot_points, manathan_plot_filename)
         Logger.get_instance().info("|--Manhattan plot saved.")
         
         # -- Plot the QQ-plot
-        fighandle, qnull, qemp = plotp.qqplot( results_df["PValue"].values)
         qqplot_plot_filename = os.path.join( self.outputPath, os.path.splitext( os.path.basename( self.phenotypeFileName))[0] + "_QQPlot.png")
         Logger.get_instance().info( "|--Saving QQplot in" + qqplot_plot_filename) 
-        pylab.savefig( fname = qqplot_plot_filename, format = "png")
-        pd.set_option('display.width', 1000)
-        Logger.get_instance().info("|--QQplot saved.")
-        
-        # -- Save the complete result to file
-        result_file_path = os.path.join(  self.outputPath, os.path.splitext( os.path.basename( self.phenotypeFileName))[0] + "_GWASresults.txt")
-        results_df.to_csv( result_file_path, sep='\t', index= False)
-        Logger.get_instance().info( "|--Result file created : " + result_file_path)
-        
-        # -- Filter the significant results to a new file
-        signif_result_path = self.filterSignificantSNP( result_file_path)
-        Logger.get_instance().info( "|--Significant result file created:" + signif_result_path)
+        lambda_gc = GwasPlot.qq_plot( plot_points, qqplot_plot_filename)
+        Logger.get_instance().info("|--QQplot saved (lambda=%1.4f)." % lambda_gc)
         
         Logger.get_instance().info( "\nFinished.\n")
         
         # Close log file
-        Logger.get_instance().close()
+        if close_log:
+            Logger.get_instance().close()
     
     
     #
-    # Build the plink files required by the fast-LMM starting from the global GDRP file and
+    # Build the bed, bim and fam files required by the fast-LMM starting from the global GDRP file and
     # keeping only the desired families
     #
-    # @param outfile : File - the file where the output of the used shell command will be written
-    #
-    def build_family_genotype(self, outfile):
+    def build_family_genotype(self):
 
-        # Create the ped file from the DGRP and families file
-        command = "plink --noweb --recode" + \
-                    " --bfile "+ self.dgrpFile +\
-                    " --keep " + self.families + \
-                    " --out " + os.path.join( self.outputPlinkPath, self.genotypeFileName)
-                    
-        self.launch_command( command, outfile)
+        plink_out_file = os.path.join( self.outputPlinkPath, "FastLMM.data." + self.genotypeFileName)
+
+        # Extract the genotype of the families from the DGRP binary genotype
+        # (through the genotype cache if it is enabled)
+        keep_individuals = set( PlinkBedFile.read_individuals( self.families))
+        if self.genotypeCachePath != None:
+            genotype_cache = GenotypeCache( self.genotypeCachePath, max_size = self.genotypeCacheMaxSize)
+            genotype_cache.get_genotype( self.dgrpFile, plink_out_file, keep_individuals = keep_individuals)
+        else:
+            PlinkBedFile( self.dgrpFile).subset( plink_out_file, keep_individuals = keep_individuals)
+        
+        # -- the files produced are the files to use
+        self.genotypeFileName = plink_out_file
+        Logger.get_instance().info( "  Bed file generated")
+    
+    #
+    # Return the path to the file of the kinship decomposition shared by the GWAS using the same genotype subset
+    #
+    # @return string - the path to the .npz file or None if the kinship cache is disabled
+    def get_kinship_file_path(self):
+        
+        if self.kinshipCachePath == None:
+            return None
+        
+        if self.dgrpFile != None and self.families != None:
+            kinship_key = GenotypeCache.compute_key( self.dgrpFile, set( PlinkBedFile.read_individuals( self.families)), None)
+        else:
+            kinship_key = GenotypeCache.compute_key( self.genotypeFileName, None, None)
+        
+        return os.path.join( self.kinshipCachePath, FastLMMWrapper.KINSHIP_FILE_PREFIX + kinship_key + KinshipDecomposition.NPZ_EXTENSION)
+    
+    #
+    # Return the list of family keys in the order of the genotype fam file
+    #
+    def get_genotype_family_names(self):
+        
+        geno_fam_path = self.genotypeFileName + PlinkBedFile.FAM_EXTENSION
+        Logger.get_instance().info( "Reading filtered genotype file : " + geno_fam_path)
+        
+        return [ self.getKey( fid, iid) for fid, iid in PlinkBedFile.read_individuals( geno_fam_path)]
     
     #
     # Check if the phenotype file has the family and individuals classified in the same order
@@ -241,16 +270,8 @@ class FastLMMWrapper:
     # 
     def check_phenotype_file(self):
         
-        # Read the genotype data file
-        geno_csv_path = os.path.join( self.outputPlinkPath, self.genotypeFileName + ".ped")
-        Logger.get_instance().info( "Reading filtered genotype file : " + geno_csv_path)
-        geno_csv_file = open( geno_csv_path)
-        geno_reader = csv.reader( geno_csv_file, delimiter=' ', quoting=csv.QUOTE_NONE)
-        
-        # Get the list of family names with the order in the .ped file
-        family_names = []
-        for row in geno_reader:
-            family_names.append( self.getKey( row[0], row[1]))
+        # Get the list of family names with the order in the genotype .fam file
+        family_names = self.get_genotype_family_names()
         
         # Read the phenotype data file
         Logger.get_instance().info( "Reading phenotype file : " + self.phenotypeFileName)
@@ -291,6 +312,8 @@ class FastLMMWrapper:
             Logger.get_instance().info( "Writing ordered phenotype file...")
             try:
                 # Produce the name of the ordered file and open it
+                # (the file staged at this path by a previous execution is removed, so that its source is not overwritten)
+                FileStaging.remove_staged_file( ordered_filepath)
                 ordered_file = open( ordered_filepath, "w")
                 # Write the headers
                 #ordered_file.write( " ".join( headers) + "\n")
@@ -304,7 +327,7 @@ class FastLMMWrapper:
             except KeyError:
                 raise Exception( "ERROR : A family name does not exist in phenotype data but is present in genotype data:" + family_name)
         else:
-            copyfile( self.phenotypeFileName, ordered_filepath)
+            FileStaging.stage_file( self.phenotypeFileName, ordered_filepath)
     
         # Replace the original phenotype file by the ordered one
         self.phenotypeFileName = ordered_filepath
@@ -317,15 +340,8 @@ class FastLMMWrapper:
     #
     def check_covariable_file( self):
         
-        # Read the genotype data file
-        Logger.get_instance().info( "Reading genotype file : " + self.genotypeFileName)
-        geno_csv_file = open( os.path.join( self.outputPlinkPath, self.genotypeFileName + ".ped"))
-        geno_reader = csv.reader( geno_csv_file, delimiter=' ', quoting=csv.QUOTE_NONE)
-        
-        # Get the list of family names with the order in the .ped file
-        family_names = []
-        for row in geno_reader:
-            family_names.append( self.getKey( row[0], row[1]))
+        # Get the list of family names with the order in the genotype .fam file
+        family_names = self.get_genotype_family_names()
         
         # Read the covariable data file
         Logger.get_instance().info( "Reading covariable file : " + self.covariableFileName)
@@ -362,6 +378,8 @@ class FastLMMWrapper:
             Logger.get_instance().info( "Writing ordered covariable file...")
             try:
                 # Produce the name of the ordered file and open it
+                # (the file staged at this path by a previous execution is removed, so that its source is not overwritten)
+                FileStaging.remove_staged_file( ordered_filepath)
                 ordered_file = open( ordered_filepath, "w")
                 # Add the phenotype information ordered by family like genotype file
                 for family_name in family_names:
@@ -373,69 +391,15 @@ class FastLMMWrapper:
             except KeyError:
                 raise Exception( "ERROR : A family name does not exist in covariable data but is present in genotype data:" + family_name)
         else:
-            copyfile( self.covariableFileName, ordered_filepath)
+            FileStaging.stage_file( self.covariableFileName, ordered_filepath)
         
         # Replace the original covariable file by the ordered one
         self.covariableFileName = ordered_filepath
     
     
-    #
-    # Filter out the significant SNP from the whole result file and write them to a new file
-    #
-    # @param result_file_path : string -the path to the GWAS result file
-    # 
-    def filterSignificantSNP(self, result_file_path):
-        
-        header_line = ""
-        significant_lines = []
-        
-        with open( result_file_path) as result_file:
-            for line in result_file:
-                tokens = line.split( "\t")
-                try:
-                    pvalue = float( tokens[5])
-                    if( pvalue < self.alpha):
-                       significant_lines.append( line) 
-                except ValueError:
-                    header_line = line
-
-        signif_result_path = os.path.splitext( result_file_path)[0] + FastLMMWrapper.RESULT_FILE_SIGNIFICANT_EXTENSION + str(self.alpha) + ".txt"
-        output_file = open( signif_result_path, "w")
-        output_file.write( header_line)
-        for line in significant_lines:
-            output_file.write( line)
-            
-        output_file.close()
-        
-        return signif_result_path
-            
-                    
-    
-    
     #
     # Return a Key compsoed by the two given strings
     # 
     def getKey(self, string1, string2):
         
         return (str( string1) + ":" + str(string2))
-
-
-    #
-    # Launch the provided command line, redirecting the standard output and error to the given outfile
-    #
-    # @param command : string - the command line to execute
-    # @param outfile : file - the output file object
-    #
-    def launch_command(self, command, outfile):
-        
-        Logger.get_instance().info( "  command = " + command)
-        
-        # -- run the command in a subprocess
-        gc.collect()
-        p = subprocess.Popen( command, shell=True, stdout=outfile, stderr=outfile)
-        while True:
-            if p.poll() != None:
-                break
-    
-
-
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from util.log.Logger import Logger
+
+# Interface of the engines executing the single-SNP LMM GWAS for the FastLMMWrapper
+#
+# A backend receives the genotype (.bed, .bim and .fam files), the phenotype file and the covariable file of a GWAS
+# and returns a pandas DataFrame with one row per SNP, sorted by p-value, with the columns of the Fast-LMM single_snp
+# function (see RESULT_COLUMNS and FastLMMWrapper). The result can also be obtained as successive chunks of rows
+# sorted by p-value (see run_chunks), so that it can be written without building the complete DataFrame (only the
+# native backend builds the chunks this way; the fastlmm backend keeps its complete result in memory and slices it).
+#
+# The available backends are:
+#   - fastlmm : the single_snp function of the Fast-LMM package (see FastLMMBackend)
+#   - native : a NumPy implementation of the same model testing the SNPs by blocks (see NativeLMMBackend)
+#
+# Both backends use the eigendecomposition of the genetic similarity matrices shared between the phenotypes
+# measured on the same families if a kinship file is provided (see KinshipDecomposition).
+
+class GwasBackend(object):
+
+    FASTLMM_BACKEND = "fastlmm"
+    NATIVE_BACKEND = "native"
+    BACKEND_LIST = [ FASTLMM_BACKEND, NATIVE_BACKEND]
+
+    RESULT_COLUMNS = [ "sid_index", "SNP", "Chr", "GenDist", "ChrPos", "PValue", "SnpWeight", "SnpWeightSE", "SnpFractVarExpl", "Mixing", "Nullh2"]
+
+    # Number of rows of the result chunks
+    RESULT_CHUNK_SIZE = 100000
+
+    #
+    # Instantiate the backend
+    #
+    # @param working_path : string - the path to the folder where the backend can write its temporary files
+    # @param memory_goal : int - the memory (in bytes) targeted by the blocks of SNPs tested at once (None for the default of the backend)
+    #
+    def __init__(self, working_path, memory_goal = None):
+
+        self.workingPath = working_path
+        self.memoryGoal = memory_goal
+
+    #
+    # Return the name of the backend
+    #
+    def get_name(self):
+
+        raise NotImplementedError( "GwasBackend.get_name : Not implemented in " + self.__class__.__name__)
+
+    #
+    # Execute the GWAS
+    #
+    # @param genotype_prefix : string - the path to the .bed, .bim and .fam files (name with no extension)
+    # @param phenotype_file_name : string - the path to the phenotype file
+    # @param covariable_file_name : string - the path to the covariable file
+    # @param kinship_file_path : string - the path to the .npz file of the shared kinship decomposition (None if not shared)
+    #
+    # @return pandas.DataFrame - the result of the test of each SNP, sorted by p-value
+    def run(self, genotype_prefix, phenotype_file_name, covariable_file_name, kinship_file_path = None):
+
+        raise NotImplementedError( "GwasBackend.run : Not implemented in " + self.__class__.__name__)
+
+    #
+    # Execute the GWAS and return its result by chunks of rows
+    # By default, the result of run() is sliced, so the complete DataFrame is kept in memory while the chunks are
+    # used; backends able to build the chunks without the complete DataFrame override this method.
+    #
+    # @param genotype_prefix : string - the path to the .bed, .bim and .fam files (name with no extension)
+    # @param phenotype_file_name : string - the path to the phenotype file
+    # @param covariable_file_name : string - the path to the covariable file
+    # @param kinship_file_path : string - the path to the .npz file of the shared kinship decomposition (None if not shared)
+    # @param chunk_size : int - the number of rows of the chunks (None for RESULT_CHUNK_SIZE)
+    #
+    # @return generator - the pandas.DataFrame chunks of the result, sorted by p-value
+    def run_chunks(self, genotype_prefix, phenotype_file_name, covariable_file_name, kinship_file_path = None, chunk_size = None):
+
+        if chunk_size == None:
+            chunk_size = GwasBackend.RESULT_CHUNK_SIZE
+
+        results_df = self.run( genotype_prefix, phenotype_file_name, covariable_file_name, kinship_file_path)
+        for chunk_start in range( 0, len( results_df), chunk_size):
+            yield results_df.iloc[ chunk_start:chunk_start + chunk_size]
+
+    #
+    # Build the backend with the given name
+    #
+    # @param backend_name : string - the name of the backend (one of BACKEND_LIST)
+    # @param working_path : string - the path to the folder where the backend can write its temporary files
+    # @param memory_goal : int - the memory (in bytes) targeted by the blocks of SNPs tested at once (None for the default of the backend)
+    #
+    # @return GwasBackend
+    # @raise ValueError : if the backend name is unknown
+    @staticmethod
+    def get_backend( backend_name, working_path, memory_goal = None):
+
+        # The backends are imported only when used, so that the native backend does not require the Fast-LMM package
+        if backend_name == GwasBackend.FASTLMM_BACKEND:
+            from util.gwas.FastLMMBackend import FastLMMBackend
+            return FastLMMBackend( working_path, memory_goal)
+        elif backend_name == GwasBackend.NATIVE_BACKEND:
+            from util.gwas.NativeLMMBackend import NativeLMMBackend
+            return NativeLMMBackend( working_path, memory_goal)
+
+        raise ValueError( "GwasBackend.get_backend : Unknown GWAS backend '" + str( backend_name) + "'. Available backends are: " + ", ".join( GwasBackend.BACKEND_LIST))
+
+    #
+    # Read the values of a phenotype or covariable file (family ID, individual ID and values separated
+    # by spaces or tabs, no header)
+    #
+    # @param file_path : string - the path to the file
+    #
+    # @return dict - the values (list of floats, NaN for missing values) of each (family ID, individual ID) tuple
+    @staticmethod
+    def read_individual_values( file_path):
+
+        values = {}
+        with open( file_path) as values_file:
+            for line in values_file:
+                tokens = line.split()
+                if len( tokens) < 3:
+                    continue
+                individual_values = []
+                for token in tokens[ 2:]:
+                    try:
+                        individual_values.append( float( token))
+                    except ValueError:
+                        individual_values.append( np.nan)
+                values[ ( tokens[ 0], tokens[ 1])] = individual_values
+
+        return values
+
+    #
+    # Return the individuals of the genotype having all their phenotype and covariable values, in genotype order,
+    # with their values
+    #
+    # @param individuals : list - the (family ID, individual ID) tuples of the genotype, in genotype order
+    # @param phenotype_file_name : string - the path to the phenotype file
+    # @param covariable_file_name : string - the path to the covariable file
+    #
+    # @return tuple - the list of individuals, the phenotype matrix (N x 1) and the covariable matrix (N x D, with no bias column)
+    @staticmethod
+    def get_complete_individuals( individuals, phenotype_file_name, covariable_file_name):
+
+        phenotype_values = GwasBackend.read_individual_values( phenotype_file_name)
+        covariable_values = GwasBackend.read_individual_values( covariable_file_name)
+
+        complete_individuals = []
+        for individual in individuals:
+            if individual in phenotype_values and individual in covariable_values \
+               and np.isfinite( phenotype_values[ individual]).all() and np.isfinite( covariable_values[ individual]).all():
+                complete_individuals.append( individual)
+        if len( complete_individuals) < len( individuals):
+            Logger.get_instance().info( "  " + str( len( individuals) - len( complete_individuals)) + " individuals of the genotype have no phenotype or covariable value")
+
+        phenotype = np.array( [ phenotype_values[ individual][ 0:1] for individual in complete_individuals])
+        covariables = np.array( [ covariable_values[ individual] for individual in complete_individuals])
+
+        return ( complete_individuals, phenotype, covariables)
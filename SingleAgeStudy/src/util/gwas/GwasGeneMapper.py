@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+from util.log.Logger import Logger
+
+# Map the SNPs of a GWAS result to the genes they affect
+#
+# For each SNP of the result with at least one MutationEffect in the database, one line is written per effect with
+# the gene information, the number of DGRP lines having the mutation (in the database and among the lines used by the
+# GWAS), the total number of lines in the database and the columns of the GWAS result. The SNPs with no effect
+# are written to a separate "missing" file.
+#
+# The effects are read from the gene annotation index of the database (see GeneAnnotationIndex) and the line counts
+# are provided by a MutationLineCounter. The result rows are processed by chunks of CHUNK_SIZE rows: for each chunk,
+# the effects and the line counts of all its SNPs are retrieved at once, then the output lines of the chunk are
+# written. The rows are written in the order of the GWAS result.
+
+class GwasGeneMapper(object):
+
+    CHUNK_SIZE = 10000
+
+    OUTPUT_HEADERS = [ "ID", "FlybaseID", "GeneSymbol", "Position", "Type", "NbOfLinesForMutationInGWAS", "NbOfLinesForMutationInDB", "TotalNbOfLinesinDB"]
+
+    #
+    # Instantiate the mapper
+    #
+    # @param gene_annotation_index : GeneAnnotationIndex - the gene annotation index of the database
+    # @param line_counter : MutationLineCounter - the counter of the lines having the mutations
+    #
+    def __init__(self, gene_annotation_index, line_counter):
+
+        self.geneAnnotationIndex = gene_annotation_index
+        self.lineCounter = line_counter
+        self.chunkSize = GwasGeneMapper.CHUNK_SIZE
+
+    #
+    # Return the total number of lines in the database
+    #
+    # @return int
+    def get_total_line_count(self):
+
+        return self.lineCounter.get_total_line_count()
+
+    #
+    # Map the SNPs of a GWAS result to genes and write the mapped and missing SNPs to files
+    #
+    # @param header_list : list - the column names of the GWAS result
+    # @param rows : iterable - the rows of the GWAS result (lists of strings in the order of header_list)
+    # @param snp_header : string - the name of the column containing the SNP ID
+    # @param output_file : file - the file where the mapped SNPs are written
+    # @param missing_file_path : string - the path to the file where the SNPs with no effect are written (created only if required)
+    #
+    # @return tuple - the number of SNPs mapped and the number of SNPs with no effect
+    def map_result(self, header_list, rows, snp_header, output_file, missing_file_path):
+
+        snp_index = header_list.index( snp_header)
+        total_line_count = str( self.get_total_line_count())
+        output_file.write( "\t".join( GwasGeneMapper.OUTPUT_HEADERS) + "\t" + "\t".join( header_list) + "\n")
+
+        self.missingFile = None
+        self.missingFilePath = missing_file_path
+        self.missingHeader = "\t".join( header_list) + "\n"
+        mapped_count = 0
+        missing_count = 0
+        mapped_ids = set()
+        chunk = []
+        for row in rows:
+            chunk.append( row)
+            if len( chunk) >= self.chunkSize:
+                mapped, missing = self.map_chunk( chunk, snp_index, total_line_count, output_file, mapped_ids)
+                mapped_count += mapped
+                missing_count += missing
+                chunk = []
+        if len( chunk) > 0:
+            mapped, missing = self.map_chunk( chunk, snp_index, total_line_count, output_file, mapped_ids)
+            mapped_count += mapped
+            missing_count += missing
+
+        if self.missingFile != None:
+            self.missingFile.close()
+            self.missingFile = None
+
+        Logger.get_instance().info( "GwasGeneMapper.map_result : " + str( mapped_count) + " SNPs mapped to genes, " + str( missing_count) + " SNPs with no gene")
+
+        return ( mapped_count, missing_count)
+
+    #
+    # Map a chunk of rows of the GWAS result and write them to the output files
+    # A SNP present in several rows is written only once (for its first row), as done before with the SNP index
+    #
+    # @param chunk : list - the rows of the chunk
+    # @param snp_index : int - the index of the column containing the SNP ID
+    # @param total_line_count : string - the total number of lines in the database
+    # @param output_file : file - the file where the mapped SNPs are written
+    # @param written_ids : set - the IDs of the SNPs already written (updated)
+    #
+    # @return tuple - the number of SNPs mapped and the number of SNPs with no effect in the chunk
+    def map_chunk(self, chunk, snp_index, total_line_count, output_file, written_ids):
+
+        mutation_ids = list( set( [ row[ snp_index] for row in chunk]) - written_ids)
+        effects = self.geneAnnotationIndex.get_effects( mutation_ids)
+        line_counts = self.lineCounter.get_line_counts( list( effects.keys()))
+
+        mapped_count = 0
+        missing_count = 0
+        for row in chunk:
+            mutation_id = row[ snp_index]
+            if mutation_id in written_ids:
+                continue
+            written_ids.add( mutation_id)
+            gwas_values = "\t".join( row)
+            if mutation_id in effects:
+                line_count, used_line_count = line_counts.get( mutation_id, ( 0, 0))
+                for flybase_id, symbol, position, effect_type in effects[ mutation_id]:
+                    output_file.write( mutation_id + "\t" + flybase_id + "\t" + symbol + "\t" + position + "\t" + effect_type + "\t" + str( used_line_count) + "\t" + str( line_count) + "\t" + total_line_count + "\t" + gwas_values + "\n")
+                mapped_count += 1
+            else:
+                if self.missingFile == None:
+                    self.missingFile = open( self.missingFilePath, "w")
+                    self.missingFile.write( self.missingHeader)
+                self.missingFile.write( gwas_values + "\t\n")
+                missing_count += 1
+
+        return ( mapped_count, missing_count)
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from scipy import stats
+
+import matplotlib.pyplot as plt
+
+from util.log.Logger import Logger
+
+# Draw the Manhattan plot and the QQ-plot of a GWAS result
+#
+# The plots reproduce the ones of Fast-LMM (fastlmm.util.util.manhattan_plot with the SNP rank on the x-axis and
+# fastlmm.util.stats.plotp.qqplot) but only draw the points that can be distinguished on the image:
+#   - all the SNPs with a p-value lower than KEEP_PVALUE are drawn
+#   - the other SNPs are thinned on a grid of cells finer than the pixels of the image (GRID_OVERSAMPLING cells
+#     per pixel in each direction): a single point is drawn per cell and per chromosome
+#   - the expected quantiles of the QQ-plot are computed analytically from the rank of the sorted p-values
+#     and the genomic control lambda only from the median p-values
+# Each chromosome of the Manhattan plot is drawn with a single rasterized scatter.
+#
+# The points are provided by a GwasPlotPoints, filled chunk by chunk while the result is streamed, so that the
+# complete result is never held in memory.
+
+class GwasPlot(object):
+
+    MANHATTAN_PVALUE_LINE = 1e-5
+    KEEP_PVALUE = 1e-3
+    GRID_OVERSAMPLING = 2
+
+    MANHATTAN_COLORS = [ "b", "g"]
+    MANHATTAN_ALPHA = 0.5
+    MANHATTAN_MARKER_SIZE = 20
+
+    QQPLOT_FIGURE_SIZE = [ 5, 5]
+    QQPLOT_MIN_PVALUE = 1e-20
+    QQPLOT_ALPHA_LEVEL = 0.05
+    QQPLOT_AXES_BUFFER = 0.1
+
+    #
+    # Draw the Manhattan plot of a GWAS result to a PNG file
+    #
+    # @param plot_points : GwasPlotPoints - the points of the GWAS result
+    # @param file_path : string - the path to the PNG file
+    # @param pvalue_line : float - the p-value at which a horizontal line is drawn (None for no line)
+    #
+    @staticmethod
+    def manhattan_plot( plot_points, file_path, pvalue_line = MANHATTAN_PVALUE_LINE):
+
+        # The points are sorted by chromosome then position, the x coordinate being the rank of the SNP
+        chromosome_values, chromosome_counts, chromosome_indexes, x, y = plot_points.get_manhattan_points()
+        snp_count = plot_points.get_snp_count()
+        chromosome_starts = np.r_[ 0, np.cumsum( chromosome_counts)[ :-1]]
+
+        figure = plt.figure()
+        try:
+            axes = figure.gca()
+            max_y = max( y.max(), np.finfo( np.float64).tiny)
+            keep = GwasPlot.thin_points( x, y, chromosome_indexes, figure, [ 0, snp_count], [ 0, max_y], -np.log10( GwasPlot.KEEP_PVALUE))
+            keep_bounds = np.searchsorted( chromosome_indexes[ keep], np.arange( len( chromosome_values) + 1))
+            for chromosome_index in range( len( chromosome_values)):
+                selection = keep[ keep_bounds[ chromosome_index]:keep_bounds[ chromosome_index + 1]]
+                axes.scatter( x[ selection], y[ selection], marker = "o", c = GwasPlot.MANHATTAN_COLORS[ chromosome_index % len( GwasPlot.MANHATTAN_COLORS)],
+                              edgecolor = "none", s = y[ selection] / max_y * GwasPlot.MANHATTAN_MARKER_SIZE + 0.5, alpha = GwasPlot.MANHATTAN_ALPHA, rasterized = True)
+
+            axes.set_xlim( [ 0, snp_count])
+            axes.set_xticks( chromosome_starts + chromosome_counts // 2)
+            axes.set_xticklabels( [ GwasPlot.get_chromosome_label( chromosome) for chromosome in chromosome_values])
+            axes.set_xlabel( "chromosome")
+            axes.set_ylabel( "-log10(P value)")
+            if pvalue_line != None:
+                axes.axhline( -np.log10( pvalue_line), linestyle = "--", color = "gray")
+            axes.set_ylim( [ 0, None])
+
+            figure.savefig( file_path, format = "png")
+        finally:
+            plt.close( figure)
+
+        Logger.get_instance().debug( "GwasPlot.manhattan_plot : " + str( len( keep)) + " points drawn for " + str( snp_count) + " SNPs")
+
+    #
+    # Draw the QQ-plot of the p-values of a GWAS result to a PNG file
+    #
+    # @param plot_points : GwasPlotPoints - the points of the GWAS result
+    # @param file_path : string - the path to the PNG file
+    #
+    # @return float - the genomic control lambda
+    @staticmethod
+    def qq_plot( plot_points, file_path):
+
+        ranks, pvalues = plot_points.get_qq_points()
+        pvalues = np.clip( pvalues, GwasPlot.QQPLOT_MIN_PVALUE, 1.0)
+        snp_count = plot_points.get_snp_count()
+        # The chi2 statistic decreases with the p-value: its median is computed from the median p-values only
+        # (interpolated between the ranks of the points kept if the median ranks were thinned out)
+        median_pvalues = np.interp( [ ( snp_count - 1) // 2, snp_count // 2], ranks, pvalues)
+        lambda_gc = stats.chi2.isf( median_pvalues, 1).mean() / 0.456
+
+        # Observed and expected -log10 p-values of the points, sorted by decreasing significance
+        observed = -np.log10( pvalues)
+        expected = -np.log10( ( 0.5 + ranks) / snp_count)
+
+        figure = plt.figure( figsize = GwasPlot.QQPLOT_FIGURE_SIZE)
+        try:
+            axes = figure.gca()
+            axes.grid( b = True, alpha = 0.5)
+            keep = GwasPlot.thin_points( expected, observed, np.zeros( len( ranks), dtype = np.intp), figure, [ 0, expected[ 0]], [ 0, observed[ 0]], -np.log10( GwasPlot.KEEP_PVALUE))
+            axes.plot( expected[ keep], observed[ keep], ".", markersize = 2, rasterized = True)
+            axes.plot( [ 0, expected[ 0]], [ 0, expected[ 0]], "k")
+            axes.set_ylabel( "-log10(P) observed")
+            axes.set_xlabel( "-log10(P) expected")
+
+            # Confidence band of the uniform distribution
+            lower, upper, theoretical_pvalues = GwasPlot.get_qq_confidence_band( snp_count, GwasPlot.QQPLOT_ALPHA_LEVEL)
+            axes.fill_between( -np.log10( theoretical_pvalues), lower, upper, color = "grey", alpha = 0.5)
+
+            legend = axes.legend( [ "$\lambda_{GC}=$%1.4f" % lambda_gc], loc = 4, numpoints = 1)
+            for legend_handle in legend.legendHandles:
+                legend_handle.set_markersize( 10)
+
+            max_limit = max( axes.get_xlim()[ 1], axes.get_ylim()[ 1])
+            axes.set_xlim( [ -GwasPlot.QQPLOT_AXES_BUFFER, max_limit + GwasPlot.QQPLOT_AXES_BUFFER])
+            axes.set_ylim( [ -GwasPlot.QQPLOT_AXES_BUFFER, max_limit + GwasPlot.QQPLOT_AXES_BUFFER])
+
+            figure.savefig( file_path, format = "png")
+        finally:
+            plt.close( figure)
+
+        Logger.get_instance().debug( "GwasPlot.qq_plot : " + str( len( keep)) + " points drawn for " + str( snp_count) + " SNPs")
+
+        return lambda_gc
+
+    #
+    # Select the points to draw: all the points above a y threshold and, for the other ones, a single point per cell
+    # of a grid finer than the pixels of the figure and per group
+    #
+    # @param x : numpy.ndarray - the x coordinates of the points
+    # @param y : numpy.ndarray - the y coordinates of the points
+    # @param groups : numpy.ndarray - the group index of the points (points of different groups are never merged)
+    # @param figure : matplotlib.figure.Figure - the figure in which the points are drawn
+    # @param x_range : list - the minimal and maximal x values
+    # @param y_range : list - the minimal and maximal y values
+    # @param keep_y : float - the y value above which all the points are kept
+    #
+    # @return numpy.ndarray - the sorted indexes of the points to draw
+    @staticmethod
+    def thin_points( x, y, groups, figure, x_range, y_range, keep_y):
+
+        if len( x) == 0:
+            return np.arange( 0)
+
+        x = np.asarray( x, dtype = np.float64)
+        y = np.asarray( y, dtype = np.float64)
+        width, height = figure.get_size_inches() * figure.dpi * GwasPlot.GRID_OVERSAMPLING
+        x_cells = np.floor( ( x - x_range[ 0]) / max( x_range[ 1] - x_range[ 0], np.finfo( np.float64).tiny) * width).astype( np.int64)
+        y_cells = np.floor( ( y - y_range[ 0]) / max( y_range[ 1] - y_range[ 0], np.finfo( np.float64).tiny) * height).astype( np.int64)
+        cell_keys = ( np.asarray( groups, dtype = np.int64) * ( int( width) + 2) + np.clip( x_cells, -1, int( width))) * ( int( height) + 2) + np.clip( y_cells, -1, int( height))
+
+        first_in_cell = np.zeros( len( x), dtype = bool)
+        first_in_cell[ np.unique( cell_keys, return_index = True)[ 1]] = True
+
+        return np.flatnonzero( first_in_cell | ( y >= keep_y))
+
+    #
+    # Compute the confidence band of the QQ-plot of uniformly distributed p-values (as done by Fast-LMM)
+    #
+    # @param snp_count : int - the number of p-values
+    # @param alpha_level : float - the significance level of the band
+    #
+    # @return tuple - the lower and upper bounds (-log10) and the theoretical p-values of the band
+    @staticmethod
+    def get_qq_confidence_band( snp_count, alpha_level):
+
+        ranks = 10 ** np.arange( np.log10( 0.5), np.log10( snp_count - 0.5) + 0.1, 0.1)
+        median = stats.beta.ppf( 0.5, ranks, snp_count - ranks)
+        beta_down = median - stats.beta.ppf( alpha_level, ranks, snp_count - ranks)
+        beta_up = stats.beta.ppf( 1 - alpha_level, ranks, snp_count - ranks) - median
+        theoretical_pvalues = ranks / snp_count
+
+        return ( -np.log10( theoretical_pvalues - beta_down), -np.log10( theoretical_pvalues + beta_up), theoretical_pvalues)
+
+    #
+    # Return the label of a chromosome on the x-axis (the integer value of numeric chromosomes, as Fast-LMM does)
+    #
+    # @param chromosome : the chromosome value
+    #
+    # @return string
+    @staticmethod
+    def get_chromosome_label( chromosome):
+
+        try:
+            return str( int( chromosome))
+        except ValueError:
+            return str( chromosome)
+
+
+# Bounded set of the points of a GWAS result drawn by GwasPlot
+#
+# The result is added chunk by chunk, the chunks being sorted by increasing p-value (see GwasResultWriter), so that
+# the rank of each SNP in the QQ-plot is its position in the stream. Only the following points are kept:
+#   - all the SNPs with a p-value lower than GwasPlot.KEEP_PVALUE
+#   - a systematic sample of the other SNPs: the SNPs whose rank is a multiple of a stride. The stride starts at 1 (all
+#     the SNPs are kept) and is doubled each time the sample exceeds MAX_SAMPLE_SIZE points
+# The number of SNPs of each chromosome is counted on all the SNPs. On the Manhattan plot, each sampled SNP stands for
+# its share of the SNPs of its chromosome that were not kept, so that the x coordinate of a point is its rank among all
+# the SNPs (exact while the stride is 1, estimated from the sample otherwise). The memory used is bounded by the number
+# of significant SNPs plus MAX_SAMPLE_SIZE, whatever the size of the result.
+
+class GwasPlotPoints(object):
+
+    MAX_SAMPLE_SIZE = 200000
+
+    #
+    # Instantiate an empty set of points
+    #
+    def __init__(self):
+
+        self.snpCount = 0
+        self.stride = 1
+        self.chromosomeCounts = {}
+        self.sampleSize = 0
+        self.pointChunks = []
+
+    #
+    # Add a chunk of the GWAS result
+    #
+    # @param chromosomes : numpy.ndarray - the chromosome of each SNP of the chunk
+    # @param positions : numpy.ndarray - the position of each SNP on its chromosome
+    # @param pvalues : numpy.ndarray - the p-value of each SNP, not lower than the p-values of the previous chunks
+    #
+    def add_chunk(self, chromosomes, positions, pvalues):
+
+        chromosomes = np.asarray( chromosomes)
+        pvalues = np.asarray( pvalues, dtype = np.float64)
+        for chromosome, count in zip( *np.unique( chromosomes, return_counts = True)):
+            self.chromosomeCounts[ chromosome] = self.chromosomeCounts.get( chromosome, 0) + count
+
+        ranks = np.arange( self.snpCount, self.snpCount + len( pvalues), dtype = np.int64)
+        significant = pvalues < GwasPlot.KEEP_PVALUE
+        sampled = ~significant & ( ranks % self.stride == 0)
+        keep = significant | sampled
+        self.pointChunks.append( ( chromosomes[ keep], np.asarray( positions)[ keep], pvalues[ keep], ranks[ keep], significant[ keep]))
+        self.snpCount += len( pvalues)
+        self.sampleSize += np.count_nonzero( sampled)
+
+        while self.sampleSize > GwasPlotPoints.MAX_SAMPLE_SIZE:
+            self.stride *= 2
+            chromosomes, positions, pvalues, ranks, significant = self.get_points()
+            keep = significant | ( ranks % self.stride == 0)
+            self.pointChunks = [ ( chromosomes[ keep], positions[ keep], pvalues[ keep], ranks[ keep], significant[ keep])]
+            self.sampleSize = np.count_nonzero( keep & ~significant)
+
+    #
+    # Return the kept points
+    #
+    # @return tuple - the chromosome, position, p-value, rank and significance (p-value lower than GwasPlot.KEEP_PVALUE) of the points, sorted by rank
+    def get_points(self):
+
+        if len( self.pointChunks) > 1:
+            self.pointChunks = [ tuple( np.concatenate( values) for values in zip( *self.pointChunks))]
+        if len( self.pointChunks) == 0:
+            return ( np.empty( 0), np.empty( 0), np.empty( 0), np.empty( 0, dtype = np.int64), np.empty( 0, dtype = bool))
+
+        return self.pointChunks[ 0]
+
+    #
+    # Return the number of SNPs added
+    #
+    # @return int
+    def get_snp_count(self):
+
+        return self.snpCount
+
+    #
+    # Return the points of the Manhattan plot
+    #
+    # @return tuple - the sorted chromosome values, the number of SNPs of each chromosome, and the chromosome index,
+    #                 x (rank by chromosome and position) and y (-log10 p-value) of the points sorted by chromosome and position
+    def get_manhattan_points(self):
+
+        chromosomes, positions, pvalues, ranks, significant = self.get_points()
+        chromosome_values = np.unique( np.array( list( self.chromosomeCounts.keys()), dtype = chromosomes.dtype))
+        chromosome_counts = np.array( [ self.chromosomeCounts[ chromosome] for chromosome in chromosome_values], dtype = np.int64)
+        chromosome_indexes = np.searchsorted( chromosome_values, chromosomes)
+        order = np.lexsort( ( positions, chromosome_indexes))
+        chromosome_indexes = chromosome_indexes[ order]
+        significant = significant[ order]
+
+        # Weight of each point: 1 for the significant SNPs, the number of other SNPs of its chromosome per sampled SNP otherwise
+        significant_counts = np.bincount( chromosome_indexes[ significant], minlength = len( chromosome_values))
+        sampled_counts = np.bincount( chromosome_indexes[ ~significant], minlength = len( chromosome_values))
+        sample_weights = ( chromosome_counts - significant_counts) / np.maximum( sampled_counts, 1).astype( np.float64)
+        weights = np.where( significant, 1.0, sample_weights[ chromosome_indexes])
+
+        # The x coordinate is the start of the chromosome plus the weights of the previous points of the chromosome
+        preceding_weights = np.cumsum( weights) - weights
+        chromosome_firsts = np.searchsorted( chromosome_indexes, np.arange( len( chromosome_values)))
+        chromosome_starts = np.r_[ 0, np.cumsum( chromosome_counts)[ :-1]]
+        x = chromosome_starts[ chromosome_indexes] + preceding_weights - preceding_weights[ np.minimum( chromosome_firsts, max( len( weights) - 1, 0))][ chromosome_indexes]
+        y = -np.log10( pvalues[ order])
+
+        return ( chromosome_values, chromosome_counts, chromosome_indexes, x, y)
+
+    #
+    # Return the points of the QQ-plot
+    #
+    # @return tuple - the rank and the p-value of the points, sorted by rank
+    def get_qq_points(self):
+
+        chromosomes, positions, pvalues, ranks, significant = self.get_points()
+
+        return ( ranks, pvalues)
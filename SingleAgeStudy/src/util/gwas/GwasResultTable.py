@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from util.log.Logger import Logger
+
+# Columnar (Parquet) version of the GWAS result file
+#
+# The result is written by chunks sorted by p-value (see GwasResultWriter), each chunk being a row group of the
+# Parquet file, compressed and with typed columns (float64 p-values and statistics, int32 indexes and positions,
+# dictionary encoded chromosomes). The min/max statistics of the PValue column stored for each row group are used
+# as an index when reading: only the row groups that may contain p-values below the requested threshold are read,
+# and since the row groups are sorted the reading stops at the first row group above it. Only the requested
+# columns are read (projection).
+#
+# Requires the pyarrow package, imported only when a columnar file is written or read.
+
+class GwasResultTable(object):
+
+    PARQUET_EXTENSION = ".parquet"
+    COMPRESSION = "snappy"
+
+    PVALUE_COLUMN = "PValue"
+    CHROMOSOME_COLUMN = "Chr"
+    COLUMN_TYPES = { "sid_index": np.int32,
+                     "ChrPos": np.int32}
+
+    #
+    # Instantiate the table (the file is created with the first chunk)
+    #
+    # @param file_path : string - the path to the Parquet file
+    #
+    def __init__(self, file_path):
+
+        self.filePath = file_path
+        self.parquetWriter = None
+        self.schema = None
+
+    #
+    # Write a chunk of results as a new row group
+    #
+    # @param chunk : pandas.DataFrame - the rows to write, sorted by p-value and following the previous chunk
+    #
+    def write_chunk(self, chunk):
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if len( chunk) == 0:
+            return
+
+        chunk = chunk.astype( dict( [ ( column, column_type) for column, column_type in GwasResultTable.COLUMN_TYPES.items() if column in chunk.columns]))
+        if self.parquetWriter == None:
+            table = pa.Table.from_pandas( chunk, preserve_index = False)
+            self.schema = table.schema
+            self.parquetWriter = pq.ParquetWriter( self.filePath, self.schema, compression = GwasResultTable.COMPRESSION, use_dictionary = True)
+        else:
+            table = pa.Table.from_pandas( chunk, schema = self.schema, preserve_index = False)
+        self.parquetWriter.write_table( table)
+
+    #
+    # Close the file
+    #
+    def close(self):
+
+        if self.parquetWriter != None:
+            self.parquetWriter.close()
+            self.parquetWriter = None
+
+    #
+    # Return the path to the columnar file corresponding to a tab-separated result file
+    #
+    # @param result_file_path : string - the path to the tab-separated result file
+    #
+    # @return string
+    @staticmethod
+    def get_file_path( result_file_path):
+
+        return os.path.splitext( result_file_path)[0] + GwasResultTable.PARQUET_EXTENSION
+
+    #
+    # Indicate if a file is a columnar result file
+    #
+    # @param file_path : string - the path to the file
+    #
+    # @return boolean
+    @staticmethod
+    def is_table_file( file_path):
+
+        return file_path.endswith( GwasResultTable.PARQUET_EXTENSION)
+
+    #
+    # Read the rows of a columnar result file with a p-value lower than a threshold
+    #
+    # @param file_path : string - the path to the Parquet file
+    # @param columns : list - the columns to read (None for all the columns)
+    # @param pvalue_threshold : float - the rows with a p-value lower than this threshold are read (None for all the rows)
+    # @param inclusive : boolean - True to also read the rows with a p-value equal to the threshold
+    #
+    # @return pandas.DataFrame - the rows, sorted by p-value, with the chromosome as categorical column
+    @staticmethod
+    def read( file_path, columns = None, pvalue_threshold = None, inclusive = False):
+
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile( file_path)
+        column_names = parquet_file.schema.names
+        if columns == None:
+            columns = column_names
+        read_columns = list( columns)
+        if pvalue_threshold != None and GwasResultTable.PVALUE_COLUMN not in read_columns:
+            read_columns.append( GwasResultTable.PVALUE_COLUMN)
+        pvalue_index = column_names.index( GwasResultTable.PVALUE_COLUMN)
+
+        frames = []
+        for row_group_index in range( parquet_file.num_row_groups):
+            # Use the p-value statistics of the row group to skip the rows above the threshold
+            if pvalue_threshold != None:
+                statistics = parquet_file.metadata.row_group( row_group_index).column( pvalue_index).statistics
+                if statistics is not None and statistics.has_min_max:
+                    if statistics.min > pvalue_threshold or ( statistics.min == pvalue_threshold and not inclusive):
+                        break
+            frame = parquet_file.read_row_group( row_group_index, columns = read_columns).to_pandas()
+            if pvalue_threshold != None:
+                if inclusive:
+                    frame = frame[ frame[ GwasResultTable.PVALUE_COLUMN] <= pvalue_threshold]
+                else:
+                    frame = frame[ frame[ GwasResultTable.PVALUE_COLUMN] < pvalue_threshold]
+            frames.append( frame)
+
+        if len( frames) == 0:
+            result_df = pd.DataFrame( columns = read_columns)
+        else:
+            result_df = pd.concat( frames, ignore_index = True)
+        result_df = result_df[ columns]
+        if GwasResultTable.CHROMOSOME_COLUMN in result_df.columns:
+            result_df[ GwasResultTable.CHROMOSOME_COLUMN] = result_df[ GwasResultTable.CHROMOSOME_COLUMN].astype( "category")
+
+        Logger.get_instance().debug( "GwasResultTable.read : " + str( len( result_df)) + " rows read from " + file_path)
+
+        return result_df
+
+    #
+    # Return the p-value of the row of a given rank in a columnar result file, among the rows with a p-value lower
+    # than alpha as in the GWAS result report (only the PValue column of the first row groups is read)
+    #
+    # @param file_path : string - the path to the Parquet file
+    # @param rank : int - the rank of the row (1 for the most significant SNP)
+    # @param alpha : float - only the rows with a p-value lower than alpha are ranked (None to rank all the rows)
+    #
+    # @return float - the p-value of the row (the highest p-value of the ranked rows if there are less rows, None if there is none)
+    @staticmethod
+    def get_rank_pvalue( file_path, rank, alpha = None):
+
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile( file_path)
+        rank_pvalue = None
+        row_count = 0
+        for row_group_index in range( parquet_file.num_row_groups):
+            pvalues = parquet_file.read_row_group( row_group_index, columns = [ GwasResultTable.PVALUE_COLUMN]).column( 0).to_pandas().values
+            # The rows are sorted: the rows passing alpha are the first ones
+            if alpha != None:
+                pvalues = pvalues[ pvalues < alpha]
+            if len( pvalues) == 0:
+                continue
+            if row_count + len( pvalues) >= rank:
+                return pvalues[ rank - row_count - 1]
+            rank_pvalue = pvalues[ -1]
+            row_count += len( pvalues)
+
+        return rank_pvalue
+
+    #
+    # Convert the columns of a result DataFrame to lists of strings formatted as in the tab-separated result file
+    #
+    # @param result_df : pandas.DataFrame - the result rows
+    #
+    # @return dict - the list of string values of each column
+    @staticmethod
+    def to_text_columns( result_df):
+
+        text_columns = {}
+        for column in result_df.columns:
+            values = np.asarray( result_df[ column].values)
+            if values.dtype.kind == "f":
+                text_columns[ column] = [ repr( float( value)) for value in values]
+            else:
+                text_columns[ column] = [ str( value) for value in values]
+
+        return text_columns
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from util.log.Logger import Logger
+from util.gwas.GwasResultTable import GwasResultTable
+
+# Write the result of a GWAS and its significant SNPs in a single streaming pass
+#
+# The result is received as chunks of rows (pandas DataFrames with the columns of the Fast-LMM single_snp function)
+# sorted by increasing p-value. Each chunk is appended to the complete tab-separated result file and the rows
+# passing each significance filter are appended to the corresponding "_signif<suffix>" file at the same time,
+# so that the complete result is never held in memory nor read again.
+#
+# The significance filters are defined by suffixes:
+#   - the alpha of the GWAS : rows with PValue < alpha (as done by FastLMMWrapper before)
+#   - a p-value (e.g. "1e-5") : rows with PValue <= value (as done by the GWAS result report)
+#   - a rank (e.g. "100th") : rows with PValue < alpha and PValue <= the p-value of the SNP of this rank among them
+#     (as done by the GWAS result report on the alpha significant file; all the rows passing alpha if they are fewer)
+#
+# If required, the complete result is also written in a columnar file (see GwasResultTable), each chunk being a row group.
+
+class GwasResultWriter(object):
+
+    SIGNIFICANT_FILE_EXTENSION = "_signif"
+    RANK_SUFFIX_END = "th"
+    PVALUE_COLUMN = "PValue"
+
+    #
+    # Instantiate the writer and create the result files
+    #
+    # @param result_file_path : string - the path to the complete result file
+    # @param alpha : float - the significance level of the GWAS
+    # @param suffix_list : list - the suffixes of the other significance filters (e.g. [ "100th", "1e-5"], None for no other filter)
+    # @param columnar : boolean - True to also write the complete result in a columnar file
+    #
+    # @raise ValueError : if a suffix is neither a p-value nor a rank
+    def __init__(self, result_file_path, alpha, suffix_list = None, columnar = False):
+
+        self.resultFilePath = result_file_path
+        self.alpha = float( alpha)
+        self.rowCount = 0
+        self.lastPValue = None
+        self.headerWritten = False
+
+        # Build the filters: ( suffix, threshold, inclusive, rank)
+        self.filters = [ GwasResultWriter.get_filter( alpha, alpha)]
+        if suffix_list == None:
+            suffix_list = []
+        for suffix in suffix_list:
+            if str( suffix) == str( alpha):
+                continue
+            self.filters.append( GwasResultWriter.get_filter( suffix, alpha))
+
+        self.resultFile = open( result_file_path, "w")
+        self.resultTable = None
+        if columnar:
+            self.resultTable = GwasResultTable( GwasResultTable.get_file_path( result_file_path))
+        self.significantFiles = []
+        for suffix, threshold, inclusive, rank in self.filters:
+            self.significantFiles.append( open( self.get_significant_file_path( suffix), "w"))
+        self.significantCounts = [ 0] * len( self.filters)
+        self.rankPValue = [ None] * len( self.filters)
+
+    #
+    # Build the significance filter of a suffix
+    #
+    # @param suffix : string - the suffix of the filter (the alpha of the GWAS, a p-value or a rank)
+    # @param alpha : float - the significance level of the GWAS
+    #
+    # @return tuple - the suffix, the p-value threshold (None for a rank), True if the threshold is inclusive and the rank (None for a threshold)
+    # @raise ValueError : if the suffix is neither a p-value nor a rank
+    @staticmethod
+    def get_filter( suffix, alpha):
+
+        suffix = str( suffix)
+        if suffix == str( alpha):
+            return ( suffix, float( alpha), False, None)
+        if suffix.endswith( GwasResultWriter.RANK_SUFFIX_END):
+            return ( suffix, None, True, int( suffix[ :-len( GwasResultWriter.RANK_SUFFIX_END)]))
+
+        return ( suffix, float( suffix), True, None)
+
+    #
+    # Return the path of the significant result file of a suffix
+    #
+    # @param suffix : string - the suffix of the significance filter
+    #
+    # @return string
+    def get_significant_file_path(self, suffix):
+
+        return os.path.splitext( self.resultFilePath)[0] + GwasResultWriter.SIGNIFICANT_FILE_EXTENSION + str( suffix) + ".txt"
+
+    #
+    # Return the paths of all the significant result files
+    #
+    # @return list
+    def get_significant_file_paths(self):
+
+        return [ self.get_significant_file_path( suffix) for suffix, threshold, inclusive, rank in self.filters]
+
+    #
+    # Write a chunk of results
+    #
+    # @param chunk : pandas.DataFrame - the rows to write, sorted by p-value and following the previous chunk
+    #
+    # @raise ValueError : if the chunk is not sorted after the previous ones
+    def write_chunk(self, chunk):
+
+        if len( chunk) == 0:
+            return
+
+        pvalues = chunk[ GwasResultWriter.PVALUE_COLUMN].values
+        if self.lastPValue != None and pvalues[ 0] < self.lastPValue:
+            raise ValueError( "GwasResultWriter.write_chunk : The results must be provided by increasing p-value")
+
+        write_header = not self.headerWritten
+        chunk.to_csv( self.resultFile, sep = '\t', index = False, header = write_header)
+        if self.resultTable != None:
+            self.resultTable.write_chunk( chunk)
+
+        for filter_index, ( suffix, threshold, inclusive, rank) in enumerate( self.filters):
+            if rank != None:
+                # The rows are sorted: the first rows up to the rank are kept, then the rows with the same p-value as the last kept one
+                if self.rowCount < rank:
+                    threshold = pvalues[ min( rank - self.rowCount, len( pvalues)) - 1]
+                else:
+                    threshold = self.rankPValue[ filter_index]
+                if self.rowCount + len( pvalues) >= rank:
+                    self.rankPValue[ filter_index] = threshold
+            if inclusive:
+                selection = pvalues <= threshold
+            else:
+                selection = pvalues < threshold
+            if rank != None:
+                # The rank is taken among the rows passing alpha
+                selection &= pvalues < self.alpha
+            chunk[ selection].to_csv( self.significantFiles[ filter_index], sep = '\t', index = False, header = write_header)
+            self.significantCounts[ filter_index] += int( selection.sum())
+
+        self.headerWritten = True
+        self.rowCount += len( pvalues)
+        self.lastPValue = pvalues[ -1]
+
+    #
+    # Write all the chunks of results and close the files
+    #
+    # @param chunks : iterable - the pandas.DataFrame chunks, sorted by p-value
+    #
+    # @return int - the number of rows written
+    def write(self, chunks):
+
+        try:
+            for chunk in chunks:
+                self.write_chunk( chunk)
+        finally:
+            self.close()
+
+        return self.rowCount
+
+    #
+    # Close the result files
+    #
+    def close(self):
+
+        if self.resultFile.closed:
+            return
+
+        self.resultFile.close()
+        if self.resultTable != None:
+            self.resultTable.close()
+            Logger.get_instance().info( "|--Columnar result file created: " + self.resultTable.filePath)
+        for filter_index, significant_file in enumerate( self.significantFiles):
+            significant_file.close()
+            Logger.get_instance().info( "|--Significant result file created: " + self.get_significant_file_path( self.filters[ filter_index][ 0]) + " (" + str( self.significantCounts[ filter_index]) + " SNPs)")
@@ -1,10 +1,22 @@
 
+import os
+
 from util.log.Logger import Logger
 from util.file.FileUtils import FileUtils
+from util.plink.PlinkBedFile import PlinkBedFile
+from util.gwas.GwasBackend import GwasBackend
 from util.gwas.FastLMMWrapper import FastLMMWrapper  
 
 
-class GwasUtil( ExecutionStrategy):
+class GwasUtil( object):
+    
+    # Columns of the Fast-LMM analysis definition file
+    INPUT_FOLDER_HEADER = "input_folder"
+    PHENOTYPE_FILE_HEADER = "phenotype_file"
+    FAMILIES_FILE_HEADER = "families_file"
+    
+    GENOTYPE_CACHE_FOLDER = "genotype_cache"
+    KINSHIP_CACHE_FOLDER = "kinship_cache"
 
     #
     # Read the file containing the definition of the Fast-LMM analysis to perform produced by the single age analysis (step 3)
@@ -67,50 +79,68 @@ class GwasUtil( ExecutionStrategy):
 
     
     #
-    # Execute the Fast-LMM analysis using the parameters provided in the dictionaries in the list
+    # Execute the Fast-LMM analysis using the parameters provided in the dictionaries in the list.
+    # The analysis are grouped by set of families (DGRP lines) so that the genotype subset and the
+    # eigendecomposition of the genetic similarity matrices are computed once per group and reused
+    # for all the phenotypes of the group (see FastLMMWrapper and KinshipDecomposition)
     #
     # @param analysis_command_list : tuple - A list of dictionary containing the Fast-LMM analysis to perform (one dictionary per analysis)
+    # @param covariable_file_name : string - The path to the covariable file
+    # @param dgrp_file_path : string - the path to the DGRP genotype .bed, .bim and .fam files (name with no extension)
+    # @param alpha : float - The significant level used to filter out the results.
+    # @param output_path : string - the path to the output folder
+    # @param log_path : string - the path to the log folder
+    # @param genotype_cache_path : string - the path to the folder of genotype subsets (None to use a folder in the output folder)
+    # @param genotype_cache_max_size : int - the maximal size of the genotype cache in bytes (None for no limit)
+    # @param kinship_cache_path : string - the path to the folder of kinship decompositions (None to use a folder in the output folder)
+    # @param gwas_backend : string - the name of the backend executing the GWAS (see GwasBackend.BACKEND_LIST)
+    # @param significance_suffix_list : list - the suffixes of the significance filters applied in addition to alpha (see GwasResultWriter, None for no other filter)
+    # @param columnar_result : boolean - True to also write the complete results in columnar files (see GwasResultTable)
+    # @param memory_goal : int - the memory (in bytes) targeted by the blocks of SNPs tested at once by the backend (None for the default of the backend)
     #
     @staticmethod
-    def execute_fastlmm_analysis( analysis_command_list, genotype_file_name, covariable_file_name, dgrp_file_path, alpha):
+    def execute_fastlmm_analysis( analysis_command_list, covariable_file_name, dgrp_file_path, alpha, output_path, log_path, genotype_cache_path = None, genotype_cache_max_size = None, kinship_cache_path = None, gwas_backend = GwasBackend.FASTLMM_BACKEND, significance_suffix_list = None, columnar_result = False, memory_goal = None):
+        
+        if genotype_cache_path == None:
+            genotype_cache_path = os.path.join( output_path, GwasUtil.GENOTYPE_CACHE_FOLDER)
+        if kinship_cache_path == None:
+            kinship_cache_path = os.path.join( output_path, GwasUtil.KINSHIP_CACHE_FOLDER)
         
+        # Group the analysis by set of families, keeping the order of the definition file
+        analysis_groups = {}
+        group_keys = []
         for analysis_dict in analysis_command_list:
+            group_key = frozenset( PlinkBedFile.read_individuals( analysis_dict[ GwasUtil.FAMILIES_FILE_HEADER]))
+            if group_key not in analysis_groups:
+                analysis_groups[ group_key] = []
+                group_keys.append( group_key)
+            analysis_groups[ group_key].append( analysis_dict)
+        Logger.get_instance().info( "Number of distinct family sets: " + str( len( group_keys)))
+        
+        for group_index, group_key in enumerate( group_keys):
+            Logger.get_instance().info( "\nExecuting the Fast-LMM GWAS of family set " + str( group_index + 1) + "/" + str( len( group_keys)) + \
+                                        " (" + str( len( group_key)) + " families, " + str( len( analysis_groups[ group_key])) + " phenotypes)")
             
-            # Get the value of the options build the FastLMM object 
-            input_path = analysis_dict[ "input"]
-            #genotype_file_name = analysis_dict[ "genotype"] 
-            phenotype_file_name = analysis_dict[ "phenotype"]
-            #covariable_file_name = analysis_dict[ "covariable"]
-            no_plink = False
-            #dgrp_file_path = analysis_dict[ "dgrp"]
-            families_file_path = analysis_dict[ "families"]
-            #alpha = 0.05
-            
-            genotype_file_name = "GWAS_DGRP";
-            
-            # Inform user about Analysis launched
-            Logger.get_instance().info( "Executing Fast-LMM GWAS with options:")
-            Logger.get_instance().info( "----------------------------")
-            Logger.get_instance().info( "  input folder = " + str( input_path))
-            Logger.get_instance().info( "  genotype     = " + str( genotype_file_name))
-            Logger.get_instance().info( "  covariable   = " + str( covariable_file_name))
-            Logger.get_instance().info( "  phenotype    = " + str( phenotype_file_name))
-            Logger.get_instance().info( "  no plink     = " + str( no_plink))
-            Logger.get_instance().info( "  DGRP file    = " + str( dgrp_file_path))
-            Logger.get_instance().info( "  families     = " + str( families_file_path))
-            Logger.get_instance().info( "  alpha        = " + str( alpha))
-            
-            # Check if one of the required option is missing
-            if( input_path == None or genotype_file_name == None or phenotype_file_name == None or covariable_file_name == None):
-                parser.print_help()
+            for analysis_dict in analysis_groups[ group_key]:
                 
-            # Insert the data to be treated with GWAS to database
-            self.insert_gwas_data_to_db( input_path, genotype_file_name, phenotype_file_name, covariable_file_name, alpha)
-            
-            # Build the FastLMM object and execute it
-            fastlmm_gwas = FastLMMWrapper( input_path, genotype_file_name, phenotype_file_name, covariable_file_name, alpha, dgrp_file_path, families_file_path)
-            fastlmm_gwas.execute( no_plink)
-
-
-    
-    
\ No newline at end of file
+                # Get the value of the options build the FastLMM object 
+                phenotype_file_name = os.path.join( analysis_dict[ GwasUtil.INPUT_FOLDER_HEADER], analysis_dict[ GwasUtil.PHENOTYPE_FILE_HEADER])
+                families_file_path = analysis_dict[ GwasUtil.FAMILIES_FILE_HEADER]
+                
+                # Inform user about Analysis launched
+                Logger.get_instance().info( "Executing Fast-LMM GWAS with options:")
+                Logger.get_instance().info( "----------------------------")
+                Logger.get_instance().info( "  covariable   = " + str( covariable_file_name))
+                Logger.get_instance().info( "  phenotype    = " + str( phenotype_file_name))
+                Logger.get_instance().info( "  DGRP file    = " + str( dgrp_file_path))
+                Logger.get_instance().info( "  families     = " + str( families_file_path))
+                Logger.get_instance().info( "  alpha        = " + str( alpha))
+                Logger.get_instance().info( "  backend      = " + str( gwas_backend))
+                
+                # Build the FastLMM object and execute it
+                fastlmm_gwas = FastLMMWrapper( phenotype_file_name, covariable_file_name, alpha, dgrp_file_path, families_file_path, output_path, log_path,
+                                               genotype_cache_path, genotype_cache_max_size, kinship_cache_path, gwas_backend, significance_suffix_list, columnar_result, memory_goal)
+                fastlmm_gwas.execute( close_log = False)
+        
+        # Close log file
+        Logger.get_instance().close()
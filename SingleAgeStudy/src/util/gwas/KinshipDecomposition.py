@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+
+import numpy as np
+
+from util.log.Logger import Logger
+from util.plink.PlinkBedFile import PlinkBedFile
+from util.exception.FileFormatException import FileFormatException
+
+# Eigendecomposition of the genetic similarity matrices used by the LMM GWAS
+#
+# As done by the Fast-LMM single_snp function, one similarity matrix is used per chromosome, built from the SNPs
+# of all the other chromosomes (leave-out-one-chromosome):
+#   - the SNPs are standardized (mean 0 and standard deviation 1 over the non-missing genotypes, missing genotypes set to 0)
+#   - K_chr = X_(not chr) . X_(not chr)^T, scaled so that its diagonal sums to the number of individuals
+#   - K_chr = U_chr . diag( S_chr) . U_chr^T
+#
+# The similarity matrices do not depend on the phenotype, so the decomposition is computed once per genotype
+# (i.e. per set of DGRP lines) and shared by all the phenotypes measured on these lines.
+# The genotype is read by chunks of SNPs and the contribution of each chromosome is accumulated in a NxN matrix,
+# so that the whole genotype is never loaded in memory.
+#
+# The decomposition can be saved to and loaded from a .npz file containing:
+#   - individuals : the "family_ID individual_ID" of the individuals, in .fam order
+#   - chromosomes : the chromosome names, in .bim order
+#   - U_<index>, S_<index> : the eigenvectors and eigenvalues of the similarity matrix of the chromosome <index>
+
+class KinshipDecomposition(object):
+
+    INDIVIDUALS_KEY = "individuals"
+    CHROMOSOMES_KEY = "chromosomes"
+    EIGENVECTORS_KEY_PREFIX = "U_"
+    EIGENVALUES_KEY_PREFIX = "S_"
+
+    NPZ_EXTENSION = ".npz"
+
+    # Number of SNPs read at once while computing the similarity matrices
+    SNP_CHUNK_SIZE = 20000
+
+    #
+    # Instantiate the decomposition
+    #
+    # @param individuals : list - the (family ID, individual ID) tuples of the individuals, in genotype order
+    # @param chromosomes : list - the chromosome names, in genotype order
+    # @param eigenvectors : dict - the eigenvectors matrix (U) of the similarity matrix of each chromosome
+    # @param eigenvalues : dict - the eigenvalues vector (S) of the similarity matrix of each chromosome
+    #
+    def __init__(self, individuals, chromosomes, eigenvectors, eigenvalues):
+
+        self.individuals = individuals
+        self.chromosomes = chromosomes
+        self.eigenvectors = eigenvectors
+        self.eigenvalues = eigenvalues
+
+    #
+    # Return the list of individuals as (family ID, individual ID) tuples, in genotype order
+    #
+    def get_individuals(self):
+
+        return self.individuals
+
+    #
+    # Return the list of chromosome names, in genotype order
+    #
+    def get_chromosomes(self):
+
+        return self.chromosomes
+
+    #
+    # Return the eigendecomposition of the similarity matrix used to test the SNPs of a chromosome
+    #
+    # @param chromosome : string - the chromosome name
+    #
+    # @return tuple - the eigenvectors matrix (U) and the eigenvalues vector (S)
+    def get_decomposition(self, chromosome):
+
+        return ( self.eigenvectors[ chromosome], self.eigenvalues[ chromosome])
+
+    #
+    # Return the similarity matrix used to test the SNPs of a chromosome, rebuilt from its eigendecomposition
+    #
+    # @param chromosome : string - the chromosome name
+    #
+    # @return numpy.ndarray - the NxN similarity matrix
+    def get_kernel(self, chromosome):
+
+        eigenvectors, eigenvalues = self.get_decomposition( chromosome)
+
+        return ( eigenvectors * eigenvalues).dot( eigenvectors.T)
+
+    #
+    # Save the decomposition to a .npz file. The file is written under a temporary name and renamed,
+    # so that concurrent jobs never read a partial file
+    #
+    # @param file_path : string - the path to the .npz file
+    #
+    def save(self, file_path):
+
+        arrays = {}
+        arrays[ KinshipDecomposition.INDIVIDUALS_KEY] = np.array( [ fid + " " + iid for fid, iid in self.individuals])
+        arrays[ KinshipDecomposition.CHROMOSOMES_KEY] = np.array( self.chromosomes)
+        for index, chromosome in enumerate( self.chromosomes):
+            arrays[ KinshipDecomposition.EIGENVECTORS_KEY_PREFIX + str( index)] = self.eigenvectors[ chromosome]
+            arrays[ KinshipDecomposition.EIGENVALUES_KEY_PREFIX + str( index)] = self.eigenvalues[ chromosome]
+
+        file_folder = os.path.dirname( os.path.abspath( file_path))
+        if not os.path.isdir( file_folder):
+            try:
+                os.makedirs( file_folder)
+            except OSError:
+                # The folder may have been created by a concurrent job
+                if not os.path.isdir( file_folder):
+                    raise
+
+        file_handle, temporary_path = tempfile.mkstemp( suffix = KinshipDecomposition.NPZ_EXTENSION, dir = file_folder)
+        try:
+            with os.fdopen( file_handle, "wb") as npz_file:
+                np.savez( npz_file, **arrays)
+            os.rename( temporary_path, file_path)
+        except:
+            if os.path.exists( temporary_path):
+                os.remove( temporary_path)
+            raise
+
+        Logger.get_instance().info( "KinshipDecomposition : Decomposition saved to " + file_path)
+
+    #
+    # Load a decomposition from a .npz file
+    #
+    # @param file_path : string - the path to the .npz file
+    #
+    # @return KinshipDecomposition
+    # @raise FileFormatException : if the file does not contain a decomposition
+    @staticmethod
+    def load( file_path):
+
+        eigenvectors = {}
+        eigenvalues = {}
+        with np.load( file_path) as data:
+            if KinshipDecomposition.INDIVIDUALS_KEY not in data.files or KinshipDecomposition.CHROMOSOMES_KEY not in data.files:
+                raise FileFormatException( "KinshipDecomposition.load : File does not contain a kinship decomposition : " + file_path)
+            individuals = [ tuple( individual.split( " ", 1)) for individual in data[ KinshipDecomposition.INDIVIDUALS_KEY]]
+            chromosomes = [ str( chromosome) for chromosome in data[ KinshipDecomposition.CHROMOSOMES_KEY]]
+            for index, chromosome in enumerate( chromosomes):
+                eigenvectors[ chromosome] = data[ KinshipDecomposition.EIGENVECTORS_KEY_PREFIX + str( index)]
+                eigenvalues[ chromosome] = data[ KinshipDecomposition.EIGENVALUES_KEY_PREFIX + str( index)]
+
+        Logger.get_instance().info( "KinshipDecomposition : Decomposition loaded from " + file_path)
+
+        return KinshipDecomposition( individuals, chromosomes, eigenvectors, eigenvalues)
+
+    #
+    # Load the decomposition of a genotype from the given .npz file or, if the file does not exist,
+    # compute it and save it to the file
+    #
+    # @param file_path : string - the path to the .npz file
+    # @param genotype_prefix : string - the path to the .bed, .bim and .fam files (name with no extension)
+    #
+    # @return KinshipDecomposition
+    @staticmethod
+    def load_or_compute( file_path, genotype_prefix):
+
+        if os.path.isfile( file_path):
+            decomposition = KinshipDecomposition.load( file_path)
+            if decomposition.get_individuals() == PlinkBedFile.read_individuals( genotype_prefix + PlinkBedFile.FAM_EXTENSION):
+                return decomposition
+            Logger.get_instance().warning( "KinshipDecomposition.load_or_compute : Individuals of " + file_path + " differ from genotype " + genotype_prefix + ". Computing it again.")
+
+        decomposition = KinshipDecomposition.compute( genotype_prefix)
+        decomposition.save( file_path)
+
+        return decomposition
+
+    #
+    # Compute the leave-out-one-chromosome decomposition of a genotype
+    #
+    # @param genotype_prefix : string - the path to the .bed, .bim and .fam files (name with no extension)
+    # @param individuals : list - the (family ID, individual ID) tuples of the individuals to use, in genotype order (None to use all the individuals)
+    #
+    # @return KinshipDecomposition
+    @staticmethod
+    def compute( genotype_prefix, individuals = None):
+
+        Logger.get_instance().info( "KinshipDecomposition : Computing the similarity matrices of genotype " + genotype_prefix)
+
+        genotype = PlinkBedFile( genotype_prefix)
+        if individuals == None:
+            individuals = genotype.get_individuals()
+            sample_index = None
+        else:
+            kept_individuals = set( individuals)
+            sample_index = np.array( [ index for index, individual in enumerate( genotype.get_individuals()) if individual in kept_individuals], dtype = np.intp)
+        individual_count = len( individuals)
+
+        chromosomes, snp_ranges = KinshipDecomposition.get_chromosome_ranges( genotype.get_snp_chromosomes())
+
+        # Accumulate the contribution of each chromosome to the similarity matrix
+        chromosome_matrices = {}
+        for chromosome in chromosomes:
+            matrix = np.zeros( ( individual_count, individual_count))
+            for range_start, range_end in snp_ranges[ chromosome]:
+                for chunk_start in range( range_start, range_end, KinshipDecomposition.SNP_CHUNK_SIZE):
+                    snps = genotype.read_genotypes( chunk_start, min( chunk_start + KinshipDecomposition.SNP_CHUNK_SIZE, range_end))
+                    if sample_index is not None:
+                        snps = snps[ sample_index]
+                    snps = KinshipDecomposition.standardize( snps)
+                    matrix += snps.dot( snps.T)
+            chromosome_matrices[ chromosome] = matrix
+        total_matrix = sum( chromosome_matrices.values())
+
+        # Decompose the similarity matrix built from the SNPs of the other chromosomes
+        eigenvectors = {}
+        eigenvalues = {}
+        for chromosome in chromosomes:
+            matrix = total_matrix - chromosome_matrices[ chromosome]
+            matrix *= individual_count / np.trace( matrix)
+            eigenvalues[ chromosome], eigenvectors[ chromosome] = np.linalg.eigh( matrix)
+            Logger.get_instance().info( "  Similarity matrix decomposed for chromosome " + chromosome)
+
+        return KinshipDecomposition( list( individuals), chromosomes, eigenvectors, eigenvalues)
+
+    #
+    # List the ranges of consecutive SNPs of each chromosome
+    #
+    # @param snp_chromosomes : list - the chromosome of each SNP, in genotype order
+    #
+    # @return tuple - the list of chromosome names (in genotype order) and the dict of [start, end[ SNP index ranges of each chromosome
+    @staticmethod
+    def get_chromosome_ranges( snp_chromosomes):
+
+        chromosomes = []
+        snp_ranges = {}
+        for snp_index, chromosome in enumerate( snp_chromosomes):
+            if chromosome not in snp_ranges:
+                chromosomes.append( chromosome)
+                snp_ranges[ chromosome] = []
+            ranges = snp_ranges[ chromosome]
+            if len( ranges) > 0 and ranges[ -1][ 1] == snp_index:
+                ranges[ -1][ 1] = snp_index + 1
+            else:
+                ranges.append( [ snp_index, snp_index + 1])
+
+        return ( chromosomes, snp_ranges)
+
+    #
+    # Standardize the SNPs of a genotype matrix: each SNP gets a mean of 0 and a standard deviation of 1
+    # over its non-missing values, then missing values are set to 0. Constant SNPs are set to 0.
+    #
+    # @param snps : numpy.ndarray - the allele counts (one row per individual, one column per SNP, NaN for missing genotypes)
+    #
+    # @return numpy.ndarray - the standardized SNPs
+    @staticmethod
+    def standardize( snps):
+
+        missing = np.isnan( snps)
+        present_count = np.maximum( ( ~missing).sum( axis = 0), 1)
+        snps = np.where( missing, 0.0, snps)
+        mean = snps.sum( axis = 0) / present_count
+        snps -= mean
+        snps[ missing] = 0.0
+        std = np.sqrt( ( snps * snps).sum( axis = 0) / present_count)
+        std[ std == 0] = np.inf
+
+        return snps / std
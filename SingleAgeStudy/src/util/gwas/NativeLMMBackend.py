@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy import optimize
+
+from util.log.Logger import Logger
+from util.plink.PlinkBedFile import PlinkBedFile
+from util.gwas.GwasBackend import GwasBackend
+from util.gwas.KinshipDecomposition import KinshipDecomposition
+
+# GWAS backend implementing the single-SNP LMM test of Fast-LMM (mode LMM(all), leave-out-one-chromosome) with NumPy
+#
+# For each chromosome:
+#   - the similarity matrix K built from the other chromosomes is taken from the kinship decomposition
+#     (see KinshipDecomposition)
+#   - the covariables X (with a bias column) are projected out of K + I, of the phenotype and of the SNPs
+#     (P = I - X.pinv(X)), and P.(K + I).P is decomposed: U.diag(S + 1).U^T (the D null dimensions are removed)
+#   - the heritability h2 of the null model is searched on a grid refined by Brent's method, minimizing
+#     the negative log-likelihood of y ~ N( 0, sigma2.(h2.K + (1-h2).I)) in the rotated space
+#   - the SNPs are read by blocks, standardized, projected and rotated by U with a single matrix product per block,
+#     then all the SNPs of the block are tested at once with the Fast-LMM statistics:
+#       beta = (g^T.V^-1.y) / (g^T.V^-1.g)
+#       var(beta) = (y^T.V^-1.y - beta.g^T.V^-1.y) / (N - D - 1) / (g^T.V^-1.g)
+#       p-value = F-distribution survival of beta^2/var(beta) with 1 and N - D - 1 degrees of freedom
+#
+# The block size is computed from a memory goal, so that the rotation of a block is a large matrix product executed
+# by BLAS (the number of BLAS threads is controlled by the OMP_NUM_THREADS / OPENBLAS_NUM_THREADS / MKL_NUM_THREADS
+# environment variables).
+#
+# The result has the same columns as the result of Fast-LMM (Mixing is always 0 since a single similarity matrix is used).
+
+class NativeLMMBackend(GwasBackend):
+
+    # Memory (in bytes) targeted by the arrays of a block of SNPs
+    MEMORY_GOAL = 512 * 1024 * 1024
+    MIN_BLOCK_SIZE = 1000
+
+    # Number of float arrays of the size of a block allocated at the same time while testing it
+    BLOCK_ARRAY_COUNT = 4
+
+    # Parameters of the heritability search (as done by Fast-LMM)
+    H2_GRID_SIZE = 10
+    H2_MIN = 0.0
+    H2_MAX = 0.99999
+    INVALID_NLL = 3E20
+
+    # Standard deviation under which a projected variable is considered as explained by the covariables
+    EXPLAINED_VARIABLE_STD = 1e-10
+
+    #
+    # Instantiate the backend
+    #
+    # @param working_path : string - the path to the folder where the backend can write its temporary files
+    # @param memory_goal : int - the memory (in bytes) targeted by the arrays of a block of SNPs (None for the default)
+    #
+    def __init__(self, working_path, memory_goal = None):
+
+        if memory_goal == None:
+            memory_goal = NativeLMMBackend.MEMORY_GOAL
+        GwasBackend.__init__( self, working_path, memory_goal)
+
+    #
+    # Return the name of the backend
+    #
+    def get_name(self):
+
+        return GwasBackend.NATIVE_BACKEND
+
+    #
+    # Execute the GWAS
+    #
+    # @param genotype_prefix : string - the path to the .bed, .bim and .fam files (name with no extension)
+    # @param phenotype_file_name : string - the path to the phenotype file
+    # @param covariable_file_name : string - the path to the covariable file
+    # @param kinship_file_path : string - the path to the .npz file of the shared kinship decomposition (None to compute it)
+    #
+    # @return pandas.DataFrame - the result of the test of each SNP, sorted by p-value
+    def run(self, genotype_prefix, phenotype_file_name, covariable_file_name, kinship_file_path = None):
+
+        results_df = pd.concat( list( self.run_chunks( genotype_prefix, phenotype_file_name, covariable_file_name, kinship_file_path)), ignore_index = True)
+
+        return results_df
+
+    #
+    # Execute the GWAS and return its result by chunks of rows. The result columns are kept in preallocated arrays
+    # and each chunk is built only when requested, from the order of the p-values.
+    #
+    # @param genotype_prefix : string - the path to the .bed, .bim and .fam files (name with no extension)
+    # @param phenotype_file_name : string - the path to the phenotype file
+    # @param covariable_file_name : string - the path to the covariable file
+    # @param kinship_file_path : string - the path to the .npz file of the shared kinship decomposition (None to compute it)
+    # @param chunk_size : int - the number of rows of the chunks (None for GwasBackend.RESULT_CHUNK_SIZE)
+    #
+    # @return generator - the pandas.DataFrame chunks of the result, sorted by p-value
+    def run_chunks(self, genotype_prefix, phenotype_file_name, covariable_file_name, kinship_file_path = None, chunk_size = None):
+
+        if chunk_size == None:
+            chunk_size = GwasBackend.RESULT_CHUNK_SIZE
+
+        result_columns = self.compute_result_columns( genotype_prefix, phenotype_file_name, covariable_file_name, kinship_file_path)
+
+        order = result_columns[ "PValue"].argsort( kind = "mergesort")
+        for chunk_start in range( 0, len( order), chunk_size):
+            chunk_order = order[ chunk_start:chunk_start + chunk_size]
+            chunk = pd.DataFrame( dict( [ ( column, result_columns[ column][ chunk_order]) for column in GwasBackend.RESULT_COLUMNS]),
+                                  columns = GwasBackend.RESULT_COLUMNS)
+            chunk.index = np.arange( chunk_start, chunk_start + len( chunk_order))
+            yield chunk
+
+    #
+    # Test all the SNPs of the genotype
+    #
+    # @param genotype_prefix : string - the path to the .bed, .bim and .fam files (name with no extension)
+    # @param phenotype_file_name : string - the path to the phenotype file
+    # @param covariable_file_name : string - the path to the covariable file
+    # @param kinship_file_path : string - the path to the .npz file of the shared kinship decomposition (None to compute it)
+    #
+    # @return dict - the array of values of each result column (see GwasBackend.RESULT_COLUMNS), in genotype order
+    def compute_result_columns(self, genotype_prefix, phenotype_file_name, covariable_file_name, kinship_file_path = None):
+
+        genotype = PlinkBedFile( genotype_prefix)
+
+        # Get the individuals having phenotype and covariable values and the similarity matrices on these individuals
+        individuals, phenotype, covariables = GwasBackend.get_complete_individuals( genotype.get_individuals(), phenotype_file_name, covariable_file_name)
+        covariables = np.c_[ covariables, np.ones( ( len( individuals), 1))]
+        if len( individuals) == len( genotype.get_individuals()):
+            sample_index = None
+            if kinship_file_path != None:
+                decomposition = KinshipDecomposition.load_or_compute( kinship_file_path, genotype_prefix)
+            else:
+                decomposition = KinshipDecomposition.compute( genotype_prefix)
+        else:
+            kept_individuals = set( individuals)
+            sample_index = np.array( [ index for index, individual in enumerate( genotype.get_individuals()) if individual in kept_individuals], dtype = np.intp)
+            decomposition = KinshipDecomposition.compute( genotype_prefix, individuals)
+
+        snp_table = genotype.get_snp_table()
+        snp_count = len( snp_table)
+        chromosomes, snp_ranges = KinshipDecomposition.get_chromosome_ranges( snp_table[ "chromosome"].values)
+        block_size = max( NativeLMMBackend.MIN_BLOCK_SIZE, self.memoryGoal // ( 8 * len( individuals) * NativeLMMBackend.BLOCK_ARRAY_COUNT))
+
+        Logger.get_instance().info( "NativeLMMBackend : Testing " + str( snp_count) + " SNPs on " + str( len( individuals)) + " individuals by blocks of " + str( block_size) + " SNPs")
+
+        result_columns = {}
+        result_columns[ "SNP"] = snp_table[ "snp"].values
+        result_columns[ "Chr"] = snp_table[ "chromosome"].map( NativeLMMBackend.get_chromosome_value).values
+        result_columns[ "GenDist"] = snp_table[ "genetic_distance"].values
+        result_columns[ "ChrPos"] = snp_table[ "position"].values
+        result_columns[ "sid_index"] = np.zeros( snp_count)
+        for column in NullModel.TEST_COLUMNS:
+            result_columns[ column] = np.zeros( snp_count)
+
+        for chromosome in chromosomes:
+            null_model = NullModel( decomposition.get_kernel( chromosome), covariables, phenotype)
+            Logger.get_instance().info( "  Null model computed for chromosome " + chromosome + " : h2 = " + str( null_model.h2))
+
+            sid_index = 0
+            for range_start, range_end in snp_ranges[ chromosome]:
+                for block_start in range( range_start, range_end, block_size):
+                    block_end = min( block_start + block_size, range_end)
+                    snps = genotype.read_genotypes( block_start, block_end)
+                    if sample_index is not None:
+                        snps = snps[ sample_index]
+                    block_frame = null_model.test_snps( KinshipDecomposition.standardize( snps))
+                    for column in NullModel.TEST_COLUMNS:
+                        result_columns[ column][ block_start:block_end] = block_frame[ column].values
+                    result_columns[ "sid_index"][ block_start:block_end] = np.arange( sid_index, sid_index + block_end - block_start)
+                    sid_index += block_end - block_start
+
+        return result_columns
+
+    #
+    # Return the value of a chromosome in the result (a float as in Fast-LMM results, or the name if it is not a number)
+    #
+    # @param chromosome : string - the chromosome name
+    #
+    @staticmethod
+    def get_chromosome_value( chromosome):
+
+        try:
+            return float( chromosome)
+        except ValueError:
+            return chromosome
+
+
+# Null model of the LMM for a phenotype and a similarity matrix, used to test blocks of SNPs
+
+class NullModel(object):
+
+    TEST_COLUMNS = [ "PValue", "SnpWeight", "SnpWeightSE", "SnpFractVarExpl", "Mixing", "Nullh2"]
+
+    #
+    # Compute the null model
+    #
+    # @param kernel : numpy.ndarray - the NxN similarity matrix
+    # @param covariables : numpy.ndarray - the N x D covariable matrix (including the bias column)
+    # @param phenotype : numpy.ndarray - the N x 1 phenotype matrix
+    #
+    def __init__(self, kernel, covariables, phenotype):
+
+        self.covariables = covariables
+        self.covariablesPinv = np.linalg.pinv( covariables)
+        self.individualCount = covariables.shape[ 0]
+        self.covariableCount = covariables.shape[ 1]
+        self.dof = self.individualCount - self.covariableCount
+
+        # Decompose the similarity matrix projected on the space orthogonal to the covariables
+        projected_kernel = self.regress( kernel + np.eye( self.individualCount))
+        projected_kernel = self.regress( projected_kernel.T)
+        eigenvalues, eigenvectors = np.linalg.eigh( projected_kernel)
+        self.U = eigenvectors[ :, self.covariableCount:]
+        self.S = eigenvalues[ self.covariableCount:] - 1.0
+
+        # Rotate the phenotype and find the heritability
+        self.UY = self.U.T.dot( self.regress( phenotype))
+        self.h2 = self.find_h2()
+
+        self.Sd = self.h2 * self.S + ( 1.0 - self.h2)
+        self.UYSd = self.UY / self.Sd[ :, np.newaxis]
+        self.YKY = ( self.UY * self.UYSd).sum()
+
+    #
+    # Project a matrix on the space orthogonal to the covariables
+    #
+    # @param matrix : numpy.ndarray - the N x P matrix
+    #
+    # @return numpy.ndarray - the projected matrix
+    def regress(self, matrix):
+
+        return matrix - self.covariables.dot( self.covariablesPinv.dot( matrix))
+
+    #
+    # Compute the negative log-likelihood of the null model for the given heritability
+    #
+    # @param h2 : float - the heritability
+    #
+    # @return float
+    def compute_nll(self, h2):
+
+        if h2 < 0.0 or h2 >= 1.0:
+            return NativeLMMBackend.INVALID_NLL
+
+        sd = h2 * self.S + ( 1.0 - h2)
+        yky = ( self.UY[ :, 0] * self.UY[ :, 0] / sd).sum()
+        sigma2 = yky / self.dof
+
+        return 0.5 * ( np.log( sd).sum() + self.dof * ( np.log( 2.0 * np.pi * sigma2) + 1))
+
+    #
+    # Find the heritability minimizing the negative log-likelihood: evaluation on a grid then refinement of the
+    # boundaries and of the local minima of the grid with Brent's method (as done by Fast-LMM)
+    #
+    # @return float - the heritability
+    def find_h2(self):
+
+        step = ( NativeLMMBackend.H2_MAX - NativeLMMBackend.H2_MIN) / NativeLMMBackend.H2_GRID_SIZE
+        grid = np.arange( NativeLMMBackend.H2_MIN, NativeLMMBackend.H2_MAX + step, step)
+        grid_nll = np.array( [ self.compute_nll( h2) for h2 in grid])
+
+        best_index = grid_nll.argmin()
+        best = ( grid[ best_index], grid_nll[ best_index])
+        candidates = []
+        if grid_nll[ 0] < grid_nll[ 1]:
+            candidates.append( optimize.fminbound( self.compute_nll, grid[ 0], grid[ 1], full_output = True)[ 0:2])
+        if grid_nll[ -1] < grid_nll[ -2]:
+            candidates.append( optimize.fminbound( self.compute_nll, grid[ -2], grid[ -1], full_output = True)[ 0:2])
+        for index in range( len( grid) - 2):
+            if grid_nll[ index + 1] < grid_nll[ index + 2] and grid_nll[ index + 1] < grid_nll[ index]:
+                candidates.append( optimize.brent( self.compute_nll, brack = ( grid[ index], grid[ index + 1], grid[ index + 2]), full_output = True)[ 0:2])
+        for candidate in candidates:
+            if candidate[ 1] < best[ 1]:
+                best = candidate
+
+        return float( best[ 0])
+
+    #
+    # Test a block of SNPs
+    #
+    # @param snps : numpy.ndarray - the N x B standardized SNPs
+    #
+    # @return pandas.DataFrame - the PValue, SnpWeight, SnpWeightSE, SnpFractVarExpl, Mixing and Nullh2 of each SNP
+    def test_snps(self, snps):
+
+        snps = self.regress( snps)
+        # SNPs explained by the covariables are not tested
+        snps[ :, snps.std( axis = 0) <= NativeLMMBackend.EXPLAINED_VARIABLE_STD] = 0.0
+        usnps = self.U.T.dot( snps)
+
+        snps_k_snps = ( usnps * usnps / self.Sd[ :, np.newaxis]).sum( axis = 0)
+        snps_k_y = usnps.T.dot( self.UYSd)[ :, 0]
+
+        with np.errstate( divide = "ignore", invalid = "ignore"):
+            beta = snps_k_y / snps_k_snps
+            beta[ snps_k_y == 0] = 0.0
+            variance_explained = snps_k_y * beta
+            variance_beta = ( self.YKY - variance_explained) / ( self.dof - 1.0) / snps_k_snps
+            p_values = stats.f.sf( beta * beta / variance_beta, 1, self.individualCount - ( self.covariableCount + 1))
+
+        block_frame = pd.DataFrame( { "PValue": p_values,
+                                      "SnpWeight": beta,
+                                      "SnpWeightSE": np.sqrt( variance_beta),
+                                      "SnpFractVarExpl": np.sqrt( variance_explained / self.YKY),
+                                      "Mixing": np.zeros( len( beta)),
+                                      "Nullh2": np.zeros( len( beta)) + self.h2},
+                                    columns = NullModel.TEST_COLUMNS)
+
+        return block_frame
@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
 
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, MemoryHandler
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
 
 from util import Constants
+from util.log.QueueLogging import QueueHandler, QueueListener
 
 ## CLass Logger
 #  ============
@@ -22,6 +29,14 @@ from util import Constants
 #
 # By default, the logging mode is set to DEBUG.
 #
+# In queue mode, the logger only puts the records in a queue: a background thread
+# formats them and writes them to the log file and the console, through buffers of
+# buffer_size records flushed when full and at each ERROR or CRITICAL record.
+# The error() and critical() methods wait until the records are written.
+#
+# The debug(), info() and warning() methods accept the arguments of the message
+# ( "%s" format), which is formatted only if the level of the message is enabled.
+#
 class Logger(object):
 
     __instance = None
@@ -31,9 +46,18 @@ class Logger(object):
     #
     # Instance variable:
     #    - logg: a logging object which allow to log.
-    def __init__(self, log_path= Constants.PATH_LOG, mode=Constants.MODE_INFO, writting_mode=Constants.LOG_NO_APPEND):
-        self.logg = Logger.setLogger( log_path, mode, writting_mode)
+    #    - queueListener: the QueueListener writing the records in queue mode (None otherwise).
+    #    - listenerPaused: True while the background thread of the queue mode is paused.
+    def __init__(self, log_path= Constants.PATH_LOG, mode=Constants.MODE_INFO, writting_mode=Constants.LOG_NO_APPEND, queue_mode=False, buffer_size=Constants.LOG_BUFFER_SIZE):
         self.mode = mode
+        self.queueListener = None
+        self.listenerPaused = False
+        if queue_mode:
+            self.logg, self.queueListener = Logger.setQueueLogger( log_path, mode, writting_mode, buffer_size)
+            # Write the records remaining in the queue at exit
+            atexit.register( self.stop_listener)
+        else:
+            self.logg = Logger.setLogger( log_path, mode, writting_mode)
 
     ## setLogger
     #  ---------
@@ -43,16 +67,62 @@ class Logger(object):
     @staticmethod
     def setLogger( log_path, mode, writting_mode):
 
-        # Reinitialize log file
-        ERROR_FILE = open( log_path, "w")
-        ERROR_FILE.write("-----------------------------------")
-        ERROR_FILE.close()
+        # Logger object which is used to write in log
+        logger = logging.getLogger()
+        # Set level to mode.
+        logger.setLevel(mode)
+
+        for handler in Logger.createHandlers( log_path, mode):
+            # add this handler to the logger
+            logger.addHandler(handler)
+
+        return logger
+
+    ## setQueueLogger
+    #  --------------
+    #
+    # Defines options to the Logger in queue mode: the handlers of the log
+    # file and of the console are behind buffers of buffer_size records,
+    # run by a QueueListener on a background thread.
+    #
+    # @return the logging object and the started QueueListener
+    @staticmethod
+    def setQueueLogger( log_path, mode, writting_mode, buffer_size):
 
         # Logger object which is used to write in log
         logger = logging.getLogger()
         # Set level to mode.
         logger.setLevel(mode)
 
+        # Buffer the records of each handler, flushed when full and on errors
+        buffered_handlers = []
+        for handler in Logger.createHandlers( log_path, mode):
+            buffered_handler = MemoryHandler( max( 1, buffer_size), flushLevel=Constants.MODE_ERROR, target=handler)
+            buffered_handler.setLevel(mode)
+            buffered_handlers.append( buffered_handler)
+
+        # Only the queue handler is attached to the logger
+        record_queue = queue.Queue()
+        logger.addHandler( QueueHandler( record_queue))
+        queue_listener = QueueListener( record_queue, *buffered_handlers)
+        queue_listener.start()
+
+        return logger, queue_listener
+
+    ## createHandlers
+    #  --------------
+    #
+    # Create the handlers of the log file and of the console.
+    #
+    # @return the list of handlers
+    @staticmethod
+    def createHandlers( log_path, mode):
+
+        # Reinitialize log file
+        ERROR_FILE = open( log_path, "w")
+        ERROR_FILE.write("-----------------------------------")
+        ERROR_FILE.close()
+
         # Create formatter which will add time and log level for each message
         # when a message will be written
         formatter = logging.Formatter \
@@ -65,15 +135,12 @@ class Logger(object):
         # Set level on mode
         file_handler.setLevel(mode)
         file_handler.setFormatter(formatter)
-        # add this handler to the logger
-        logger.addHandler(file_handler)
 
         # Second handler to print log message on console
         steam_handler = logging.StreamHandler()
         steam_handler.setLevel(mode)
-        logger.addHandler(steam_handler)
 
-        return logger
+        return [ file_handler, steam_handler]
 
     ## get_instance
     #  ------------
@@ -83,23 +150,40 @@ class Logger(object):
     # same object.
     #
     # @return Logger instance.
+    # @param queue_mode: True to write the records on a background thread
+    # @param buffer_size: the number of records buffered in queue mode
+    #
+    # @return Logger instance.
     @staticmethod
-    def get_instance( log_path= Constants.PATH_LOG, logging_mode=Constants.MODE_INFO, writting_mode=Constants.LOG_APPEND):
+    def get_instance( log_path= Constants.PATH_LOG, logging_mode=Constants.MODE_INFO, writting_mode=Constants.LOG_APPEND, queue_mode=False, buffer_size=Constants.LOG_BUFFER_SIZE):
         if Logger.__instance == None:
-            Logger.__instance = Logger( log_path, logging_mode, writting_mode)
+            Logger.__instance = Logger( log_path, logging_mode, writting_mode, queue_mode, buffer_size)
         return Logger.__instance
 
+    ## is_enabled
+    #  ----------
+    #
+    # Indicates if the messages of a level are logged (to avoid building
+    # messages that are not logged)
+    #
+    # @param level: the level ( e.g. Constants.MODE_DEBUG)
+    #
+    # @return boolean
+    def is_enabled(self, level):
+        return level >= self.mode and self.logg.isEnabledFor(level)
+
     ## debug
     #  -----
     #
     # Log debug
     #
     # @param message: messgae to log
+    # @param args: the arguments of the message
     #
     # @return None
-    def debug(self, message):
-        if self.mode == Constants.MODE_DEBUG:
-            self.logg.debug(message)
+    def debug(self, message, *args):
+        if self.is_enabled( Constants.MODE_DEBUG):
+            self.logg.debug(message, *args)
 
     ## info
     #  ----
@@ -107,10 +191,9 @@ class Logger(object):
     # Log info
     #
     # @return None
-    def info(self, message):
-        if (self.mode == Constants.MODE_DEBUG or
-            self.mode == Constants.MODE_INFO):
-                self.logg.info(message)
+    def info(self, message, *args):
+        if self.is_enabled( Constants.MODE_INFO):
+            self.logg.info(message, *args)
 
     ## warning
     #  -------
@@ -118,16 +201,14 @@ class Logger(object):
     # Log warning
     #
     # @return None
-    def warning(self, message):
-        if (self.mode == Constants.MODE_DEBUG or
-            self.mode == Constants.MODE_INFO or
-            self.mode == Constants.MODE_WARNING):
-                self.logg.warning(message)
+    def warning(self, message, *args):
+        if self.is_enabled( Constants.MODE_WARNING):
+            self.logg.warning(message, *args)
 
     ## error
     #  -----
     #
-    # Log error
+    # Log error (in queue mode, wait until the records are written)
     #
     # @return None
     def error(self, message, ex=True):
@@ -143,6 +224,7 @@ class Logger(object):
                 self.mode == Constants.MODE_WARNING or
                 self.mode == Constants.MODE_ERROR):
                     self.logg.error(message)
+        self.flush()
 
     ## critical
     #  --------
@@ -152,14 +234,105 @@ class Logger(object):
     # @return None
     def critical(self, message):
         self.logg.critical(message, exc_info=False)
+        self.stop_listener()
         exit()
-        
+
+    ## flush
+    #  -----
+    #
+    # Wait until the records in queue are written and flush the buffers
+    # (queue mode only)
+    #
+    # @return None
+    def flush(self):
+        if self.queueListener != None:
+            if not self.listenerPaused:
+                self.queueListener.queue.join()
+            for handler in self.queueListener.handlers:
+                handler.flush()
+
+    ## stop_listener
+    #  -------------
+    #
+    # Write the records in queue and stop the background thread
+    # (queue mode only)
+    #
+    # @return None
+    def stop_listener(self):
+        if self.queueListener != None:
+            if not self.listenerPaused:
+                self.queueListener.stop()
+            for handler in self.queueListener.handlers:
+                target = handler.target
+                handler.close()
+                target.close()
+            self.queueListener = None
+            self.listenerPaused = False
+
+    ## pause_listener
+    #  --------------
+    #
+    # Write the records in queue and stop the background thread until
+    # resume_listener() is called, e.g. before forking processes, which
+    # must not inherit the locks held by this thread. The records logged
+    # in the meantime stay in the queue. (queue mode only)
+    #
+    # @return None
+    def pause_listener(self):
+        if self.queueListener != None and not self.listenerPaused:
+            self.queueListener.stop()
+            self.listenerPaused = True
+
+    ## resume_listener
+    #  ---------------
+    #
+    # Restart the background thread stopped by pause_listener()
+    # (queue mode only)
+    #
+    # @return None
+    def resume_listener(self):
+        if self.queueListener != None and self.listenerPaused:
+            self.queueListener.start()
+            self.listenerPaused = False
+
+    ## get_record_handlers
+    #  -------------------
+    #
+    # Return the handlers writing the records: the buffered handlers of the
+    # background thread in queue mode, the handlers of the logger otherwise.
+    # Records read from another queue can be handled by them directly.
+    #
+    # @return the list of handlers
+    def get_record_handlers(self):
+        if self.queueListener != None:
+            return list( self.queueListener.handlers)
+        return self.logg.handlers[:]
+
+    ## forward_to_queue
+    #  ----------------
+    #
+    # Put the records in a queue read by another process (e.g. a
+    # multiprocessing.Queue read by a QueueListener of the parent process)
+    # instead of writing them. Used in the child processes of a process pool,
+    # where the background thread of the queue mode does not exist.
+    #
+    # @param record_queue: the queue
+    #
+    # @return None
+    def forward_to_queue(self, record_queue):
+        for handler in self.logg.handlers[:]:
+            self.logg.removeHandler(handler)
+        self.logg.addHandler( QueueHandler( record_queue))
+        self.queueListener = None
+        self.listenerPaused = False
+
     #
     # Close all logging handlers
     #
     # @return None        
     def close(self):
         
+        self.stop_listener()
         handlers = self.logg.handlers[:]
         for handler in handlers:
             handler.close()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import logging
+
+# Queue-based logging handlers: the QueueHandler attached to the logger only puts the records in a queue, and the
+# QueueListener formats them and writes them to the real handlers (file, console) on a background thread, so the
+# threads logging in hot loops do not wait for the disk or console I/O.
+#
+# The standard library provides these classes from Python 3.2 (logging.handlers); this module provides the
+# same API for Python 2.7, and uses the standard classes when they exist.
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+
+except ImportError:
+
+    class QueueHandler( logging.Handler):
+
+        #
+        # Instantiate the handler
+        #
+        # @param record_queue : Queue - the queue the records are put in
+        #
+        def __init__(self, record_queue):
+
+            logging.Handler.__init__( self)
+            self.queue = record_queue
+
+        #
+        # Prepare a record to be handled on another thread: the message is merged with its arguments and the
+        # exception is rendered, so that the record no longer references the objects of the caller
+        #
+        # @param record : LogRecord - the record
+        #
+        # @return LogRecord - the prepared record
+        def prepare(self, record):
+
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException( record.exc_info)
+                record.exc_info = None
+
+            return record
+
+        #
+        # Put a record in the queue
+        #
+        # @param record : LogRecord - the record
+        #
+        def emit(self, record):
+
+            try:
+                self.queue.put_nowait( self.prepare( record))
+            except Exception:
+                self.handleError( record)
+
+    class QueueListener(object):
+
+        _sentinel = None
+
+        #
+        # Instantiate the listener
+        #
+        # @param record_queue : Queue - the queue the records are read from
+        # @param handlers : the handlers writing the records
+        # @param respect_handler_level : boolean - True to pass to each handler only the records of its level
+        #
+        def __init__(self, record_queue, *handlers, **kwargs):
+
+            self.queue = record_queue
+            self.handlers = handlers
+            self.respect_handler_level = kwargs.get( "respect_handler_level", False)
+            self._thread = None
+
+        #
+        # Start the background thread handling the records
+        #
+        def start(self):
+
+            self._thread = threading.Thread( target = self._monitor)
+            self._thread.setDaemon( True)
+            self._thread.start()
+
+        #
+        # Handle a record with the handlers
+        #
+        # @param record : LogRecord - the record
+        #
+        def handle(self, record):
+
+            for handler in self.handlers:
+                if not self.respect_handler_level or record.levelno >= handler.level:
+                    handler.handle( record)
+
+        #
+        # Handle the records of the queue until the sentinel is read
+        #
+        def _monitor(self):
+
+            has_task_done = hasattr( self.queue, "task_done")
+            while True:
+                record = self.queue.get( True)
+                try:
+                    if record is self._sentinel:
+                        break
+                    self.handle( record)
+                finally:
+                    if has_task_done:
+                        self.queue.task_done()
+
+        #
+        # Stop the background thread once all the records of the queue are handled
+        #
+        def stop(self):
+
+            self.queue.put_nowait( self._sentinel)
+            self._thread.join()
+            self._thread = None
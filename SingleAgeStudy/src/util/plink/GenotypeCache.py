@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+
+from util.log.Logger import Logger
+from util.plink.PlinkBedFile import PlinkBedFile
+from util.file.FileStaging import FileStaging
+from util.exception.SNPnetException import SNPnetException
+
+# Content-addressed cache of genotype subsets shared by the GWAS jobs
+#
+# Many GWAS jobs use exactly the same set of DGRP lines (same families file content), so they require
+# the same genotype subset. Each subset is built once and stored in a cache folder under a key computed from:
+#   - the fingerprint of the source genotype files (path, size and modification time of .bed, .bim and .fam)
+#   - the sorted list of kept individuals
+#   - the sorted list of kept SNPs (or all SNPs)
+#
+# Each cache entry is a folder named by the key and containing the .bed, .bim and .fam files of the subset.
+# An entry is built in a temporary folder and published with an atomic rename, so that concurrent jobs never
+# see a partial entry. The jobs get the cached files through hard links (or reflinks or copies if hard links are
+# not possible, see FileStaging), so that an entry can be evicted while another job is using it.
+#
+# The modification time of the entry folder is updated at each use and the least recently used entries
+# are evicted when the total size or the number of entries of the cache exceeds the provided limits.
+
+class GenotypeCache(object):
+
+    ENTRY_FILE_NAME = "geno"
+    TEMPORARY_ENTRY_PREFIX = ".tmp_"
+    ALL_SNPS_KEY = "ALL_SNPS"
+
+    # Time (in seconds) after which a temporary entry is considered as left by a crashed job
+    TEMPORARY_ENTRY_MAX_AGE = 24 * 3600
+
+    #
+    # Instantiate the genotype cache
+    #
+    # @param cache_path : string - the path to the cache folder (created if required)
+    # @param max_size : int - the maximal total size of the cache in bytes (None for no limit)
+    # @param max_entries : int - the maximal number of entries in the cache (None for no limit)
+    #
+    def __init__(self, cache_path, max_size = None, max_entries = None):
+
+        self.cachePath = cache_path
+        self.maxSize = max_size
+        self.maxEntries = max_entries
+
+        if not os.path.isdir( self.cachePath):
+            try:
+                os.makedirs( self.cachePath)
+            except OSError:
+                # The folder may have been created by a concurrent job
+                if not os.path.isdir( self.cachePath):
+                    raise
+
+    #
+    # Provide the genotype subset of the source genotype at the target path, building it
+    # in the cache if no job built it before
+    #
+    # @param source_prefix : string - the path to the source .bed, .bim and .fam files (name with no extension)
+    # @param target_prefix : string - the path where the .bed, .bim and .fam files of the subset must be provided
+    # @param keep_individuals : set - the (family ID, individual ID) tuples to keep (None to keep all individuals)
+    # @param extract_snps : set - the SNP IDs to keep (None to keep all SNPs)
+    #
+    # @return PlinkBedFile - the genotype subset at the target path
+    def get_genotype(self, source_prefix, target_prefix, keep_individuals = None, extract_snps = None):
+
+        key = GenotypeCache.compute_key( source_prefix, keep_individuals, extract_snps)
+        entry_path = os.path.join( self.cachePath, key)
+        entry_prefix = os.path.join( entry_path, GenotypeCache.ENTRY_FILE_NAME)
+
+        # The entry may be evicted by a concurrent job between its lookup and its linking,
+        # so the entry is rebuilt once if linking fails
+        for attempt in range( 2):
+            if os.path.isdir( entry_path):
+                Logger.get_instance().info( "GenotypeCache : Using cached genotype " + key)
+            else:
+                Logger.get_instance().info( "GenotypeCache : Building genotype " + key)
+                self.build_entry( source_prefix, entry_path, keep_individuals, extract_snps)
+
+            try:
+                self.touch_entry( entry_path)
+                GenotypeCache.link_genotype( entry_prefix, target_prefix)
+                break
+            except ( OSError, IOError, SNPnetException) as os_error:
+                if attempt > 0:
+                    raise
+                Logger.get_instance().warning( "GenotypeCache.get_genotype : Unable to use cached genotype " + key + " (" + str( os_error) + "). Rebuilding it.")
+
+        self.evict( key)
+
+        return PlinkBedFile( target_prefix)
+
+    #
+    # Build a cache entry in a temporary folder and publish it with an atomic rename
+    #
+    # @param source_prefix : string - the path to the source .bed, .bim and .fam files (name with no extension)
+    # @param entry_path : string - the path of the entry folder to publish
+    # @param keep_individuals : set - the (family ID, individual ID) tuples to keep (None to keep all individuals)
+    # @param extract_snps : set - the SNP IDs to keep (None to keep all SNPs)
+    #
+    def build_entry(self, source_prefix, entry_path, keep_individuals, extract_snps):
+
+        temporary_path = tempfile.mkdtemp( prefix = GenotypeCache.TEMPORARY_ENTRY_PREFIX, dir = self.cachePath)
+        try:
+            PlinkBedFile( source_prefix).subset( os.path.join( temporary_path, GenotypeCache.ENTRY_FILE_NAME), keep_individuals, extract_snps)
+            os.chmod( temporary_path, 0755)
+            os.rename( temporary_path, entry_path)
+        except OSError:
+            # A concurrent job published the same entry first: its entry is used
+            shutil.rmtree( temporary_path, ignore_errors = True)
+            if not os.path.isdir( entry_path):
+                raise
+        except:
+            shutil.rmtree( temporary_path, ignore_errors = True)
+            raise
+
+    #
+    # Mark the entry as recently used
+    #
+    # @param entry_path : string - the path of the entry folder
+    #
+    def touch_entry(self, entry_path):
+
+        os.utime( entry_path, None)
+
+    #
+    # Evict the least recently used entries until the cache respects its size and entries limits
+    #
+    # @param protected_key : string - the key of an entry that must not be evicted
+    #
+    def evict(self, protected_key = None):
+
+        if self.maxSize == None and self.maxEntries == None:
+            return
+
+        # List the entries with their last use time and size
+        entries = []
+        total_size = 0
+        for entry_name in os.listdir( self.cachePath):
+            entry_path = os.path.join( self.cachePath, entry_name)
+            if not os.path.isdir( entry_path):
+                continue
+            try:
+                last_use_time = os.path.getmtime( entry_path)
+                if entry_name.startswith( GenotypeCache.TEMPORARY_ENTRY_PREFIX):
+                    if time.time() - last_use_time > GenotypeCache.TEMPORARY_ENTRY_MAX_AGE:
+                        shutil.rmtree( entry_path, ignore_errors = True)
+                    continue
+                entry_size = sum( [ os.path.getsize( os.path.join( entry_path, file_name)) for file_name in os.listdir( entry_path)])
+            except OSError:
+                # The entry was removed by a concurrent job
+                continue
+            entries.append( ( last_use_time, entry_name, entry_size))
+            total_size += entry_size
+
+        # Remove the oldest entries while a limit is exceeded
+        entries.sort()
+        entry_count = len( entries)
+        for last_use_time, entry_name, entry_size in entries:
+            if ( self.maxSize == None or total_size <= self.maxSize) and ( self.maxEntries == None or entry_count <= self.maxEntries):
+                break
+            if entry_name == protected_key:
+                continue
+            Logger.get_instance().info( "GenotypeCache : Evicting genotype " + entry_name + " (" + str( entry_size) + " bytes)")
+            shutil.rmtree( os.path.join( self.cachePath, entry_name), ignore_errors = True)
+            total_size -= entry_size
+            entry_count -= 1
+
+    #
+    # Compute the key of a genotype subset
+    #
+    # @param source_prefix : string - the path to the source .bed, .bim and .fam files (name with no extension)
+    # @param keep_individuals : set - the (family ID, individual ID) tuples to keep (None to keep all individuals)
+    # @param extract_snps : set - the SNP IDs to keep (None to keep all SNPs)
+    #
+    # @return string - the hexadecimal key
+    @staticmethod
+    def compute_key( source_prefix, keep_individuals, extract_snps):
+
+        key_hash = hashlib.sha1()
+
+        # Fingerprint of the source genotype
+        for extension in [ PlinkBedFile.BED_EXTENSION, PlinkBedFile.BIM_EXTENSION, PlinkBedFile.FAM_EXTENSION]:
+            source_path = os.path.realpath( source_prefix + extension)
+            source_stat = os.stat( source_path)
+            key_hash.update( source_path + "\t" + str( source_stat.st_size) + "\t" + str( int( source_stat.st_mtime)) + "\n")
+
+        # Kept individuals
+        if keep_individuals == None:
+            key_hash.update( "ALL_INDIVIDUALS\n")
+        else:
+            for fid, iid in sorted( keep_individuals):
+                key_hash.update( fid + " " + iid + "\n")
+        key_hash.update( "\n")
+
+        # Kept SNPs
+        if extract_snps == None:
+            key_hash.update( GenotypeCache.ALL_SNPS_KEY + "\n")
+        else:
+            for snp_id in sorted( extract_snps):
+                key_hash.update( snp_id + "\n")
+
+        return key_hash.hexdigest()
+
+    #
+    # Provide the .bed, .bim and .fam files of a genotype at a new path through hard links
+    # (or reflinks or copies if hard links are not possible, never symbolic links since the entry may be evicted)
+    #
+    # @param source_prefix : string - the path to the genotype files (name with no extension)
+    # @param target_prefix : string - the path to the linked genotype files (name with no extension)
+    #
+    @staticmethod
+    def link_genotype( source_prefix, target_prefix):
+
+        FileStaging.stage_genotype( source_prefix, target_prefix, FileStaging.INDEPENDENT_METHODS)
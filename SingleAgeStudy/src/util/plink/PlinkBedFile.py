@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from util.log.Logger import Logger
+from util.exception.FileFormatException import FileFormatException
+
+# Read and subset PLINK binary genotype files (.bed/.bim/.fam) without calling plink
+# https://www.cog-genomics.org/plink/1.9/formats#bed
+#
+# - The .fam file contains one line per individual (family ID, individual ID, father, mother, sex, phenotype)
+# - The .bim file contains one line per SNP (chromosome, SNP ID, genetic distance, position, allele 1, allele 2)
+# - The .bed file starts with 3 magic bytes (0x6c 0x1b 0x01 for SNP-major mode) followed, for each SNP, by
+#   ceil( nb_individuals / 4) bytes. Each byte contains the genotypes of 4 individuals coded on 2 bits,
+#   starting from the low-order bits:
+#     00 : homozygous for allele 1
+#     01 : missing genotype
+#     10 : heterozygous
+#     11 : homozygous for allele 2
+#
+# The .bed file is accessed through a read-only memory map and processed by chunks of SNPs, so that the
+# subset of a whole DGRP genotype is produced without loading it in memory and without writing the
+# intermediate text .ped/.map files produced by "plink --recode".
+#
+# As with plink --keep/--extract, the kept individuals and SNPs stay in the order of the source files and
+# the allele coding of the source .bim file is preserved.
+
+class PlinkBedFile(object):
+
+    BED_MAGIC_NUMBER = [ 0x6c, 0x1b]
+    BED_SNP_MAJOR_MODE = 0x01
+    BED_HEADER_SIZE = 3
+
+    BED_EXTENSION = ".bed"
+    BIM_EXTENSION = ".bim"
+    FAM_EXTENSION = ".fam"
+
+    # Number of SNPs processed at once while subsetting the genotype
+    SNP_CHUNK_SIZE = 50000
+
+    # The bit shifts giving access to the 4 genotypes packed in a byte
+    GENOTYPE_SHIFTS = np.array( [ 0, 2, 4, 6], dtype = np.uint8)
+
+    # The number of allele 2 corresponding to each genotype code (as counted by pysnptools)
+    ALLELE_2_COUNTS = np.array( [ 0.0, np.nan, 1.0, 2.0])
+
+    # The same counts as 8-bit integers (-1 for missing genotypes)
+    MISSING_ALLELE_COUNT = -1
+    ALLELE_2_INT8_COUNTS = np.array( [ 0, MISSING_ALLELE_COUNT, 1, 2], dtype = np.int8)
+
+    #
+    # Open the PLINK binary genotype defined by the given prefix
+    #
+    # @param prefix : string - the path to the .bed, .bim and .fam files (name with no extension)
+    #
+    # @raise FileFormatException : if the .bed file is not a SNP-major PLINK file consistent with the .bim and .fam files
+    def __init__(self, prefix):
+
+        self.prefix = prefix
+        self.individuals = PlinkBedFile.read_individuals( prefix + PlinkBedFile.FAM_EXTENSION)
+        self.snpCount = PlinkBedFile.count_lines( prefix + PlinkBedFile.BIM_EXTENSION)
+        self.bytesPerSnp = ( len( self.individuals) + 3) // 4
+
+        bed_path = prefix + PlinkBedFile.BED_EXTENSION
+        with open( bed_path, "rb") as bed_file:
+            header = bytearray( bed_file.read( PlinkBedFile.BED_HEADER_SIZE))
+        if len( header) != PlinkBedFile.BED_HEADER_SIZE or list( header[ 0:2]) != PlinkBedFile.BED_MAGIC_NUMBER:
+            raise FileFormatException( "PlinkBedFile.__init__ : File is not a PLINK .bed file : " + bed_path)
+        if header[ 2] != PlinkBedFile.BED_SNP_MAJOR_MODE:
+            raise FileFormatException( "PlinkBedFile.__init__ : Only SNP-major .bed files are supported : " + bed_path)
+
+        expected_size = PlinkBedFile.BED_HEADER_SIZE + self.snpCount * self.bytesPerSnp
+        if os.path.getsize( bed_path) != expected_size:
+            raise FileFormatException( "PlinkBedFile.__init__ : Size of " + bed_path + " (" + str( os.path.getsize( bed_path)) + " bytes)" +
+                                       " is not consistent with " + str( self.snpCount) + " SNPs and " + str( len( self.individuals)) + " individuals")
+
+        self.bed = np.memmap( bed_path, dtype = np.uint8, mode = "r", offset = PlinkBedFile.BED_HEADER_SIZE,
+                              shape = ( self.snpCount, self.bytesPerSnp))
+
+    #
+    # Return the list of individuals of the genotype as (family ID, individual ID) tuples, in .fam order
+    #
+    def get_individuals(self):
+
+        return self.individuals
+
+    #
+    # Return the number of SNPs of the genotype
+    #
+    def get_snp_count(self):
+
+        return self.snpCount
+
+    #
+    # Return the chromosome of each SNP of the genotype, in .bim order
+    #
+    # @return list - the chromosome names
+    def get_snp_chromosomes(self):
+
+        chromosomes = []
+        with open( self.prefix + PlinkBedFile.BIM_EXTENSION) as bim_file:
+            for line in bim_file:
+                tokens = line.split()
+                if len( tokens) > 0:
+                    chromosomes.append( tokens[ 0])
+
+        return chromosomes
+
+    #
+    # Return the description of the SNPs of the genotype, in .bim order
+    #
+    # @return pandas.DataFrame - the chromosome (string), SNP ID (string), genetic distance (float) and position (float) of each SNP
+    def get_snp_table(self):
+
+        return pd.read_csv( self.prefix + PlinkBedFile.BIM_EXTENSION, delim_whitespace = True, header = None,
+                            names = [ "chromosome", "snp", "genetic_distance", "position", "allele_1", "allele_2"],
+                            usecols = [ "chromosome", "snp", "genetic_distance", "position"],
+                            dtype = { "chromosome": str, "snp": str, "genetic_distance": np.float64, "position": np.float64})
+
+    #
+    # Read the genotypes of a range of SNPs as allele 2 counts
+    #
+    # @param snp_start : int - the index of the first SNP to read
+    # @param snp_end : int - the index after the last SNP to read
+    #
+    # @return numpy.ndarray - the allele counts (one row per individual, one column per SNP, NaN for missing genotypes)
+    def read_genotypes(self, snp_start, snp_end):
+
+        codes = PlinkBedFile.unpack_genotypes( self.bed[ snp_start:snp_end], len( self.individuals))
+
+        return PlinkBedFile.ALLELE_2_COUNTS[ codes.T]
+
+    #
+    # Read the genotypes of a list of SNPs as 8-bit allele 2 counts, by chunks of SNP_CHUNK_SIZE SNPs
+    #
+    # @param snp_indexes : numpy.ndarray - the indexes of the SNPs to read
+    # @param sample_index : numpy.ndarray - the indexes of the individuals to keep (None to keep all individuals)
+    #
+    # @return numpy.ndarray - the int8 allele counts (one row per individual, one column per SNP, MISSING_ALLELE_COUNT for missing genotypes)
+    def read_genotype_counts(self, snp_indexes, sample_index = None):
+
+        sample_count = len( self.individuals) if sample_index is None else len( sample_index)
+        counts = np.empty( ( sample_count, len( snp_indexes)), dtype = np.int8)
+        for start in range( 0, len( snp_indexes), PlinkBedFile.SNP_CHUNK_SIZE):
+            end = min( start + PlinkBedFile.SNP_CHUNK_SIZE, len( snp_indexes))
+            chunk_counts = PlinkBedFile.ALLELE_2_INT8_COUNTS[ PlinkBedFile.unpack_genotypes( self.bed[ snp_indexes[ start:end]], len( self.individuals))]
+            if sample_index is not None:
+                chunk_counts = chunk_counts[ :, sample_index]
+            counts[ :, start:end] = chunk_counts.T
+
+        return counts
+
+    #
+    # Write a new PLINK binary genotype containing only the requested individuals and SNPs
+    #
+    # @param output_prefix : string - the path to the .bed, .bim and .fam files to produce (name with no extension)
+    # @param keep_individuals : set - the (family ID, individual ID) tuples to keep (None to keep all individuals)
+    # @param extract_snps : set - the SNP IDs to keep (None to keep all SNPs)
+    #
+    # @return PlinkBedFile - the produced genotype
+    def subset(self, output_prefix, keep_individuals = None, extract_snps = None):
+
+        Logger.get_instance().info( "Subsetting genotype " + self.prefix + " to " + output_prefix)
+
+        # Select the individuals to keep, in .fam order, and write the new .fam file
+        sample_index = []
+        with open( self.prefix + PlinkBedFile.FAM_EXTENSION) as fam_file, open( output_prefix + PlinkBedFile.FAM_EXTENSION, "w") as out_fam_file:
+            index = 0
+            for line in fam_file:
+                tokens = line.split()
+                if len( tokens) < 2:
+                    continue
+                if keep_individuals == None or ( tokens[ 0], tokens[ 1]) in keep_individuals:
+                    sample_index.append( index)
+                    out_fam_file.write( line)
+                index += 1
+        if keep_individuals != None and len( sample_index) < len( keep_individuals):
+            Logger.get_instance().warning( "PlinkBedFile.subset : " + str( len( keep_individuals) - len( sample_index)) + " individuals to keep are not present in " + self.prefix + PlinkBedFile.FAM_EXTENSION)
+
+        # Select the SNPs to keep, in .bim order, and write the new .bim file
+        snp_index = []
+        with open( self.prefix + PlinkBedFile.BIM_EXTENSION) as bim_file, open( output_prefix + PlinkBedFile.BIM_EXTENSION, "w") as out_bim_file:
+            index = 0
+            for line in bim_file:
+                tokens = line.split()
+                if len( tokens) == 0:
+                    continue
+                if extract_snps == None or tokens[ 1] in extract_snps:
+                    snp_index.append( index)
+                    out_bim_file.write( line)
+                index += 1
+
+        keep_all_samples = ( len( sample_index) == len( self.individuals))
+        sample_index = np.array( sample_index, dtype = np.intp)
+        snp_index = np.array( snp_index, dtype = np.intp)
+
+        # Write the new .bed file chunk by chunk
+        with open( output_prefix + PlinkBedFile.BED_EXTENSION, "wb") as out_bed_file:
+            out_bed_file.write( bytearray( PlinkBedFile.BED_MAGIC_NUMBER + [ PlinkBedFile.BED_SNP_MAJOR_MODE]))
+            for start in range( 0, len( snp_index), PlinkBedFile.SNP_CHUNK_SIZE):
+                packed = self.bed[ snp_index[ start:start + PlinkBedFile.SNP_CHUNK_SIZE]]
+                if not keep_all_samples:
+                    packed = PlinkBedFile.pack_genotypes( PlinkBedFile.unpack_genotypes( packed, len( self.individuals))[ :, sample_index])
+                out_bed_file.write( np.ascontiguousarray( packed).tobytes())
+
+        Logger.get_instance().info( "  Genotype subset written : " + str( len( sample_index)) + " individuals, " + str( len( snp_index)) + " SNPs")
+
+        return PlinkBedFile( output_prefix)
+
+    #
+    # Unpack a matrix of packed genotypes to a matrix of 2-bit genotype codes
+    #
+    # @param packed : numpy.ndarray - the packed genotypes (one row of bytes per SNP)
+    # @param sample_count : int - the number of individuals
+    #
+    # @return numpy.ndarray - the genotype codes (one row per SNP, one column per individual)
+    @staticmethod
+    def unpack_genotypes( packed, sample_count):
+
+        codes = ( packed[ :, :, np.newaxis] >> PlinkBedFile.GENOTYPE_SHIFTS) & 3
+        return codes.reshape( packed.shape[ 0], -1)[ :, :sample_count]
+
+    #
+    # Pack a matrix of 2-bit genotype codes (one row per SNP, one column per individual) to bytes
+    # The unused bits of the last byte of each SNP are set to 0, as done by plink
+    #
+    # @param codes : numpy.ndarray - the genotype codes
+    #
+    # @return numpy.ndarray - the packed genotypes (one row of bytes per SNP)
+    @staticmethod
+    def pack_genotypes( codes):
+
+        snp_count, sample_count = codes.shape
+        byte_count = ( sample_count + 3) // 4
+        padded = np.zeros( ( snp_count, byte_count * 4), dtype = np.uint8)
+        padded[ :, :sample_count] = codes
+        padded = padded.reshape( snp_count, byte_count, 4)
+
+        return padded[ :, :, 0] | ( padded[ :, :, 1] << 2) | ( padded[ :, :, 2] << 4) | ( padded[ :, :, 3] << 6)
+
+    #
+    # Read the individuals of a .fam file or of a plink --keep file (family ID and individual ID as first columns)
+    #
+    # @param file_path : string - the path to the file
+    #
+    # @return list - the (family ID, individual ID) tuples in file order
+    @staticmethod
+    def read_individuals( file_path):
+
+        individuals = []
+        with open( file_path) as individual_file:
+            for line in individual_file:
+                tokens = line.split()
+                if len( tokens) < 2:
+                    continue
+                individuals.append( ( tokens[ 0], tokens[ 1]))
+
+        return individuals
+
+    #
+    # Read the SNP IDs of a plink --extract file (SNP ID as first column)
+    #
+    # @param file_path : string - the path to the file
+    #
+    # @return set - the SNP IDs
+    @staticmethod
+    def read_snp_ids( file_path):
+
+        snp_ids = set()
+        with open( file_path) as snp_file:
+            for line in snp_file:
+                tokens = line.split()
+                if len( tokens) > 0:
+                    snp_ids.add( tokens[ 0])
+
+        return snp_ids
+
+    #
+    # Count the non-empty lines of a file
+    #
+    # @param file_path : string - the path to the file
+    #
+    # @return int - the number of non-empty lines
+    @staticmethod
+    def count_lines( file_path):
+
+        count = 0
+        with open( file_path) as input_file:
+            for line in input_file:
+                if line.strip() != "":
+                    count += 1
+
+        return count
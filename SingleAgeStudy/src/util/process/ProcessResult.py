@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+
+## Class ProcessResult
+#  ===================
+#
+# Each instance of this class describes the execution of one external command
+# launched through the ProcessRunner.
+#
+# A ProcessResult contains:
+#    - command: (String) the executed command line.
+#    - return_code: (Integer) the exit code of the command (negative if killed by a signal).
+#    - wall_time: (Float) the elapsed time of the command (in seconds).
+#    - cpu_time: (Float) the user + system CPU time consumed by the command and its children (in seconds).
+#    - max_rss: (Integer) the peak resident set size of the command (the largest of its programs, in kB).
+#    - stderr_tail: (String) the last bytes written by the command on its standard error.
+#    - timed_out: (Boolean) True if the command was killed because it exceeded its timeout.
+class ProcessResult(object):
+
+    ## Constructor of ProcessResult
+    #  ----------------------------
+    def __init__(self, command, return_code, wall_time, cpu_time, max_rss, stderr_tail, timed_out=False):
+        self.command = command
+        self.return_code = return_code
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.max_rss = max_rss
+        self.stderr_tail = stderr_tail
+        self.timed_out = timed_out
+
+    ## succeeded
+    #  ---------
+    #
+    # Return True if the command ended normally with a zero exit code.
+    #
+    # @return Boolean
+    def succeeded(self):
+        return self.return_code == 0 and not self.timed_out
+
+    ## get_summary
+    #  -----------
+    #
+    # Return a one line description of the resources used by the command.
+    #
+    # @return String
+    def get_summary(self):
+        return "exit code=" + str( self.return_code) + \
+               ", wall time=" + "%.2f" % self.wall_time + "s" + \
+               ", cpu time=" + "%.2f" % self.cpu_time + "s" + \
+               ", max RSS=" + str( self.max_rss) + "kB" + \
+               (", TIMED OUT" if self.timed_out else "")
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+import os
+import gc
+import time
+import errno
+import select
+import signal
+import subprocess
+
+from util.log.Logger import Logger
+from util.process.ProcessResult import ProcessResult
+from util.exception.ProcessException import ProcessException
+
+
+## Class ProcessRunner
+#  ===================
+#
+# This class contains static methods to execute external commands (plink,
+# preFastEpistasis, smpFastEpistasis...) in a subprocess.
+#
+# The parent process does not poll the child: it sleeps in select() on the
+# standard error pipe of the command (or in a blocking wait once the pipe is
+# closed), so that the CPU stays fully available for the command itself.
+#
+# For each command:
+#    - the standard output is redirected to the provided output file
+#    - the standard error is copied to the provided output file and its last
+#      bytes are kept to be reported in case of failure
+#    - the exit code is checked and a ProcessException is raised on failure
+#      (if required)
+#    - the command is killed (with its whole process group) if it exceeds the
+#      provided timeout
+#    - the wall time, CPU time and peak RSS of the command are measured from
+#      the resource usage of its own process, returned by os.wait4 when the
+#      child is reaped (the usage of the shell includes the programs it waited
+#      for), so that the figures of concurrent commands do not mix
+class ProcessRunner(object):
+
+    # The number of bytes of standard error kept to describe a failure
+    STDERR_TAIL_SIZE = 4096
+
+    # The size of the blocks read from the standard error pipe
+    READ_BLOCK_SIZE = 65536
+
+    # The maximal time (in seconds) the parent sleeps before checking the timeout
+    TIMEOUT_CHECK_INTERVAL = 5.0
+
+    ## run
+    #  ---
+    #
+    # Launch the provided command line in a shell and wait for its end.
+    #
+    #    @param command : string - the command line to execute
+    #    @param outfile : file - the file object where standard output and error are written (None to inherit them)
+    #    @param cwd : string - the working directory of the command (None to keep the current one)
+    #    @param timeout : float - the maximal duration of the command in seconds (None for no limit)
+    #    @param check : boolean - True if a ProcessException must be raised when the command fails
+    #
+    # @return ProcessResult
+    # @raise ProcessException : if check is True and the command returned a non-zero code or timed out
+    @staticmethod
+    def run( command, outfile = None, cwd = None, timeout = None, check = True):
+
+        Logger.get_instance().info( "  command = " + command)
+        if cwd != None:
+            Logger.get_instance().info( "  working directory = " + cwd)
+
+        # Release the memory that can be released before forking
+        gc.collect()
+        if outfile != None:
+            outfile.flush()
+
+        start_time = time.time()
+
+        # Launch the command in its own process group so that a timeout kills
+        # the shell and all the programs it launched
+        process = subprocess.Popen( command, shell = True, cwd = cwd,
+                                    stdout = outfile, stderr = subprocess.PIPE,
+                                    close_fds = True, preexec_fn = os.setsid)
+
+        stderr_tail, timed_out = ProcessRunner.consume_stderr( process, outfile, start_time, timeout)
+        wait_timed_out, usage = ProcessRunner.wait( process, start_time, timeout)
+        timed_out = wait_timed_out or timed_out
+
+        wall_time = time.time() - start_time
+        cpu_time = usage.ru_utime + usage.ru_stime
+
+        result = ProcessResult( command, process.returncode, wall_time, cpu_time, usage.ru_maxrss, stderr_tail, timed_out)
+        Logger.get_instance().info( "  command ended: " + result.get_summary())
+
+        if check and not result.succeeded():
+            if timed_out:
+                message = "ProcessRunner.run : The command exceeded its timeout of " + str( timeout) + "s : " + command
+            else:
+                message = "ProcessRunner.run : The command failed with exit code " + str( process.returncode) + " : " + command
+            Logger.get_instance().error( message + "\n  last standard error lines:\n" + stderr_tail, ex = False)
+            raise ProcessException( message, "\n" + stderr_tail)
+
+        return result
+
+    ## consume_stderr
+    #  --------------
+    #
+    # Copy the standard error of the process to the output file until the pipe
+    # is closed, keeping its last bytes. The parent sleeps in select() between
+    # two writes of the command.
+    #
+    #    @param process : Popen - the running process
+    #    @param outfile : file - the file object where standard error is copied (may be None)
+    #    @param start_time : float - the time the process was started at
+    #    @param timeout : float - the maximal duration of the command in seconds (may be None)
+    #
+    # @return tuple - the tail of the standard error and True if the process was killed for timeout
+    @staticmethod
+    def consume_stderr( process, outfile, start_time, timeout):
+
+        stderr_fd = process.stderr.fileno()
+        stderr_tail = ""
+        timed_out = False
+
+        while True:
+            select_timeout = None
+            if timeout != None:
+                remaining = timeout - ( time.time() - start_time)
+                if remaining <= 0:
+                    ProcessRunner.kill( process)
+                    timed_out = True
+                    break
+                select_timeout = min( remaining, ProcessRunner.TIMEOUT_CHECK_INTERVAL)
+
+            try:
+                ready, _, _ = select.select( [ stderr_fd], [], [], select_timeout)
+            except select.error as select_error:
+                if select_error.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            if len( ready) == 0:
+                continue
+
+            data = os.read( stderr_fd, ProcessRunner.READ_BLOCK_SIZE)
+            if not data:
+                break
+            if outfile != None:
+                outfile.write( data)
+                outfile.flush()
+            stderr_tail = ( stderr_tail + data)[ -ProcessRunner.STDERR_TAIL_SIZE:]
+
+        process.stderr.close()
+
+        return ( stderr_tail, timed_out)
+
+    ## wait
+    #  ----
+    #
+    # Wait for the end of the process and reap it with os.wait4 to get its own
+    # resource usage. Without timeout, this is a blocking wait. With a timeout,
+    # the parent sleeps between two checks of the process state and kills the
+    # process if the timeout is reached.
+    # The return code of the process is set on the Popen object.
+    #
+    #    @param process : Popen - the running process
+    #    @param start_time : float - the time the process was started at
+    #    @param timeout : float - the maximal duration of the command in seconds (may be None)
+    #
+    # @return tuple - True if the process was killed for timeout and the resource usage of the process
+    @staticmethod
+    def wait( process, start_time, timeout):
+
+        timed_out = False
+        wait_options = 0 if timeout == None else os.WNOHANG
+        while True:
+            try:
+                pid, status, usage = os.wait4( process.pid, wait_options)
+            except OSError as wait_error:
+                if wait_error.errno == errno.EINTR:
+                    continue
+                raise
+            if pid == process.pid:
+                break
+
+            remaining = timeout - ( time.time() - start_time)
+            if remaining <= 0:
+                ProcessRunner.kill( process)
+                timed_out = True
+                wait_options = 0
+                continue
+            time.sleep( min( remaining, ProcessRunner.TIMEOUT_CHECK_INTERVAL))
+
+        if os.WIFSIGNALED( status):
+            process.returncode = -os.WTERMSIG( status)
+        else:
+            process.returncode = os.WEXITSTATUS( status)
+
+        return ( timed_out, usage)
+
+    ## kill
+    #  ----
+    #
+    # Kill the process group of the given process.
+    #
+    #    @param process : Popen - the running process
+    #
+    # @return None
+    @staticmethod
+    def kill( process):
+
+        Logger.get_instance().warning( "ProcessRunner.kill : Killing process group " + str( process.pid))
+        try:
+            os.killpg( process.pid, signal.SIGKILL)
+        except OSError:
+            pass
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from util import Constants
+from util.log.Logger import Logger
+from util.exception.SNPnetException import SNPnetException
+
+# Export of DB tables (or joins of tables) to typed columnar files: Arrow IPC files (Feather V2 format) or Parquet files
+#
+# Columnar version of SqlManager.export_table: the rows are streamed from the cursor by batches of batch_size rows,
+# each batch being written as a record batch (Arrow) or a row group (Parquet). The type of each column is given by
+# the declared type of the column in its table (SQLite type affinity), so the files are read with their types by the
+# R scripts (arrow::read_feather, arrow::read_parquet) with no text parsing.
+# The file is written under a temporary name in the output folder and renamed when complete.
+#
+# Requires the pyarrow package, imported only when a columnar file is written.
+
+class ColumnarTableExporter(object):
+
+    FEATHER_FORMAT = "feather"
+    PARQUET_FORMAT = "parquet"
+    FORMATS = [ FEATHER_FORMAT, PARQUET_FORMAT]
+    EXTENSIONS = { FEATHER_FORMAT: ".arrow", PARQUET_FORMAT: ".parquet"}
+    PARQUET_COMPRESSION = "snappy"
+    TEMPORARY_EXPORT_PREFIX = ".tmp_"
+
+    # Arrow types of the SQLite declared types, by order of the SQLite type affinity rules (the columns with
+    # no matching declared type are exported as strings)
+    TYPE_AFFINITIES = [ ( "INT", "int64"), ( "BOOL", "bool_"), ( "CHAR", "string"), ( "CLOB", "string"), ( "TEXT", "string"),
+                        ( "REAL", "float64"), ( "FLOA", "float64"), ( "DOUB", "float64")]
+    DEFAULT_TYPE = "string"
+
+    #
+    # Instantiate the exporter
+    #
+    # @param sql_manager : SqlManager - the SqlManager of the DB to export
+    # @param batch_size : int - the number of rows fetched and written at once (None for Constants.FETCH_SIZE)
+    #
+    def __init__(self, sql_manager, batch_size = None):
+
+        self.sqlManager = sql_manager
+        self.batchSize = batch_size if batch_size != None else Constants.FETCH_SIZE
+
+    #
+    # Return the Arrow type names of the columns of a table, from their declared types
+    #
+    # @param connection : the raw connection to the DB
+    # @param table_name : string - the name of the table
+    #
+    # @return list - the ( column name, Arrow type name) tuples, in the order of the table
+    def get_column_types(self, connection, table_name):
+
+        cursor = connection.cursor()
+        try:
+            cursor.execute( "PRAGMA table_info(" + table_name + ")")
+            return [ ( str( column_info[ 1]), ColumnarTableExporter.get_arrow_type( column_info[ 2])) for column_info in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    #
+    # Return the Arrow type name of a SQLite declared type
+    #
+    # @param declared_type : string - the declared type of the column (e.g. "VARCHAR")
+    #
+    # @return string
+    @staticmethod
+    def get_arrow_type( declared_type):
+
+        declared_type = ( declared_type or "").upper()
+        for affinity, arrow_type in ColumnarTableExporter.TYPE_AFFINITIES:
+            if affinity in declared_type:
+                return arrow_type
+
+        return ColumnarTableExporter.DEFAULT_TYPE
+
+    #
+    # Export the content of a table, or of a join of tables, to a columnar file
+    #
+    # @param table_name : string - the name of the DB table to export, or the FROM clause of a join
+    # @param output_path : string - the path to the output file
+    # @param file_format : string - the format of the file, among FORMATS
+    # @param columns : list - the columns to export, as "table.column" for a join (None for all the columns of a table)
+    # @param where : string - the SQL condition the exported rows satisfy (None for all the rows)
+    # @param parameters : tuple - the values of the "?" parameters of the condition
+    #
+    # @return int - the number of rows exported
+    # @raise SNPnetException : if the format is unknown
+    def export_table(self, table_name, output_path, file_format, columns = None, where = None, parameters = ()):
+
+        import pyarrow as pa
+
+        if file_format not in ColumnarTableExporter.FORMATS:
+            raise SNPnetException( "ColumnarTableExporter.export_table : Unknown format '" + str( file_format) + "'. The formats are " + ", ".join( ColumnarTableExporter.FORMATS) + ".")
+
+        # Get a raw connection to the database from the engine
+        con = self.sqlManager.get_engine().raw_connection()
+        try:
+            # Build the query and the schema of the file
+            if columns == None:
+                column_types = self.get_column_types( con, table_name)
+            else:
+                table_types = {}
+                column_types = []
+                for column in columns:
+                    column_table, column_name = column.split( ".") if "." in column else ( table_name, column)
+                    if column_table not in table_types:
+                        table_types[ column_table] = dict( self.get_column_types( con, column_table))
+                    column_types.append( ( column_name, table_types[ column_table].get( column_name, ColumnarTableExporter.DEFAULT_TYPE)))
+            schema = pa.schema( [ pa.field( column_name, getattr( pa, arrow_type)()) for column_name, arrow_type in column_types])
+            query = "select " + ( ", ".join( columns) if columns != None else "*") + " from " + table_name
+            if where != None:
+                query += " where " + where
+
+            # Execute the query on DB
+            cursor = con.cursor()
+            cursor.execute( query, parameters)
+
+            # Write the rows to the file by batches
+            temporary_path = os.path.join( os.path.dirname( os.path.abspath( output_path)), ColumnarTableExporter.TEMPORARY_EXPORT_PREFIX + os.path.basename( output_path))
+            writer = self.open_writer( temporary_path, file_format, schema)
+            try:
+                row_count = 0
+                while True:
+                    rows = cursor.fetchmany( self.batchSize)
+                    if len( rows) == 0:
+                        break
+                    self.write_batch( writer, file_format, schema, rows)
+                    row_count += len( rows)
+                # An empty table is written with its schema only
+                if row_count == 0 and file_format == ColumnarTableExporter.PARQUET_FORMAT:
+                    writer.write_table( schema.empty_table())
+                writer.close()
+            except:
+                writer.close()
+                os.remove( temporary_path)
+                raise
+            cursor.close()
+            os.rename( temporary_path, output_path)
+        finally:
+            # Return the connection to the pool
+            con.close()
+
+        Logger.get_instance().info( "ColumnarTableExporter.export_table : " + str( row_count) + " rows of " + table_name + " exported to " + output_path)
+
+        return row_count
+
+    #
+    # Open the writer of a columnar file
+    #
+    # @param path : string - the path to the file
+    # @param file_format : string - the format of the file, among FORMATS
+    # @param schema : pyarrow.Schema - the schema of the file
+    #
+    # @return the pyarrow writer
+    def open_writer(self, path, file_format, schema):
+
+        import pyarrow as pa
+
+        if file_format == ColumnarTableExporter.PARQUET_FORMAT:
+            import pyarrow.parquet as pq
+            return pq.ParquetWriter( path, schema, compression = ColumnarTableExporter.PARQUET_COMPRESSION, use_dictionary = True)
+        else:
+            return pa.RecordBatchFileWriter( path, schema)
+
+    #
+    # Write a batch of rows to a columnar file
+    #
+    # @param writer : the pyarrow writer of the file
+    # @param file_format : string - the format of the file, among FORMATS
+    # @param schema : pyarrow.Schema - the schema of the file
+    # @param rows : list - the rows (tuples in the order of the schema)
+    #
+    def write_batch(self, writer, file_format, schema, rows):
+
+        import pyarrow as pa
+
+        arrays = []
+        for field, values in zip( schema, zip( *rows)):
+            # SQLite stores the booleans as integers
+            if field.type == pa.bool_():
+                values = [ bool( value) if value != None else None for value in values]
+            arrays.append( pa.array( values, type = field.type))
+        batch = pa.RecordBatch.from_arrays( arrays, schema.names)
+
+        if file_format == ColumnarTableExporter.PARQUET_FORMAT:
+            writer.write_table( pa.Table.from_batches( [ batch], schema))
+        else:
+            writer.write_batch( batch)
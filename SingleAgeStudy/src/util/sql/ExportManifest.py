@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import tempfile
+
+from util.log.Logger import Logger
+from util.annotation.DatabaseIndex import DatabaseIndex
+from util.sql.TableFingerprint import TableFingerprint
+
+# Manifest of the files exported from the tables of a DB, used to skip the export of the files whose tables did not change
+#
+# The manifest is a JSON file stored beside the exported files. It records:
+#   - the fingerprint of the DB file (path, size and modification time, see DatabaseIndex.compute_fingerprint)
+#   - the content fingerprint of each exported table: number of rows, maximal rowid and SHA-1 checksum of the rows
+#   - for each exported file, the tables it is built from and the settings of its export (format, columns...)
+# A file is up to date if it exists, its export settings are the same and the fingerprints of its tables are the same.
+# While the DB file itself is unchanged the table fingerprints of the manifest are reused with no query, so a rerun on
+# the same DB only reads the manifest; otherwise the fingerprint of each table is computed once (a single scan of the
+# table, with no formatting nor writing) and only the files of the modified tables are exported again.
+# Within Snakemake, the outputs of the export are removed before it runs: the export is only triggered when the content
+# of the tables changed through the fingerprint file of the tables (see TableFingerprint and the export_sql_tables rule).
+
+class ExportManifest(object):
+
+    MANIFEST_FILE_NAME = "export_manifest.json"
+    TEMPORARY_MANIFEST_PREFIX = ".tmp_"
+
+    DB_FINGERPRINT_KEY = "db_fingerprint"
+    TABLES_KEY = "tables"
+    FILES_KEY = "files"
+    SETTINGS_KEY = "settings"
+
+    #
+    # Instantiate the manifest of an export folder, loading its previous content if it exists
+    #
+    # @param manifest_path : string - the path to the manifest file
+    # @param sql_manager : SqlManager - the SqlManager of the exported DB
+    #
+    def __init__(self, manifest_path, sql_manager):
+
+        self.manifestPath = manifest_path
+        self.sqlManager = sql_manager
+        self.dbFingerprint = DatabaseIndex.compute_fingerprint( sql_manager.get_DBpath())
+
+        previous_content = {}
+        if os.path.exists( manifest_path):
+            try:
+                with open( manifest_path) as manifest_file:
+                    previous_content = json.load( manifest_file)
+            except ValueError:
+                Logger.get_instance().warning( "ExportManifest : The manifest " + manifest_path + " can not be read and is ignored")
+
+        self.files = previous_content.get( ExportManifest.FILES_KEY, {})
+        # The fingerprints of the tables are reused only if the DB file is the same
+        if previous_content.get( ExportManifest.DB_FINGERPRINT_KEY) == self.dbFingerprint:
+            self.tableFingerprints = previous_content.get( ExportManifest.TABLES_KEY, {})
+        else:
+            self.tableFingerprints = {}
+
+    #
+    # Return the content fingerprint of a table (computed at the first call if the DB file changed)
+    #
+    # @param table_name : string - the name of the table
+    #
+    # @return string - the fingerprint "<row count>:<max rowid>:<checksum>"
+    def get_table_fingerprint(self, table_name):
+
+        if table_name not in self.tableFingerprints:
+            self.tableFingerprints[ table_name] = self.compute_table_fingerprint( table_name)
+
+        return self.tableFingerprints[ table_name]
+
+    #
+    # Compute the content fingerprint of a table: its number of rows, its maximal rowid and the checksum of its rows
+    # read in the order of the rowid (see TableFingerprint)
+    #
+    # @param table_name : string - the name of the table
+    #
+    # @return string
+    def compute_table_fingerprint(self, table_name):
+
+        con = self.sqlManager.get_engine().raw_connection()
+        try:
+            fingerprint = TableFingerprint.compute( con, table_name)
+        finally:
+            con.close()
+
+        Logger.get_instance().debug( "ExportManifest.compute_table_fingerprint : Fingerprint of table " + table_name + " computed")
+
+        return fingerprint
+
+    #
+    # Indicate if an exported file is up to date
+    #
+    # @param output_path : string - the path to the exported file
+    # @param table_names : list - the names of the tables the file is built from
+    # @param settings : dict - the settings of the export (JSON serializable)
+    #
+    # @return boolean
+    def is_up_to_date(self, output_path, table_names, settings):
+
+        file_entry = self.files.get( os.path.basename( output_path))
+        if not os.path.exists( output_path) or file_entry == None:
+            return False
+        if file_entry[ ExportManifest.SETTINGS_KEY] != json.loads( json.dumps( settings)):
+            return False
+
+        return file_entry[ ExportManifest.TABLES_KEY] == dict( [ ( table_name, self.get_table_fingerprint( table_name)) for table_name in table_names])
+
+    #
+    # Record an exported file
+    #
+    # @param output_path : string - the path to the exported file
+    # @param table_names : list - the names of the tables the file is built from
+    # @param settings : dict - the settings of the export (JSON serializable)
+    #
+    def record(self, output_path, table_names, settings):
+
+        self.files[ os.path.basename( output_path)] = { ExportManifest.TABLES_KEY: dict( [ ( table_name, self.get_table_fingerprint( table_name)) for table_name in table_names]),
+                                                        ExportManifest.SETTINGS_KEY: settings}
+
+    #
+    # Write the manifest file (written under a temporary name and renamed)
+    #
+    def save(self):
+
+        file_descriptor, temporary_path = tempfile.mkstemp( prefix = ExportManifest.TEMPORARY_MANIFEST_PREFIX, dir = os.path.dirname( os.path.abspath( self.manifestPath)))
+        with os.fdopen( file_descriptor, "w") as manifest_file:
+            json.dump( { ExportManifest.DB_FINGERPRINT_KEY: self.dbFingerprint,
+                         ExportManifest.TABLES_KEY: self.tableFingerprints,
+                         ExportManifest.FILES_KEY: self.files}, manifest_file, indent = 2, sort_keys = True)
+        os.rename( temporary_path, self.manifestPath)
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sqlite3
+import urllib
 
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, pool, inspect, select
+from sqlalchemy import Table, MetaData, Column
 from sqlalchemy import exc
 
 from posix import remove
@@ -22,18 +25,52 @@ class SqlManager(object) :
 
     __instance = None
 
+    # SQLite pragmas applied to each new connection of the engine: the default journal mode of SQLite with a full sync
+    # to disk, a larger page cache (in KB when negative), memory-mapped reads and temporary tables in memory.
+    # The pragmas modifying the DB file (journal_mode, synchronous) are not applied in read-only mode.
+    DEFAULT_PRAGMAS = [ ( "synchronous", "FULL"), ( "cache_size", "-65536"), ( "mmap_size", "268435456"), ( "temp_store", "MEMORY")]
+    WRITE_PRAGMAS = [ "journal_mode", "synchronous"]
+
+    # SQLite pragmas added when the WAL journal is enabled (see Constants.SQLITE_WAL_JOURNAL): readers are not blocked
+    # by a writer and the DB file is synced to disk at checkpoints only. The WAL mode is stored in the DB file: the
+    # file is then only readable by SQLite libraries supporting WAL, on a local file system (no NFS).
+    WAL_PRAGMAS = [ ( "journal_mode", "WAL"), ( "synchronous", "NORMAL")]
+
+    # SQLite pragmas applied to the connection of the bulk inserts during the load: no sync to disk and a larger page cache
+    # (the pragmas of the engine are restored after the load)
+    BULK_LOAD_PRAGMAS = [ ( "synchronous", "OFF"), ( "cache_size", "-200000")]
+
+    # URI parameters of the read-only mode: the DB file is opened read-only and considered as not modified by other
+    # processes during the connection (no lock, no journal)
+    READ_ONLY_URI_PARAMETERS = "?mode=ro&immutable=1"
+    WAL_FILE_SUFFIX = "-wal"
+
+    # Compressions of the exported files and their file extensions
+    GZIP_COMPRESSION = "gzip"
+    ZSTD_COMPRESSION = "zstd"
+    EXPORT_COMPRESSIONS = [ GZIP_COMPRESSION, ZSTD_COMPRESSION]
+    EXPORT_EXTENSIONS = { GZIP_COMPRESSION: ".gz", ZSTD_COMPRESSION: ".zst"}
+    TEMPORARY_EXPORT_PREFIX = ".tmp_"
+
+    # Hot queries of the project checked by check_query_plans: ( name, table, SQL query with "?" parameters)
+    QUERY_PLAN_CHECKS = [ ( "effects of mutations", "mutation_effect", "SELECT flybase_id, symbol, position, type FROM mutation_effect WHERE mutation_id IN ( ?, ?)"),
+                          ( "gene annotation index build", "mutation_effect", "SELECT mutation_id, flybase_id, symbol, position, type FROM mutation_effect ORDER BY mutation_id, flybase_id"),
+                          ( "lines of mutations", "mutation_in_line", "SELECT line_id FROM mutation_in_line WHERE mutation_id IN ( ?, ?)"),
+                          ( "SNPs by allele counts", "mutation", "SELECT mutation_id FROM mutation WHERE refCount >= ? AND altCount >= ? AND type_mutation = ?"),
+                          ( "mutations of a phenotype by weight", "processed_mutation", "SELECT name, weight FROM processed_mutation WHERE phenotype_name = ? ORDER BY weight DESC")]
+
     def __init__(self):
         self.DBPath = None
         self.session = None
+        self.engine = None
+        self.readOnly = False
+        self.pragmas = SqlManager.get_default_pragmas( Constants.SQLITE_WAL_JOURNAL)
 
     def get_session(self):
         if(self.session == None):
-            # Create engine to dedicated database
-            engine = create_engine(Constants.PATH_SQL_BASE + self.DBPath)
-
-            # Open the DB session
+            # Open the DB session on the engine shared by all the sessions
             session = sessionmaker()
-            session.configure(bind=engine, autoflush=True, expire_on_commit=False)
+            session.configure(bind=self.get_engine(), autoflush=True, expire_on_commit=False)
 
             # Get the session and insert several objects in ENSEMBL table
             self.session = session()
@@ -48,11 +85,49 @@ class SqlManager(object) :
 
     # #
     # Set the path to the DB file
+    # The engine of the previous DB file is released.
     #
     # @param path : string - the path to the DB file
+    # @param read_only : boolean - True to open the DB file in read-only immutable mode (for the scripts that only read the DB)
     #    
-    def set_DBpath(self, path):
+    def set_DBpath(self, path, read_only = False):
+        if path != self.DBPath or read_only != self.readOnly:
+            self.dispose_engine()
         self.DBPath = path
+        self.readOnly = read_only
+
+    # #
+    # Set the SQLite pragmas applied to the new connections (by default DEFAULT_PRAGMAS)
+    # The engine is released so that the next connections use the new pragmas.
+    #
+    # @param pragmas : list - the ( pragma name, value) tuples
+    #
+    def set_pragmas(self, pragmas):
+        self.dispose_engine()
+        self.pragmas = list( pragmas)
+
+    # #
+    # Enable or disable the WAL journal of the DB file on the new connections (see WAL_PRAGMAS)
+    # The engine is released so that the next connections use the new pragmas.
+    #
+    # @param wal_journal : boolean - True to use the WAL journal, False for the default journal mode of SQLite
+    #
+    def set_wal_journal(self, wal_journal):
+        self.set_pragmas( SqlManager.get_default_pragmas( wal_journal))
+
+    # #
+    # Returns the pragmas applied by default to the new connections
+    #
+    # @param wal_journal : boolean - True to add the pragmas of the WAL journal
+    #
+    # @return list - the ( pragma name, value) tuples
+    @staticmethod
+    def get_default_pragmas( wal_journal):
+
+        if wal_journal:
+            return list( SqlManager.DEFAULT_PRAGMAS) + list( SqlManager.WAL_PRAGMAS)
+
+        return list( SqlManager.DEFAULT_PRAGMAS)
 
     # #
     # Returns the path to the DB file
@@ -73,17 +148,78 @@ class SqlManager(object) :
         return os.path.dirname( self.DBPath)
 
     # #
-    # Returns a SQLalchemy engine to the DB file
+    # Returns the SQLalchemy engine to the DB file
+    # A single engine is created per DB file, with a pool of connections on which the pragmas are applied once
+    # (the page cache of a connection is kept between the sessions).
     #
     # @return a SQLalchemy engine to the DB file
     #    
     def get_engine( self):
 
-        if self.DBPath != None:
-            engine = create_engine(Constants.PATH_SQL_BASE + self.DBPath)
-            return engine
-        
-        return None
+        if self.DBPath == None:
+            return None
+
+        if self.engine == None:
+            if self.readOnly:
+                # Open the file through its URI if the SQLite library supports it, otherwise in query-only mode
+                # (an immutable connection ignores the WAL file, which holds the last commits until a checkpoint)
+                wal_path = self.DBPath + SqlManager.WAL_FILE_SUFFIX
+                if os.path.exists( wal_path) and os.path.getsize( wal_path) > 0:
+                    Logger.get_instance().warning( "SqlManager.get_engine : The DB has a WAL file not checkpointed, the DB is opened in query-only mode")
+                    self.engine = create_engine( Constants.PATH_SQL_BASE + self.DBPath, connect_args = { "check_same_thread": False}, poolclass = pool.QueuePool)
+                elif SqlManager.is_uri_supported():
+                    db_uri = "file:" + urllib.quote( os.path.abspath( self.DBPath)) + SqlManager.READ_ONLY_URI_PARAMETERS
+                    self.engine = create_engine( Constants.PATH_SQL_BASE, creator = lambda: sqlite3.connect( db_uri, check_same_thread = False), poolclass = pool.QueuePool)
+                else:
+                    Logger.get_instance().warning( "SqlManager.get_engine : The SQLite library does not support URI file names, the DB is opened in query-only mode")
+                    self.engine = create_engine( Constants.PATH_SQL_BASE + self.DBPath, connect_args = { "check_same_thread": False}, poolclass = pool.QueuePool)
+            else:
+                self.engine = create_engine( Constants.PATH_SQL_BASE + self.DBPath, connect_args = { "check_same_thread": False}, poolclass = pool.QueuePool)
+            event.listen( self.engine, "connect", self.on_connect)
+
+        return self.engine
+
+    # #
+    # Apply the pragmas to a new connection of the engine
+    #
+    # @param dbapi_connection : the sqlite3 connection
+    # @param connection_record : the connection record of the pool
+    #
+    def on_connect( self, dbapi_connection, connection_record):
+
+        cursor = dbapi_connection.cursor()
+        try:
+            if self.readOnly:
+                cursor.execute( "PRAGMA query_only = ON")
+            for pragma_name, pragma_value in self.pragmas:
+                if not self.readOnly or pragma_name not in SqlManager.WRITE_PRAGMAS:
+                    cursor.execute( "PRAGMA " + pragma_name + " = " + str( pragma_value))
+        finally:
+            cursor.close()
+
+    # #
+    # Release the engine and its connections (the session is closed)
+    #
+    def dispose_engine( self):
+
+        if self.session != None:
+            self.close_session()
+        if self.engine != None:
+            self.engine.dispose()
+            self.engine = None
+
+    # #
+    # Indicates if the SQLite library opens URI file names
+    #
+    # @return boolean
+    @staticmethod
+    def is_uri_supported():
+
+        connection = sqlite3.connect( ":memory:")
+        try:
+            return ( "USE_URI",) in [ tuple( row) for row in connection.execute( "PRAGMA compile_options")]
+        finally:
+            connection.close()
 
     # #
     # Commit the actual session and close it after
@@ -120,10 +256,219 @@ class SqlManager(object) :
 
 
     def delete(self, obj):
-        
+
         if obj != None:
             self.session.delete( obj)
-        
+
+
+    # #
+    # Insert rows in a table of the DB by batches, in a single transaction
+    # The rows are inserted with Core "executemany" INSERT statements of bulk_size rows, with no ORM object
+    # and no unit-of-work flush. The SQLite pragmas of BULK_LOAD_PRAGMAS are applied to the connection used for the load.
+    #
+    # @param table : Table or model class - the table to insert the rows in
+    # @param rows : iterable - the rows to insert (dictionaries with the column names as keys)
+    # @param bulk_size : int - the number of rows inserted per statement (None for Constants.BULK_SIZE)
+    #
+    # @return int - the number of rows inserted
+    # @raise SNPnetException : if an error occurred while inserting the rows (no row is inserted)
+    def bulk_insert(self, table, rows, bulk_size = None):
+
+        return self.bulk_insert_tables( [ ( table, rows)], bulk_size)
+
+    # #
+    # Insert ORM objects in the DB by batches, in a single transaction
+    # The objects are converted to rows of their table (see get_bulk_row) and inserted in the order of their first
+    # class in the list, so that the parent objects are inserted before their children if they come first.
+    # The objects are not attached to the session.
+    #
+    # @param objects : list - the ORM objects to insert
+    # @param bulk_size : int - the number of rows inserted per statement (None for Constants.BULK_SIZE)
+    #
+    # @return int - the number of rows inserted
+    # @raise SNPnetException : if an error occurred while inserting the rows (no row is inserted)
+    def bulk_insert_objects(self, objects, bulk_size = None):
+
+        table_rows = []
+        rows_by_class = {}
+        for obj in objects:
+            if obj.__class__ not in rows_by_class:
+                rows_by_class[ obj.__class__] = []
+                table_rows.append( ( obj.__class__, rows_by_class[ obj.__class__]))
+            rows_by_class[ obj.__class__].append( SqlManager.get_bulk_row( obj))
+
+        return self.bulk_insert_tables( table_rows, bulk_size)
+
+    # #
+    # Insert rows in several tables of the DB by batches, in a single transaction
+    #
+    # @param table_rows : list - the ( table or model class, iterable of row dictionaries) tuples, in the order of insertion
+    # @param bulk_size : int - the number of rows inserted per statement (None for Constants.BULK_SIZE)
+    #
+    # @return int - the number of rows inserted
+    # @raise SNPnetException : if an error occurred while inserting the rows (no row is inserted)
+    def bulk_insert_tables(self, table_rows, bulk_size = None):
+
+        connection = self.get_engine().connect()
+        try:
+            for pragma_name, pragma_value in SqlManager.BULK_LOAD_PRAGMAS:
+                connection.execute( "PRAGMA " + pragma_name + " = " + pragma_value)
+            transaction = connection.begin()
+            try:
+                row_count = 0
+                for table, rows in table_rows:
+                    row_count += SqlManager.insert_batches( connection, table, rows, bulk_size)
+                transaction.commit()
+            except exc.SQLAlchemyError as sqle:
+                transaction.rollback()
+                raise SNPnetException( "SqlManager.bulk_insert_tables : An error occurred while inserting the rows.", sqle )
+        finally:
+            # The connection returns to the pool with the pragmas of the engine
+            self.on_connect( connection.connection, None)
+            connection.close()
+
+        Logger.get_instance().debug( "SqlManager.bulk_insert_tables : " + str( row_count) + " rows inserted")
+
+        return row_count
+
+    # #
+    # Execute the INSERT statements of rows by batches on a connection or a session (in its current transaction)
+    #
+    # @param connection : Connection or Session - the connection or session executing the statements
+    # @param table : Table or model class - the table to insert the rows in
+    # @param rows : iterable - the rows to insert (dictionaries with the column names as keys)
+    # @param bulk_size : int - the number of rows inserted per statement (None for Constants.BULK_SIZE)
+    #
+    # @return int - the number of rows inserted
+    @staticmethod
+    def insert_batches( connection, table, rows, bulk_size = None):
+
+        if bulk_size == None:
+            bulk_size = Constants.BULK_SIZE
+        insert_statement = getattr( table, "__table__", table).insert()
+
+        row_count = 0
+        batch = []
+        for row in rows:
+            batch.append( row)
+            if len( batch) >= bulk_size:
+                connection.execute( insert_statement, batch)
+                row_count += len( batch)
+                batch = []
+        if len( batch) > 0:
+            connection.execute( insert_statement, batch)
+            row_count += len( batch)
+
+        return row_count
+
+    # #
+    # Return the row of the table of an ORM object
+    #
+    # @param obj : the ORM object
+    #
+    # @return dict - the values of all the columns of the object (None for the columns with no value)
+    @staticmethod
+    def get_bulk_row( obj):
+
+        return dict( [ ( column.key, getattr( obj, column.key, None)) for column in obj.__table__.columns])
+
+    # #
+    # Execute a query filtered on a list of values of a column ("column IN values") and stream its rows
+    # The values are bound by chunks of chunk_size values, so that a statement never exceeds the SQLite limit of host
+    # parameters nor builds a huge query plan. From temporary_table_size values, the values are inserted in a
+    # temporary table of the connection instead and the query is filtered with a sub-query on this table.
+    # The duplicated values are removed; the rows are returned by chunk, not in the order of the query.
+    #
+    # @param query : Select - the Core SELECT query (e.g. select( [ MutationEffect.mutation_id, MutationEffect.symbol]))
+    # @param column : Column or attribute - the column filtered on the values
+    # @param values : iterable - the values of the column
+    # @param chunk_size : int - the number of values bound per statement (None for Constants.IN_QUERY_CHUNK_SIZE)
+    # @param temporary_table_size : int - the number of values from which a temporary table is used (None for Constants.IN_QUERY_TEMPORARY_TABLE_SIZE)
+    #
+    # @return generator - the rows of the query
+    def iterate_in_query(self, query, column, values, chunk_size = None, temporary_table_size = None):
+
+        if chunk_size == None:
+            chunk_size = Constants.IN_QUERY_CHUNK_SIZE
+        if temporary_table_size == None:
+            temporary_table_size = Constants.IN_QUERY_TEMPORARY_TABLE_SIZE
+        values = sorted( set( values))
+        if len( values) == 0:
+            return
+
+        connection = self.get_engine().connect()
+        try:
+            if len( values) < temporary_table_size:
+                for chunk_start in range( 0, len( values), chunk_size):
+                    for row in SqlManager.fetch_rows( connection.execute( query.where( column.in_( values[ chunk_start:chunk_start + chunk_size])))):
+                        yield row
+            else:
+                value_table = self.create_value_table( connection, column, values)
+                try:
+                    for row in SqlManager.fetch_rows( connection.execute( query.where( column.in_( select( [ value_table.c.value]))))):
+                        yield row
+                finally:
+                    self.drop_value_table( connection, value_table)
+        finally:
+            connection.close()
+
+    # #
+    # Create a temporary table of a connection holding a list of values of a column
+    # The temporary tables are written in the temporary DB, even in read-only mode.
+    #
+    # @param connection : Connection - the connection
+    # @param column : Column or attribute - the column the values belong to
+    # @param values : list - the distinct values
+    #
+    # @return Table - the temporary table, with a single "value" primary key column
+    def create_value_table(self, connection, column, values):
+
+        value_table = Table( "in_values_" + str( id( values)), MetaData(), Column( "value", column.type, primary_key = True), prefixes = [ "TEMPORARY"])
+        if self.readOnly:
+            connection.execute( "PRAGMA query_only = OFF")
+        try:
+            value_table.create( connection)
+            SqlManager.insert_batches( connection, value_table, ( { "value": value} for value in values))
+        finally:
+            if self.readOnly:
+                connection.execute( "PRAGMA query_only = ON")
+
+        return value_table
+
+    # #
+    # Drop a temporary table created by create_value_table
+    #
+    # @param connection : Connection - the connection
+    # @param value_table : Table - the temporary table
+    def drop_value_table(self, connection, value_table):
+
+        if self.readOnly:
+            connection.execute( "PRAGMA query_only = OFF")
+        try:
+            value_table.drop( connection)
+        finally:
+            if self.readOnly:
+                connection.execute( "PRAGMA query_only = ON")
+
+    # #
+    # Stream the rows of a result by batches of Constants.FETCH_SIZE rows
+    #
+    # @param result : ResultProxy - the result of a query
+    #
+    # @return generator - the rows of the result
+    @staticmethod
+    def fetch_rows( result):
+
+        try:
+            while True:
+                rows = result.fetchmany( Constants.FETCH_SIZE)
+                if len( rows) == 0:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            result.close()
+
 
     def build_database(self, path, keep_file=True):
         if keep_file == False:
@@ -134,20 +479,78 @@ class SqlManager(object) :
                 Logger.get_instance().info('Can not delete file : ' + str(path))
                 pass
 
-        # Create engine to dedicated database
-        engine = create_engine(Constants.PATH_SQL_BASE + path)
-
-        # Open the DB session
-        session = sessionmaker()
-        session.configure(bind=engine)
+        # Use the engine of the dedicated database
+        self.set_DBpath( path)
 
         # Create all the required table in DB according to class model
-        Base.metadata.create_all(engine)
+        Base.metadata.create_all( self.get_engine())
 
-        self.DBPath = path
+        # Create the indexes of the tables that existed before
+        self.ensure_indexes()
 
         Logger.get_instance().info('File created : ' + str(path))
 
+    # #
+    # Create the indexes declared by the models on the tables of the DB that do not have them yet
+    # (the DB files built before the declaration of the indexes), then update the statistics of the query planner
+    #
+    # @return list - the names of the indexes created
+    def ensure_indexes(self):
+
+        # Import the models declaring the indexes of the hot queries
+        from model.Mutation import Mutation
+        from model.ProcessedMutation import ProcessedMutation
+
+        engine = self.get_engine()
+        inspector = inspect( engine)
+        table_names = inspector.get_table_names()
+        created_indexes = []
+        for table in Base.metadata.tables.values():
+            if table.name not in table_names:
+                continue
+            existing_indexes = [ index[ "name"] for index in inspector.get_indexes( table.name)]
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    Logger.get_instance().info( "SqlManager.ensure_indexes : Creating index " + index.name + " on table " + table.name)
+                    index.create( engine)
+                    created_indexes.append( index.name)
+
+        if len( created_indexes) > 0:
+            engine.execute( "ANALYZE")
+            # Write the indexes to the DB file so that they are seen by the read-only connections
+            engine.execute( "PRAGMA wal_checkpoint(TRUNCATE)")
+
+        return created_indexes
+
+    # #
+    # Check with EXPLAIN QUERY PLAN that the hot queries of QUERY_PLAN_CHECKS use an index
+    # A query uses an index if none of its steps is a scan of a table (a scan of an index is accepted).
+    # The queries on tables absent from the DB are not checked.
+    #
+    # @return list - the ( query name, uses an index, query plan details) tuples of the checked queries
+    def check_query_plans(self):
+
+        engine = self.get_engine()
+        table_names = inspect( engine).get_table_names()
+        results = []
+        for query_name, table_name, query in SqlManager.QUERY_PLAN_CHECKS:
+            if table_name not in table_names:
+                continue
+            try:
+                plan_details = [ str( row[ -1]) for row in engine.execute( "EXPLAIN QUERY PLAN " + query, [ None] * query.count( "?"))]
+            except exc.OperationalError as oe:
+                Logger.get_instance().warning( "SqlManager.check_query_plans : " + query_name + " can not be planned: " + str( oe.orig))
+                results.append( ( query_name, False, [ str( oe.orig)]))
+                continue
+            uses_index = len( [ detail for detail in plan_details if detail.startswith( "SCAN") and "INDEX" not in detail]) == 0
+            results.append( ( query_name, uses_index, plan_details))
+            if uses_index:
+                Logger.get_instance().info( "SqlManager.check_query_plans : " + query_name + " uses an index: " + " | ".join( plan_details))
+            else:
+                Logger.get_instance().warning( "SqlManager.check_query_plans : " + query_name + " scans a table: " + " | ".join( plan_details))
+
+        return results
+
     @staticmethod
     def get_instance():
 
@@ -192,34 +595,118 @@ class SqlManager(object) :
 
     # #
     # Export the content of the given table to CSV file (tab separated)
+    # The rows are streamed from the cursor by batches of batch_size rows, so the table is never loaded in memory.
+    # The file is written under a temporary name in the output folder and renamed when complete.
     # 
-    # @param table_name : string - the name of the DB table to export
+    # @param table_name : string - the name of the DB table to export, or the FROM clause of a join
     # @param output_path : string - the path to the output file
-    def export_table( self, table_name, output_path):
-        
-        # Connect to the database
-        import sqlite3
-        con = sqlite3.connect( self.DBPath)
-        
-        # Create the CSV output file
-        import csv
-        outfile = open( output_path, "w")
-        outcsv = csv.writer( outfile,  delimiter='\t')
-        
-        # Execute the query on DB
-        cursor = con.execute( "select * from " + table_name)
-        
-        # Dump table column headers
-        headers = []
-        for header in cursor.description:
-            headers.append( header[0])
-        outcsv.writerow( headers)
-        
-        # Dump the table rows
-        outcsv.writerows(cursor.fetchall())
-        
-        # Close the file
-        outfile.close()
+    # @param columns : list - the names of the columns to export, as "table.column" for a join (None for all the columns)
+    # @param where : string - the SQL condition the exported rows satisfy (None for all the rows)
+    # @param parameters : tuple - the values of the "?" parameters of the condition
+    # @param batch_size : int - the number of rows fetched at once (None for Constants.FETCH_SIZE)
+    # @param compression : string - the compression of the file, among EXPORT_COMPRESSIONS (None for no compression)
+    #
+    # @return int - the number of rows exported
+    # @raise SNPnetException : if the compression is unknown or not available
+    def export_table( self, table_name, output_path, columns = None, where = None, parameters = (), batch_size = None, compression = None):
+
+        if batch_size == None:
+            batch_size = Constants.FETCH_SIZE
+
+        # Build the query
+        query = "select " + ( ", ".join( columns) if columns != None else "*") + " from " + table_name
+        if where != None:
+            query += " where " + where
+
+        # Get a raw connection to the database from the engine
+        con = self.get_engine().raw_connection()
+        try:
+            # Execute the query on DB
+            cursor = con.cursor()
+            cursor.execute( query, parameters)
+
+            # Create the CSV output file
+            import csv
+            temporary_path = os.path.join( os.path.dirname( os.path.abspath( output_path)), SqlManager.TEMPORARY_EXPORT_PREFIX + os.path.basename( output_path))
+            outfile = SqlManager.open_export_file( temporary_path, compression)
+            try:
+                outcsv = csv.writer( outfile,  delimiter='\t')
+
+                # Dump table column headers
+                outcsv.writerow( [ header[0] for header in cursor.description])
+
+                # Dump the table rows by batches
+                row_count = 0
+                while True:
+                    rows = cursor.fetchmany( batch_size)
+                    if len( rows) == 0:
+                        break
+                    outcsv.writerows( rows)
+                    row_count += len( rows)
+                outfile.close()
+            except:
+                outfile.close()
+                os.remove( temporary_path)
+                raise
+            cursor.close()
+            os.rename( temporary_path, output_path)
+        finally:
+            # Return the connection to the pool
+            con.close()
+
+        Logger.get_instance().info( "SqlManager.export_table : " + str( row_count) + " rows of " + table_name + " exported to " + output_path)
+
+        return row_count
+
+    # #
+    # Export several tables to CSV files in parallel, each table on its own connection of the engine
+    #
+    # @param table_exports : list - the ( table name, output path) tuples, or ( table name, output path, dictionary of the
+    #                               named arguments of export_table) tuples
+    # @param thread_count : int - the number of tables exported at the same time
+    # @param export_function : function - the function exporting a table, with the arguments of export_table
+    #                                     (None for export_table, e.g. ColumnarTableExporter.export_table)
+    #
+    # @return list - the number of rows exported for each table
+    def export_tables( self, table_exports, thread_count = None, export_function = None):
+
+        from multiprocessing.pool import ThreadPool
+
+        if export_function == None:
+            export_function = self.export_table
+        if thread_count == None:
+            thread_count = len( table_exports)
+        thread_pool = ThreadPool( max( 1, min( thread_count, len( table_exports))))
+        try:
+            return thread_pool.map( lambda table_export: export_function( table_export[ 0], table_export[ 1], **( table_export[ 2] if len( table_export) > 2 else {})), table_exports)
+        finally:
+            thread_pool.close()
+            thread_pool.join()
+
+    # #
+    # Open an export file for writing, with a compression
+    #
+    # @param path : string - the path to the file
+    # @param compression : string - the compression of the file, among EXPORT_COMPRESSIONS (None for no compression)
+    #
+    # @return the file object
+    # @raise SNPnetException : if the compression is unknown or not available
+    @staticmethod
+    def open_export_file( path, compression):
+
+        if compression == None:
+            return open( path, "w")
+        elif compression == SqlManager.GZIP_COMPRESSION:
+            import gzip
+            return gzip.open( path, "wb")
+        elif compression == SqlManager.ZSTD_COMPRESSION:
+            try:
+                import zstandard
+            except ImportError as ie:
+                raise SNPnetException( "SqlManager.open_export_file : The zstandard package is required to export files with zstd compression.", ie)
+            return zstandard.ZstdCompressor().stream_writer( open( path, "wb"))
+        else:
+            raise SNPnetException( "SqlManager.open_export_file : Unknown compression '" + str( compression) + "'. The compressions are " + ", ".join( SqlManager.EXPORT_COMPRESSIONS) + ".")
         
         
         
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import sqlite3
+import hashlib
+import tempfile
+
+from util import Constants
+
+# Content fingerprint of the tables of a SQLite DB, and the fingerprint file used as Snakemake input of the export
+#
+# The fingerprint of a table is its number of rows, its maximal rowid and the SHA-1 checksum of its rows read in the
+# order of the rowid (the rows are serialized as JSON, so that the fingerprint is the same with Python 2 and 3).
+#
+# Snakemake removes the outputs of a job before running it, so a rule can not keep its output when nothing changed.
+# The fingerprint file is thus updated when the Snakefile is parsed (see update_file): the fingerprints of the tables
+# are computed and the file is rewritten only if they differ from the ones it holds. The rules depending on the
+# tables take the fingerprint file as input instead of the DB file, so that they are executed again only if the
+# content of the tables changed (not when the DB file is only touched or when other tables are modified).
+# The fingerprints are cached beside the fingerprint file with the size and modification time of the DB file: while
+# the DB file is unchanged no query is executed; otherwise each table is scanned once.
+#
+# Only the standard library is used, so that the Snakefiles can import this module.
+
+class TableFingerprint(object):
+
+    CACHE_FILE_SUFFIX = ".cache"
+    TEMPORARY_FILE_PREFIX = ".tmp_"
+
+    DB_STAT_KEY = "db_stat"
+    TABLES_KEY = "tables"
+
+    #
+    # Compute the content fingerprint of a table
+    #
+    # @param connection : sqlite3.Connection - a connection to the DB (or the DBAPI connection of an engine)
+    # @param table_name : string - the name of the table
+    #
+    # @return string - the fingerprint "<row count>:<max rowid>:<checksum>"
+    @staticmethod
+    def compute( connection, table_name):
+
+        cursor = connection.cursor()
+        try:
+            try:
+                cursor.execute( "select count(*), max(rowid) from " + table_name)
+                row_count, max_rowid = cursor.fetchone()
+                order_clause = " order by rowid"
+            except sqlite3.OperationalError:
+                # Table without rowid
+                cursor.execute( "select count(*) from " + table_name)
+                row_count, max_rowid = cursor.fetchone()[0], None
+                order_clause = ""
+
+            checksum = hashlib.sha1()
+            cursor.execute( "select * from " + table_name + order_clause)
+            while True:
+                rows = cursor.fetchmany( Constants.FETCH_SIZE)
+                if len( rows) == 0:
+                    break
+                checksum.update( json.dumps( rows, ensure_ascii = True, default = repr).encode( "ascii"))
+        finally:
+            cursor.close()
+
+        return str( row_count) + ":" + str( max_rowid) + ":" + checksum.hexdigest()
+
+    #
+    # Update the fingerprint file of tables of a DB, rewriting it only if the fingerprints of the tables changed
+    #
+    # @param fingerprint_file_path : string - the path to the fingerprint file
+    # @param db_path : string - the path to the DB file
+    # @param table_names : list - the names of the tables
+    #
+    # @return boolean - True if the fingerprint file was written
+    @staticmethod
+    def update_file( fingerprint_file_path, db_path, table_names):
+
+        cache_file_path = fingerprint_file_path + TableFingerprint.CACHE_FILE_SUFFIX
+        db_stat = os.stat( db_path)
+        db_stat = [ os.path.realpath( db_path), db_stat.st_size, db_stat.st_mtime]
+
+        # Reuse the fingerprints of the cache if the DB file is the same, otherwise compute them
+        cache = TableFingerprint.read_json( cache_file_path)
+        table_fingerprints = {}
+        if cache.get( TableFingerprint.DB_STAT_KEY) == db_stat:
+            table_fingerprints = cache.get( TableFingerprint.TABLES_KEY, {})
+        missing_tables = [ table_name for table_name in table_names if table_name not in table_fingerprints]
+        if len( missing_tables) > 0:
+            connection = sqlite3.connect( db_path)
+            try:
+                connection.execute( "PRAGMA query_only = ON")
+                for table_name in missing_tables:
+                    table_fingerprints[ table_name] = TableFingerprint.compute( connection, table_name)
+            finally:
+                connection.close()
+            TableFingerprint.write_json( cache_file_path, { TableFingerprint.DB_STAT_KEY: db_stat, TableFingerprint.TABLES_KEY: table_fingerprints})
+
+        fingerprints = { TableFingerprint.TABLES_KEY: dict( [ ( table_name, table_fingerprints[ table_name]) for table_name in table_names])}
+        if TableFingerprint.read_json( fingerprint_file_path) == fingerprints:
+            return False
+        TableFingerprint.write_json( fingerprint_file_path, fingerprints)
+
+        return True
+
+    #
+    # Read a JSON file
+    #
+    # @param file_path : string - the path to the file
+    #
+    # @return dict - the content of the file (empty if the file does not exist or can not be read)
+    @staticmethod
+    def read_json( file_path):
+
+        if not os.path.exists( file_path):
+            return {}
+        try:
+            with open( file_path) as json_file:
+                return json.load( json_file)
+        except ValueError:
+            return {}
+
+    #
+    # Write a JSON file (written under a temporary name and renamed)
+    #
+    # @param file_path : string - the path to the file
+    # @param content : dict - the content of the file
+    #
+    @staticmethod
+    def write_json( file_path, content):
+
+        folder = os.path.dirname( os.path.abspath( file_path))
+        if not os.path.exists( folder):
+            os.makedirs( folder)
+        file_descriptor, temporary_path = tempfile.mkstemp( prefix = TableFingerprint.TEMPORARY_FILE_PREFIX, dir = folder)
+        with os.fdopen( file_descriptor, "w") as json_file:
+            json.dump( content, json_file, indent = 2, sort_keys = True)
+        os.rename( temporary_path, file_path)
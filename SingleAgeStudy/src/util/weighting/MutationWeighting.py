@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from scipy import sparse
+
+from util.log.Logger import Logger
+from util.sql.SqlManager import SqlManager
+from util.annotation.DatabaseIndex import DatabaseIndex
+
+from model.ProcessedStrain import ProcessedStrain
+from model.ProcessedMutation import ProcessedMutation
+
+# Compute the weights, ranks and ratios of all the mutations for ProcessedPhenotypes (batch version of
+# ProcessedMutation.compute_weight)
+#
+# The weight of a mutation for a phenotype is the mean, over the strains of the phenotype carrying the mutation,
+# of the reference value times the rank of the strain, counted negatively for the LOW strains and positively for the
+# HIGH strains (0 for the other strains). For each phenotype, the strain reference values, ranks and types are read
+# once into two vectors indexed by line:
+#   - the signed score of each strain (+/- reference_value * rank)
+#   - the presence of each strain (1 if the strain is processed for the phenotype)
+# The mutation -> line membership is a sparse matrix built from the bitset index of the database (see
+# LineMembershipIndex), by blocks of MUTATION_BLOCK_SIZE mutations. The sums of scores and the number of lines of
+# all the mutations for a batch of phenotypes are computed with a single product of each block by the matrix of the
+# strain vectors, then the ranks (1 for the highest weight) and the ratios are computed with a sort.
+#
+# The results are written in bulk to the processed_mutation table, replacing the previous mutations of the phenotype
+# (see script/mutation_weighting/compute_mutation_weights.py).
+
+class MutationWeighting(object):
+
+    LOW_TYPE = "LOW"
+    HIGH_TYPE = "HIGH"
+
+    # Number of mutations of the blocks of the membership matrix
+    MUTATION_BLOCK_SIZE = 100000
+    # Number of phenotypes computed with the same products
+    PHENOTYPE_BATCH_SIZE = 8
+
+    #
+    # Instantiate the weighting
+    #
+    # @param sql_session : Session - the SQLAlchemy session to the database
+    # @param line_membership_index : LineMembershipIndex - the line membership index of the database
+    #
+    def __init__(self, sql_session, line_membership_index):
+
+        self.sqlSession = sql_session
+        self.lineMembershipIndex = line_membership_index
+        self.mutationIds = line_membership_index.mutationIds
+        self.lineIds = line_membership_index.lineIds
+
+    #
+    # Read the strains of a phenotype and build its strain vectors
+    #
+    # @param processed_phenotype : ProcessedPhenotype - the phenotype
+    #
+    # @return tuple - the signed score and the presence of each line of the index
+    def get_strain_vectors(self, processed_phenotype):
+
+        query = self.sqlSession.query( ProcessedStrain.strain_number, ProcessedStrain.reference_value, ProcessedStrain.rank, ProcessedStrain.type)
+        query = query.filter( ProcessedStrain.phenotype_name == processed_phenotype.name, ProcessedStrain.method == processed_phenotype.method,
+                              ProcessedStrain.age == processed_phenotype.age)
+        strain_rows = query.all()
+
+        scores = np.zeros( len( self.lineIds), dtype = np.float64)
+        presences = np.zeros( len( self.lineIds), dtype = np.float64)
+        if len( strain_rows) == 0:
+            return ( scores, presences)
+
+        strain_numbers, reference_values, ranks, types = zip( *strain_rows)
+        strain_scores = np.array( [ ( reference_value or 0.0) * ( rank or 0) for reference_value, rank in zip( reference_values, ranks)], dtype = np.float64)
+        types = np.array( types, dtype = object)
+        strain_scores[ types == MutationWeighting.LOW_TYPE] *= -1
+        strain_scores[ ( types != MutationWeighting.LOW_TYPE) & ( types != MutationWeighting.HIGH_TYPE)] = 0
+
+        positions, found = DatabaseIndex.locate( self.lineIds, strain_numbers)
+        if not found.all():
+            Logger.get_instance().warning( "MutationWeighting.get_strain_vectors : " + str( int( ( ~found).sum())) + " strains of phenotype " + processed_phenotype.name + " have no mutation in the database")
+        scores[ positions[ found]] = strain_scores[ found]
+        presences[ positions[ found]] = 1
+
+        return ( scores, presences)
+
+    #
+    # Build a block of the mutation -> line membership matrix
+    #
+    # @param block_start : int - the index of the first mutation of the block
+    # @param block_end : int - the index following the last mutation of the block
+    #
+    # @return scipy.sparse.csr_matrix - the membership matrix of the block (one row per mutation, one column per line)
+    def get_membership_block(self, block_start, block_end):
+
+        line_flags = np.unpackbits( self.lineMembershipIndex.lineBits[ block_start:block_end], axis = 1)[ :, :len( self.lineIds)]
+        mutation_indexes, line_indexes = line_flags.nonzero()
+        indptr = np.r_[ 0, np.cumsum( np.bincount( mutation_indexes, minlength = block_end - block_start))]
+
+        return sparse.csr_matrix( ( np.ones( len( line_indexes), dtype = np.float64), line_indexes, indptr), shape = ( block_end - block_start, len( self.lineIds)))
+
+    #
+    # Compute the weights, ranks and ratios of all the mutations for a list of phenotypes
+    #
+    # @param processed_phenotype_list : list<ProcessedPhenotype> - the phenotypes
+    #
+    # @return list - for each phenotype, a tuple of arrays ( indexes of the mutations carried by at least one of its strains,
+    #                number of lines, weight, rank and ratio of these mutations)
+    def compute_weights(self, processed_phenotype_list):
+
+        phenotype_count = len( processed_phenotype_list)
+        strain_vectors = [ self.get_strain_vectors( processed_phenotype) for processed_phenotype in processed_phenotype_list]
+        strain_matrix = np.column_stack( [ scores for scores, presences in strain_vectors] + [ presences for scores, presences in strain_vectors])
+
+        # Sums of the scores and number of lines of each mutation, for all the phenotypes at once
+        mutation_sums = np.empty( ( len( self.mutationIds), 2 * phenotype_count), dtype = np.float64)
+        for block_start in range( 0, len( self.mutationIds), MutationWeighting.MUTATION_BLOCK_SIZE):
+            block_end = min( block_start + MutationWeighting.MUTATION_BLOCK_SIZE, len( self.mutationIds))
+            mutation_sums[ block_start:block_end] = self.get_membership_block( block_start, block_end).dot( strain_matrix)
+
+        results = []
+        for phenotype_index in range( phenotype_count):
+            number_lines = np.rint( mutation_sums[ :, phenotype_count + phenotype_index]).astype( np.int64)
+            mutation_indexes = np.flatnonzero( number_lines > 0)
+            number_lines = number_lines[ mutation_indexes]
+            weights = mutation_sums[ mutation_indexes, phenotype_index] / number_lines
+            ranks, ratios = MutationWeighting.compute_ranks_and_ratios( weights)
+            results.append( ( mutation_indexes, number_lines, weights, ranks, ratios))
+
+        return results
+
+    #
+    # Compute the ranks and the ratios of a list of weights
+    # The rank is the position of the weight in the decreasing order (starting at 1). The ratio is the proportion of
+    # weights higher or equal (for positive weights) or lower or equal (for negative weights) than the weight.
+    #
+    # @param weights : numpy.ndarray - the weights
+    #
+    # @return tuple - the arrays of the ranks and of the ratios
+    @staticmethod
+    def compute_ranks_and_ratios( weights):
+
+        weight_count = len( weights)
+        ranks = np.empty( weight_count, dtype = np.int64)
+        ranks[ np.argsort( -weights, kind = "mergesort")] = np.arange( 1, weight_count + 1)
+
+        sorted_weights = np.sort( weights)
+        ratios = np.where( weights >= 0,
+                           weight_count - np.searchsorted( sorted_weights, weights, side = "left"),
+                           np.searchsorted( sorted_weights, weights, side = "right")) / float( max( weight_count, 1))
+
+        return ( ranks, ratios)
+
+    #
+    # Write the mutations of a phenotype to the processed_mutation table, replacing its previous mutations
+    # The rows are inserted by batches of Constants.BULK_SIZE rows (see SqlManager.insert_batches); the session is not committed.
+    #
+    # @param processed_phenotype : ProcessedPhenotype - the phenotype
+    # @param result : tuple - the result of the phenotype computed by compute_weights
+    #
+    # @return int - the number of rows written
+    def write_weights(self, processed_phenotype, result):
+
+        mutation_indexes, number_lines, weights, ranks, ratios = result
+
+        self.sqlSession.query( ProcessedMutation).filter( ProcessedMutation.phenotype_name == processed_phenotype.name, ProcessedMutation.method == processed_phenotype.method,
+                                                          ProcessedMutation.age == processed_phenotype.age).delete( synchronize_session = False)
+
+        mutation_names = self.mutationIds[ mutation_indexes].tolist()
+        rows = ( { "phenotype_name": processed_phenotype.name, "method": processed_phenotype.method, "age": processed_phenotype.age,
+                   "name": mutation_name, "number_line": number_line, "weight": weight, "rank": rank, "ratio": ratio}
+                 for mutation_name, number_line, weight, rank, ratio in zip( mutation_names, number_lines.tolist(), weights.tolist(), ranks.tolist(), ratios.tolist()))
+        SqlManager.insert_batches( self.sqlSession, ProcessedMutation, rows)
+
+        return len( mutation_names)
+
+    #
+    # Compute and write the mutations of a list of phenotypes, by batches of PHENOTYPE_BATCH_SIZE phenotypes
+    #
+    # @param processed_phenotype_list : list<ProcessedPhenotype> - the phenotypes
+    #
+    def process(self, processed_phenotype_list):
+
+        for batch_start in range( 0, len( processed_phenotype_list), MutationWeighting.PHENOTYPE_BATCH_SIZE):
+            phenotype_batch = processed_phenotype_list[ batch_start:batch_start + MutationWeighting.PHENOTYPE_BATCH_SIZE]
+            for processed_phenotype, result in zip( phenotype_batch, self.compute_weights( phenotype_batch)):
+                row_count = self.write_weights( processed_phenotype, result)
+                Logger.get_instance().info( "MutationWeighting.process : " + str( row_count) + " mutations weighted for phenotype " + processed_phenotype.name +
+                                            " (" + str( processed_phenotype.method) + ", " + str( processed_phenotype.age) + ")")
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+# Annotation database of the tests of the gene mapping, written in a temporary folder by setUp and removed by tearDown:
+#   - the mutation_effect table: s1 has two effects, s2, s4 and s6 one effect, s3 and s5 none
+#   - the mutation_in_line table: the lines dgrp1 to dgrp7 carrying the mutations (s4 and s5 are carried by no line)
+#   - the families file of the lines line_1, line_2, line_3 and line_5 used by the analysis
+# The effects are inserted in the order of their mutation and of their Flybase ID.
+# The test cases inherit from this class and from unittest.TestCase.
+
+class AnnotationTestData(object):
+
+    EFFECT_TABLE_DDL = "CREATE TABLE mutation_effect (flybase_id VARCHAR, symbol VARCHAR, mutation_id VARCHAR, position VARCHAR, type VARCHAR, PRIMARY KEY (flybase_id, mutation_id))"
+    LINE_TABLE_DDL = "CREATE TABLE mutation_in_line (mutation_id VARCHAR, line_id VARCHAR, PRIMARY KEY (mutation_id, line_id))"
+
+    EFFECTS = [ ( "FBgn01", "g1", "s1", "INTRON", "SNP"),
+                ( "FBgn02", "g2", "s1", "UTR_3_PRIME", "SNP"),
+                ( "FBgn03", "g3", "s2", "SYNONYMOUS_CODING", "SNP"),
+                ( "FBgn04", "g4", "s4", "UPSTREAM", "DEL"),
+                ( "FBgn05", "g5", "s6", "INTRON", "SNP")]
+
+    MUTATION_LINES = { "s1" : [ "dgrp1", "dgrp2", "dgrp4"],
+                       "s2" : [ "dgrp3", "dgrp5", "dgrp6", "dgrp7"],
+                       "s3" : [ "dgrp1"],
+                       "s6" : [ "dgrp2"]}
+
+    USED_LINES = [ "line_1", "line_2", "line_3", "line_5"]
+
+    def setUp(self):
+
+        self.folder = tempfile.mkdtemp()
+        self.db_path = os.path.join( self.folder, "annotation.sqlite")
+        connection = sqlite3.connect( self.db_path)
+        try:
+            connection.execute( AnnotationTestData.EFFECT_TABLE_DDL)
+            connection.execute( AnnotationTestData.LINE_TABLE_DDL)
+            connection.executemany( "INSERT INTO mutation_effect (flybase_id, symbol, mutation_id, position, type) VALUES (?, ?, ?, ?, ?)", AnnotationTestData.EFFECTS)
+            connection.executemany( "INSERT INTO mutation_in_line (mutation_id, line_id) VALUES (?, ?)",
+                                    [ ( mutation_id, line_id) for mutation_id in sorted( AnnotationTestData.MUTATION_LINES) for line_id in AnnotationTestData.MUTATION_LINES[ mutation_id]])
+            connection.commit()
+        finally:
+            connection.close()
+
+        self.families_file_path = os.path.join( self.folder, "families.txt")
+        with open( self.families_file_path, "w") as families_file:
+            for line in AnnotationTestData.USED_LINES:
+                families_file.write( line + " " + line + "\n")
+        self.index_folder = os.path.join( self.folder, "index")
+
+    def tearDown(self):
+
+        shutil.rmtree( self.folder)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+
+import numpy as np
+from pysnptools.snpreader import Bed, SnpData
+
+# Data of the tests of the GWAS backends, written in a temporary folder by setUp and removed by tearDown:
+#   - the genotype of related lines on 3 chromosomes (each line is a mix of a few founders), with some missing genotypes
+#   - a phenotype with a polygenic effect, one causal SNP and a covariable effect
+#   - the covariable
+# The test cases inherit from this class and from unittest.TestCase.
+
+class GwasTestData(object):
+
+    INDIVIDUAL_COUNT = 60
+    CHROMOSOME_COUNT = 3
+    SNPS_PER_CHROMOSOME = 40
+
+    def setUp(self):
+
+        self.folder = tempfile.mkdtemp()
+        random = np.random.RandomState( 11)
+        snp_count = GwasTestData.CHROMOSOME_COUNT * GwasTestData.SNPS_PER_CHROMOSOME
+
+        # Genotypes of related lines: each line is a mix of a few founders, with some missing genotypes
+        founders = random.randint( 0, 2, size = ( 6, snp_count)) * 2.0
+        origins = random.randint( 0, len( founders), size = ( GwasTestData.INDIVIDUAL_COUNT, snp_count))
+        values = np.where( random.rand( GwasTestData.INDIVIDUAL_COUNT, snp_count) < 0.2, 1.0, founders[ origins[ :, 0]])
+        values = np.where( random.rand( *values.shape) < 0.5, founders[ origins, np.arange( snp_count)], values)
+        values[ random.rand( *values.shape) < 0.02] = np.nan
+
+        iid = np.array( [ [ "line_" + str( index), "line_" + str( index)] for index in range( GwasTestData.INDIVIDUAL_COUNT)])
+        sid = np.array( [ "snp_" + str( index) for index in range( snp_count)])
+        pos = np.array( [ [ 1 + index // GwasTestData.SNPS_PER_CHROMOSOME, 0, 1000 + index] for index in range( snp_count)])
+        self.genotype_prefix = self.folder + "/genotype"
+        Bed.write( self.genotype_prefix, SnpData( iid = iid, sid = sid, pos = pos, val = values), count_A1 = False)
+
+        # Phenotype with a polygenic effect, one causal SNP and a covariable effect
+        covariable = random.randn( GwasTestData.INDIVIDUAL_COUNT)
+        filled_values = np.where( np.isnan( values), 1.0, values)
+        phenotype = filled_values.dot( random.randn( snp_count)) * 0.1 + filled_values[ :, 5] + 0.5 * covariable + random.randn( GwasTestData.INDIVIDUAL_COUNT)
+        self.phenotype_file_name = self.folder + "/phenotype.txt"
+        self.covariable_file_name = self.folder + "/covariable.txt"
+        with open( self.phenotype_file_name, "w") as phenotype_file, open( self.covariable_file_name, "w") as covariable_file:
+            for index, ( fid, individual_id) in enumerate( iid):
+                phenotype_file.write( fid + " " + individual_id + " " + repr( phenotype[ index]) + "\n")
+                covariable_file.write( fid + " " + individual_id + " " + repr( covariable[ index]) + "\n")
+
+    def tearDown(self):
+
+        shutil.rmtree( self.folder)
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import tempfile
+
+# Tests of the SingleAgeStudy python sources
+#
+# The tests are executed from the SingleAgeStudy folder with:
+#     python -m unittest discover -s test -t .
+# The src folder is added to the path and the Logger is initialized once, in a temporary folder, at WARNING level.
+# The plots are drawn with the Agg backend of matplotlib, as in the Snakemake rules.
+
+os.environ.setdefault( "MPLBACKEND", "Agg")
+
+SRC_PATH = os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__))), "src")
+if SRC_PATH not in sys.path:
+    sys.path.insert( 0, SRC_PATH)
+
+from util import Constants
+from util.log.Logger import Logger
+
+LOG_PATH = os.path.join( tempfile.mkdtemp( prefix = "single_age_study_test_"), "test.log")
+Logger.get_instance( LOG_PATH, Constants.MODE_WARNING)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import os
+import hashlib
+import sqlite3
+import unittest
+
+from test.AnnotationTestData import AnnotationTestData
+from util.annotation.DatabaseIndex import DatabaseIndex
+from util.annotation.GeneAnnotationIndex import GeneAnnotationIndex
+from util.annotation.LineMembershipIndex import LineMembershipIndex
+from util.annotation.MutationLineCounter import MutationLineCounter
+
+# Test of the annotation indexes of a database (gene annotation and line membership), of the line counts computed
+# from them, and of their rebuild when the database changes
+
+class TestDatabaseIndex( AnnotationTestData, unittest.TestCase):
+
+    # The effects of the mutations are the ones of the mutation_effect table, by Flybase ID
+    def test_gene_annotation_index(self):
+
+        index = GeneAnnotationIndex.get_index( self.index_folder, self.db_path)
+        effects = index.get_effects( [ "s6", "s1", "s3", "unknown", "s1"])
+
+        self.assertEqual( index.get_mutation_count(), 4)
+        self.assertEqual( sorted( effects.keys()), [ "s1", "s6"])
+        self.assertEqual( effects[ "s1"], [ ( "FBgn01", "g1", "INTRON", "SNP"), ( "FBgn02", "g2", "UTR_3_PRIME", "SNP")])
+        self.assertEqual( effects[ "s6"], [ ( "FBgn05", "g5", "INTRON", "SNP")])
+        self.assertEqual( index.get_effects( []), {})
+
+    # The lines carrying the mutations and their counts among the lines used by an analysis are the ones of the
+    # mutation_in_line table
+    def test_line_membership_index(self):
+
+        index = LineMembershipIndex.get_index( self.index_folder, self.db_path)
+        self.assertEqual( index.get_line_ids(), [ "dgrp" + str( number) for number in range( 1, 8)])
+        for mutation_id, line_ids in AnnotationTestData.MUTATION_LINES.items():
+            self.assertEqual( index.get_lines( mutation_id), line_ids)
+        self.assertEqual( index.get_lines( "s4"), [])
+
+        counter = MutationLineCounter( index, AnnotationTestData.USED_LINES)
+        self.assertEqual( counter.get_total_line_count(), 7)
+        self.assertEqual( counter.get_line_counts( [ "s1", "s2", "s3", "s4", "s6"]), { "s1" : ( 3, 2), "s2" : ( 4, 2), "s3" : ( 1, 1), "s6" : ( 1, 1)})
+
+    # An index is reused while the database is unchanged, and rebuilt when its fingerprint (path, size and modification
+    # time of the database file) changes
+    def test_rebuild_on_fingerprint_change(self):
+
+        db_stat = os.stat( self.db_path)
+        fingerprint = DatabaseIndex.compute_fingerprint( self.db_path)
+        self.assertEqual( fingerprint, hashlib.sha1( os.path.realpath( self.db_path) + "\t" + str( db_stat.st_size) + "\t" + str( int( db_stat.st_mtime)) + "\n").hexdigest())
+
+        index = GeneAnnotationIndex.get_index( self.index_folder, self.db_path)
+        self.assertEqual( os.path.basename( index.indexPath), GeneAnnotationIndex.INDEX_FOLDER_PREFIX + fingerprint)
+        self.assertEqual( GeneAnnotationIndex.get_index( self.index_folder, self.db_path).indexPath, index.indexPath)
+        self.assertEqual( len( os.listdir( self.index_folder)), 1)
+
+        # Add an effect to s3 and move the modification time, so that the fingerprint changes even within the same second
+        connection = sqlite3.connect( self.db_path)
+        try:
+            connection.execute( "INSERT INTO mutation_effect (flybase_id, symbol, mutation_id, position, type) VALUES ('FBgn06', 'g6', 's3', 'INTRON', 'SNP')")
+            connection.commit()
+        finally:
+            connection.close()
+        os.utime( self.db_path, ( db_stat.st_atime, int( db_stat.st_mtime) + 10))
+
+        rebuilt_index = GeneAnnotationIndex.get_index( self.index_folder, self.db_path)
+        self.assertNotEqual( rebuilt_index.indexPath, index.indexPath)
+        self.assertEqual( os.path.basename( rebuilt_index.indexPath), GeneAnnotationIndex.INDEX_FOLDER_PREFIX + DatabaseIndex.compute_fingerprint( self.db_path))
+        self.assertEqual( rebuilt_index.get_effects( [ "s3"]), { "s3" : [ ( "FBgn06", "g6", "INTRON", "SNP")]})
+        self.assertEqual( index.get_effects( [ "s3"]), {})
+        self.assertEqual( sorted( os.listdir( self.index_folder)), sorted( [ os.path.basename( index.indexPath), os.path.basename( rebuilt_index.indexPath)]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from test import SRC_PATH
+from util.epistasis.EpistasisShards import EpistasisShards
+from util.epistasis.NativeEpistasisEngine import NativeEpistasisEngine
+
+# Test of the split of SET_B in shards and of the merge of the shard summaries, by EpistasisShards and by the
+# merge_epistasis_shards.py script executing the shards as separate jobs
+
+class TestEpistasisShards(unittest.TestCase):
+
+    MERGE_SCRIPT_PATH = os.path.join( os.path.dirname( SRC_PATH), "script", "epistasis_analysis", "merge_epistasis_shards.py")
+
+    SET_A = [ "snp_2", "snp_0", "snp_1"]
+    SET_B = [ "snp_10", "snp_11", "snp_12", "snp_13", "snp_14"]
+
+    # Rows of the shard summaries (CHR SNP N_SIG N_TOT PROP CHISQ CHR SNP), not in SET_A order.
+    # snp_1 has the same best chi-square in both shards: the partner of the first shard is kept.
+    SHARD_ROWS = [ [ [ "1", "snp_1", "1", "2", "0.5", "12.5", "3", "snp_10"],
+                     [ "1", "snp_0", "0", "2", "0", "3.25", "1", "snp_11"]],
+                   [ [ "1", "snp_0", "1", "2", "0.5", "9.75", "2", "snp_13"],
+                     [ "2", "snp_2", "2", "3", "0.6667", "20.1", "1", "snp_12"],
+                     [ "1", "snp_1", "1", "3", "0.3333", "12.5", "2", "snp_14"]]]
+
+    MERGED_ROWS = [ [ "2", "snp_2", "2", "3", "0.6667", "20.1", "1", "snp_12"],
+                    [ "1", "snp_0", "1", "4", "0.25", "9.75", "2", "snp_13"],
+                    [ "1", "snp_1", "2", "5", "0.4", "12.5", "3", "snp_10"]]
+
+    def setUp(self):
+
+        self.folder = tempfile.mkdtemp()
+        self.set_file_name = os.path.join( self.folder, "sets.txt")
+        EpistasisShards.write_set_file( self.set_file_name, TestEpistasisShards.SET_A, TestEpistasisShards.SET_B)
+        self.summary_file_paths = []
+        for shard_index, rows in enumerate( TestEpistasisShards.SHARD_ROWS):
+            summary_file_path = os.path.join( self.folder, "geno" + EpistasisShards.SHARD_SUFFIX + str( shard_index) + ".summary")
+            with open( summary_file_path, "w") as summary_file:
+                summary_file.write( "Epistasis summary of shard " + str( shard_index) + "\n")
+                summary_file.write( NativeEpistasisEngine.SUMMARY_HEADER_FORMAT % tuple( NativeEpistasisEngine.SUMMARY_HEADERS))
+                summary_file.write( "\n")
+                for row in rows:
+                    summary_file.write( NativeEpistasisEngine.SUMMARY_HEADER_FORMAT % tuple( row))
+            self.summary_file_paths.append( summary_file_path)
+
+    def tearDown(self):
+
+        shutil.rmtree( self.folder)
+
+    # The chunks are contiguous, cover SET_B in order and their sizes differ by 1 at most, even with more shards than SNPs
+    def test_shard_snps(self):
+
+        for snp_count, shard_count in [ ( 5, 3), ( 5, 5), ( 2, 3), ( 1, 4), ( 0, 2)]:
+            set_b = TestEpistasisShards.SET_B[ 0:snp_count]
+            chunks = [ EpistasisShards.get_shard_snps( set_b, shard_count, shard_index) for shard_index in range( shard_count)]
+            self.assertEqual( sum( chunks, []), set_b, ( snp_count, shard_count))
+            sizes = [ len( chunk) for chunk in chunks]
+            self.assertTrue( max( sizes) - min( sizes) <= 1, ( snp_count, shard_count, sizes))
+
+        self.assertEqual( [ EpistasisShards.get_shard_snps( [ "a", "b"], 3, shard_index) for shard_index in range( 3)], [ [], [ "a"], [ "b"]])
+
+    # The set file of a shard holds the whole SET_A and the chunk of SET_B of the shard
+    def test_write_shard_set_file(self):
+
+        shard_set_file_path = os.path.join( self.folder, "shard_sets.txt")
+        set_a, shard_snps = EpistasisShards.write_shard_set_file( self.set_file_name, shard_set_file_path, 3, 1)
+
+        self.assertEqual( ( set_a, shard_snps), ( TestEpistasisShards.SET_A, [ "snp_11", "snp_12"]))
+        self.assertEqual( NativeEpistasisEngine.read_snp_sets( shard_set_file_path), ( set_a, shard_snps))
+
+    # The counts are summed, the proportion recomputed, the best chi-square kept with the partner of the first shard on ties,
+    # and the rows written in SET_A order
+    def test_merge_summaries(self):
+
+        output_path = os.path.join( self.folder, "merged.summary")
+        row_count = EpistasisShards.merge_summaries( self.set_file_name, self.summary_file_paths, output_path)
+
+        self.assertEqual( row_count, len( TestEpistasisShards.SET_A))
+        self.assertEqual( EpistasisShards.read_summary_rows( output_path), TestEpistasisShards.MERGED_ROWS)
+
+        # The order of the rows does not depend on the order of the shards
+        reversed_output_path = os.path.join( self.folder, "reversed.summary")
+        EpistasisShards.merge_summaries( self.set_file_name, self.summary_file_paths[ ::-1], reversed_output_path)
+        self.assertEqual( [ row[ 1] for row in EpistasisShards.read_summary_rows( reversed_output_path)], TestEpistasisShards.SET_A)
+
+    # The script merging the shards executed as separate jobs writes the summary of merge_summaries
+    def test_merge_script(self):
+
+        output_path = os.path.join( self.folder, "merged.summary")
+        EpistasisShards.merge_summaries( self.set_file_name, self.summary_file_paths, output_path)
+
+        script_output_path = os.path.join( self.folder, "script.summary")
+        environment = dict( os.environ, PYTHONPATH = SRC_PATH)
+        subprocess.check_output( [ sys.executable, TestEpistasisShards.MERGE_SCRIPT_PATH, "-s", self.set_file_name, "-i", ",".join( self.summary_file_paths),
+                                   "-o", script_output_path, "-l", self.folder], stderr = subprocess.STDOUT, env = environment)
+
+        with open( output_path) as merged_file, open( script_output_path) as script_file:
+            self.assertEqual( script_file.read(), merged_file.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
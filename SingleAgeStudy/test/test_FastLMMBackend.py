@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+from fastlmm.association import single_snp
+
+from util.gwas.GwasBackend import GwasBackend
+from util.gwas.FastLMMBackend import FastLMMBackend
+from test.GwasTestData import GwasTestData
+
+# Regression test of the Fast-LMM backend using a shared kinship decomposition against a plain single_snp execution
+
+class TestFastLMMBackend( GwasTestData, unittest.TestCase):
+
+    # The p-values obtained with the shared decomposition are the ones of single_snp
+    def test_kinship_run_matches_single_snp(self):
+
+        expected_df = single_snp( self.genotype_prefix, self.phenotype_file_name, covar = self.covariable_file_name)
+        backend = FastLMMBackend( self.folder)
+        results_df = backend.run( self.genotype_prefix, self.phenotype_file_name, self.covariable_file_name, self.folder + "/kinship.npz")
+
+        self.assertEqual( list( results_df.columns), list( expected_df.columns))
+        self.assertEqual( len( results_df), len( expected_df))
+        expected_df = expected_df.set_index( "SNP").loc[ results_df[ "SNP"]]
+        for column in [ "PValue", "SnpWeight", "SnpWeightSE", "Nullh2"]:
+            np.testing.assert_allclose( results_df[ column].values, expected_df[ column].values, rtol = 1e-5, atol = 1e-10, err_msg = column)
+        np.testing.assert_array_equal( results_df[ "sid_index"].values, expected_df[ "sid_index"].values)
+        self.assertTrue( ( np.diff( results_df[ "PValue"].values) >= 0).all())
+
+        # The decomposition saved by the first run is reused
+        reused_df = backend.run( self.genotype_prefix, self.phenotype_file_name, self.covariable_file_name, self.folder + "/kinship.npz")
+        np.testing.assert_array_equal( reused_df[ "PValue"].values, results_df[ "PValue"].values)
+
+    # The memory goal given to the backends only changes the number of SNPs tested at once, and GB_goal is only given
+    # to Fast-LMM if a memory goal is set
+    def test_memory_goal(self):
+
+        self.assertEqual( GwasBackend.get_backend( GwasBackend.FASTLMM_BACKEND, self.folder).get_memory_options(), {})
+
+        memory_goal = 1024 * 1024
+        backend = GwasBackend.get_backend( GwasBackend.FASTLMM_BACKEND, self.folder, memory_goal)
+        self.assertEqual( backend.get_gb_goal(), 1.0 / 1024)
+        self.assertEqual( backend.get_memory_options(), { "GB_goal" : 1.0 / 1024})
+        self.assertEqual( GwasBackend.get_backend( GwasBackend.NATIVE_BACKEND, self.folder, memory_goal).memoryGoal, memory_goal)
+
+        expected_df = single_snp( self.genotype_prefix, self.phenotype_file_name, covar = self.covariable_file_name)
+        results_df = backend.run( self.genotype_prefix, self.phenotype_file_name, self.covariable_file_name)
+        np.testing.assert_allclose( results_df[ "PValue"].values, expected_df[ "PValue"].values, rtol = 1e-10)
+
+
+if __name__ == "__main__":
+    unittest.main()
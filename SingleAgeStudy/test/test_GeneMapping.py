@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+import subprocess
+
+from test import SRC_PATH
+from test.AnnotationTestData import AnnotationTestData
+
+# Test of the GWAS and epistasis gene mapping scripts (GwasGeneMapper and EpistasisGeneMapper on the annotation indexes)
+# against the files written by the mapping scripts querying the database before the indexes (expected files below)
+
+class TestGeneMapping( AnnotationTestData, unittest.TestCase):
+
+    SCRIPT_PATH = os.path.join( os.path.dirname( SRC_PATH), "script")
+    GWAS_SCRIPT_PATH = os.path.join( SCRIPT_PATH, "gwas_gene_mapping", "gwas_result_gene_mapping.py")
+    EPISTASIS_SCRIPT_PATH = os.path.join( SCRIPT_PATH, "epistasis_gene_mapping", "epistasis_result_gene_mapping.py")
+
+    GWAS_RESULT = ( "sid_index\tSNP\tChr\tChrPos\tPValue\n"
+                    "0\ts1\t2L\t1000\t1.2e-07\n"
+                    "1\ts2\t2L\t2000\t3.4500000000000004e-05\n"
+                    "2\ts3\t3R\t1500\t0.00012\n"
+                    "3\ts4\tX\t300\t0.0021\n"
+                    "4\ts5\tX\t400\t0.01\n"
+                    "5\ts6\t3R\t2500\t0.049\n")
+
+    EXPECTED_GWAS_GENEMAP = ( "ID\tFlybaseID\tGeneSymbol\tPosition\tType\tNbOfLinesForMutationInGWAS\tNbOfLinesForMutationInDB\tTotalNbOfLinesinDB\tsid_index\tSNP\tChr\tChrPos\tPValue\n"
+                              "s1\tFBgn01\tg1\tINTRON\tSNP\t2\t3\t7\t0\ts1\t2L\t1000\t1.2e-07\n"
+                              "s1\tFBgn02\tg2\tUTR_3_PRIME\tSNP\t2\t3\t7\t0\ts1\t2L\t1000\t1.2e-07\n"
+                              "s2\tFBgn03\tg3\tSYNONYMOUS_CODING\tSNP\t2\t4\t7\t1\ts2\t2L\t2000\t3.4500000000000004e-05\n"
+                              "s4\tFBgn04\tg4\tUPSTREAM\tDEL\t0\t0\t7\t3\ts4\tX\t300\t0.0021\n"
+                              "s6\tFBgn05\tg5\tINTRON\tSNP\t1\t1\t7\t5\ts6\t3R\t2500\t0.049\n")
+
+    EXPECTED_GWAS_GENEMAP_MISSING = ( "sid_index\tSNP\tChr\tChrPos\tPValue\n"
+                                      "2\ts3\t3R\t1500\t0.00012\t\n"
+                                      "4\ts5\tX\t400\t0.01\t\n")
+
+    EPISTASIS_SUMMARY = ( "Epistasis summary\n"
+                          " CHR          SNP    N_SIG    N_TOT     PROP        CHISQ  CHR          SNP\n"
+                          "\n"
+                          "   1           s1        1        3   0.3333        12.57    1           s2\n"
+                          "   1           s2        0        2        0         3.25    2           s3\n"
+                          "   2           s6        2        4      0.5         20.1    1           s4\n"
+                          "   1           s4        0        0        0            0   NA           NA\n"
+                          "   2           s5        1        5      0.2        9.125    1           s1\n"
+                          "   1           s2        1        3   0.3333           11    1           s1\n")
+
+    EXPECTED_EPISTASIS_GENEMAP = ( "1_ID\t1_FlybaseID\t1_GeneSymbol\t1_Position\t1_Type\t1_NbOfLinesForMutationInEpistasis\t1_NbOfLinesForMutationInDB\t1_TotalNbOfLinesinDB\t"
+                                   "1_CHR\t1_SNP\tN_SIG\tN_TOT\tPROP\tCHISQ\t2_CHR\t2_SNP\t"
+                                   "2_ID\t2_FlybaseID\t2_GeneSymbol\t2_Position\t2_Type\t2_NbOfLinesForMutationInEpistasis\t2_NbOfLinesForMutationInDB\t2_TotalNbOfLinesinDB\n"
+                                   "s1\tFBgn01\tg1\tINTRON\tSNP\t2\t3\t7\t1\ts1\t1\t3\t0.3333\t12.57\t1\ts2\ts2\tFBgn03\tg3\tSYNONYMOUS_CODING\tSNP\t2\t4\t7\n"
+                                   "s6\tFBgn05\tg5\tINTRON\tSNP\t1\t1\t7\t2\ts6\t2\t4\t0.5\t20.1\t1\ts4\ts4\tFBgn04\tg4\tUPSTREAM\tDEL\t0\t0\t7\n"
+                                   "s2\tFBgn03\tg3\tSYNONYMOUS_CODING\tSNP\t2\t4\t7\t1\ts2\t1\t3\t0.3333\t11\t1\ts1\ts1\tFBgn01\tg1\tINTRON\tSNP\t2\t3\t7\n")
+
+    # The script querying the database wrote the missing pairs after the previous output line, with no line break:
+    # the pairs are now written with the columns of the summary, one per line
+    EXPECTED_EPISTASIS_GENEMAP_MISSING = ( "1_CHR\t1_SNP\tN_SIG\tN_TOT\tPROP\tCHISQ\t2_CHR\t2_SNP\n"
+                                           "1\ts2\t0\t2\t0\t3.25\t2\ts3\n"
+                                           "1\ts4\t0\t0\t0\t0\tNA\tNA\n"
+                                           "2\ts5\t1\t5\t0.2\t9.125\t1\ts1\n")
+
+    #
+    # Execute a mapping script on the database of the test
+    #
+    # @param script_path : string - the path to the script
+    # @param arguments : list - the arguments of the script other than the database, families, index, output and log ones
+    #
+    def execute_script(self, script_path, arguments):
+
+        environment = dict( os.environ, PYTHONPATH = SRC_PATH)
+        subprocess.check_output( [ sys.executable, script_path, "-f", self.families_file_path, "-d", self.db_path, "-x", self.index_folder,
+                                   "-o", self.folder, "-l", self.folder] + arguments, stderr = subprocess.STDOUT, env = environment)
+
+    def read_file(self, file_name):
+
+        with open( os.path.join( self.folder, file_name)) as read_file:
+            return read_file.read()
+
+    # The mapped SNPs and the SNPs with no gene are the ones of the script querying the database, byte for byte
+    def test_gwas_mapping(self):
+
+        result_file_path = os.path.join( self.folder, "result.txt")
+        with open( result_file_path, "w") as result_file:
+            result_file.write( TestGeneMapping.GWAS_RESULT)
+        self.execute_script( TestGeneMapping.GWAS_SCRIPT_PATH, [ "-g", result_file_path])
+
+        self.assertEqual( self.read_file( "result_genemap.txt"), TestGeneMapping.EXPECTED_GWAS_GENEMAP)
+        self.assertEqual( self.read_file( "result_genemapmissing.txt"), TestGeneMapping.EXPECTED_GWAS_GENEMAP_MISSING)
+
+    # The mapped pairs are the ones of the script querying the database, byte for byte, with the tokens of the summary
+    def test_epistasis_mapping(self):
+
+        summary_file_path = os.path.join( self.folder, "phenotype.epi.qt.lm.summary")
+        with open( summary_file_path, "w") as summary_file:
+            summary_file.write( TestGeneMapping.EPISTASIS_SUMMARY)
+        self.execute_script( TestGeneMapping.EPISTASIS_SCRIPT_PATH, [ "-e", summary_file_path])
+
+        self.assertEqual( self.read_file( "phenotype.epi.qt.lm.summary_genemap.txt"), TestGeneMapping.EXPECTED_EPISTASIS_GENEMAP)
+        self.assertEqual( self.read_file( "phenotype.epi.qt.lm.summary_genemap_missing.txt"), TestGeneMapping.EXPECTED_EPISTASIS_GENEMAP_MISSING)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from scipy import stats
+
+from util.gwas.GwasPlot import GwasPlot, GwasPlotPoints
+
+# Test of the points of the GWAS plots, filled chunk by chunk, against the complete result
+
+class TestGwasPlot(unittest.TestCase):
+
+    SNP_COUNT = 5000
+    CHUNK_SIZE = 700
+
+    def setUp(self):
+
+        self.folder = tempfile.mkdtemp()
+        random = np.random.RandomState( 5)
+        self.chromosomes = random.choice( [ 1.0, 2.0, 3.0], TestGwasPlot.SNP_COUNT)
+        self.positions = random.permutation( TestGwasPlot.SNP_COUNT) * 10
+        self.pvalues = np.sort( np.r_[ random.rand( TestGwasPlot.SNP_COUNT - 50), random.rand( 50) * 1e-5])
+
+    def tearDown(self):
+
+        shutil.rmtree( self.folder)
+
+    def get_plot_points(self):
+
+        plot_points = GwasPlotPoints()
+        for start in range( 0, TestGwasPlot.SNP_COUNT, TestGwasPlot.CHUNK_SIZE):
+            end = start + TestGwasPlot.CHUNK_SIZE
+            plot_points.add_chunk( self.chromosomes[ start:end], self.positions[ start:end], self.pvalues[ start:end])
+
+        return plot_points
+
+    # Rank of each SNP by chromosome then position, in the order of the Manhattan points
+    def get_expected_manhattan_points(self):
+
+        order = np.lexsort( ( self.positions, self.chromosomes))
+
+        return ( np.arange( TestGwasPlot.SNP_COUNT), -np.log10( self.pvalues[ order]), self.chromosomes[ order])
+
+    def get_expected_lambda(self):
+
+        return np.median( stats.chi2.isf( self.pvalues, 1)) / 0.456
+
+    def test_all_points_kept(self):
+
+        plot_points = self.get_plot_points()
+
+        chromosome_values, chromosome_counts, chromosome_indexes, x, y = plot_points.get_manhattan_points()
+        expected_x, expected_y, expected_chromosomes = self.get_expected_manhattan_points()
+        np.testing.assert_array_equal( chromosome_values, [ 1.0, 2.0, 3.0])
+        np.testing.assert_array_equal( chromosome_counts, [ np.count_nonzero( self.chromosomes == value) for value in chromosome_values])
+        np.testing.assert_array_equal( chromosome_values[ chromosome_indexes], expected_chromosomes)
+        np.testing.assert_allclose( x, expected_x)
+        np.testing.assert_allclose( y, expected_y)
+
+        ranks, pvalues = plot_points.get_qq_points()
+        np.testing.assert_array_equal( ranks, np.arange( TestGwasPlot.SNP_COUNT))
+        np.testing.assert_array_equal( pvalues, self.pvalues)
+
+        lambda_gc = GwasPlot.qq_plot( plot_points, os.path.join( self.folder, "qq.png"))
+        self.assertAlmostEqual( lambda_gc, self.get_expected_lambda(), places = 10)
+        GwasPlot.manhattan_plot( plot_points, os.path.join( self.folder, "manhattan.png"))
+        self.assertTrue( os.path.getsize( os.path.join( self.folder, "manhattan.png")) > 0)
+
+    def test_sampled_points(self):
+
+        max_sample_size = GwasPlotPoints.MAX_SAMPLE_SIZE
+        GwasPlotPoints.MAX_SAMPLE_SIZE = 1000
+        try:
+            plot_points = self.get_plot_points()
+        finally:
+            GwasPlotPoints.MAX_SAMPLE_SIZE = max_sample_size
+
+        # The significant SNPs are all kept, the other ones are sampled with a stride
+        ranks, pvalues = plot_points.get_qq_points()
+        significant_count = np.count_nonzero( self.pvalues < GwasPlot.KEEP_PVALUE)
+        self.assertEqual( plot_points.stride, 8)
+        self.assertTrue( len( ranks) <= significant_count + 1000)
+        np.testing.assert_array_equal( ranks[ :significant_count], np.arange( significant_count))
+        np.testing.assert_array_equal( pvalues, self.pvalues[ ranks])
+        self.assertEqual( plot_points.get_snp_count(), TestGwasPlot.SNP_COUNT)
+
+        # The Manhattan coordinates estimated from the sample stay close to the exact rank of the SNPs
+        chromosome_values, chromosome_counts, chromosome_indexes, x, y = plot_points.get_manhattan_points()
+        expected_x, expected_y, expected_chromosomes = self.get_expected_manhattan_points()
+        expected_rank = dict( zip( zip( expected_chromosomes, -expected_y), expected_x))
+        rank_errors = [ abs( x_value - expected_rank[ ( chromosome_values[ chromosome_index], -y_value)]) for chromosome_index, x_value, y_value in zip( chromosome_indexes, x, y)]
+        self.assertTrue( max( rank_errors) < 0.03 * TestGwasPlot.SNP_COUNT)
+
+        lambda_gc = GwasPlot.qq_plot( plot_points, os.path.join( self.folder, "qq.png"))
+        self.assertAlmostEqual( lambda_gc, self.get_expected_lambda(), places = 2)
+        GwasPlot.manhattan_plot( plot_points, os.path.join( self.folder, "manhattan.png"))
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from util.gwas.GwasBackend import GwasBackend
+from util.gwas.GwasResultTable import GwasResultTable
+from util.gwas.GwasResultWriter import GwasResultWriter
+
+# Test of the significant SNPs read from the columnar result file against the significant result files
+
+class TestGwasResultTable(unittest.TestCase):
+
+    SNP_COUNT = 1000
+    CHUNK_SIZE = 30
+    ALPHA = 0.05
+    SUFFIX_LIST = [ "100th", "1e-3", ALPHA]
+
+    def setUp(self):
+
+        self.folder = tempfile.mkdtemp()
+        random = np.random.RandomState( 3)
+        pvalues = np.sort( np.r_[ random.rand( TestGwasResultTable.SNP_COUNT - 20) * 0.2, np.repeat( 1e-3, 20)])
+        # The p-values of ranks 100 and 101 are equal, so that the tie is also selected by the rank filter
+        pvalues[ 100] = pvalues[ 99]
+        self.result_df = pd.DataFrame( dict( [ ( column, np.zeros( TestGwasResultTable.SNP_COUNT)) for column in GwasBackend.RESULT_COLUMNS]), columns = GwasBackend.RESULT_COLUMNS)
+        self.result_df[ "SNP"] = [ "snp_" + str( index) for index in range( TestGwasResultTable.SNP_COUNT)]
+        self.result_df[ "Chr"] = 1.0
+        self.result_df[ "ChrPos"] = np.arange( TestGwasResultTable.SNP_COUNT)
+        self.result_df[ "PValue"] = pvalues
+
+        self.result_file_path = self.folder + "/result_GWASresults.txt"
+        self.result_writer = GwasResultWriter( self.result_file_path, TestGwasResultTable.ALPHA, TestGwasResultTable.SUFFIX_LIST, columnar = True)
+        self.result_writer.write( [ self.result_df.iloc[ start:start + TestGwasResultTable.CHUNK_SIZE] for start in range( 0, TestGwasResultTable.SNP_COUNT, TestGwasResultTable.CHUNK_SIZE)])
+
+    def tearDown(self):
+
+        shutil.rmtree( self.folder)
+
+    def test_significant_rows(self):
+
+        table_file_path = GwasResultTable.get_file_path( self.result_file_path)
+        for suffix in TestGwasResultTable.SUFFIX_LIST:
+            suffix, pvalue_threshold, inclusive, rank = GwasResultWriter.get_filter( suffix, TestGwasResultTable.ALPHA)
+            if rank != None:
+                pvalue_threshold = GwasResultTable.get_rank_pvalue( table_file_path, rank, TestGwasResultTable.ALPHA)
+            table_df = GwasResultTable.read( table_file_path, pvalue_threshold = pvalue_threshold, inclusive = inclusive)
+            significant_df = pd.read_csv( self.result_writer.get_significant_file_path( suffix), sep = "\t", float_precision = "round_trip")
+            self.assertTrue( len( significant_df) > 0, suffix)
+            self.assertEqual( list( table_df[ "SNP"]), list( significant_df[ "SNP"]), suffix)
+            np.testing.assert_array_equal( table_df[ "PValue"].values, significant_df[ "PValue"].values)
+
+        self.assertEqual( GwasResultTable.get_rank_pvalue( table_file_path, 101), self.result_df[ "PValue"].values[ 100])
+        self.assertEqual( GwasResultTable.get_rank_pvalue( table_file_path, 5000), self.result_df[ "PValue"].values[ -1])
+
+    # The rank is taken among the SNPs passing alpha, as in the GWAS result report: with fewer SNPs passing alpha than
+    # the rank, only these SNPs are selected, and not all the SNPs up to the rank
+    def test_rank_among_alpha(self):
+
+        pvalues = self.result_df[ "PValue"].values
+        alpha_count = int( ( pvalues < TestGwasResultTable.ALPHA).sum())
+        rank = alpha_count + 50
+        self.assertTrue( pvalues[ rank - 1] >= TestGwasResultTable.ALPHA)
+
+        rank_file_path = self.folder + "/rank_GWASresults.txt"
+        suffix = str( rank) + GwasResultWriter.RANK_SUFFIX_END
+        rank_writer = GwasResultWriter( rank_file_path, TestGwasResultTable.ALPHA, [ suffix], columnar = True)
+        rank_writer.write( [ self.result_df])
+        significant_df = pd.read_csv( rank_writer.get_significant_file_path( suffix), sep = "\t")
+        self.assertEqual( list( significant_df[ "SNP"]), list( self.result_df[ "SNP"].values[ 0:alpha_count]))
+
+        table_file_path = GwasResultTable.get_file_path( rank_file_path)
+        self.assertEqual( GwasResultTable.get_rank_pvalue( table_file_path, rank), pvalues[ rank - 1])
+        self.assertEqual( GwasResultTable.get_rank_pvalue( table_file_path, rank, TestGwasResultTable.ALPHA), pvalues[ alpha_count - 1])
+        self.assertEqual( GwasResultTable.get_rank_pvalue( table_file_path, 10, 1e-9), None)
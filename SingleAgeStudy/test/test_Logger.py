@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+import multiprocessing
+
+from util import Constants
+from util.log.Logger import Logger
+
+# Test of the queue mode of the Logger
+# (the loggers of the tests are attached to the root logger: its handlers are detached during each test and restored after it)
+
+class TestLogger(unittest.TestCase):
+
+    def setUp(self):
+
+        self.folder = tempfile.mkdtemp()
+        self.log_path = os.path.join( self.folder, "test.log")
+        self.root_handlers = logging.getLogger().handlers[:]
+        self.root_level = logging.getLogger().level
+        for handler in self.root_handlers:
+            logging.getLogger().removeHandler( handler)
+        self.logger = None
+
+    def tearDown(self):
+
+        if self.logger != None:
+            self.logger.stop_listener()
+        root_logger = logging.getLogger()
+        for handler in root_logger.handlers[:]:
+            handler.close()
+            root_logger.removeHandler( handler)
+        for handler in self.root_handlers:
+            root_logger.addHandler( handler)
+        root_logger.setLevel( self.root_level)
+        shutil.rmtree( self.folder)
+
+    def read_log(self):
+
+        with open( self.log_path) as log_file:
+            return log_file.read()
+
+    # The arguments of the messages of the disabled levels are not formatted
+    def test_is_enabled(self):
+
+        self.logger = Logger( self.log_path, Constants.MODE_WARNING, queue_mode = True)
+        argument = FormatCounter()
+
+        self.assertFalse( self.logger.is_enabled( Constants.MODE_INFO))
+        self.assertTrue( self.logger.is_enabled( Constants.MODE_WARNING))
+        self.logger.debug( "debug %s", argument)
+        self.logger.info( "info %s", argument)
+        self.logger.flush()
+        self.assertEqual( argument.formatCount, 0)
+        self.assertNotIn( "info", self.read_log())
+
+        self.logger.warning( "warning %s", argument)
+        self.logger.flush()
+        self.assertEqual( argument.formatCount, 1)
+        self.assertIn( "warning formatted", self.read_log())
+
+    # The records are buffered until the buffer is full or an error is logged, which writes all the buffered records
+    def test_flush_on_error(self):
+
+        self.logger = Logger( self.log_path, Constants.MODE_INFO, queue_mode = True, buffer_size = 3)
+
+        self.logger.info( "first")
+        self.logger.info( "second")
+        self.logger.queueListener.queue.join()
+        self.assertNotIn( "first", self.read_log())
+
+        self.logger.info( "third")
+        self.logger.queueListener.queue.join()
+        self.assertIn( "third", self.read_log())
+
+        self.logger.info( "fourth")
+        self.logger.queueListener.queue.join()
+        self.assertNotIn( "fourth", self.read_log())
+
+        self.logger.error( "failure", ex = False)
+        log = self.read_log()
+        self.assertIn( "fourth", log)
+        self.assertIn( "failure", log)
+        self.assertLess( log.index( "fourth"), log.index( "failure"))
+
+    # The records of a child process are put in a queue read by the parent, and an error of the child does not wait
+    # for the background thread of the parent
+    def test_forward_to_queue(self):
+
+        self.logger = Logger( self.log_path, Constants.MODE_INFO, queue_mode = True)
+        record_queue = multiprocessing.Queue()
+        child = multiprocessing.Process( target = log_in_child, args = ( self.logger, record_queue))
+        child.start()
+        records = [ record_queue.get( timeout = 30) for index in range( 2)]
+        child.join( 30)
+
+        self.assertEqual( child.exitcode, 0)
+        self.assertEqual( [ record.getMessage() for record in records], [ "shard 3 done", "shard failure"])
+        self.assertEqual( [ record.levelno for record in records], [ Constants.MODE_INFO, Constants.MODE_ERROR])
+        self.assertNotIn( "shard", self.read_log())
+
+    # While the background thread is paused, the records of another queue are written by the buffered handlers only,
+    # and the records of the logger stay in its queue until the thread is resumed
+    def test_pause_listener(self):
+
+        self.logger = Logger( self.log_path, Constants.MODE_INFO, queue_mode = True, buffer_size = 1)
+        self.assertEqual( self.logger.get_record_handlers(), list( self.logger.queueListener.handlers))
+
+        self.logger.pause_listener()
+        self.logger.info( "paused")
+        record_handlers = self.logger.get_record_handlers()
+        for handler in record_handlers:
+            handler.handle( logging.makeLogRecord( { "msg" : "shard record", "levelno" : Constants.MODE_INFO, "levelname" : "INFO"}))
+        self.logger.flush()
+        log = self.read_log()
+        self.assertIn( "shard record", log)
+        self.assertNotIn( "paused", log)
+
+        self.logger.resume_listener()
+        self.logger.flush()
+        self.assertIn( "paused", self.read_log())
+
+
+#
+# Log messages in a child process after forwarding its records to a queue
+#
+# @param logger : Logger - the logger inherited from the parent
+# @param record_queue : multiprocessing.Queue - the queue read by the parent
+#
+def log_in_child( logger, record_queue):
+
+    logger.forward_to_queue( record_queue)
+    logger.info( "shard %d done", 3)
+    logger.error( "shard failure", ex = False)
+
+
+# Argument of a message counting its formatting
+
+class FormatCounter(object):
+
+    def __init__(self):
+
+        self.formatCount = 0
+
+    def __str__(self):
+
+        self.formatCount += 1
+
+        return "formatted"
+
+
+if __name__ == "__main__":
+    unittest.main()
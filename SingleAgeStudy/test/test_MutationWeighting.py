@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy import create_engine, pool
+from sqlalchemy.orm import sessionmaker
+
+from util.annotation.LineMembershipIndex import LineMembershipIndex
+from util.weighting.MutationWeighting import MutationWeighting
+from model.ProcessedStrain import ProcessedStrain
+from model.ProcessedMutation import ProcessedMutation
+
+# Test of the batch weighting of the mutations against ProcessedMutation.compute_weight, on an in-memory database
+# holding the tables read and written by the weighting (the phenotypes are given by their keys, as the weighting only
+# reads the name, method and age of the ProcessedPhenotype objects)
+
+Phenotype = namedtuple( "Phenotype", [ "name", "method", "age"])
+
+class TestMutationWeighting(unittest.TestCase):
+
+    LINE_COUNT = 12
+    MUTATION_COUNT = 40
+    TYPES = [ "HIGH", "LOW", "NONE"]
+
+    # The processed phenotypes, with the lines of their strains (the line L20 carries no mutation)
+    PHENOTYPES = [ ( "Heartperiod_Mean", "IQR", 1, [ "L%02d" % index for index in range( 10)] + [ "L20"]),
+                   ( "Heartperiod_Mean", "IQR", 4, [ "L%02d" % index for index in range( 3, 8)]),
+                   ( "Systolic_Interval", "mean", 1, [ "L%02d" % index for index in range( 0, 12, 2)])]
+
+    TABLES = [ "CREATE TABLE mutation_in_line ( mutation_id VARCHAR, line_id VARCHAR, PRIMARY KEY ( mutation_id, line_id))",
+               "CREATE TABLE processed_strain ( phenotype_name VARCHAR, method VARCHAR, age INTEGER, strain_number VARCHAR, reference_value FLOAT, rank INTEGER, type VARCHAR, "
+               + "PRIMARY KEY ( phenotype_name, method, age, strain_number))",
+               "CREATE TABLE processed_mutation ( phenotype_name VARCHAR, method VARCHAR, age INTEGER, name VARCHAR, number_line INTEGER, rank INTEGER, weight FLOAT, ratio FLOAT, fdr FLOAT, "
+               + "PRIMARY KEY ( phenotype_name, method, age, name))"]
+
+    def setUp(self):
+
+        self.folder = tempfile.mkdtemp()
+        self.connection = sqlite3.connect( ":memory:", check_same_thread = False)
+        self.connection.text_factory = str
+        self.engine = create_engine( "sqlite://", creator = lambda: self.connection, poolclass = pool.StaticPool)
+        for table in TestMutationWeighting.TABLES:
+            self.connection.execute( table)
+        self.session = sessionmaker( bind = self.engine)()
+
+        random = np.random.RandomState( 5)
+        line_ids = [ "L%02d" % index for index in range( TestMutationWeighting.LINE_COUNT)]
+        self.mutation_lines = {}
+        for index in range( TestMutationWeighting.MUTATION_COUNT):
+            line_flags = random.rand( TestMutationWeighting.LINE_COUNT) < 0.4
+            line_flags[ random.randint( TestMutationWeighting.LINE_COUNT)] = True
+            self.mutation_lines[ "m%03d" % index] = set( np.array( line_ids)[ line_flags])
+        # Mutations with the same weight (same lines) and a mutation carried only by lines with no strain
+        self.mutation_lines[ "m001"] = set( self.mutation_lines[ "m000"])
+        self.mutation_lines[ "m002"] = set( [ "L11"])
+        self.connection.executemany( "INSERT INTO mutation_in_line ( mutation_id, line_id) VALUES ( ?, ?)",
+                                     [ ( mutation_id, line_id) for mutation_id, lines in sorted( self.mutation_lines.items()) for line_id in sorted( lines)])
+
+        self.processed_phenotypes = []
+        for name, method, age, strain_numbers in TestMutationWeighting.PHENOTYPES:
+            self.processed_phenotypes.append( Phenotype( name, method, age))
+            self.connection.executemany( "INSERT INTO processed_strain VALUES ( ?, ?, ?, ?, ?, ?, ?)",
+                                         [ ( name, method, age, strain_number, float( random.randn()), rank + 1, TestMutationWeighting.TYPES[ random.randint( len( TestMutationWeighting.TYPES))])
+                                           for rank, strain_number in enumerate( random.permutation( strain_numbers))])
+        self.connection.commit()
+
+        LineMembershipIndex.write_connection_arrays( self.connection, self.folder)
+        self.line_membership_index = LineMembershipIndex( self.folder)
+
+    def tearDown(self):
+
+        self.session.close()
+        self.engine.dispose()
+        self.connection.close()
+        shutil.rmtree( self.folder)
+
+    # Compute the processed mutations of a phenotype one by one with ProcessedMutation.compute_weight
+    # (the rank is the position in the decreasing order of the weights, the ratio the proportion of weights higher
+    # or equal, for a positive weight, or lower or equal, for a negative weight)
+    def get_reference_mutations(self, processed_phenotype):
+
+        processed_strains = self.session.query( ProcessedStrain).filter( ProcessedStrain.phenotype_name == processed_phenotype.name, ProcessedStrain.method == processed_phenotype.method,
+                                                                        ProcessedStrain.age == processed_phenotype.age).all()
+        mutation_ids = []
+        weights = []
+        line_counts = []
+        for mutation_id in sorted( self.mutation_lines.keys()):
+            # The strains carrying the mutation, in the order of the lines
+            carrying_strains = sorted( [ strain for strain in processed_strains if strain.get_strain_number() in self.mutation_lines[ mutation_id]],
+                                       key = lambda strain: strain.get_strain_number())
+            if len( carrying_strains) == 0:
+                continue
+            mutation_ids.append( mutation_id)
+            weights.append( ProcessedMutation.compute_weight( carrying_strains))
+            line_counts.append( len( carrying_strains))
+
+        ranks = [ 0] * len( weights)
+        for rank, position in enumerate( sorted( range( len( weights)), key = lambda position: -weights[ position])):
+            ranks[ position] = rank + 1
+        ratios = [ len( [ other for other in weights if ( other >= weight if weight >= 0 else other <= weight)]) / float( len( weights)) for weight in weights]
+
+        return dict( [ ( mutation_id, ( line_count, weight, rank, ratio)) for mutation_id, line_count, weight, rank, ratio in zip( mutation_ids, line_counts, weights, ranks, ratios)])
+
+    # The weights, line counts, ranks and ratios written are the ones of compute_weight, whatever the block and batch sizes
+    def test_process_matches_compute_weight(self):
+
+        for mutation_block_size, phenotype_batch_size in [ ( MutationWeighting.MUTATION_BLOCK_SIZE, MutationWeighting.PHENOTYPE_BATCH_SIZE), ( 7, 2)]:
+            default_sizes = ( MutationWeighting.MUTATION_BLOCK_SIZE, MutationWeighting.PHENOTYPE_BATCH_SIZE)
+            MutationWeighting.MUTATION_BLOCK_SIZE, MutationWeighting.PHENOTYPE_BATCH_SIZE = mutation_block_size, phenotype_batch_size
+            try:
+                MutationWeighting( self.session, self.line_membership_index).process( self.processed_phenotypes)
+            finally:
+                MutationWeighting.MUTATION_BLOCK_SIZE, MutationWeighting.PHENOTYPE_BATCH_SIZE = default_sizes
+            self.session.commit()
+
+            for processed_phenotype in self.processed_phenotypes:
+                written_mutations = dict( [ ( name, ( number_line, weight, rank, ratio)) for name, number_line, weight, rank, ratio in
+                                            self.session.query( ProcessedMutation.name, ProcessedMutation.number_line, ProcessedMutation.weight, ProcessedMutation.rank, ProcessedMutation.ratio)
+                                                        .filter( ProcessedMutation.phenotype_name == processed_phenotype.name, ProcessedMutation.method == processed_phenotype.method,
+                                                                 ProcessedMutation.age == processed_phenotype.age)])
+                reference_mutations = self.get_reference_mutations( processed_phenotype)
+                self.assertGreater( len( reference_mutations), 10)
+                self.assertEqual( written_mutations, reference_mutations)
+                self.assertNotIn( "m002", written_mutations)
+
+    # The ranks follow the decreasing weights (ties in the order of the mutation IDs) and the ratios count the
+    # weights at least as extreme on the same side of 0
+    def test_compute_ranks_and_ratios(self):
+
+        ranks, ratios = MutationWeighting.compute_ranks_and_ratios( np.array( [ 0.5, -1.0, 2.0, 0.5, -0.25, 0.0]))
+
+        self.assertEqual( ranks.tolist(), [ 2, 6, 1, 3, 5, 4])
+        self.assertEqual( ratios.tolist(), [ 3 / 6.0, 1 / 6.0, 1 / 6.0, 3 / 6.0, 2 / 6.0, 4 / 6.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from pysnptools.snpreader import Bed, SnpData
+
+from util.plink.PlinkBedFile import PlinkBedFile
+from util.epistasis.NativeEpistasisEngine import NativeEpistasisEngine, SnpBlock
+from util.epistasis.EpistasisSummaryReader import EpistasisSummaryReader
+
+# Test of the pairwise epistasis test of the native engine (Frisch-Waugh projection of the sums of the blocks)
+# against a least squares fit of the model y = b0 + b1.a + b2.b + b3.a.b of each pair
+
+class TestNativeEpistasisEngine(unittest.TestCase):
+
+    INDIVIDUAL_COUNT = 90
+    SNP_COUNT = 24
+    SET_A = range( 0, 8)
+    SET_B = range( 0, 24)
+    MISSING_PHENOTYPE_INDIVIDUAL = 7
+
+    def setUp(self):
+
+        self.folder = tempfile.mkdtemp()
+        random = np.random.RandomState( 13)
+        values = random.choice( [ 0.0, 2.0, 1.0], size = ( TestNativeEpistasisEngine.INDIVIDUAL_COUNT, TestNativeEpistasisEngine.SNP_COUNT), p = [ 0.5, 0.45, 0.05])
+        values[ random.rand( *values.shape) < 0.05] = np.nan
+        # A SNP in complete linkage with another one: their pair is not testable
+        values[ :, 5] = values[ :, 4]
+        iid = np.array( [ [ "line_" + str( index), "line_" + str( index)] for index in range( TestNativeEpistasisEngine.INDIVIDUAL_COUNT)])
+        sid = np.array( [ "snp_" + str( index) for index in range( TestNativeEpistasisEngine.SNP_COUNT)])
+        pos = np.array( [ [ 1 + index % 3, 0, 100 * index] for index in range( TestNativeEpistasisEngine.SNP_COUNT)])
+        self.genotype_prefix = self.folder + "/genotype"
+        Bed.write( self.genotype_prefix, SnpData( iid = iid, sid = sid, pos = pos, val = values), count_A1 = False)
+        self.genotypes = PlinkBedFile( self.genotype_prefix).read_genotypes( 0, TestNativeEpistasisEngine.SNP_COUNT)
+
+        # Phenotype with an interaction between SNPs 1 and 10, and an individual with no value
+        self.phenotype = random.randn( TestNativeEpistasisEngine.INDIVIDUAL_COUNT) + 0.8 * np.nan_to_num( self.genotypes[ :, 1]) * np.nan_to_num( self.genotypes[ :, 10])
+        self.phenotype_file_name = self.folder + "/phenotype.txt"
+        with open( self.phenotype_file_name, "w") as phenotype_file:
+            phenotype_file.write( "fid iid phenotype\n")
+            for index, ( fid, individual_id) in enumerate( iid):
+                value = "-9" if index == TestNativeEpistasisEngine.MISSING_PHENOTYPE_INDIVIDUAL else repr( self.phenotype[ index])
+                phenotype_file.write( fid + " " + individual_id + " " + value + "\n")
+        self.set_file_name = self.folder + "/sets.txt"
+        with open( self.set_file_name, "w") as set_file:
+            set_file.write( "SET_A\n" + "".join( [ sid[ index] + "\n" for index in TestNativeEpistasisEngine.SET_A]) + "END\n\n")
+            set_file.write( "SET_B\n" + "".join( [ sid[ index] + "\n" for index in TestNativeEpistasisEngine.SET_B]) + "END\n")
+
+    def tearDown(self):
+
+        shutil.rmtree( self.folder)
+
+    # Chi-square of the interaction term of a pair by least squares (None if the pair is not testable)
+    def get_reference_chisq(self, a, b):
+
+        samples = np.arange( TestNativeEpistasisEngine.INDIVIDUAL_COUNT) != TestNativeEpistasisEngine.MISSING_PHENOTYPE_INDIVIDUAL
+        samples &= ~np.isnan( self.genotypes[ :, a]) & ~np.isnan( self.genotypes[ :, b])
+        a_values, b_values, y = self.genotypes[ samples, a], self.genotypes[ samples, b], self.phenotype[ samples]
+        design = np.c_[ np.ones( len( y)), a_values, b_values, a_values * b_values]
+        if a == b or np.linalg.matrix_rank( design) < NativeEpistasisEngine.MODEL_PARAMETER_COUNT:
+            return None
+        coefficients, residual_sum_squares = np.linalg.lstsq( design, y, rcond = None)[ 0:2]
+        variance = residual_sum_squares[ 0] / ( len( y) - NativeEpistasisEngine.MODEL_PARAMETER_COUNT)
+        coefficient_variance = variance * np.linalg.inv( design.T.dot( design))[ 3, 3]
+
+        return coefficients[ 3] ** 2 / coefficient_variance
+
+    # The chi-squares of all the pairs of two blocks are the ones of the least squares fits
+    def test_block_matches_lstsq(self):
+
+        engine = NativeEpistasisEngine()
+        genotype = PlinkBedFile( self.genotype_prefix)
+        sample_index, phenotype = engine.read_phenotype( genotype.get_individuals(), self.phenotype_file_name)
+        set_a, set_b = np.array( TestNativeEpistasisEngine.SET_A), np.array( TestNativeEpistasisEngine.SET_B)
+        a_block = SnpBlock( genotype.read_genotype_counts( set_a, sample_index), phenotype)
+        b_block = SnpBlock( genotype.read_genotype_counts( set_b, sample_index), phenotype)
+        chisq, tested = engine.test_block( a_block.get_left_matrix(), b_block.get_right_matrix(), len( set_a), len( set_b))
+
+        for a_position, a in enumerate( set_a):
+            for b_position, b in enumerate( set_b):
+                reference_chisq = self.get_reference_chisq( a, b)
+                if reference_chisq == None:
+                    self.assertFalse( tested[ a_position, b_position] and a != b, ( a, b))
+                else:
+                    self.assertTrue( tested[ a_position, b_position], ( a, b))
+                    self.assertTrue( np.isclose( chisq[ a_position, b_position], reference_chisq, rtol = 1e-8), ( a, b))
+
+    # The summary gives the counts of tests and the best partner of the least squares fits, whatever the block sizes
+    def test_summary_matches_lstsq(self):
+
+        threshold = stats.chi2.isf( NativeEpistasisEngine.SUMMARY_THRESHOLD, 1)
+        expected_rows = []
+        for a in TestNativeEpistasisEngine.SET_A:
+            chisqs = [ ( self.get_reference_chisq( a, b), b) for b in TestNativeEpistasisEngine.SET_B]
+            chisqs = [ ( chisq, b) for chisq, b in chisqs if chisq != None]
+            best_chisq, best_b = max( chisqs)
+            expected_rows.append( ( "snp_" + str( a), sum( [ chisq > threshold for chisq, b in chisqs]), len( chisqs), best_chisq, "snp_" + str( best_b)))
+
+        for set_a_block_size, set_b_block_size in [ ( None, None), ( 3, 5)]:
+            summary_file_path = self.folder + "/summary.txt"
+            engine = NativeEpistasisEngine( set_a_block_size = set_a_block_size, set_b_block_size = set_b_block_size)
+            engine.run( self.genotype_prefix, self.phenotype_file_name, self.set_file_name, summary_file_path)
+            summary_df = EpistasisSummaryReader( summary_file_path).read()[ 0]
+
+            self.assertEqual( list( summary_df[ "1_SNP"]), [ row[ 0] for row in expected_rows])
+            self.assertEqual( list( summary_df[ "N_SIG"]), [ row[ 1] for row in expected_rows])
+            self.assertEqual( list( summary_df[ "N_TOT"]), [ row[ 2] for row in expected_rows])
+            np.testing.assert_allclose( summary_df[ "CHISQ"].values, [ row[ 3] for row in expected_rows], rtol = 1e-3)
+            self.assertEqual( list( summary_df[ "2_SNP"]), [ row[ 4] for row in expected_rows])
+
+    # A SNP of SET_A with tests but no positive chi-square has no best partner
+    def test_no_partner(self):
+
+        summary_file_path = self.folder + "/summary.txt"
+        engine = NativeEpistasisEngine()
+        snp_table = PlinkBedFile( self.genotype_prefix).get_snp_table()
+        engine.write_summary( summary_file_path, snp_table, np.array( [ 0, 1]), np.array( [ 2, 3]), np.array( [ 0, 1]), np.array( [ 2, 2]),
+                              np.array( [ 0.0, 7.5]), np.array( [ -1, 1]))
+
+        with open( summary_file_path) as summary_file:
+            rows = [ line.split() for line in summary_file.readlines()[ 3:]]
+        self.assertEqual( rows[ 0][ -2:], [ NativeEpistasisEngine.NO_PARTNER, NativeEpistasisEngine.NO_PARTNER])
+        self.assertEqual( rows[ 1][ -2:], [ "1", "snp_3"])
+
+        summary_df, summary_index = EpistasisSummaryReader( summary_file_path).read()
+        self.assertTrue( pd.isnull( summary_df[ "2_SNP"].iloc[ 0]))
+        self.assertEqual( summary_df[ "2_SNP"].iloc[ 1], "snp_3")
+        self.assertEqual( list( summary_index.get_pair_codes()[ :, 1]), [ -1, summary_index.snpCodes[ "snp_3"]])
+        self.assertFalse( summary_index.contains( NativeEpistasisEngine.NO_PARTNER))
+
+
+if __name__ == "__main__":
+    unittest.main()
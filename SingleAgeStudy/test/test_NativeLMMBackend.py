@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+from fastlmm.association import single_snp
+
+from util.gwas.NativeLMMBackend import NativeLMMBackend
+from test.GwasTestData import GwasTestData
+
+# Test of the LOCO null model and the SNP tests of the native backend against the single_snp function of Fast-LMM
+# (same genotype, phenotype and covariable as the test of the Fast-LMM backend, see GwasTestData)
+
+class TestNativeLMMBackend( GwasTestData, unittest.TestCase):
+
+    # The native backend gives the results of single_snp, with the similarity matrices computed or loaded
+    def test_native_run_matches_single_snp(self):
+
+        expected_df = single_snp( self.genotype_prefix, self.phenotype_file_name, covar = self.covariable_file_name).set_index( "SNP")
+        backend = NativeLMMBackend( self.folder)
+        for kinship_file_path in [ None, self.folder + "/kinship.npz", self.folder + "/kinship.npz"]:
+            results_df = backend.run( self.genotype_prefix, self.phenotype_file_name, self.covariable_file_name, kinship_file_path)
+
+            self.assertEqual( sorted( results_df[ "SNP"]), sorted( expected_df.index))
+            self.assertTrue( ( np.diff( results_df[ "PValue"].values) >= 0).all())
+            snp_expected_df = expected_df.loc[ results_df[ "SNP"]]
+            for column in [ "PValue", "SnpWeight", "SnpWeightSE", "Nullh2"]:
+                np.testing.assert_allclose( results_df[ column].values, snp_expected_df[ column].values, rtol = 1e-5, atol = 1e-10, err_msg = column)
+            # The null model of each chromosome leaves the chromosome out of the similarity matrix (LOCO)
+            self.assertEqual( len( np.unique( results_df[ "Nullh2"].values)), GwasTestData.CHROMOSOME_COUNT)
+            for column in [ "Chr", "ChrPos", "GenDist"]:
+                np.testing.assert_array_equal( results_df[ column].values, snp_expected_df[ column].values)
+
+
+if __name__ == "__main__":
+    unittest.main()
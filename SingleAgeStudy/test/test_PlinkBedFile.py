@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from pysnptools.snpreader import Bed, SnpData
+
+from util.plink.PlinkBedFile import PlinkBedFile
+
+# Tests of the PLINK genotype reader and subset writer against the pysnptools Bed reader
+
+class TestPlinkBedFile(unittest.TestCase):
+
+    # An individual count that is not a multiple of 4, so that the last byte of each SNP is padded
+    INDIVIDUAL_COUNT = 23
+    SNP_COUNT = 41
+
+    def setUp(self):
+
+        self.folder = tempfile.mkdtemp()
+        random = np.random.RandomState( 7)
+        values = random.randint( 0, 3, size = ( TestPlinkBedFile.INDIVIDUAL_COUNT, TestPlinkBedFile.SNP_COUNT)).astype( np.float64)
+        values[ random.rand( *values.shape) < 0.1] = np.nan
+        iid = np.array( [ [ "line_" + str( index), "line_" + str( index)] for index in range( TestPlinkBedFile.INDIVIDUAL_COUNT)])
+        sid = np.array( [ "snp_" + str( index) for index in range( TestPlinkBedFile.SNP_COUNT)])
+        pos = np.array( [ [ 1 + index % 3, 0, 100 * index] for index in range( TestPlinkBedFile.SNP_COUNT)])
+        self.prefix = self.folder + "/genotype"
+        Bed.write( self.prefix, SnpData( iid = iid, sid = sid, pos = pos, val = values), count_A1 = False)
+        self.values = values
+
+    def tearDown(self):
+
+        shutil.rmtree( self.folder)
+
+    # The allele 2 counts read are the ones of pysnptools
+    def test_read_genotypes(self):
+
+        bed_file = PlinkBedFile( self.prefix)
+        expected = Bed( self.prefix, count_A1 = False).read().val
+
+        np.testing.assert_array_equal( bed_file.read_genotypes( 0, TestPlinkBedFile.SNP_COUNT), expected)
+        np.testing.assert_array_equal( expected, self.values)
+
+        snp_indexes = np.array( [ 3, 0, 40, 17])
+        sample_index = np.array( [ 1, 5, 22])
+        counts = bed_file.read_genotype_counts( snp_indexes, sample_index).astype( np.float64)
+        counts[ counts == PlinkBedFile.MISSING_ALLELE_COUNT] = np.nan
+        np.testing.assert_array_equal( counts, expected[ sample_index][ :, snp_indexes])
+
+    # A subset read by pysnptools has the genotypes and the SNP description of the source
+    def test_subset_round_trip(self):
+
+        source = Bed( self.prefix, count_A1 = False)
+        keep_individuals = set( [ tuple( source.iid[ index]) for index in [ 0, 3, 4, 9, 22]])
+        extract_snps = set( source.sid[ [ 1, 2, 8, 30, 40]])
+
+        PlinkBedFile( self.prefix).subset( self.folder + "/subset", keep_individuals, extract_snps)
+        subset = Bed( self.folder + "/subset", count_A1 = False).read()
+
+        sample_index = source.iid_to_index( subset.iid)
+        snp_index = source.sid_to_index( subset.sid)
+        self.assertEqual( len( sample_index), len( keep_individuals))
+        self.assertEqual( set( subset.sid), extract_snps)
+        self.assertTrue( ( np.diff( sample_index) > 0).all() and ( np.diff( snp_index) > 0).all())
+        np.testing.assert_array_equal( subset.val, source.read().val[ sample_index][ :, snp_index])
+        np.testing.assert_array_equal( subset.pos, source.pos[ snp_index])
+        with open( self.prefix + PlinkBedFile.BIM_EXTENSION) as bim_file, open( self.folder + "/subset" + PlinkBedFile.BIM_EXTENSION) as subset_bim_file:
+            self.assertEqual( subset_bim_file.readlines(), [ line for line in bim_file.readlines() if line.split()[ 1] in extract_snps])
+
+        # Keeping all the individuals copies the packed SNPs
+        PlinkBedFile( self.prefix).subset( self.folder + "/all_individuals", None, extract_snps)
+        np.testing.assert_array_equal( Bed( self.folder + "/all_individuals", count_A1 = False).read().val, source.read().val[ :, snp_index])
+
+
+if __name__ == "__main__":
+    unittest.main()
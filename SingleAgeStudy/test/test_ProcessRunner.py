@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import unittest
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+import test
+from util.process.ProcessRunner import ProcessRunner
+
+# Tests of the resource usage reported by ProcessRunner for each command
+
+class TestProcessRunner(unittest.TestCase):
+
+    # A command allocating about 200 MB
+    LARGE_COMMAND = sys.executable + " -c \"data = bytearray( 200 * 1024 * 1024)\""
+    SMALL_COMMAND = "true"
+    # A command consuming a fixed amount of CPU
+    BUSY_COMMAND = sys.executable + " -c \"sum( xrange( 20000000))\""
+
+    # The peak RSS of a command is not the peak of the previous commands
+    # The commands are run from a new interpreter since the peak RSS of a command starts from the RSS of its parent at fork time
+    def test_max_rss_per_command(self):
+
+        script = "; ".join( [ "import sys",
+                              "sys.path.insert( 0, " + repr( test.SRC_PATH) + ")",
+                              "from util import Constants",
+                              "from util.log.Logger import Logger",
+                              "Logger.get_instance( " + repr( test.LOG_PATH) + ", Constants.MODE_WARNING)",
+                              "from util.process.ProcessRunner import ProcessRunner",
+                              "print ProcessRunner.run( " + repr( TestProcessRunner.LARGE_COMMAND) + ").max_rss",
+                              "print ProcessRunner.run( " + repr( TestProcessRunner.SMALL_COMMAND) + ").max_rss"])
+        large_max_rss, small_max_rss = [ int( value) for value in subprocess.check_output( [ sys.executable, "-c", script]).split()]
+
+        self.assertGreater( large_max_rss, 150 * 1024)
+        self.assertLess( small_max_rss, 50 * 1024)
+
+    # The CPU time of concurrent commands is the CPU time of each command
+    def test_cpu_time_of_concurrent_commands(self):
+
+        single_cpu_time = ProcessRunner.run( TestProcessRunner.BUSY_COMMAND).cpu_time
+        pool = ThreadPool( 3)
+        try:
+            results = pool.map( ProcessRunner.run, [ TestProcessRunner.BUSY_COMMAND] * 3)
+        finally:
+            pool.close()
+            pool.join()
+
+        for result in results:
+            self.assertTrue( result.succeeded())
+            self.assertGreater( result.cpu_time, 0.5 * single_cpu_time)
+            self.assertLess( result.cpu_time, 1.5 * single_cpu_time)
+
+    # The return code of failing and killed commands is reported
+    def test_return_code(self):
+
+        self.assertEqual( ProcessRunner.run( "exit 3", check = False).return_code, 3)
+        timed_out_result = ProcessRunner.run( "sleep 10", timeout = 0.5, check = False)
+        self.assertTrue( timed_out_result.timed_out)
+        self.assertEqual( timed_out_result.return_code, -9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from util.sql.SqlManager import SqlManager
+
+# Test of the journal mode of the DB files written through the SqlManager
+
+class TestSqlManager(unittest.TestCase):
+
+    def setUp(self):
+
+        self.folder = tempfile.mkdtemp()
+        self.db_path = os.path.join( self.folder, "test.sqlite")
+        self.sql_manager = SqlManager()
+        self.sql_manager.set_DBpath( self.db_path)
+
+    def tearDown(self):
+
+        self.sql_manager.dispose_engine()
+        shutil.rmtree( self.folder)
+
+    def write_table(self):
+
+        connection = self.sql_manager.get_engine().connect()
+        try:
+            connection.execute( "CREATE TABLE IF NOT EXISTS value ( id INTEGER PRIMARY KEY)")
+            connection.execute( "INSERT INTO value DEFAULT VALUES")
+            return connection.execute( "PRAGMA journal_mode").scalar()
+        finally:
+            connection.close()
+
+    # The default journal mode of SQLite is kept unless the WAL journal is enabled
+    def test_journal_mode(self):
+
+        self.assertEqual( self.write_table().lower(), "delete")
+        self.assertFalse( os.path.exists( self.db_path + SqlManager.WAL_FILE_SUFFIX))
+
+        self.sql_manager.set_wal_journal( True)
+        self.assertEqual( self.write_table().lower(), "wal")
+
+        self.sql_manager.set_wal_journal( False)
+        self.assertEqual( self.sql_manager.pragmas, SqlManager.DEFAULT_PRAGMAS)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import unittest
+from distutils.spawn import find_executable
+
+from util.sql.TableFingerprint import TableFingerprint
+
+# Test of the fingerprint file of the exported tables: it is rewritten only when the content of the tables changes,
+# so that a Snakemake rerun on a touched DB does nothing
+
+class TestTableFingerprint(unittest.TestCase):
+
+    STUDY_PATH = os.path.dirname( os.path.dirname( os.path.abspath( __file__)))
+    SNAKEFILE_PATH = os.path.join( STUDY_PATH, "1_lines_analysis_rules")
+    CONFIG_PATH = os.path.join( STUDY_PATH, "config", "single_age_study_config.yaml")
+    DB_NAME = "Phenosnip.201612.sqlite"
+    EXPORT_FILES = [ "output/1_export_sql_tables/" + file_name + ".csv" for file_name in [ "strain", "individual", "phenotype_data", "phenotype_data_joined"]]
+
+    def setUp(self):
+
+        self.folder = tempfile.mkdtemp()
+        os.makedirs( os.path.join( self.folder, "input"))
+        self.db_path = os.path.join( self.folder, "input", TestTableFingerprint.DB_NAME)
+        self.execute_sql( [ "create table strain ( number integer primary key, control boolean)",
+                            "create table individual ( name text primary key, strain_number integer)",
+                            "create table phenotype_data ( individual_name text, phenotype_name text, value float)",
+                            "create table other ( value text)",
+                            "insert into strain values ( 1, 0)",
+                            "insert into individual values ( 'fly_1', 1)",
+                            "insert into phenotype_data values ( 'fly_1', 'heart_period', 0.5)"])
+        self.fingerprint_file_path = os.path.join( self.folder, "fingerprints.json")
+
+    def tearDown(self):
+
+        shutil.rmtree( self.folder)
+
+    def execute_sql(self, statements):
+
+        connection = sqlite3.connect( self.db_path)
+        try:
+            for statement in statements:
+                connection.execute( statement)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def touch_db(self):
+
+        db_time = os.path.getmtime( self.db_path) + 10
+        os.utime( self.db_path, ( db_time, db_time))
+
+    def update_file(self):
+
+        return TableFingerprint.update_file( self.fingerprint_file_path, self.db_path, [ "strain", "individual"])
+
+    def test_update_file(self):
+
+        self.assertTrue( self.update_file())
+        fingerprint_time = os.path.getmtime( self.fingerprint_file_path)
+        self.assertFalse( self.update_file())
+
+        # The DB file is touched or a table that is not fingerprinted is modified: the file is kept
+        self.touch_db()
+        self.assertFalse( self.update_file())
+        self.execute_sql( [ "insert into other values ( 'value')"])
+        self.assertFalse( self.update_file())
+        self.assertEqual( os.path.getmtime( self.fingerprint_file_path), fingerprint_time)
+
+        # A row of a fingerprinted table is modified: the file is rewritten
+        self.execute_sql( [ "update individual set strain_number = 2"])
+        self.assertTrue( self.update_file())
+        self.assertFalse( self.update_file())
+
+    def run_snakemake(self):
+
+        return subprocess.check_output( [ "snakemake"] + TestTableFingerprint.EXPORT_FILES + [ "--dry-run", "--cores", "1", "--snakefile", TestTableFingerprint.SNAKEFILE_PATH,
+                                                                                "--directory", self.folder, "--configfile", TestTableFingerprint.CONFIG_PATH], stderr = subprocess.STDOUT)
+
+    # A rerun of the export rule on a touched DB does nothing, and the export is executed again when a table changes
+    @unittest.skipIf( find_executable( "snakemake") == None, "Snakemake is not installed")
+    def test_snakemake_rerun(self):
+
+        self.assertIn( "rule export_sql_tables:", self.run_snakemake())
+        for file_path in TestTableFingerprint.EXPORT_FILES:
+            if not os.path.exists( os.path.dirname( os.path.join( self.folder, file_path))):
+                os.makedirs( os.path.dirname( os.path.join( self.folder, file_path)))
+            open( os.path.join( self.folder, file_path), "w").close()
+
+        self.touch_db()
+        self.execute_sql( [ "insert into other values ( 'value')"])
+        self.assertIn( "Nothing to be done", self.run_snakemake())
+
+        self.execute_sql( [ "insert into strain values ( 2, 1)"])
+        self.assertIn( "rule export_sql_tables:", self.run_snakemake())